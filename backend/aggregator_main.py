@@ -0,0 +1,23 @@
+"""Entry point for group filter aggregation processes.
+
+See group_filters.group_filter_aggregation_process.
+"""
+
+import asyncio
+from argparse import ArgumentParser
+
+from group_filters.group_filter_aggregation_runner import GroupFilterAggregationRunner
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--endpoint", dest="endpoint", required=True)
+    parser.add_argument("--log-name-suffix", dest="log_name_suffix", required=True)
+    args = parser.parse_args()
+
+    runner = GroupFilterAggregationRunner(args.endpoint, args.log_name_suffix)
+    await runner.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,11 @@
+"""Batch processing of recordings with filters, see batch.batch_runner."""
+
+from .batch_runner import (
+    BatchRunner,
+    BatchResultDict,
+    BatchSummaryDict,
+    BatchTaskDict,
+    RecordingDict,
+    find_recordings,
+)
+from .offline_track_handler import OfflineTrackHandler
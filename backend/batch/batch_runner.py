@@ -0,0 +1,657 @@
+"""Provide the `BatchRunner`, which runs filters over stored recordings in bulk.
+
+Filters normally run live in hub.track_handler.TrackHandler.  The BatchRunner runs the
+same filter implementations over recordings, e.g. to re-analyse a session with a new
+filter configuration.  Recordings are split into segments of fixed duration, and the
+segments of all recordings are processed in parallel on a process pool, so the
+processing speed is bound by the available cores instead of real time.
+
+Every segment is processed by a new set of filters, which decode the recording in a
+streaming fashion, starting at the keyframe before the segment.  Filters keeping
+state across frames (e.g. the speaking time) therefore start from scratch for every
+segment.  Filters accessing filters of the other track, e.g. DISPLAY_SPEAKING_TIME,
+are not supported.
+
+Outputs are written into the output directory:
+
+- `measurements/<participant_id>/`: measurements of the filters, see
+  filter_api.measurement_sink.  Rows are timestamped with the wall clock time the
+  frame was recorded at, if the recording has a recording index (see
+  hub.recording_index), otherwise with the time in the recording.
+- `<recording>_batch.mp4/mp3`: annotated recordings, i.e. the filter output, if
+  `annotate` is enabled.
+- `summary.json`: throughput and results of all tasks.  Unknown durations and the
+  open end of the last segment of a recording are written as `null`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Literal, TypedDict
+
+import av
+from av import AudioFrame, AudioResampler, VideoFrame
+
+from batch.offline_track_handler import OfflineTrackHandler
+from filter_api import FilterOfflineAPI
+from filters import FilterDict
+from filters.filter_factory import create_filter
+from filters.open_face_au.open_face_pool import OpenFaceWorkerPool
+from hub.record_handler import MANIFEST_FILE, add_output_stream, concat_segments
+from hub.recording_index import INDEX_SUFFIX, RecordingIndex
+
+RECORDING_PATTERN = re.compile(
+    r"(?P<participant_id>.+?)(?P<raw>_raw)?_\d{8}_\d{6}\.(?P<extension>mp3|mp4|mkv)"
+)
+"""Pattern of recording file names, see hub.record_handler.RecordHandler."""
+
+VIDEO_SOURCE = Literal["raw", "filtered", "all"]
+"""Video recordings to process.
+
+`raw` uses the raw video recordings (see hub.packet_record_handler), or the filtered
+recording for participants without raw recording.  `filtered` uses the recordings of
+the filtered video only, `all` uses both.
+"""
+
+_logger = logging.getLogger("BatchRunner")
+
+
+class RecordingDict(TypedDict):
+    """TypedDict for recordings processed by the BatchRunner.
+
+    Attributes
+    ----------
+    path : str
+        Path of the recording.
+    participant_id : str
+        Participant the recording belongs to.
+    kind : str, "audio" or "video"
+        Kind of the recording.
+    raw : bool
+        Whether the recording is a raw (unfiltered) video recording.
+    duration : float
+        Duration of the recording in seconds, `math.inf` if unknown.
+    start : float
+        Wall clock time of the start of the recording, 0 if unknown.
+    """
+
+    path: str
+    participant_id: str
+    kind: Literal["audio", "video"]
+    raw: bool
+    duration: float
+    start: float
+
+
+class BatchTaskDict(TypedDict):
+    """TypedDict for a single segment of a recording processed by a worker.
+
+    Attributes
+    ----------
+    recording : RecordingDict
+        Recording to process.
+    segment : int
+        Segment number.
+    start : float
+        Start of the segment in seconds, relative to the start of the recording.
+    end : float
+        End of the segment in seconds (exclusive).
+    filters : list of filters.FilterDict
+        Filters to run on the segment.
+    measurement_directory : str
+        Directory for filter measurements.
+    output : str or None
+        Path for the annotated segment, None if the output is not written.
+    """
+
+    recording: RecordingDict
+    segment: int
+    start: float
+    end: float
+    filters: list[FilterDict]
+    measurement_directory: str
+    output: str | None
+
+
+class BatchResultDict(TypedDict):
+    """TypedDict for the result of a BatchTaskDict.
+
+    Attributes
+    ----------
+    task : BatchTaskDict
+        The executed task.
+    frames : int
+        Number of processed frames.
+    media_seconds : float
+        Duration of the processed part of the recording in seconds.
+    seconds : float
+        Processing time in seconds.
+    error : str or None
+        Error, if the task failed.
+    """
+
+    task: BatchTaskDict
+    frames: int
+    media_seconds: float
+    seconds: float
+    error: str | None
+
+
+class BatchSummaryDict(TypedDict):
+    """TypedDict for the summary of a batch run.
+
+    Attributes
+    ----------
+    recordings : int
+        Number of processed recordings.
+    tasks : int
+        Number of executed tasks (segments).
+    failed : int
+        Number of failed tasks.
+    frames : int
+        Total number of processed frames.
+    media_seconds : float
+        Total duration of processed recordings in seconds.
+    seconds : float
+        Wall clock duration of the batch run in seconds.
+    fps : float
+        Processed frames per second.
+    realtime_factor : float
+        Processed media seconds per second.
+    """
+
+    recordings: int
+    tasks: int
+    failed: int
+    frames: int
+    media_seconds: float
+    seconds: float
+    fps: float
+    realtime_factor: float
+
+
+def find_recordings(
+    paths: list[str], video_source: VIDEO_SOURCE = "raw"
+) -> list[RecordingDict]:
+    """Find recordings in `paths`.
+
+    Parameters
+    ----------
+    paths : list of str
+        Recording files or session directories containing recordings.
+    video_source : str, "raw", "filtered" or "all", default "raw"
+        Video recordings to use, see `VIDEO_SOURCE`.
+
+    Returns
+    -------
+    list of RecordingDict
+        Recordings, ordered by path.
+    """
+    files: list[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)))
+        else:
+            files.append(path)
+
+    recordings: list[RecordingDict] = []
+    for file in files:
+        match = RECORDING_PATTERN.fullmatch(os.path.basename(file))
+        if match is None or not os.path.isfile(file):
+            continue
+        extension = match.group("extension")
+        recordings.append(
+            RecordingDict(
+                path=file,
+                participant_id=match.group("participant_id"),
+                kind="audio" if extension == "mp3" else "video",
+                raw=extension == "mkv",
+                duration=math.inf,
+                start=0,
+            )
+        )
+
+    if video_source == "raw":
+        with_raw = {r["participant_id"] for r in recordings if r["raw"]}
+        recordings = [
+            r
+            for r in recordings
+            if r["kind"] == "audio" or r["raw"] or r["participant_id"] not in with_raw
+        ]
+    elif video_source == "filtered":
+        recordings = [r for r in recordings if not r["raw"]]
+
+    for recording in recordings:
+        recording["duration"] = _get_duration(recording["path"])
+        recording["start"] = _get_start(recording["path"])
+    return recordings
+
+
+def _get_duration(path: str) -> float:
+    """Get the duration of recording `path` in seconds, `math.inf` if unknown."""
+    try:
+        with av.open(path) as container:
+            if container.duration is not None:
+                return container.duration / av.time_base
+    except av.FFmpegError as e:
+        _logger.warning(f"Failed to read duration of {path}: {e}")
+    return math.inf
+
+
+def _get_start(path: str) -> float:
+    """Get the wall clock start time of `path` from its recording index, or 0."""
+    try:
+        return RecordingIndex.load(path + INDEX_SUFFIX).start
+    except (OSError, ValueError):
+        return 0
+
+
+def _replace_non_finite(value: Any) -> Any:
+    """Replace `math.inf` and NaN in `value` with None, to write valid JSON."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _replace_non_finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_non_finite(v) for v in value]
+    return value
+
+
+def _init_worker(log_level: int) -> None:
+    """Initialize a worker process of the BatchRunner."""
+    logging.basicConfig(
+        level=log_level,
+        format="%(levelname)s:%(processName)s:%(name)s: %(message)s",
+    )
+
+
+def run_task(task: BatchTaskDict) -> BatchResultDict:
+    """Process a single segment of a recording.  Executed on a worker process."""
+    start_time = time.perf_counter()
+    frames = 0
+    error = None
+    try:
+        frames = asyncio.run(_run_task(task))
+    except Exception as e:
+        error = repr(e)
+        _logger.exception(f"Failed to process {task['recording']['path']}")
+
+    end = min(task["end"], task["recording"]["duration"])
+    return BatchResultDict(
+        task=task,
+        frames=frames,
+        media_seconds=end - task["start"] if math.isfinite(end) else 0,
+        seconds=time.perf_counter() - start_time,
+        error=error,
+    )
+
+
+async def _run_task(task: BatchTaskDict) -> int:
+    """Run the filters of `task` on its segment.  Returns the number of frames."""
+    recording = task["recording"]
+    kind = recording["kind"]
+    segment_start = recording["start"] + task["start"]
+    # Raw and filtered video recordings of a participant start at the same time, tag
+    # the run id so their measurements do not overwrite each other.
+    tag = "raw" if recording["raw"] else kind
+    filter_api = FilterOfflineAPI(
+        task["measurement_directory"], run_id=f"{round(segment_start * 1000)}-{tag}"
+    )
+    audio_track_handler = OfflineTrackHandler("audio", filter_api)
+    video_track_handler = OfflineTrackHandler("video", filter_api)
+    track_handler = audio_track_handler if kind == "audio" else video_track_handler
+
+    for config in task["filters"]:
+        track_handler.filters[config["id"]] = create_filter(
+            config, audio_track_handler, video_track_handler  # type: ignore
+        )
+    filters = list(track_handler.filters.values())
+    await asyncio.gather(*[f.complete_setup() for f in filters])
+
+    frames = 0
+    output = None
+    output_stream = None
+    first_pts = None
+    last_pts = -1
+    try:
+        with av.open(recording["path"]) as container:
+            streams = (
+                container.streams.audio if kind == "audio" else container.streams.video
+            )
+            stream = streams[0]
+            stream.thread_type = "AUTO"
+            if task["start"] > 0:
+                container.seek(
+                    round(task["start"] / stream.time_base),
+                    stream=stream,
+                    backward=True,
+                    any_frame=False,
+                )
+
+            # Convert audio to the format of frames received with aiortc.
+            resampler = None
+            if kind == "audio":
+                resampler = AudioResampler("s16", "stereo", 48000, frame_size=960)
+
+            for decoded in container.decode(stream):
+                if decoded.time is None or decoded.time < task["start"]:
+                    continue
+                if decoded.time >= task["end"]:
+                    break
+                frame_time = decoded.time
+                for frame in resampler.resample(decoded) if resampler else [decoded]:
+                    if frame.time is not None:
+                        frame_time = frame.time
+                    filter_api.set_time(recording["start"] + frame_time)
+                    if isinstance(frame, VideoFrame):
+                        ndarray = frame.to_ndarray(format="bgr24")
+                    else:
+                        ndarray = frame.to_ndarray()
+                    for active_filter in filters:
+                        ndarray = await active_filter.process(frame, ndarray)
+                    frames += 1
+                    # Allow tasks started by filters to run, as they would live.
+                    await asyncio.sleep(0)
+
+                    if task["output"] is None or frame.pts is None:
+                        continue
+
+                    if isinstance(frame, VideoFrame):
+                        new_frame = VideoFrame.from_ndarray(ndarray, format="bgr24")
+                    else:
+                        new_frame = AudioFrame.from_ndarray(
+                            ndarray, format="s16", layout="stereo"
+                        )
+                        new_frame.sample_rate = frame.sample_rate
+                    new_frame.time_base = frame.time_base
+                    if first_pts is None:
+                        first_pts = frame.pts
+                        output = av.open(task["output"], "w")
+                        output_stream = add_output_stream(output, new_frame)
+
+                    # Timestamps of every segment start at 0, see concat_segments.
+                    new_frame.pts = max(frame.pts - first_pts, last_pts + 1)
+                    last_pts = new_frame.pts
+                    for packet in output_stream.encode(new_frame):
+                        output.mux(packet)
+
+        if output is not None and output_stream is not None:
+            for packet in output_stream.encode(None):
+                output.mux(packet)
+    finally:
+        if output is not None:
+            output.close()
+        await asyncio.gather(*[f.cleanup() for f in filters])
+
+    return frames
+
+
+class BatchRunner:
+    """Runs filters over recordings on a process pool.  See module docs."""
+
+    output_directory: str
+    audio_filters: list[FilterDict]
+    video_filters: list[FilterDict]
+    workers: int
+    segment_duration: float
+    annotate: bool
+    open_face_port: int
+
+    def __init__(
+        self,
+        output_directory: str,
+        audio_filters: list[FilterDict],
+        video_filters: list[FilterDict],
+        workers: int = 0,
+        segment_duration: float = 60.0,
+        annotate: bool = False,
+        open_face_port: int = 5556,
+    ) -> None:
+        """Create new BatchRunner.
+
+        Parameters
+        ----------
+        output_directory : str
+            Directory outputs are written to.  Created if it does not exist.
+        audio_filters : list of filters.FilterDict
+            Filters executed on audio recordings.
+        video_filters : list of filters.FilterDict
+            Filters executed on video recordings.
+        workers : int, default 0
+            Number of worker processes.  If 0, the number of CPU cores is used.  If an
+            `OPENFACE_AU` filter is used, half of them run the OpenFace worker pool.
+        segment_duration : float, default 60.0
+            Duration of the segments recordings are split into, in seconds.
+        annotate : bool, default False
+            Whether the filter output is written into new recordings.
+        open_face_port : int, default 5556
+            Port for the OpenFace worker pool, started if an `OPENFACE_AU` filter is
+            used.  Should differ from the port used by a running hub.
+        """
+        self.output_directory = output_directory
+        self.audio_filters = audio_filters
+        self.video_filters = video_filters
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.segment_duration = segment_duration
+        self.annotate = annotate
+        self.open_face_port = open_face_port
+
+    def create_tasks(self, recordings: list[RecordingDict]) -> list[BatchTaskDict]:
+        """Split `recordings` into tasks, one for each segment.
+
+        Tasks are ordered by segment, so all recordings progress evenly.
+        """
+        tasks: list[BatchTaskDict] = []
+        for recording in recordings:
+            filters = (
+                self.audio_filters
+                if recording["kind"] == "audio"
+                else self.video_filters
+            )
+            if len(filters) == 0:
+                continue
+
+            duration = recording["duration"]
+            count = 1
+            if math.isfinite(duration):
+                count = max(1, math.ceil(duration / self.segment_duration))
+            for segment in range(count):
+                start = segment * self.segment_duration
+                end = (
+                    math.inf if segment == count - 1 else start + self.segment_duration
+                )
+                tasks.append(
+                    BatchTaskDict(
+                        recording=recording,
+                        segment=segment,
+                        start=start,
+                        end=end,
+                        filters=filters,
+                        measurement_directory=os.path.join(
+                            self.output_directory,
+                            "measurements",
+                            recording["participant_id"],
+                        ),
+                        output=self._get_segment_path(recording, segment),
+                    )
+                )
+        tasks.sort(key=lambda t: (t["segment"], t["recording"]["path"]))
+        return tasks
+
+    async def run(self, recordings: list[RecordingDict]) -> BatchSummaryDict:
+        """Process `recordings` and write the outputs.
+
+        Returns
+        -------
+        BatchSummaryDict
+            Summary of the batch run.  Also written to `summary.json` in the output
+            directory.
+        """
+        os.makedirs(self.output_directory, exist_ok=True)
+        tasks = self.create_tasks(recordings)
+        for task in tasks:
+            if task["output"] is not None:
+                os.makedirs(os.path.dirname(task["output"]), exist_ok=True)
+
+        # The OpenFace workers do the heavy lifting for OPENFACE_AU, so the cores are
+        # split between them and the task processes instead of oversubscribing.
+        pool = None
+        workers = self.workers
+        if any(f["name"] == "OPENFACE_AU" for f in self.video_filters):
+            open_face_workers = max(1, self.workers // 2)
+            workers = max(1, self.workers - open_face_workers)
+            pool = OpenFaceWorkerPool(self.open_face_port, open_face_workers)
+            await pool.start()
+
+        _logger.info(
+            f"Processing {len(recordings)} recordings in {len(tasks)} segments with "
+            f"{workers} workers"
+        )
+        start_time = time.perf_counter()
+        results: list[BatchResultDict] = []
+        executor = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(logging.getLogger().getEffectiveLevel(),),
+        )
+        try:
+            loop = asyncio.get_running_loop()
+            futures = [loop.run_in_executor(executor, run_task, t) for t in tasks]
+            for future in asyncio.as_completed(futures):
+                result = await future
+                results.append(result)
+                self._log_progress(result, results, len(tasks), start_time)
+        finally:
+            executor.shutdown(cancel_futures=True)
+            if pool is not None:
+                await pool.stop()
+
+        if self.annotate:
+            await loop.run_in_executor(None, self._concat_outputs, results)
+
+        summary = self._summarize(results, start_time)
+        summary["recordings"] = len({r["task"]["recording"]["path"] for r in results})
+        with open(os.path.join(self.output_directory, "summary.json"), "w") as file:
+            json.dump(
+                _replace_non_finite({"summary": summary, "results": results}),
+                file,
+                indent=2,
+                allow_nan=False,
+            )
+        _logger.info(
+            f"Finished {summary['tasks']} segments ({summary['failed']} failed): "
+            f"{summary['frames']} frames in {summary['seconds']:.1f}s, "
+            f"{summary['fps']:.1f} fps, {summary['realtime_factor']:.1f}x real time"
+        )
+        return summary
+
+    def _get_segment_path(self, recording: RecordingDict, segment: int) -> str | None:
+        if not self.annotate:
+            return None
+        output = self._get_output_path(recording)
+        extension = os.path.splitext(output)[1]
+        return os.path.join(
+            self._get_segment_directory(recording), f"{segment:05d}{extension}"
+        )
+
+    def _get_output_path(self, recording: RecordingDict) -> str:
+        """Get the path of the annotated recording for `recording`."""
+        base = os.path.splitext(os.path.basename(recording["path"]))[0]
+        extension = "mp3" if recording["kind"] == "audio" else "mp4"
+        return os.path.join(self.output_directory, f"{base}_batch.{extension}")
+
+    def _get_segment_directory(self, recording: RecordingDict) -> str:
+        """Get the directory for annotated segments of `recording`."""
+        output = self._get_output_path(recording)
+        return f"{os.path.splitext(output)[0]}_{recording['kind']}_segments"
+
+    def _concat_outputs(self, results: list[BatchResultDict]) -> None:
+        """Concatenate the annotated segments of every recording."""
+        by_recording: dict[str, list[BatchResultDict]] = {}
+        for result in results:
+            if result["task"]["output"] is not None:
+                path = result["task"]["recording"]["path"]
+                by_recording.setdefault(path, []).append(result)
+
+        for recording_results in by_recording.values():
+            recording_results.sort(key=lambda r: r["task"]["segment"])
+            recording = recording_results[0]["task"]["recording"]
+            output = self._get_output_path(recording)
+            directory = self._get_segment_directory(recording)
+            segments = [
+                {
+                    "file": os.path.basename(r["task"]["output"]),  # type: ignore
+                    "start": r["task"]["start"],
+                    "duration": r["media_seconds"],
+                    "frames": r["frames"],
+                }
+                for r in recording_results
+                if r["error"] is None and os.path.isfile(r["task"]["output"])  # type: ignore
+            ]
+            manifest = {
+                "kind": recording["kind"],
+                "output": os.path.basename(output),
+                "segment_duration": self.segment_duration,
+                "segments": segments,
+            }
+            with open(os.path.join(directory, MANIFEST_FILE), "w") as file:
+                json.dump(manifest, file, indent=2)
+
+            try:
+                concat_segments(directory, output)
+            except (ValueError, av.FFmpegError) as e:
+                _logger.error(f"Failed to write {output}: {e!r}")
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _log_progress(
+        self,
+        result: BatchResultDict,
+        results: list[BatchResultDict],
+        total: int,
+        start_time: float,
+    ) -> None:
+        task = result["task"]
+        name = os.path.basename(task["recording"]["path"])
+        if result["error"] is not None:
+            _logger.error(
+                f"[{len(results)}/{total}] {name} segment {task['segment']} failed: "
+                f"{result['error']}"
+            )
+            return
+
+        fps = result["frames"] / max(result["seconds"], 1e-9)
+        summary = self._summarize(results, start_time)
+        _logger.info(
+            f"[{len(results)}/{total}] {name} segment {task['segment']}: "
+            f"{result['frames']} frames in {result['seconds']:.1f}s ({fps:.0f} fps). "
+            f"Total: {summary['fps']:.0f} fps, {summary['realtime_factor']:.1f}x "
+            "real time"
+        )
+
+    def _summarize(
+        self, results: list[BatchResultDict], start_time: float
+    ) -> BatchSummaryDict:
+        seconds = time.perf_counter() - start_time
+        frames = sum(r["frames"] for r in results)
+        media_seconds = sum(r["media_seconds"] for r in results)
+        return BatchSummaryDict(
+            recordings=0,
+            tasks=len(results),
+            failed=sum(1 for r in results if r["error"] is not None),
+            frames=frames,
+            media_seconds=media_seconds,
+            seconds=seconds,
+            fps=frames / max(seconds, 1e-9),
+            realtime_factor=media_seconds / max(seconds, 1e-9),
+        )
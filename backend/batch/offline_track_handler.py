@@ -0,0 +1,48 @@
+"""Provide `OfflineTrackHandler`, a stand-in for TrackHandler when processing recordings."""
+
+from __future__ import annotations
+
+from typing import Literal
+
+from filters.filter import Filter
+from filter_api import FilterOfflineAPI
+
+
+class OfflineTrackHandler:
+    """Provides the parts of hub.track_handler.TrackHandler filters use.
+
+    Filters access the filter API and the other filters of a track through their track
+    handlers.  When processing recordings, there is no connection and no live track,
+    so OfflineTrackHandler only holds the filters and the filter API.
+    """
+
+    kind: Literal["audio", "video"]
+    filter_api: FilterOfflineAPI
+    muted: bool
+    _filters: dict[str, Filter]
+
+    def __init__(
+        self, kind: Literal["audio", "video"], filter_api: FilterOfflineAPI
+    ) -> None:
+        """Initialize new OfflineTrackHandler.
+
+        Parameters
+        ----------
+        kind : str, "audio" or "video"
+            Kind of the processed recording.
+        filter_api : filter_api.FilterOfflineAPI
+            Filter API for the filters of this track.
+        """
+        self.kind = kind
+        self.filter_api = filter_api
+        self.muted = False
+        self._filters = {}
+
+    @property
+    def filters(self) -> dict[str, Filter]:
+        """Get filters of this track, mapped by filter ID."""
+        return self._filters
+
+    def reset_execute_filters(self) -> None:
+        """Has no effect, all filters are always executed on recordings."""
+        return
@@ -0,0 +1,152 @@
+"""Entry point for batch processing recordings with filters.
+
+Examples
+--------
+Run the speaking time and OpenFace filters over all recordings of a session, using all
+cores:
+
+    python batch_main.py sessions/<session_id> --audio-filters AUDIO_SPEAKING_TIME
+        --video-filters OPENFACE_AU --output sessions/<session_id>/batch
+
+See batch.batch_runner for details.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from argparse import ArgumentParser
+
+from batch import BatchRunner, find_recordings
+from filters import FilterDict
+from filters.filter_utils import get_filter_dict, is_valid_filter_dict
+
+
+def parse_filters(value: str, channel: str) -> list[FilterDict]:
+    """Parse filters given on the command line.
+
+    Parameters
+    ----------
+    value : str
+        JSON list of filters.FilterDict, or a comma separated list of filter names.
+        Filters given by name use their default configuration.
+    channel : str, "audio" or "video"
+        Channel the filters must support.
+
+    Raises
+    ------
+    ValueError
+        If a filter is unknown, invalid or does not support `channel`.
+    """
+    value = value.strip()
+    if value == "":
+        return []
+
+    if value.startswith("["):
+        filters = json.loads(value)
+    else:
+        filter_classes = get_filter_dict()
+        filters = []
+        for name in value.split(","):
+            name = name.strip()
+            if name not in filter_classes:
+                raise ValueError(f'Unknown filter: "{name}"')
+            filter_json = filter_classes[name].get_filter_json(filter_classes[name])
+            filters.append(
+                FilterDict(
+                    name=name,
+                    id=filter_json["id"],
+                    channel=filter_json["channel"],
+                    groupFilter=filter_json["groupFilter"],
+                    config=filter_json["config"],
+                )
+            )
+
+    for filter_dict in filters:
+        if not is_valid_filter_dict(filter_dict):
+            raise ValueError(f"Invalid filter: {filter_dict}")
+        if filter_dict["groupFilter"]:
+            raise ValueError(f'Group filters are not supported: {filter_dict["name"]}')
+        if filter_dict["channel"] not in (channel, "both"):
+            raise ValueError(f'{filter_dict["name"]} is not a {channel} filter')
+    return filters
+
+
+async def main():
+    parser = ArgumentParser(description="Run filters over recordings.")
+    parser.add_argument(
+        "recordings",
+        nargs="+",
+        help="Recordings or session directories containing recordings.",
+    )
+    parser.add_argument("--audio-filters", dest="audio_filters", default="")
+    parser.add_argument("--video-filters", dest="video_filters", default="")
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        default=None,
+        help="Output directory. Default: batch_<date>_<time> next to the recordings.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=0,
+        help="Number of worker processes. Default: number of CPU cores.",
+    )
+    parser.add_argument(
+        "--segment-duration",
+        dest="segment_duration",
+        type=float,
+        default=60.0,
+        help="Duration of the segments recordings are split into, in seconds.",
+    )
+    parser.add_argument(
+        "--video-source",
+        dest="video_source",
+        choices=["raw", "filtered", "all"],
+        default="raw",
+    )
+    parser.add_argument(
+        "--annotate",
+        action="store_true",
+        help="Write the filter output into new recordings.",
+    )
+    parser.add_argument(
+        "--open-face-port", dest="open_face_port", type=int, default=5556
+    )
+    parser.add_argument("--log", dest="log", default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log))
+    audio_filters = parse_filters(args.audio_filters, "audio")
+    video_filters = parse_filters(args.video_filters, "video")
+    if len(audio_filters) == 0 and len(video_filters) == 0:
+        parser.error("No filters given.")
+
+    recordings = find_recordings(args.recordings, args.video_source)
+    if len(recordings) == 0:
+        parser.error("No recordings found.")
+
+    output = args.output
+    if output is None:
+        directory = os.path.dirname(os.path.abspath(recordings[0]["path"]))
+        output = os.path.join(directory, time.strftime("batch_%Y%m%d_%H%M%S"))
+
+    runner = BatchRunner(
+        output,
+        audio_filters,
+        video_filters,
+        args.workers,
+        args.segment_duration,
+        args.annotate,
+        args.open_face_port,
+    )
+    await runner.run(recordings)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,5 @@
+"""Benchmarks for the experimental hub backend.
+
+Benchmarks are executed as modules from the `backend` folder, e.g.:
+`python -m benchmarks.open_face_transport`.  See `benchmarks/README.md`.
+"""
@@ -0,0 +1,492 @@
+"""Benchmark `Filter.process` of all filters on fixture clips.
+
+Discovers all filters in the filter registry (`filters.filter_utils.get_filter_dict`),
+creates each with the default config from `get_filter_json` and runs it over fixture
+clips for several video resolutions and audio sample rates.  Every frame is converted
+to and from NumPy like in hub.track_handler.TrackHandler, so the results show the
+latency a filter adds to a live stream.  A pass without filters measures the
+conversions alone.
+
+Per filter and clip, the latency of `process` and of the full frame (including the
+conversions) is reported, as well as the achieved frame rate compared to a budget and
+the memory allocated (traced with `tracemalloc`, which includes NumPy arrays but not
+frames allocated by FFmpeg).  Filters whose backend is not available (see
+`get_unavailable_reason`) are skipped, their results would only measure the fallback.  With `--baseline`, results are compared to a previous
+`--output` from the same machine and the benchmark fails on regressions.
+
+Usage (from the `backend` folder):
+`python -m benchmarks.filter_process --frames 200 --output filters.json`
+"""
+
+import asyncio
+import fractions
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from typing import Literal
+
+import av
+import numpy
+from av import AudioFrame, AudioResampler, VideoFrame
+
+import hub.hub  # noqa: F401, import before filters to avoid a circular import
+from batch.offline_track_handler import OfflineTrackHandler
+from filter_api import FilterOfflineAPI
+from filters import Filter, FilterDict
+from filters.filter_factory import create_filter
+from filters.filter_utils import get_filter_dict
+from filters.open_face_au import open_face_pool
+
+RESOLUTIONS = ("320x240", "640x480", "1280x720")
+"""Default video resolutions of the fixture clips."""
+
+SAMPLE_RATES = (16000, 48000)
+"""Default audio sample rates of the fixture clips."""
+
+CLIP_FRAMES = 60
+"""Number of frames in a fixture clip, clips are looped."""
+
+AUDIO_FRAME_DURATION = 0.02
+"""Duration of an audio frame in seconds, as received from WebRTC clients."""
+
+BASELINE_FILTER = "(conversion only)"
+"""Name of the pass without filters in the results."""
+
+
+def create_video_clip(
+    width: int, height: int, path: str | None = None
+) -> list[VideoFrame]:
+    """Create a fixture clip of `CLIP_FRAMES` yuv420p frames, like decoded WebRTC video.
+
+    Parameters
+    ----------
+    width, height : int
+        Resolution of the clip.
+    path : str, optional
+        Video file the clip is read from (scaled to the resolution).  If not set, a
+        synthetic clip with a moving rectangle on a noisy gradient is created.
+    """
+    if path is not None:
+        frames = []
+        with av.open(path) as container:
+            for decoded in container.decode(video=0):
+                frame = decoded.reformat(width=width, height=height, format="yuv420p")
+                frame.pts = decoded.pts
+                frame.time_base = decoded.time_base
+                frames.append(frame)
+                if len(frames) == CLIP_FRAMES:
+                    break
+        return frames
+
+    rng = numpy.random.default_rng(0)
+    gradient = numpy.linspace(0, 255, width, dtype=numpy.float32)[None, :, None]
+    frames = []
+    for i in range(CLIP_FRAMES):
+        image = numpy.repeat(numpy.repeat(gradient, height, 0), 3, 2)
+        image += rng.normal(0, 8, image.shape).astype(numpy.float32)
+        x = (i * width // CLIP_FRAMES) % (width - width // 4)
+        image[height // 3 : height * 2 // 3, x : x + width // 4] = (40, 180, 220)
+        image = image.clip(0, 255).astype(numpy.uint8)
+        frame = VideoFrame.from_ndarray(image, format="bgr24").reformat(
+            format="yuv420p"
+        )
+        frame.pts = i * 3000
+        frame.time_base = fractions.Fraction(1, 90000)
+        frames.append(frame)
+    return frames
+
+
+def create_audio_clip(sample_rate: int, path: str | None = None) -> list[AudioFrame]:
+    """Create a fixture clip of `CLIP_FRAMES` s16 stereo frames, like WebRTC audio.
+
+    Parameters
+    ----------
+    sample_rate : int
+        Sample rate of the clip.
+    path : str, optional
+        Audio file the clip is read from (resampled).  If not set, a synthetic clip is
+        created, alternating between a noisy tone and silence every 0.5 seconds.
+    """
+    samples = round(sample_rate * AUDIO_FRAME_DURATION)
+    if path is not None:
+        frames = []
+        resampler = AudioResampler("s16", "stereo", sample_rate, frame_size=samples)
+        with av.open(path) as container:
+            for decoded in container.decode(audio=0):
+                frames.extend(resampler.resample(decoded))
+                if len(frames) >= CLIP_FRAMES:
+                    break
+        return frames[:CLIP_FRAMES]
+
+    rng = numpy.random.default_rng(0)
+    frames = []
+    for i in range(CLIP_FRAMES):
+        t = (numpy.arange(samples) + i * samples) / sample_rate
+        speaking = int(i * AUDIO_FRAME_DURATION / 0.5) % 2 == 0
+        signal = numpy.sin(2 * numpy.pi * 440 * t) * (8000 if speaking else 0)
+        signal += rng.normal(0, 50, samples)
+        stereo = numpy.repeat(signal.astype(numpy.int16), 2)[None, :]
+        frame = AudioFrame.from_ndarray(stereo, format="s16", layout="stereo")
+        frame.sample_rate = sample_rate
+        frame.pts = i * samples
+        frame.time_base = fractions.Fraction(1, sample_rate)
+        frames.append(frame)
+    return frames
+
+
+def get_unavailable_reason(filter_class: type[Filter]) -> str | None:
+    """Get why the backend of `filter_class` is not available, or None if it is."""
+    name = filter_class.name(filter_class)
+    if name == "OPENFACE_AU" and open_face_pool.get_endpoint() is None:
+        return "OpenFace worker pool is not running"
+    return None
+
+
+def get_filter_kinds(filter_class: type[Filter]) -> list[Literal["audio", "video"]]:
+    """Get the kinds of tracks `filter_class` is benchmarked on."""
+    channel = filter_class.get_filter_json(filter_class)["channel"]
+    return ["audio", "video"] if channel == "both" else [channel]
+
+
+def get_default_config(filter_class: type[Filter]) -> FilterDict:
+    """Get the default config of `filter_class`, see `Filter.get_filter_json`."""
+    return json.loads(json.dumps(filter_class.get_filter_json(filter_class)))
+
+
+async def create_filters(
+    filter_class: type[Filter] | None, kind: Literal["audio", "video"]
+) -> tuple[Filter | None, list[Filter]]:
+    """Create a filter with its default config and the filters it requires.
+
+    Required filters (`requiresOtherFilter` in the config) are created with their
+    default config on the track handler of their channel.
+
+    Returns
+    -------
+    tuple of filters.Filter or None and list of filters.Filter
+        The benchmarked filter and all created filters, for cleanup.
+    """
+    if filter_class is None:
+        return None, []
+    filter_api = FilterOfflineAPI()
+    handlers = {
+        "audio": OfflineTrackHandler("audio", filter_api),
+        "video": OfflineTrackHandler("video", filter_api),
+    }
+    registry = get_filter_dict()
+    config = get_default_config(filter_class)
+    config["channel"] = kind
+    created = []
+    for option in config["config"].values():
+        if not isinstance(option, dict) or not option.get("requiresOtherFilter"):
+            continue
+        required_config = get_default_config(registry[option["defaultValue"][0]])
+        required_kind = get_filter_kinds(registry[required_config["name"]])[0]
+        required = create_filter(
+            required_config, handlers["audio"], handlers["video"]  # type: ignore
+        )
+        handlers[required_kind].filters[required_config["id"]] = required
+        created.append(required)
+        option["value"] = required_config["id"]
+
+    benchmarked = create_filter(
+        config, handlers["audio"], handlers["video"]  # type: ignore
+    )
+    handlers[kind].filters[config["id"]] = benchmarked
+    created.append(benchmarked)
+    await asyncio.gather(*[f.complete_setup() for f in created])
+    return benchmarked, created
+
+
+async def process_frame(
+    active_filter: Filter | None, frame: VideoFrame | AudioFrame
+) -> tuple[float, float]:
+    """Process `frame` like hub.track_handler.TrackHandler.
+
+    Returns
+    -------
+    tuple of float
+        Duration of `process` and of the full frame, including the NumPy conversions.
+    """
+    start = time.perf_counter()
+    if isinstance(frame, VideoFrame):
+        ndarray = frame.to_ndarray(format="bgr24")
+    else:
+        ndarray = frame.to_ndarray()
+    process_start = time.perf_counter()
+    if active_filter is not None:
+        ndarray = await active_filter.process(frame, ndarray)
+    process_end = time.perf_counter()
+    if isinstance(frame, VideoFrame):
+        new_frame = VideoFrame.from_ndarray(ndarray, format="bgr24")
+        new_frame.time_base = frame.time_base
+        new_frame.pts = frame.pts
+    else:
+        new_frame = AudioFrame.from_ndarray(ndarray)
+        new_frame.pts = frame.pts
+        new_frame.time_base = frame.time_base
+        new_frame.sample_rate = frame.sample_rate
+    end = time.perf_counter()
+    return process_end - process_start, end - start
+
+
+async def benchmark_filter(
+    filter_class: type[Filter] | None,
+    kind: Literal["audio", "video"],
+    clip: list[VideoFrame] | list[AudioFrame],
+    args,
+) -> dict:
+    """Benchmark `filter_class` on `clip`.  None benchmarks the conversions only."""
+    active_filter, created = await create_filters(filter_class, kind)
+    process_times = []
+    total_times = []
+    peaks = []
+    try:
+        for i in range(args.warmup + args.frames):
+            process, total = await process_frame(active_filter, clip[i % len(clip)])
+            if i >= args.warmup:
+                process_times.append(process * 1000)
+                total_times.append(total * 1000)
+            # Allow tasks started by filters to run, as they would live.
+            await asyncio.sleep(0)
+
+        # Trace allocations in a separate pass, tracing slows down allocations.
+        tracemalloc.start()
+        start_size, _ = tracemalloc.get_traced_memory()
+        for i in range(args.allocation_frames):
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await process_frame(active_filter, clip[i % len(clip)])
+            peaks.append(tracemalloc.get_traced_memory()[1] - size)
+            await asyncio.sleep(0)
+        end_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        await asyncio.gather(*[f.cleanup() for f in created])
+
+    if kind == "video":
+        budget_fps = args.budget_fps
+    else:
+        budget_fps = 1 / AUDIO_FRAME_DURATION
+    total_ms = _stats(total_times)
+    return {
+        "process_ms": _stats(process_times),
+        "total_ms": total_ms,
+        "fps": round(1000 / total_ms["mean"], 1) if total_ms["mean"] > 0 else None,
+        "budget_fps": budget_fps,
+        "within_budget": total_ms["p95"] <= 1000 / budget_fps,
+        "allocated_kib_per_frame": _stats([peak / 1024 for peak in peaks]),
+        "retained_kib": round((end_size - start_size) / 1024, 1),
+    }
+
+
+async def run_benchmarks(args) -> list[dict]:
+    """Benchmark all selected filters on all fixture clips."""
+    registry = get_filter_dict()
+    filter_classes: dict[str, type[Filter] | None] = {BASELINE_FILTER: None}
+    for name, filter_class in sorted(registry.items()):
+        # Mute filters are not part of the filter pipeline, see TrackHandler.
+        if filter_class.filter_type(filter_class) == "NONE":
+            continue
+        if args.filters is None or name in args.filters:
+            filter_classes[name] = filter_class
+
+    clips: dict[str, dict[str, list]] = {"video": {}, "audio": {}}
+    for resolution in args.resolutions:
+        width, height = (int(v) for v in resolution.split("x"))
+        clips["video"][resolution] = create_video_clip(width, height, args.video_clip)
+    for sample_rate in args.sample_rates:
+        clips["audio"][f"{sample_rate}Hz"] = create_audio_clip(
+            sample_rate, args.audio_clip
+        )
+
+    results = []
+    for name, filter_class in filter_classes.items():
+        if filter_class is None:
+            kinds: list[Literal["audio", "video"]] = ["audio", "video"]
+        else:
+            kinds = get_filter_kinds(filter_class)
+        for kind in kinds:
+            for fixture, clip in clips[kind].items():
+                result = {"filter": name, "kind": kind, "fixture": fixture}
+                reason = None
+                if filter_class is not None:
+                    reason = get_unavailable_reason(filter_class)
+                if reason is not None:
+                    result["skipped"] = reason
+                    results.append(result)
+                    _print_result(result)
+                    continue
+                try:
+                    result |= await asyncio.wait_for(
+                        benchmark_filter(filter_class, kind, clip, args), args.timeout
+                    )
+                except Exception as error:
+                    result["error"] = repr(error)
+                results.append(result)
+                _print_result(result)
+    return results
+
+
+def compare_to_baseline(
+    results: list[dict], path: str, tolerance: float, min_difference: float
+) -> list[str]:
+    """Compare the `total_ms` p50 of `results` to a previous output at `path`.
+
+    Returns
+    -------
+    list of str
+        Descriptions of the regressions, where the p50 grew by more than `tolerance`
+        (ratio) and by more than `min_difference` milliseconds.  The latter ignores
+        noise of frames processed in microseconds.
+    """
+    with open(path) as file:
+        baseline = {
+            (r["filter"], r["kind"], r["fixture"]): r
+            for r in json.load(file)["results"]
+        }
+
+    regressions = []
+    for result in results:
+        key = (result["filter"], result["kind"], result["fixture"])
+        previous = baseline.get(key)
+        label = f"{key[0]} ({key[1]}, {key[2]})"
+        if previous is None or "error" in previous or "skipped" in previous:
+            print(f"{label}: no baseline")
+            continue
+        if "skipped" in result:
+            print(f"{label}: skipped, {result['skipped']}")
+            continue
+        if "error" in result:
+            regressions.append(f"{label}: failed, {result['error']}")
+            continue
+        p50, previous_p50 = result["total_ms"]["p50"], previous["total_ms"]["p50"]
+        ratio = p50 / max(previous_p50, 1e-6)
+        print(f"{label}: p50 {ratio:.2f}x baseline")
+        if ratio > tolerance and p50 - previous_p50 > min_difference:
+            regressions.append(f"{label}: p50 {ratio:.2f}x baseline")
+    return regressions
+
+
+def _print_result(result: dict) -> None:
+    label = f"{result['filter']:>26} {result['kind']:>5} {result['fixture']:>9}"
+    if "error" in result:
+        print(f"{label}: failed, {result['error']}")
+        return
+    if "skipped" in result:
+        print(f"{label}: skipped, {result['skipped']}")
+        return
+    total_ms = result["total_ms"]
+    print(
+        f"{label}: process p50 {result['process_ms']['p50']:8.3f}ms | total p50 "
+        f"{total_ms['p50']:8.3f}ms, p95 {total_ms['p95']:8.3f}ms, p99 "
+        f"{total_ms['p99']:8.3f}ms | {result['fps']:8.1f} fps "
+        f"({'ok' if result['within_budget'] else 'OVER BUDGET'}) | "
+        f"{result['allocated_kib_per_frame']['mean']:9.1f} KiB/frame"
+    )
+
+
+def _stats(values: list[float]) -> dict:
+    """Get mean, percentiles and maximum for `values`."""
+    if len(values) == 0:
+        return {}
+    data = numpy.array(values)
+    return {
+        "mean": round(float(data.mean()), 3),
+        "p50": round(float(numpy.percentile(data, 50)), 3),
+        "p95": round(float(numpy.percentile(data, 95)), 3),
+        "p99": round(float(numpy.percentile(data, 99)), 3),
+        "max": round(float(data.max()), 3),
+    }
+
+
+async def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--filters", nargs="+", help="Names of the benchmarked filters, default all."
+    )
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument(
+        "--warmup", type=int, default=10, help="Frames processed before measuring."
+    )
+    parser.add_argument(
+        "--allocation-frames",
+        type=int,
+        default=20,
+        help="Frames processed with tracemalloc to measure allocations.",
+    )
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS))
+    parser.add_argument(
+        "--sample-rates", type=int, nargs="+", default=list(SAMPLE_RATES)
+    )
+    parser.add_argument(
+        "--video-clip", help="Video file used as clip instead of synthetic video."
+    )
+    parser.add_argument(
+        "--audio-clip", help="Audio file used as clip instead of synthetic audio."
+    )
+    parser.add_argument(
+        "--budget-fps",
+        type=float,
+        default=30,
+        help="Video frame rate a filter must sustain.  Audio must run in real time.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=120,
+        help="Seconds after which the benchmark of a filter on a clip is aborted.",
+    )
+    parser.add_argument("--output", help="Optional path for a JSON result file.")
+    parser.add_argument("--baseline", help="Previous --output to compare against.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="Maximum ratio of p50 to the baseline before failing.",
+    )
+    parser.add_argument(
+        "--min-difference",
+        type=float,
+        default=0.1,
+        help="Minimum increase of p50 in milliseconds before failing.",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+        },
+        "frames": args.frames,
+        "budget_fps": args.budget_fps,
+        "video_clip": args.video_clip,
+        "audio_clip": args.audio_clip,
+        "results": await run_benchmarks(args),
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results["results"], args.baseline, args.tolerance, args.min_difference
+        )
+        if regressions:
+            print("Regressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
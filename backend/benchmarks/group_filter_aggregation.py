@@ -0,0 +1,518 @@
+"""Simulate group filter aggregation for a growing number of participants.
+
+Simulated participants process synthetic frames with a group filter (default
+`TEMPLATE_GF`, see group_filters.template) at a configurable rate with jitter, and send
+the results through the real transport (`GroupFilterSender`, see
+group_filters.group_filter_broker) to a `GroupFilterBroker` with the
+`GroupFilterAggregator` of the group filter.  Like the participant connections of the
+hub, the participants run in separate processes, the broker and aggregator run on the
+event loop of the benchmark, like on the hub or the aggregation process of an
+experiment.
+
+Every message triggers one aggregation for each combination of
+`num_participants_in_aggregation` participants with enough data, so the cost of a
+message grows combinatorially with the number of participants.  For every participant
+count and rate of the sweep, the benchmark reports the message rates, the duration of
+the aggregation step per message, the end-to-end latency from sending to the
+aggregation result, the backlog of messages queued for the aggregator and the messages
+dropped by the senders.  Use it to size group filter studies before running them.
+
+Usage (from the `backend` folder):
+`python -m benchmarks.group_filter_aggregation --participants 2 4 8 16 --rate 30`
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import threading
+import time
+from argparse import ArgumentParser
+from math import comb
+from multiprocessing.sharedctypes import SynchronizedArray
+from time import perf_counter, time_ns
+from typing import Any, Literal
+from uuid import uuid4
+
+import numpy
+from av import AudioFrame, VideoFrame
+
+import hub.hub  # noqa: F401, import before filters to avoid a circular import
+from filters import FilterDict
+from group_filters import GroupFilter, GroupFilterAggregator
+from group_filters.group_filter_broker import (
+    GroupFilterBroker,
+    GroupFilterSender,
+    get_group_filter_endpoint,
+    get_topic,
+)
+from group_filters.group_filter_factory import create_group_filter
+from group_filters.group_filter_utils import get_group_filter_dict
+
+FILTER_ID = "benchmark"
+"""ID of the simulated group filter."""
+
+CLIP_FRAMES = 30
+"""Number of synthetic frames per participant, frames are looped."""
+
+SAMPLE_INTERVAL = 0.25
+"""Interval in seconds in which the backlog of the aggregator is sampled."""
+
+AUDIO_SAMPLE_RATE = 48000
+AUDIO_FRAME_DURATION = 0.02
+"""Sample rate and duration of synthetic audio frames, as received from WebRTC."""
+
+
+class MeasuredAggregator(GroupFilterAggregator):
+    """GroupFilterAggregator measuring `handle_message`, see `benchmark_point`."""
+
+    received: int
+    aggregations: int
+    failed: int
+    cycles: list[float]
+    latencies: list[float]
+
+    def __init__(
+        self, kind: Literal["video", "audio"], group_filter: type[GroupFilter]
+    ) -> None:
+        super().__init__(kind, group_filter)  # type: ignore[arg-type]
+        self.received = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the measurements, except the number of received messages."""
+        self.aggregations = 0
+        self.failed = 0
+        self.cycles = []
+        self.latencies = []
+
+    def handle_message(self, message: dict) -> list[tuple[tuple[str, ...], Any]]:
+        """Measure the aggregation step and the latency since `message` was sent."""
+        self.received += 1
+        start = perf_counter()
+        try:
+            results = super().handle_message(message)
+        except Exception:
+            # Counted and re-raised, the broker handles the exception like on the hub.
+            self.failed += 1
+            raise
+        self.cycles.append((perf_counter() - start) * 1000)
+        self.latencies.append((time_ns() - message["time"]) / 1_000_000)
+        self.aggregations += len(results)
+        return results
+
+
+class CountingSender(GroupFilterSender):
+    """GroupFilterSender counting sent and dropped messages in shared memory."""
+
+    _counts: SynchronizedArray
+    _index: int
+
+    def __init__(self, endpoint: str, counts: SynchronizedArray, index: int) -> None:
+        super().__init__(endpoint)
+        self._counts = counts
+        self._index = index
+
+    def send(self, topic: str, message: Any) -> bool:
+        """Send `message` and count it as sent or dropped."""
+        sent = super().send(topic, message)
+        self._counts[2 * self._index + (0 if sent else 1)] += 1
+        return sent
+
+
+class StartSignal:
+    """Start time, shared with the sender processes once they are ready."""
+
+    def __init__(self, value: Any, event: Any) -> None:
+        self._value = value
+        self._event = event
+
+    @property
+    def value(self) -> float:
+        return self._value.value
+
+    def set(self, start_time: float) -> None:
+        self._value.value = start_time
+        self._event.set()
+
+    def wait(self) -> None:
+        self._event.wait()
+
+
+def apply_overrides(group_filter: type[GroupFilter], overrides: dict) -> None:
+    """Override the class attributes of `group_filter`, e.g. `batch_size`."""
+    for name, value in overrides.items():
+        setattr(group_filter, name, value)
+
+
+def create_frames(
+    kind: str, width: int, height: int, seed: int
+) -> list[tuple[VideoFrame | AudioFrame, numpy.ndarray]]:
+    """Create synthetic frames with their ndarray, as passed to group filters."""
+    rng = numpy.random.default_rng(seed)
+    frames: list[tuple[VideoFrame | AudioFrame, numpy.ndarray]] = []
+    for _ in range(CLIP_FRAMES):
+        if kind == "video":
+            ndarray = rng.integers(0, 256, (height, width, 3), dtype=numpy.uint8)
+            frames.append((VideoFrame.from_ndarray(ndarray, format="bgr24"), ndarray))
+        else:
+            samples = int(AUDIO_SAMPLE_RATE * AUDIO_FRAME_DURATION)
+            ndarray = rng.integers(-3000, 3000, (1, samples * 2), dtype=numpy.int16)
+            frame = AudioFrame.from_ndarray(ndarray, format="s16", layout="stereo")
+            frame.sample_rate = AUDIO_SAMPLE_RATE
+            frames.append((frame, ndarray))
+    return frames
+
+
+def run_participants(
+    endpoint: str,
+    indices: list[int],
+    config: FilterDict,
+    kind: str,
+    settings: dict,
+    counts: SynchronizedArray,
+    ready: Any,
+    start: StartSignal,
+) -> None:
+    """Entry point of a sender process, simulates the participants with `indices`."""
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(
+        send_data(endpoint, indices, config, kind, settings, counts, ready, start)
+    )
+
+
+async def send_data(
+    endpoint: str,
+    indices: list[int],
+    config: FilterDict,
+    kind: str,
+    settings: dict,
+    counts: SynchronizedArray,
+    ready: Any,
+    start: StartSignal,
+) -> None:
+    """Process frames and send the data of participants until the end of the run.
+
+    Every participant sends `rate` frames per second, with a random phase and every
+    frame shifted by a uniformly distributed jitter of up to +/- `jitter_ms`.  Send
+    times are scheduled from the start, so late frames do not reduce the rate.
+    """
+    group_filter = get_group_filter_dict()[config["name"]]
+    apply_overrides(group_filter, settings["overrides"])
+    rate = settings["rate"]
+    jitter = settings["jitter_ms"] / 1000
+
+    senders = []
+    participants = []
+    for index in indices:
+        sender = CountingSender(endpoint, counts, index)
+        participant = create_group_filter(config, f"participant-{index}")
+        participant.set_sender(sender, get_topic(kind, config["id"]))
+        senders.append(sender)
+        participants.append(participant)
+    frames = [
+        create_frames(kind, settings["width"], settings["height"], index)
+        for index in indices
+    ]
+    ready.put(indices)
+    await asyncio.get_running_loop().run_in_executor(None, start.wait)
+    start_time = start.value
+    end_time = start_time + settings["run_duration"]
+
+    async def run(participant: GroupFilter, clip: list, seed: int) -> None:
+        rng = random.Random(seed)
+        phase = rng.uniform(0, 1 / rate)
+        k = 0
+        while True:
+            target = start_time + phase + k / rate + rng.uniform(-jitter, jitter)
+            if target >= end_time:
+                return
+            await asyncio.sleep(max(target - time.time(), 0))
+            frame, ndarray = clip[k % len(clip)]
+            await participant.process_individual_frame_and_send_data_to_aggregator(
+                frame, ndarray, time_ns()
+            )
+            k += 1
+
+    await asyncio.gather(
+        *[run(p, clip, i) for p, clip, i in zip(participants, frames, indices)]
+    )
+    for participant, sender in zip(participants, senders):
+        await participant.cleanup()
+        sender.close()
+
+
+async def benchmark_point(
+    participants: int, rate: float, group_filter: type[GroupFilter], args: Any
+) -> dict:
+    """Run the simulation for `participants` participants sending `rate` messages/s.
+
+    The broker and the aggregator run on this event loop, the participants in
+    `args.sender_processes` processes.  Measurements start after `args.warmup`
+    seconds.  After the participants stopped, the benchmark waits up to
+    `args.drain_timeout` seconds for the aggregator to process the backlog.
+    """
+    kind = args.kind
+    config = FilterDict(
+        name=group_filter.name(),
+        id=FILTER_ID,
+        channel=kind,
+        groupFilter=True,
+        config={},
+    )
+    endpoint = get_group_filter_endpoint(f"benchmark-{uuid4()}")
+    aggregator = MeasuredAggregator(kind, group_filter)
+    broker = GroupFilterBroker(endpoint)
+    broker.start()
+    broker.set_aggregators(kind, {FILTER_ID: aggregator})
+
+    settings = {
+        "rate": rate,
+        "jitter_ms": args.jitter,
+        "width": args.width,
+        "height": args.height,
+        "run_duration": args.warmup + args.duration,
+        "overrides": args.overrides,
+    }
+    context = multiprocessing.get_context("spawn")
+    counts = context.Array("q", 2 * participants, lock=False)
+    ready = context.Queue()
+    start_signal = StartSignal(context.Value("d", 0.0, lock=False), context.Event())
+    num_processes = max(1, min(args.sender_processes, participants))
+    processes = [
+        context.Process(
+            target=run_participants,
+            args=(
+                endpoint,
+                list(range(i, participants, num_processes)),
+                config,
+                kind,
+                settings,
+                counts,
+                ready,
+                start_signal,
+            ),
+            daemon=True,
+        )
+        for i in range(num_processes)
+    ]
+    loop = asyncio.get_running_loop()
+    try:
+        for process in processes:
+            process.start()
+        for _ in processes:
+            await loop.run_in_executor(None, ready.get, True, 60)
+
+        start_time = time.time() + 0.5
+        start_signal.set(start_time)
+        await asyncio.sleep(max(start_time + args.warmup - time.time(), 0))
+
+        def sent() -> int:
+            return sum(counts[0::2])
+
+        def dropped() -> int:
+            return sum(counts[1::2])
+
+        aggregator.reset()
+        sent_start, dropped_start = sent(), dropped()
+        received_start = aggregator.received
+        cpu_start, measure_start = time.process_time(), time.time()
+        backlog: list[tuple[float, int]] = []
+        stopped = threading.Event()
+
+        def sample_backlog() -> None:
+            # Sampled from a thread, so samples are not delayed by the aggregator.
+            while not stopped.wait(SAMPLE_INTERVAL):
+                backlog.append(
+                    (time.time() - measure_start, sent() - aggregator.received)
+                )
+
+        sampler = threading.Thread(target=sample_backlog, daemon=True)
+        sampler.start()
+        await asyncio.sleep(args.duration)
+        stopped.set()
+        sampler.join()
+        elapsed = time.time() - measure_start
+        cpu = time.process_time() - cpu_start
+        num_sent, num_dropped = sent() - sent_start, dropped() - dropped_start
+        num_received = aggregator.received - received_start
+        cycles, latencies = list(aggregator.cycles), list(aggregator.latencies)
+        aggregations, failed = aggregator.aggregations, aggregator.failed
+
+        for process in processes:
+            await loop.run_in_executor(None, process.join, args.drain_timeout)
+        drain_start = time.time()
+        while (
+            aggregator.received < sent()
+            and time.time() - drain_start < args.drain_timeout
+        ):
+            await asyncio.sleep(0.05)
+        drain_s = time.time() - drain_start
+        undrained = sent() - aggregator.received
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        await broker.stop()
+
+    growth = 0.0
+    if len(backlog) > 1:
+        growth = float(numpy.polyfit(*zip(*backlog), 1)[0])
+    keeps_up = num_dropped == 0 and failed == 0 and growth < 0.01 * num_sent / elapsed
+    combinations = group_filter.num_participants_in_aggregation
+    batch_size = max(group_filter.batch_size, 1)
+    return {
+        "participants": participants,
+        "rate": rate,
+        "combinations": (
+            1 if combinations == "all" else comb(participants, int(combinations))
+        ),
+        "expected_per_s": round(participants * rate / batch_size, 1),
+        "sent_per_s": round(num_sent / elapsed, 1),
+        "received_per_s": round(num_received / elapsed, 1),
+        "aggregations_per_s": round(aggregations / elapsed, 1),
+        "cycle_ms": _stats(cycles),
+        "latency_ms": _stats(latencies),
+        "backlog": _stats([b for _, b in backlog]),
+        "backlog_growth_per_s": round(growth, 1),
+        "dropped": num_dropped,
+        "dropped_ratio": round(num_dropped / max(num_sent + num_dropped, 1), 4),
+        "failed": failed,
+        "aggregator_load_percent": round(sum(cycles) / 1000 / elapsed * 100, 1),
+        "cpu_percent": round(cpu / elapsed * 100, 1),
+        "drain_s": round(drain_s, 3),
+        "undrained": undrained,
+        "keeps_up": keeps_up,
+    }
+
+
+def _stats(values: list[float]) -> dict:
+    """Get mean, percentiles and maximum for `values`."""
+    if len(values) == 0:
+        return {}
+    data = numpy.array(values)
+    return {
+        "mean": round(float(data.mean()), 3),
+        "p50": round(float(numpy.percentile(data, 50)), 3),
+        "p95": round(float(numpy.percentile(data, 95)), 3),
+        "p99": round(float(numpy.percentile(data, 99)), 3),
+        "max": round(float(data.max()), 3),
+    }
+
+
+def _parse_num_participants(value: str) -> int | str:
+    """Parse `--num-participants-in-aggregation`, an int or "all"."""
+    return value if value == "all" else int(value)
+
+
+async def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--participants", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument(
+        "--rate",
+        type=float,
+        nargs="+",
+        default=[30],
+        help="Frames per second and participant, e.g. 30 for video, 50 for audio.",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=5,
+        help="Maximum deviation of a frame from its schedule, in milliseconds.",
+    )
+    parser.add_argument("--group-filter", default="TEMPLATE_GF")
+    parser.add_argument("--kind", choices=["video", "audio"], default="video")
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--height", type=int, default=48)
+    parser.add_argument(
+        "--num-participants-in-aggregation",
+        type=_parse_num_participants,
+        help="Override the attribute of the group filter, an int or 'all'.",
+    )
+    parser.add_argument(
+        "--data-len", type=int, help="Override `data_len_per_participant`."
+    )
+    parser.add_argument("--batch-size", type=int, help="Override `batch_size`.")
+    parser.add_argument(
+        "--batch-window", type=float, help="Override `batch_window`, in milliseconds."
+    )
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument(
+        "--warmup", type=float, default=2, help="Seconds sent before measuring."
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=10,
+        help="Maximum seconds to wait for the backlog after the participants stopped.",
+    )
+    parser.add_argument(
+        "--sender-processes",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+        help="Processes the participants are distributed over.",
+    )
+    parser.add_argument("--output", help="Optional path for a JSON result file.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    group_filters = get_group_filter_dict()
+    if args.group_filter not in group_filters:
+        parser.error(
+            f"Unknown group filter {args.group_filter}, available: "
+            + ", ".join(group_filters)
+        )
+    group_filter = group_filters[args.group_filter]
+    args.overrides = {
+        name: value
+        for name, value in [
+            ("num_participants_in_aggregation", args.num_participants_in_aggregation),
+            ("data_len_per_participant", args.data_len),
+            ("batch_size", args.batch_size),
+            ("batch_window", args.batch_window),
+        ]
+        if value is not None
+    }
+    apply_overrides(group_filter, args.overrides)
+
+    results = {
+        "platform": platform.platform(),
+        "group_filter": args.group_filter,
+        "kind": args.kind,
+        "num_participants_in_aggregation": group_filter.num_participants_in_aggregation,
+        "data_len_per_participant": group_filter.data_len_per_participant,
+        "batch_size": group_filter.batch_size,
+        "batch_window": group_filter.batch_window,
+        "jitter_ms": args.jitter,
+        "duration": args.duration,
+        "sweep": [],
+    }
+    for rate in args.rate:
+        for participants in args.participants:
+            r = await benchmark_point(participants, rate, group_filter, args)
+            results["sweep"].append(r)
+            print(
+                f"{participants:>3} participants @ {rate:g}/s: sent "
+                f"{r['sent_per_s']:8.1f} msg/s, received {r['received_per_s']:8.1f} "
+                f"msg/s, {r['aggregations_per_s']:9.1f} aggregations/s | cycle p50 "
+                f"{r['cycle_ms'].get('p50', 0):7.3f}ms, p95 "
+                f"{r['cycle_ms'].get('p95', 0):7.3f}ms | latency p50 "
+                f"{r['latency_ms'].get('p50', 0):8.2f}ms, p95 "
+                f"{r['latency_ms'].get('p95', 0):8.2f}ms | backlog max "
+                f"{r['backlog'].get('max', 0):6.0f}, growth "
+                f"{r['backlog_growth_per_s']:7.1f}/s | dropped {r['dropped']} | "
+                f"load {r['aggregator_load_percent']:5.1f}%"
+                + ("" if r["keeps_up"] else " | FALLING BEHIND")
+            )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,201 @@
+"""Benchmark the offer -> answer time of connections for different ICE settings.
+
+Measures the time the hub needs to answer an offer, which is dominated by ICE
+candidate gathering, for the main connection of a client (`connection_factory`) and for
+sub-connections (`SubConnection.handle_offer`).  The offers are created by local aiortc
+clients, only host candidates are used on the client side.
+
+Usage (from the `backend` folder):
+`python -m benchmarks.ice_offer_answer --runs 5 --sub-connections 3`
+"""
+
+import asyncio
+import json
+import logging
+import time
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+import numpy
+from aiortc import RTCConfiguration, RTCPeerConnection
+from aiortc.mediastreams import AudioStreamTrack, VideoStreamTrack
+
+from connection.connection import connection_factory
+from connection.ice import configure_ice
+from connection.sub_connection import SubConnection
+from filter_api import FilterOfflineAPI
+from server import Config
+
+MODES = ("config", "host-only", "unreachable-stun")
+"""ICE settings to compare.
+
+`config` uses the ICE settings in `config.json`, `host-only` only gathers host
+candidates and `unreachable-stun` uses a STUN server that does not respond, as on
+air-gapped machines.
+"""
+
+
+def get_ice_config(mode: str, gathering_timeout: float | None) -> SimpleNamespace:
+    """Get the ICE settings for `mode`, based on the hub config."""
+    config = Config()
+    ice_config = SimpleNamespace(
+        ice_servers=config.ice_servers,
+        ice_host_only=config.ice_host_only,
+        ice_gathering_timeout=config.ice_gathering_timeout,
+        ice_port_range=config.ice_port_range,
+    )
+    if mode == "host-only":
+        ice_config.ice_host_only = True
+    elif mode == "unreachable-stun":
+        # TEST-NET-1 address, reserved for documentation, never responds.
+        ice_config.ice_servers = [{"urls": "stun:192.0.2.1:3478"}]
+        ice_config.ice_host_only = False
+    if gathering_timeout is not None:
+        ice_config.ice_gathering_timeout = gathering_timeout
+    return ice_config
+
+
+def _create_client() -> RTCPeerConnection:
+    return RTCPeerConnection(RTCConfiguration(iceServers=[]))
+
+
+async def _noop_handler(_) -> None:
+    return
+
+
+async def benchmark_main_connection() -> float:
+    """Get the offer -> answer time of a main connection in milliseconds."""
+    client = _create_client()
+    client.addTrack(AudioStreamTrack())
+    client.addTrack(VideoStreamTrack())
+    client.createDataChannel("API")
+    await client.setLocalDescription(await client.createOffer())
+
+    start = time.perf_counter()
+    _, connection = await connection_factory(
+        client.localDescription,
+        _noop_handler,
+        "benchmark",
+        [],
+        [],
+        [],
+        [],
+        FilterOfflineAPI(),
+        [False, "", 0, False],
+    )
+    duration = (time.perf_counter() - start) * 1000
+
+    await connection.stop()
+    await client.close()
+    return duration
+
+
+async def benchmark_sub_connection() -> float:
+    """Get the offer -> answer time of a sub-connection in milliseconds."""
+    sub_connection = SubConnection(
+        "benchmark", VideoStreamTrack(), AudioStreamTrack(), None, "benchmark"
+    )
+    client = _create_client()
+    client.addTransceiver("video", direction="recvonly")
+    client.addTransceiver("audio", direction="recvonly")
+    await client.setLocalDescription(await client.createOffer())
+
+    start = time.perf_counter()
+    await sub_connection.handle_offer(client.localDescription)
+    duration = (time.perf_counter() - start) * 1000
+
+    await sub_connection.stop()
+    await client.close()
+    return duration
+
+
+async def benchmark_mode(
+    mode: str, runs: int, sub_connections: int, gathering_timeout: float | None
+) -> dict:
+    """Run the benchmark for `mode`."""
+    ice_config = get_ice_config(mode, gathering_timeout)
+    configure_ice(ice_config)
+
+    main_times = []
+    sub_times = []
+    for _ in range(runs):
+        main_times.append(await benchmark_main_connection())
+        for _ in range(sub_connections):
+            sub_times.append(await benchmark_sub_connection())
+
+    return {
+        "mode": mode,
+        # Only the URLs, TURN servers have credentials.
+        "ice_servers": (
+            []
+            if ice_config.ice_host_only
+            else [s["urls"] for s in ice_config.ice_servers]
+        ),
+        "ice_gathering_timeout": ice_config.ice_gathering_timeout,
+        "main_connection_ms": _stats(main_times),
+        "sub_connection_ms": _stats(sub_times),
+    }
+
+
+def _stats(values: list[float]) -> dict:
+    """Get mean, percentiles and maximum for `values`."""
+    if len(values) == 0:
+        return {}
+    data = numpy.array(values)
+    return {
+        "mean": round(float(data.mean()), 3),
+        "p50": round(float(numpy.percentile(data, 50)), 3),
+        "p95": round(float(numpy.percentile(data, 95)), 3),
+        "max": round(float(data.max()), 3),
+    }
+
+
+async def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--sub-connections",
+        type=int,
+        default=3,
+        help="Number of sub-connections measured per run.",
+    )
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument(
+        "--gathering-timeout",
+        type=float,
+        default=None,
+        help="Overrides ice_gathering_timeout from config.json.",
+    )
+    parser.add_argument("--output", help="Optional path for a JSON result file.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # Connections are closed before ICE completes, aiortc reports this as an error.
+    logging.getLogger("asyncio").setLevel(logging.CRITICAL)
+
+    results = {
+        "runs": args.runs,
+        "sub_connections": args.sub_connections,
+        "modes": [
+            await benchmark_mode(
+                mode, args.runs, args.sub_connections, args.gathering_timeout
+            )
+            for mode in args.modes
+        ],
+    }
+
+    for r in results["modes"]:
+        main_ms = r["main_connection_ms"]
+        sub_ms = r["sub_connection_ms"]
+        print(
+            f"{r['mode']:>16}: main connection mean {main_ms['mean']:9.3f}ms, "
+            f"p95 {main_ms['p95']:9.3f}ms | sub-connection mean "
+            f"{sub_ms.get('mean', 0):9.3f}ms, p95 {sub_ms.get('p95', 0):9.3f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,743 @@
+"""Benchmark how many participants the hub sustains, using headless participants.
+
+Starts a hub (`main.py`) for every participant count of the sweep and connects an
+experimenter and N synthetic participants to it, all running on aiortc in this process.
+The experimenter creates a session with N participants (optionally with filters) and
+starts the experiment, then the participants join with `/offer` and subscribe to
+each other by answering every `CONNECTION_PROPOSAL` with a `CONNECTION_OFFER`, like the
+frontend.
+
+Synthetic participants send silence and a video showing a time code (see
+`TimecodeVideoTrack`), which is read from the received frames to measure the end-to-end
+latency through the hub.  With `--media`, a file is sent instead and end-to-end latency
+is not measured.
+
+Usage (from the `backend` folder):
+`python -m benchmarks.load_test --participants 2 4 8 16 --output load_test.json`
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fractions
+import json
+import logging
+import os
+import re
+import shutil
+import signal
+import sys
+import time
+from argparse import ArgumentParser
+from asyncio.subprocess import DEVNULL, Process, create_subprocess_exec
+from typing import Any
+
+import aiohttp
+import numpy
+from aiortc import (
+    MediaStreamTrack,
+    RTCConfiguration,
+    RTCPeerConnection,
+    RTCSessionDescription,
+)
+from aiortc.contrib.media import MediaPlayer
+from aiortc.mediastreams import AudioStreamTrack, MediaStreamError
+from av import VideoFrame
+
+from hub import BACKEND_DIR
+from server import Config
+
+TIMECODE_ROWS = 4
+TIMECODE_COLUMNS = 8
+"""Grid of the time code, one block per bit: 24 bits time code, 8 bits checksum."""
+
+MAX_LATENCY_MS = 10000
+"""Latencies above are discarded, e.g. time codes destroyed by filters."""
+
+
+class TimecodeVideoTrack(MediaStreamTrack):
+    """Video track showing the time it was created as grid of black and white blocks.
+
+    The time code is the lower 24 bits of `time.monotonic` in milliseconds, followed by
+    an 8 bit checksum.  The blocks are large enough to survive encoding, see
+    `read_timecode`.
+    """
+
+    kind = "video"
+
+    _width: int
+    _height: int
+    _fps: float
+    _start: float | None
+    _count: int
+
+    def __init__(self, width: int, height: int, fps: float) -> None:
+        super().__init__()
+        self._width = width
+        self._height = height
+        self._fps = fps
+        self._start = None
+        self._count = 0
+
+    async def recv(self) -> VideoFrame:
+        """Get the next frame, paced to `fps`."""
+        if self._start is None:
+            self._start = time.monotonic()
+        else:
+            self._count += 1
+            wait = self._start + self._count / self._fps - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        image = numpy.zeros((self._height, self._width), numpy.uint8)
+        bits = _get_timecode_bits(_now_ms())
+        block_height = self._height // TIMECODE_ROWS
+        block_width = self._width // TIMECODE_COLUMNS
+        blocks = bits.repeat(block_height, 0).repeat(block_width, 1)
+        image[: blocks.shape[0], : blocks.shape[1]] = blocks * 255
+
+        frame = VideoFrame.from_ndarray(image, format="gray")
+        frame.pts = int(self._count * 90000 / self._fps)
+        frame.time_base = fractions.Fraction(1, 90000)
+        return frame
+
+
+def read_timecode(frame: VideoFrame) -> int | None:
+    """Read the time code of a frame sent by a `TimecodeVideoTrack`.
+
+    Returns None if the frame has no valid time code.
+    """
+    image = frame.to_ndarray(format="gray")
+    block_height = image.shape[0] // TIMECODE_ROWS
+    block_width = image.shape[1] // TIMECODE_COLUMNS
+    if block_height < 4 or block_width < 4:
+        return None
+    # Only use the center of each block, edges are blurred by encoding.
+    blocks = image[: block_height * TIMECODE_ROWS, : block_width * TIMECODE_COLUMNS]
+    blocks = blocks.reshape(TIMECODE_ROWS, block_height, TIMECODE_COLUMNS, block_width)
+    centers = blocks[
+        :,
+        block_height // 4 : block_height * 3 // 4,
+        :,
+        block_width // 4 : block_width * 3 // 4,
+    ]
+    bits = centers.mean(axis=(1, 3)) > 128
+    value = int("".join("1" if bit else "0" for bit in bits.flat), 2)
+    timecode, checksum = value >> 8, value & 0xFF
+    if checksum != _get_checksum(timecode):
+        return None
+    return timecode
+
+
+def _now_ms() -> int:
+    """Get the current time code, see `TimecodeVideoTrack`."""
+    return int(time.monotonic() * 1000) & 0xFFFFFF
+
+
+def _get_checksum(timecode: int) -> int:
+    """Get the checksum of `timecode`.  Not 0 for black frames."""
+    return ((timecode >> 16) + (timecode >> 8) + timecode) & 0xFF ^ 0xA5
+
+
+def _get_timecode_bits(timecode: int) -> numpy.ndarray:
+    """Get the bits of `timecode` and its checksum as grid of the time code."""
+    value = (timecode << 8) | _get_checksum(timecode)
+    bits = [(value >> (31 - i)) & 1 for i in range(32)]
+    return numpy.array(bits, numpy.uint8).reshape(TIMECODE_ROWS, TIMECODE_COLUMNS)
+
+
+class StreamStats:
+    """Statistics of one received stream."""
+
+    video_frames: int
+    audio_frames: int
+    latencies: list[float]
+
+    def __init__(self) -> None:
+        self.video_frames = 0
+        self.audio_frames = 0
+        self.latencies = []
+
+
+class Client:
+    """Headless client, connecting to the hub like the frontend."""
+
+    name: str
+    offer_ms: float | None
+    connected_ms: float | None
+    mesh_ms: float | None
+    streams: dict[str, StreamStats]
+    loopback: StreamStats
+    _tracks: list[MediaStreamTrack]
+    _peers: int
+    _start: float
+    _pc: RTCPeerConnection | None
+    _channel: Any
+    _subconnections: dict[str, RTCPeerConnection]
+    _pending: list[tuple[str, asyncio.Future]]
+    _tasks: list[asyncio.Task]
+    _logger: logging.Logger
+
+    def __init__(self, name: str, tracks: list[MediaStreamTrack], peers: int) -> None:
+        """Create new Client.  Use `connect` to connect it to the hub.
+
+        Parameters
+        ----------
+        name : str
+            Name of the client, used for logging.
+        tracks : list of aiortc.MediaStreamTrack
+            Tracks sent to the hub.
+        peers : int
+            Number of streams the client subscribes to once all participants joined,
+            used to measure `mesh_ms`.
+        """
+        self.name = name
+        self.offer_ms = None
+        self.connected_ms = None
+        self.mesh_ms = None
+        self.streams = {}
+        self.loopback = StreamStats()
+        self._tracks = tracks
+        self._peers = peers
+        self._start = 0.0
+        self._pc = None
+        self._channel = None
+        self._subconnections = {}
+        self._pending = []
+        self._tasks = []
+        self._logger = logging.getLogger(f"Client-{name}")
+
+    async def connect(
+        self, http: aiohttp.ClientSession, url: str, request: dict
+    ) -> None:
+        """Connect to the hub at `url` and wait until the API data channel is open.
+
+        Parameters
+        ----------
+        http : aiohttp.ClientSession
+            Session used for the `/offer` request.
+        url : str
+            Base URL of the hub.
+        request : dict
+            Offer request parameters except the session description, e.g. `user_type`.
+        """
+        self._start = time.monotonic()
+        self._pc = RTCPeerConnection(RTCConfiguration(iceServers=[]))
+        for track in self._tracks:
+            self._pc.addTrack(track)
+        self._channel = self._pc.createDataChannel("API")
+        opened = asyncio.Event()
+        self._channel.on("open", opened.set)
+        self._channel.on("message", self._handle_message)
+
+        @self._pc.on("connectionstatechange")
+        def _on_state_change() -> None:
+            assert self._pc is not None
+            if self._pc.connectionState == "connected" and self.connected_ms is None:
+                self.connected_ms = self._elapsed_ms()
+
+        self._pc.on("track", lambda track: self._consume(track, self.loopback, False))
+
+        await self._pc.setLocalDescription(await self._pc.createOffer())
+        offer = self._pc.localDescription
+        request = {"sdp": offer.sdp, "type": offer.type, **request}
+        async with http.post(f"{url}/offer", json={"request": request}) as response:
+            answer = json.loads(await response.text())
+        if answer["type"] != "SESSION_DESCRIPTION":
+            raise RuntimeError(f"{self.name} failed to join: {answer['data']}")
+        self.offer_ms = self._elapsed_ms()
+        await self._pc.setRemoteDescription(
+            RTCSessionDescription(answer["data"]["sdp"], answer["data"]["type"])
+        )
+        await asyncio.wait_for(opened.wait(), 30)
+
+    async def request(
+        self, type: str, data: Any, response_type: str, timeout: float = 30
+    ) -> Any:
+        """Send an API message and wait for the next message of `response_type`.
+
+        Raises
+        ------
+        RuntimeError
+            If the hub responded with an `ERROR`.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((response_type, future))
+        self.send(type, data)
+        return await asyncio.wait_for(future, timeout)
+
+    def send(self, type: str, data: Any) -> None:
+        """Send an API message to the hub."""
+        self._channel.send(json.dumps({"type": type, "data": data}))
+
+    async def close(self) -> None:
+        """Close all connections of this client."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for pc in self._subconnections.values():
+            await pc.close()
+        if self._pc is not None:
+            await self._pc.close()
+
+    def reset_stats(self) -> None:
+        """Reset the frame counters and latencies of all streams."""
+        for stats in [*self.streams.values(), self.loopback]:
+            stats.__init__()
+
+    def _elapsed_ms(self) -> float:
+        return (time.monotonic() - self._start) * 1000
+
+    def _handle_message(self, message: str) -> None:
+        """Handle an API message received from the hub."""
+        parsed = json.loads(message)
+        match parsed["type"]:
+            case "CONNECTION_PROPOSAL":
+                self._tasks.append(
+                    asyncio.create_task(self._handle_proposal(parsed["data"]))
+                )
+            case "CONNECTION_ANSWER":
+                self._tasks.append(
+                    asyncio.create_task(self._handle_answer(parsed["data"]))
+                )
+            case "ERROR":
+                self._logger.warning(f"Received error: {parsed['data']}")
+                for _, future in self._pending:
+                    if not future.done():
+                        future.set_exception(RuntimeError(parsed["data"]))
+                self._pending = []
+            case message_type:
+                for pending in self._pending:
+                    if pending[0] == message_type:
+                        self._pending.remove(pending)
+                        if not pending[1].done():
+                            pending[1].set_result(parsed["data"])
+                        break
+
+    async def _handle_proposal(self, proposal: dict) -> None:
+        """Subscribe to the stream proposed in a `CONNECTION_PROPOSAL`."""
+        pc = RTCPeerConnection(RTCConfiguration(iceServers=[]))
+        self._subconnections[proposal["id"]] = pc
+        pc.addTransceiver("video", direction="recvonly")
+        pc.addTransceiver("audio", direction="recvonly")
+        stats = self.streams[proposal["id"]] = StreamStats()
+        pc.on("track", lambda track: self._consume(track, stats, True))
+        await pc.setLocalDescription(await pc.createOffer())
+        offer = {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
+        self.send("CONNECTION_OFFER", {"id": proposal["id"], "offer": offer})
+
+    async def _handle_answer(self, answer: dict) -> None:
+        """Handle the `CONNECTION_ANSWER` to a subscription."""
+        pc = self._subconnections.get(answer["id"])
+        if pc is None:
+            return
+        description = answer["answer"]
+        await pc.setRemoteDescription(
+            RTCSessionDescription(description["sdp"], description["type"])
+        )
+
+    def _consume(self, track: MediaStreamTrack, stats: StreamStats, peer: bool) -> None:
+        """Start receiving `track`.  Unconsumed tracks buffer all frames."""
+        self._tasks.append(asyncio.create_task(self._receive(track, stats, peer)))
+
+    async def _receive(
+        self, track: MediaStreamTrack, stats: StreamStats, peer: bool
+    ) -> None:
+        """Receive frames of `track` and record them in `stats`."""
+        while True:
+            try:
+                frame = await track.recv()
+            except MediaStreamError:
+                return
+            if track.kind == "audio":
+                stats.audio_frames += 1
+                continue
+
+            stats.video_frames += 1
+            if peer and stats.video_frames == 1 and self.mesh_ms is None:
+                receiving = [s for s in self.streams.values() if s.video_frames > 0]
+                if len(receiving) >= self._peers:
+                    self.mesh_ms = self._elapsed_ms()
+
+            timecode = read_timecode(frame)
+            if timecode is not None:
+                latency = (_now_ms() - timecode) & 0xFFFFFF
+                if latency < MAX_LATENCY_MS:
+                    stats.latencies.append(latency)
+
+
+def create_tracks(args: Any) -> list[MediaStreamTrack]:
+    """Create the tracks sent by one participant."""
+    if args.media is not None:
+        player = MediaPlayer(args.media, loop=True)
+        tracks = [track for track in (player.audio, player.video) if track is not None]
+        if len(tracks) > 0:
+            return tracks
+    return [AudioStreamTrack(), TimecodeVideoTrack(args.width, args.height, args.fps)]
+
+
+def create_session(participants: int, filters: dict) -> dict:
+    """Create a SessionDict for a new session with `participants` participants.
+
+    Parameters
+    ----------
+    participants : int
+        Number of participants in the session.
+    filters : dict
+        Filter configs applied to all participants, with the keys `audio_filters`,
+        `video_filters`, `audio_group_filters` or `video_group_filters`.
+    """
+    return {
+        "id": "",
+        "title": "Load test",
+        "description": f"Created by benchmarks.load_test, {participants} participants.",
+        "date": int(time.time() * 1000),
+        "time_limit": 3600000,
+        "record": False,
+        "participants": [
+            {
+                "id": "",
+                "participant_name": f"Participant {i}",
+                "muted_video": False,
+                "muted_audio": False,
+                "audio_filters": filters.get("audio_filters", []),
+                "video_filters": filters.get("video_filters", []),
+                "audio_group_filters": filters.get("audio_group_filters", []),
+                "video_group_filters": filters.get("video_group_filters", []),
+                "position": {"x": 0, "y": 0, "z": 0},
+                "size": {"width": 100, "height": 100},
+                "chat": [],
+                "banned": False,
+            }
+            for i in range(participants)
+        ],
+        "creation_time": 0,
+        "start_time": 0,
+        "end_time": 0,
+        "notes": [],
+        "log": [],
+    }
+
+
+async def start_hub(http: aiohttp.ClientSession, url: str, log: str | None) -> Process:
+    """Start the hub (`main.py`) and wait until it responds to requests."""
+    output = DEVNULL if log is None else open(log, "a")
+    process = await create_subprocess_exec(
+        sys.executable,
+        "main.py",
+        cwd=BACKEND_DIR,
+        stdout=output,
+        stderr=output,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.returncode is not None:
+            raise RuntimeError("Hub exited during startup, see --hub-log.")
+        try:
+            async with http.get(url):
+                return process
+        except aiohttp.ClientConnectionError:
+            await asyncio.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Hub did not start within 60 seconds.")
+
+
+async def stop_hub(process: Process) -> None:
+    """Stop the hub like a KeyboardInterrupt, kill it if it does not exit."""
+    process.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(process.wait(), 30)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+def remove_session(session_id: str) -> None:
+    """Remove the files of a session created by the benchmark from `sessions`.
+
+    Sessions of experiments can not be deleted through the API.
+    """
+    sessions_dir = os.path.join(BACKEND_DIR, "sessions")
+    try:
+        os.remove(os.path.join(sessions_dir, f"{session_id}.json"))
+    except FileNotFoundError:
+        pass
+    shutil.rmtree(os.path.join(sessions_dir, session_id), ignore_errors=True)
+
+
+async def get_process_metrics(
+    http: aiohttp.ClientSession, url: str
+) -> dict[str, dict[str, float]] | None:
+    """Get CPU time and RSS of all hub processes from `/metrics`.
+
+    Returns None if metrics are disabled (`metrics_interval` is 0).
+    """
+    async with http.get(f"{url}/metrics") as response:
+        if response.status != 200:
+            return None
+        text = await response.text()
+
+    processes: dict[str, dict[str, float]] = {}
+    pattern = re.compile(
+        r'^(process_cpu_seconds_total|process_resident_memory_bytes)\{.*process="'
+        r'([^"]*)".*\} (\S+)$',
+        re.MULTILINE,
+    )
+    for name, process, value in pattern.findall(text):
+        processes.setdefault(process, {})[name] = float(value)
+    return processes
+
+
+def summarize_hub(
+    before: dict[str, dict[str, float]] | None,
+    after: dict[str, dict[str, float]] | None,
+    duration: float,
+) -> dict | None:
+    """Get CPU usage and RSS of the hub processes in the measurement window."""
+    if before is None or after is None:
+        return None
+    processes = {}
+    for process, values in after.items():
+        cpu = values.get("process_cpu_seconds_total", 0)
+        cpu_before = before.get(process, {}).get("process_cpu_seconds_total", 0)
+        processes[process] = {
+            "cpu_percent": round((cpu - cpu_before) / duration * 100, 1),
+            "rss_mb": round(
+                values.get("process_resident_memory_bytes", 0) / 2**20, 1
+            ),
+        }
+    return {
+        "cpu_percent": round(sum(p["cpu_percent"] for p in processes.values()), 1),
+        "rss_mb": round(sum(p["rss_mb"] for p in processes.values()), 1),
+        "subprocesses": len(processes) - 1,
+        "processes": processes,
+    }
+
+
+async def benchmark_participants(
+    http: aiohttp.ClientSession, url: str, participants: int, args: Any
+) -> tuple[dict, str | None]:
+    """Run the benchmark for `participants` participants on the hub at `url`.
+
+    Returns the results and the ID of the created session.
+    """
+    config = Config()
+    experimenter = Client("experimenter", [], participants)
+    clients: list[Client] = []
+    joins: list[Any] = []
+    session_id = None
+    try:
+        await experimenter.connect(
+            http,
+            url,
+            {
+                "user_type": "experimenter",
+                "experimenter_password": config.experimenter_password,
+            },
+        )
+        session = await experimenter.request(
+            "SAVE_SESSION", create_session(participants, args.filters), "SAVED_SESSION"
+        )
+        session_id = session["id"]
+        await experimenter.request(
+            "CREATE_EXPERIMENT", {"session_id": session_id}, "SUCCESS"
+        )
+        # Participants only subscribe to each other in running experiments
+        await experimenter.request("START_EXPERIMENT", None, "SUCCESS")
+
+        clients = [
+            Client(p["participant_name"], create_tracks(args), participants - 1)
+            for p in session["participants"]
+        ]
+
+        async def _join(i: int, client: Client, participant_id: str) -> None:
+            await asyncio.sleep(i * args.join_interval)
+            await client.connect(
+                http,
+                url,
+                {
+                    "user_type": "participant",
+                    "session_id": session_id,
+                    "participant_id": participant_id,
+                },
+            )
+
+        joins = await asyncio.gather(
+            *(
+                _join(i, client, p["id"])
+                for i, (client, p) in enumerate(zip(clients, session["participants"]))
+            ),
+            return_exceptions=True,
+        )
+        for client, join in zip(clients, joins):
+            if isinstance(join, BaseException):
+                logging.warning(f"{client.name} failed to join: {join!r}")
+
+        # Wait until every participant receives all other participants
+        deadline = time.monotonic() + args.join_timeout
+        while time.monotonic() < deadline and any(c.mesh_ms is None for c in clients):
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(args.warmup)
+
+        for client in clients:
+            client.reset_stats()
+        hub_before = await get_process_metrics(http, url)
+        cpu_before = time.process_time()
+        start = time.monotonic()
+        await asyncio.sleep(args.duration)
+        duration = time.monotonic() - start
+        cpu = time.process_time() - cpu_before
+        hub_after = await get_process_metrics(http, url)
+    finally:
+        for client in [experimenter, *clients]:
+            await client.close()
+
+    streams = [s for c in clients for s in c.streams.values()]
+    loopbacks = [c.loopback for c in clients]
+    results = {
+        "participants": participants,
+        "joined": sum(not isinstance(join, BaseException) for join in joins),
+        "offer_ms": _stats([c.offer_ms for c in clients if c.offer_ms is not None]),
+        "connected_ms": _stats(
+            [c.connected_ms for c in clients if c.connected_ms is not None]
+        ),
+        "mesh_ms": _stats([c.mesh_ms for c in clients if c.mesh_ms is not None]),
+        "streams_expected": participants * (participants - 1),
+        "streams_receiving": sum(s.video_frames > 0 for s in streams),
+        "video_fps": _stats([s.video_frames / duration for s in streams]),
+        "audio_fps": _stats([s.audio_frames / duration for s in streams]),
+        "loopback_video_fps": _stats([s.video_frames / duration for s in loopbacks]),
+        "latency_ms": _stats([latency for s in streams for latency in s.latencies]),
+        "loopback_latency_ms": _stats(
+            [latency for s in loopbacks for latency in s.latencies]
+        ),
+        "hub": summarize_hub(hub_before, hub_after, duration),
+        "client_cpu_percent": round(cpu / duration * 100, 1),
+    }
+    return results, session_id
+
+
+async def run_sweep_point(participants: int, args: Any) -> dict:
+    """Run the benchmark for `participants` participants, on a new hub if required."""
+    config = Config()
+    url = args.url
+    if url is None:
+        scheme = "https" if config.https else "http"
+        url = f"{scheme}://{config.host}:{config.port}"
+
+    connector = aiohttp.TCPConnector(ssl=False)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        hub = None if args.url is not None else await start_hub(http, url, args.hub_log)
+        session_id = None
+        try:
+            results, session_id = await benchmark_participants(
+                http, url, participants, args
+            )
+        finally:
+            if hub is not None:
+                await stop_hub(hub)
+                if session_id is not None:
+                    remove_session(session_id)
+    if hub is None and session_id is not None:
+        print(f"Created session {session_id} on {url}, delete it manually.")
+    return results
+
+
+def _stats(values: list[float]) -> dict:
+    """Get mean, minimum, percentiles and maximum for `values`."""
+    if len(values) == 0:
+        return {}
+    data = numpy.array(values)
+    return {
+        "mean": round(float(data.mean()), 3),
+        "min": round(float(data.min()), 3),
+        "p50": round(float(numpy.percentile(data, 50)), 3),
+        "p95": round(float(numpy.percentile(data, 95)), 3),
+        "max": round(float(data.max()), 3),
+    }
+
+
+async def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--participants", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=20,
+        help="Measurement window in seconds, should be well above metrics_interval.",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=3,
+        help="Seconds to wait after all participants joined, before measuring.",
+    )
+    parser.add_argument(
+        "--join-interval",
+        type=float,
+        default=0,
+        help="Seconds between the joins of two participants, 0 joins all at once.",
+    )
+    parser.add_argument(
+        "--join-timeout",
+        type=float,
+        default=60,
+        help="Maximum seconds to wait for all participants to receive each other.",
+    )
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument(
+        "--media",
+        help="Audio / video file sent by all participants instead of synthetic media.",
+    )
+    parser.add_argument(
+        "--filters",
+        help="JSON file with filter configs for all participants, see README.",
+    )
+    parser.add_argument(
+        "--url", help="Use a running hub at this URL instead of starting one."
+    )
+    parser.add_argument("--hub-log", help="Append the output of started hubs here.")
+    parser.add_argument("--output", help="Optional path for a JSON result file.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # Connections are closed while media is flowing, aiortc reports this as an error.
+    logging.getLogger("asyncio").setLevel(logging.CRITICAL)
+
+    filters: dict = {}
+    if args.filters is not None:
+        with open(args.filters) as file:
+            filters = json.load(file)
+    args.filters = filters
+
+    results = {
+        "duration": args.duration,
+        "video": {"width": args.width, "height": args.height, "fps": args.fps},
+        "media": args.media,
+        "filters": filters,
+        "sweep": [],
+    }
+    for participants in args.participants:
+        r = await run_sweep_point(participants, args)
+        results["sweep"].append(r)
+        hub = r["hub"] or {}
+        print(
+            f"{participants:>3} participants: joined {r['joined']}, streams "
+            f"{r['streams_receiving']}/{r['streams_expected']} | video fps mean "
+            f"{r['video_fps'].get('mean', 0):6.2f}, min "
+            f"{r['video_fps'].get('min', 0):6.2f} | latency p50 "
+            f"{r['latency_ms'].get('p50', 0):7.1f}ms, p95 "
+            f"{r['latency_ms'].get('p95', 0):7.1f}ms | hub cpu "
+            f"{hub.get('cpu_percent', 0):6.1f}%, rss {hub.get('rss_mb', 0):7.1f}MB, "
+            f"{hub.get('subprocesses', 0)} subprocesses | client cpu "
+            f"{r['client_cpu_percent']:6.1f}%"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""Provide a stub for the OpenFace AUExtractor, used by benchmarks.
+
+The stub implements the extractor side of the protocol in
+filters.open_face_au.frame_transport.  It decodes every frame, but instead of running
+OpenFace it returns constant AU intensities after an optional, simulated processing
+time.
+"""
+
+import json
+import time
+import multiprocessing
+
+import zmq
+
+from filters.open_face_au.frame_transport import decode_frame
+
+
+def run_stub_extractor(endpoint: str, work_ms: float = 0.0) -> None:
+    """Run the stub extractor until the process is terminated.
+
+    Parameters
+    ----------
+    endpoint : str
+        ZMQ endpoint the stub connects to, e.g. `tcp://127.0.0.1:5555`.
+    work_ms : float, default 0.0
+        Simulated processing time per frame in milliseconds.
+    """
+    context = zmq.Context()
+    socket = context.socket(zmq.REP)
+    socket.connect(endpoint)
+
+    while True:
+        parts = socket.recv_multipart()
+        header, ndarray = decode_frame(parts)
+        if work_ms > 0:
+            time.sleep(work_ms / 1000)
+
+        height, width = (0, 0) if ndarray is None else ndarray.shape[:2]
+        result = {
+            "frame": None if header is None else header["frame"],
+            "intensity": {"AU06": 0.0, "AU12": 0.0},
+            "roi": {"x": 0, "y": 0, "width": width, "height": height},
+        }
+        socket.send(json.dumps(result).encode("utf-8"))
+
+
+def start_stub_extractor(
+    endpoint: str, work_ms: float = 0.0
+) -> multiprocessing.Process:
+    """Start `run_stub_extractor` in a new daemon process.
+
+    See `run_stub_extractor` for parameters.
+    """
+    process = multiprocessing.Process(
+        target=run_stub_extractor, args=(endpoint, work_ms), daemon=True
+    )
+    process.start()
+    return process
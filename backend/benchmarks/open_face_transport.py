@@ -0,0 +1,125 @@
+"""Benchmark the frame transports used to send frames to the OpenFace AUExtractor.
+
+Measures the end-to-end latency of a single AU extraction request (encoding, sending,
+decoding in the extractor and receiving the result) for each transport, using the stub
+extractor in `benchmarks.open_face_stub` instead of OpenFace.
+
+Usage (from the `backend` folder):
+`python -m benchmarks.open_face_transport --width 1280 --height 720 --frames 200`
+"""
+
+import json
+import time
+from argparse import ArgumentParser
+
+import numpy
+import zmq
+
+from benchmarks.open_face_stub import start_stub_extractor
+from filters.open_face_au.frame_transport import (
+    TRANSPORTS,
+    SharedFrameSlot,
+    encode_frame,
+)
+
+
+def benchmark_transport(
+    transport: str, frames: list[numpy.ndarray], work_ms: float
+) -> dict:
+    """Run all `frames` through the stub extractor using `transport`.
+
+    Returns
+    -------
+    dict
+        Latency statistics in milliseconds for encoding and the full round trip.
+    """
+    context = zmq.Context()
+    socket = context.socket(zmq.REQ)
+    port = socket.bind_to_random_port("tcp://127.0.0.1")
+    stub = start_stub_extractor(f"tcp://127.0.0.1:{port}", work_ms)
+    slot = SharedFrameSlot()
+
+    encode_times = []
+    round_trip_times = []
+    try:
+        for i, frame in enumerate(frames):
+            start = time.perf_counter()
+            parts = encode_frame(frame, transport, i, None, slot)  # type: ignore
+            encoded = time.perf_counter()
+            socket.send_multipart(parts)
+            socket.recv()
+            end = time.perf_counter()
+            encode_times.append((encoded - start) * 1000)
+            round_trip_times.append((end - start) * 1000)
+    finally:
+        stub.terminate()
+        slot.close()
+        socket.close(linger=0)
+        context.term()
+
+    return {
+        "transport": transport,
+        "encode_ms": _stats(encode_times),
+        "round_trip_ms": _stats(round_trip_times),
+    }
+
+
+def _stats(values: list[float]) -> dict:
+    """Get mean and percentiles for `values`, skipping the first (warm up) value."""
+    data = numpy.array(values[1:] if len(values) > 1 else values)
+    return {
+        "mean": round(float(data.mean()), 3),
+        "p50": round(float(numpy.percentile(data, 50)), 3),
+        "p95": round(float(numpy.percentile(data, 95)), 3),
+        "max": round(float(data.max()), 3),
+    }
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument(
+        "--work-ms",
+        type=float,
+        default=0.0,
+        help="Simulated extraction time in the stub extractor.",
+    )
+    parser.add_argument(
+        "--transports", nargs="+", choices=TRANSPORTS, default=list(TRANSPORTS)
+    )
+    parser.add_argument("--output", help="Optional path for a JSON result file.")
+    args = parser.parse_args()
+
+    # Noise compresses badly, which makes this a worst case for png and jpeg.
+    rng = numpy.random.default_rng(0)
+    frames = [
+        rng.integers(0, 255, (args.height, args.width, 3), dtype=numpy.uint8)
+        for _ in range(min(args.frames, 10))
+    ]
+    frames = [frames[i % len(frames)] for i in range(args.frames)]
+
+    results = {
+        "resolution": [args.width, args.height],
+        "frames": args.frames,
+        "work_ms": args.work_ms,
+        "transports": [
+            benchmark_transport(t, frames, args.work_ms) for t in args.transports
+        ],
+    }
+
+    for r in results["transports"]:
+        print(
+            f"{r['transport']:>5}: encode {r['encode_ms']['mean']:8.3f}ms, round trip "
+            f"mean {r['round_trip_ms']['mean']:8.3f}ms, "
+            f"p95 {r['round_trip_ms']['p95']:8.3f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,24 +7,37 @@ from aiortc import (
     RTCDataChannel,
     RTCSessionDescription,
     MediaStreamTrack,
+    RTCRtpReceiver,
     RTCRtpSender,
 )
+from aiortc.stats import (
+    RTCInboundRtpStreamStats,
+    RTCRemoteInboundRtpStreamStats,
+    RTCStatsReport,
+    RTCTransportStats,
+)
 import shortuuid
 import asyncio
 import logging
 import json
+import time
 
 from connection.messages import (
     ConnectionAnswerDict,
     ConnectionOfferDict,
     ConnectionProposalDict,
+    RecordingFilesDict,
 )
+from connection.ice import create_peer_connection
 from connection.sub_connection import SubConnection
+from hub import frame_tracing, metrics
 from hub.track_handler import TrackHandler
 from hub.exceptions import ErrorDictException
+from hub.profiler import SamplingProfiler
 from connection.connection_interface import ConnectionInterface
 from connection.connection_state import ConnectionState, parse_connection_state
 from hub.record_handler import RecordHandler
+from hub.packet_record_handler import PacketRecordHandler
 
 from custom_types.error import ErrorDict
 from filters import FilterDict
@@ -41,6 +54,8 @@ class Connection(ConnectionInterface):
     Extends AsyncIOEventEmitter, providing the following events:
     - `state_change` : hub.connection_state.ConnectionState
         Emitted when the state of this connection changes.
+    - `recording_finished` : connection.messages.RecordingFilesDict
+        Emitted when recording stopped and the recordings were written.
 
     Notes
     -----
@@ -70,7 +85,11 @@ class Connection(ConnectionInterface):
     _tasks: list[asyncio.Task]
     _audio_record_handler: RecordHandler
     _video_record_handler: RecordHandler
-    _raw_video_record_handler: RecordHandler
+    _raw_video_record_handler: PacketRecordHandler
+    _last_bytes: tuple[float, dict[str, int]] | None
+    _sub_connection_bytes: dict[str, dict[str, int]]
+    _closed_bytes: dict[str, int]
+    _profiler: SamplingProfiler | None
 
     def __init__(
         self,
@@ -115,23 +134,26 @@ class Connection(ConnectionInterface):
         self._incoming_audio = TrackHandler("audio", self, filter_api)
         self._incoming_video = TrackHandler("video", self, filter_api)
 
-        (record, record_to) = record_data
+        record, record_to, segment_duration, fsync = record_data
         self._audio_record_handler = RecordHandler(
-            self._incoming_audio, record, record_to
+            self._incoming_audio, record, record_to, segment_duration, fsync
         )
         self._video_record_handler = RecordHandler(
-            self._incoming_video, record, record_to
+            self._incoming_video, record, record_to, segment_duration, fsync
         )
         # Since experimenter's path recording is empty, so we try to avoid adding raw so experimenter will not be recorded
-        if (record_to != ""):
+        if record_to != "":
             record_to += "_raw"
 
-        self._raw_video_record_handler = RecordHandler(
-            self._incoming_video, record, record_to
-        )
-        
+        self._raw_video_record_handler = PacketRecordHandler(record, record_to)
+
         self._dc = None
         self._tasks = []
+        self._last_bytes = None
+        self._sub_connection_bytes = {}
+        self._closed_bytes = {"sent": 0, "received": 0}
+        self._profiler = None
+        metrics.add_collector(self._collect_metrics)
 
         # Register event handlers
         pc.add_listener("datachannel", self._on_datachannel)
@@ -186,11 +208,13 @@ class Connection(ConnectionInterface):
         self._stopped = True
         self._logger.debug("Stopping Connection")
 
+        # Stop recording first, so `recording_finished` is emitted before `CLOSED`
+        await self.stop_recording()
+        await self.stop_profile()
+
         if self._state not in [ConnectionState.CLOSED, ConnectionState.FAILED]:
             self._set_state(ConnectionState.CLOSED)
 
-        await self.stop_recording()
-
         # Close all SubConnections
         coros: list[Coroutine] = []
         for sc in self._sub_connections.values():
@@ -206,6 +230,8 @@ class Connection(ConnectionInterface):
             await self._incoming_audio.stop()
 
         await self._main_pc.close()
+        metrics.remove_collector(self._collect_metrics)
+        metrics.remove_series(connection=self._log_name_suffix)
         self.remove_all_listeners()
 
     async def send(self, data: MessageDict | dict) -> None:
@@ -231,8 +257,8 @@ class Connection(ConnectionInterface):
         subconnection_id = shortuuid.uuid()
         sc = SubConnection(
             subconnection_id,
-            self._incoming_video.subscribe(),
-            self._incoming_audio.subscribe(),
+            self._incoming_video.subscribe(subconnection_id),
+            self._incoming_audio.subscribe(subconnection_id),
             participant_summary,
             self._log_name_suffix,
         )
@@ -282,14 +308,47 @@ class Connection(ConnectionInterface):
     async def start_recording(self) -> None:
         # For docstring see ConnectionInterface or hover over function declaration
         await asyncio.gather(
-            self._video_record_handler.start(), self._raw_video_record_handler.start(), self._audio_record_handler.start()
+            self._video_record_handler.start(),
+            self._raw_video_record_handler.start(),
+            self._audio_record_handler.start(),
         )
 
     async def stop_recording(self) -> None:
         # For docstring see ConnectionInterface or hover over function declaration
-        await asyncio.gather(
-            self._video_record_handler.stop(), self._raw_video_record_handler.stop(), self._audio_record_handler.stop()
+        video, raw_video, audio = await asyncio.gather(
+            self._video_record_handler.stop(),
+            self._raw_video_record_handler.stop(),
+            self._audio_record_handler.stop(),
         )
+        if video is None and raw_video is None and audio is None:
+            return
+
+        files = RecordingFilesDict(video=video, raw_video=raw_video, audio=audio)
+        self._logger.debug(f"Recording finished: {files}")
+        self.emit("recording_finished", files)
+
+    async def get_frame_trace(self) -> list[dict]:
+        # For docstring see ConnectionInterface or hover over function declaration
+        return frame_tracing.get_events(self._log_name_suffix)
+
+    async def start_profile(self, duration: float) -> str:
+        # For docstring see ConnectionInterface or hover over function declaration
+        if self._profiler is not None:
+            raise ErrorDictException(
+                code=409,
+                type="PROFILE_ALREADY_RUNNING",
+                description="A profile of this connection is already running.",
+            )
+        self._profiler = SamplingProfiler()
+        try:
+            return await self._profiler.run(duration)
+        finally:
+            self._profiler = None
+
+    async def stop_profile(self) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        if self._profiler is not None:
+            self._profiler.stop()
 
     async def set_video_filters(self, filters: list[FilterDict]) -> None:
         # For docstring see ConnectionInterface or hover over function declaration
@@ -300,23 +359,90 @@ class Connection(ConnectionInterface):
         await self._incoming_audio.set_filters(filters)
 
     async def set_video_group_filters(
-        self, group_filters: list[FilterDict], ports: list[int]
+        self, group_filters: list[FilterDict], endpoint: str
     ) -> None:
         # For docstring see ConnectionInterface or hover over function declaration
-        await self._incoming_video.set_group_filters(group_filters, ports)
+        await self._incoming_video.set_group_filters(group_filters, endpoint)
 
     async def set_audio_group_filters(
-        self, group_filters: list[FilterDict], ports: list[int]
+        self, group_filters: list[FilterDict], endpoint: str
     ) -> None:
         # For docstring see ConnectionInterface or hover over function declaration
-        await self._incoming_audio.set_group_filters(group_filters, ports)
+        await self._incoming_audio.set_group_filters(group_filters, endpoint)
 
     async def _handle_closed_subconnection(self, subconnection_id: str) -> None:
         """Remove a closed SubConnection from Connection."""
         self._logger.debug(f"Remove sub connection {subconnection_id}")
         self._sub_connections.pop(subconnection_id)
+        # Keep the bytes of the closed SubConnection in `hub_webrtc_bytes_total`.
+        transferred = self._sub_connection_bytes.pop(subconnection_id, {})
+        for direction, total in transferred.items():
+            self._closed_bytes[direction] += total
         self._logger.debug(f"SubConnections after removing: {self._sub_connections}")
 
+    async def _collect_metrics(self) -> None:
+        """Update the WebRTC metrics of this connection, see hub.metrics.
+
+        Bytes and bitrates include the transports of all SubConnections, closed ones are
+        counted up to their last collection.  Packets, loss and round trip time are
+        taken from the main peer connection, which carries the streams of the client.
+        """
+        suffix = self._log_name_suffix
+        main_report = await self._main_pc.getStats()
+        transferred = self._get_transferred_bytes(main_report)
+        for sc_id, sc in list(self._sub_connections.items()):
+            sc_bytes = self._get_transferred_bytes(await sc._pc.getStats())
+            # Skip SubConnections closed while waiting for the stats.
+            if sc_id in self._sub_connections:
+                self._sub_connection_bytes[sc_id] = sc_bytes
+        for sc_bytes in [self._closed_bytes, *self._sub_connection_bytes.values()]:
+            for direction, total in sc_bytes.items():
+                transferred[direction] += total
+
+        for stats in main_report.values():
+            if isinstance(stats, RTCInboundRtpStreamStats):
+                metrics.counter(
+                    "hub_webrtc_packets_received_total",
+                    connection=suffix,
+                    kind=stats.kind,
+                ).set(stats.packetsReceived)
+                metrics.counter(
+                    "hub_webrtc_packets_lost_total", connection=suffix, kind=stats.kind
+                ).set(stats.packetsLost)
+            elif isinstance(stats, RTCRemoteInboundRtpStreamStats):
+                metrics.gauge(
+                    "hub_webrtc_round_trip_time_seconds",
+                    connection=suffix,
+                    kind=stats.kind,
+                ).set(stats.roundTripTime)
+                metrics.gauge(
+                    "hub_webrtc_fraction_lost", connection=suffix, kind=stats.kind
+                ).set(stats.fractionLost)
+
+        now = time.monotonic()
+        for direction, total in transferred.items():
+            metrics.counter(
+                "hub_webrtc_bytes_total", connection=suffix, direction=direction
+            ).set(total)
+            if self._last_bytes is not None and now > self._last_bytes[0]:
+                delta = max(0, total - self._last_bytes[1][direction])
+                metrics.gauge(
+                    "hub_webrtc_bitrate_bits_per_second",
+                    connection=suffix,
+                    direction=direction,
+                ).set(delta * 8 / (now - self._last_bytes[0]))
+        self._last_bytes = (now, transferred)
+
+    @staticmethod
+    def _get_transferred_bytes(report: RTCStatsReport) -> dict[str, int]:
+        """Get the bytes sent and received on the transports in `report`."""
+        transferred = {"sent": 0, "received": 0}
+        for stats in report.values():
+            if isinstance(stats, RTCTransportStats):
+                transferred["sent"] += stats.bytesSent
+                transferred["received"] += stats.bytesReceived
+        return transferred
+
     def _on_datachannel(self, channel: RTCDataChannel) -> None:
         """Handle new incoming datachannel.
 
@@ -433,14 +559,22 @@ class Connection(ConnectionInterface):
         self._logger.debug(f"{track.kind} track received")
         if track.kind == "audio":
             task = asyncio.create_task(self._incoming_audio.set_track(track))
-            sender = self._main_pc.addTrack(self._incoming_audio.subscribe())
-            self._audio_record_handler.add_track(self._incoming_audio.subscribe())
+            sender = self._main_pc.addTrack(self._incoming_audio.subscribe("client"))
+            frame_tracing.trace_sender(sender)
+            self._audio_record_handler.add_track(
+                self._incoming_audio.subscribe("recorder")
+            )
             self._listen_to_track_close(self._incoming_audio, sender)
         elif track.kind == "video":
             task = asyncio.create_task(self._incoming_video.set_track(track))
-            sender = self._main_pc.addTrack(self._incoming_video.subscribe())
-            self._video_record_handler.add_track(self._incoming_video.subscribe())
-            self._raw_video_record_handler.add_track(track)
+            sender = self._main_pc.addTrack(self._incoming_video.subscribe("client"))
+            frame_tracing.trace_sender(sender)
+            self._video_record_handler.add_track(
+                self._incoming_video.subscribe("recorder")
+            )
+            receiver = self._get_receiver(track)
+            if receiver is not None:
+                self._raw_video_record_handler.add_receiver(receiver)
             self._listen_to_track_close(self._incoming_video, sender)
         else:
             self._logger.error(f"Unknown track kind {track.kind}. Ignoring track")
@@ -453,6 +587,14 @@ class Connection(ConnectionInterface):
             """Handles tracks ended event."""
             self._logger.debug(f"{track.kind} track ended")
 
+    def _get_receiver(self, track: MediaStreamTrack) -> RTCRtpReceiver | None:
+        """Get the receiver of the incoming `track` in the main peer connection."""
+        for transceiver in self._main_pc.getTransceivers():
+            if transceiver.receiver.track is track:
+                return transceiver.receiver
+        self._logger.warning(f"No receiver found for {track.kind} track")
+        return None
+
     def _listen_to_track_close(self, track: TrackHandler, sender: RTCRtpSender):
         """Add a handler to the `ended` event on `track` that closes its transceiver.
 
@@ -510,8 +652,8 @@ async def connection_factory(
     tuple with aiortc.RTCSessionDescription, hub.connection.Connection
         WebRTC answer that should be send back to the client and a Connection.
     """
-    pc = RTCPeerConnection()
-    record_data = (record_data[0], record_data[1])
+    pc = create_peer_connection()
+    record_data = tuple(record_data)
     connection = Connection(
         pc, message_handler, log_name_suffix, filter_api, record_data
     )
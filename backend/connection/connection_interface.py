@@ -177,27 +177,33 @@ class ConnectionInterface(AsyncIOEventEmitter, metaclass=ABCMeta):
 
     @abstractmethod
     async def set_video_group_filters(
-        self, group_filters: list[FilterDict], ports: list[int]
+        self, group_filters: list[FilterDict], endpoint: str
     ) -> None:
-        """Set or update video filters to `filters`.
+        """Set or update video group filters to `group_filters`.
 
         Parameters
         ----------
-        filters : list of filters.FilterDict
-            List of video filter configs.
+        group_filters : list of filters.FilterDict
+            List of video group filter configs.
+        endpoint : str
+            Group filter endpoint of the experiment the group filters send data to, see
+            group_filters.group_filter_broker.
         """
         pass
 
     @abstractmethod
     async def set_audio_group_filters(
-        self, group_filters: list[FilterDict], ports: list[int]
+        self, group_filters: list[FilterDict], endpoint: str
     ) -> None:
-        """Set or update audio filters to `filters`.
+        """Set or update audio group filters to `group_filters`.
 
         Parameters
         ----------
-        filters : list of filters.FilterDict
-            List of audio filter configs.
+        group_filters : list of filters.FilterDict
+            List of audio group filter configs.
+        endpoint : str
+            Group filter endpoint of the experiment the group filters send data to, see
+            group_filters.group_filter_broker.
         """
         pass
 
@@ -213,6 +219,52 @@ class ConnectionInterface(AsyncIOEventEmitter, metaclass=ABCMeta):
     async def stop_recording(self) -> None:
         """Stop recording tracks for this connection.
 
-        Both audio and video recorder will stop.
+        Both audio and video recorder will stop.  When the recordings are written, the
+        `recording_finished` event is emitted with a
+        connection.messages.RecordingFilesDict.
+        """
+        pass
+
+    @abstractmethod
+    async def get_frame_trace(self) -> list[dict]:
+        """Get the frame traces of the tracks of this connection.
+
+        Returns
+        -------
+        list of dict
+            Chrome trace events, see hub.frame_tracing.get_events.  Empty if frame
+            tracing is disabled.
+        """
+        pass
+
+    @abstractmethod
+    async def start_profile(self, duration: float) -> str:
+        """Profile the process executing this connection, see hub.profiler.
+
+        Returns when the profile finished, after `duration` or when `stop_profile` is
+        called.
+
+        Parameters
+        ----------
+        duration : float
+            Maximum duration of the profile in seconds.
+
+        Returns
+        -------
+        str
+            Profile as collapsed stacks.
+
+        Raises
+        ------
+        ErrorDictException
+            If a profile of this connection is already running.
+        """
+        pass
+
+    @abstractmethod
+    async def stop_profile(self) -> None:
+        """Stop the profile started with `start_profile` early.
+
+        Does nothing if no profile is running.
         """
         pass
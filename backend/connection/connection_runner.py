@@ -3,6 +3,7 @@
 import asyncio
 import json
 import logging
+import os
 import sys
 import time
 from typing import Any
@@ -11,13 +12,20 @@ from aiortc import RTCSessionDescription
 
 from connection.connection import Connection, connection_factory
 from connection.connection_state import ConnectionState
-from connection.messages import ConnectionAnswerDict, ConnectionProposalDict
+from connection.messages import (
+    ConnectionAnswerDict,
+    ConnectionProposalDict,
+    RecordingFilesDict,
+)
 from custom_types.message import MessageDict
 from filters import FilterDict
+from hub import frame_tracing, metrics
 from hub.exceptions import ErrorDictException
+from hub.loop_monitor import LoopMonitor
 from filter_api import FilterSubprocessAPI
 from hub.subprocess_logging import SubprocessLoggingHandler
 from server import Config
+from connection.ice import configure_ice
 
 
 class ConnectionRunner:
@@ -36,6 +44,8 @@ class ConnectionRunner:
     _running: bool
     _stopped_event: asyncio.Event
     _tasks: list[asyncio.Task]
+    _metrics_reporter: metrics.MetricsReporter
+    _loop_monitor: LoopMonitor
     _logger: logging.Logger
 
     def __init__(self) -> None:
@@ -46,6 +56,7 @@ class ConnectionRunner:
         self._tasks = []
         self._stopped_event = asyncio.Event()
         config = Config()
+        configure_ice(config)
 
         # Setup logging for subprocess
         handler = SubprocessLoggingHandler(self._send_command)
@@ -60,6 +71,13 @@ class ConnectionRunner:
 
         self._logger = logging.getLogger("ConnectionRunner")
 
+        metrics.configure(f"connection-{os.getpid()}", config.metrics_interval)
+        frame_tracing.configure(config.frame_tracing, f"connection-{os.getpid()}")
+        self._metrics_reporter = metrics.MetricsReporter(
+            self._send_command, config.metrics_interval
+        )
+        self._loop_monitor = LoopMonitor(config.loop_monitor_threshold)
+
     async def run(
         self,
         offer: RTCSessionDescription,
@@ -69,6 +87,7 @@ class ConnectionRunner:
         audio_group_filters: list[FilterDict],
         video_group_filters: list[FilterDict],
         record_data: list,
+        measurement_directory: str | None = None,
     ) -> None:
         """Run the ConnectionRunner.  Returns after the ConnectionRunner finished.
 
@@ -78,9 +97,12 @@ class ConnectionRunner:
             Initial connection offer from the client.
         log_name_suffix : str
             Suffix for logger used in Connection.
+        measurement_directory : str, optional
+            Directory filter measurements are stored in, see
+            filter_api.filter_api_interface.FilterAPIInterface.
         """
         self._running = True
-        filter_api = FilterSubprocessAPI(self._send_command)
+        filter_api = FilterSubprocessAPI(self._send_command, measurement_directory)
         answer, self._connection = await connection_factory(
             offer,
             self._relay_api_message,
@@ -93,9 +115,14 @@ class ConnectionRunner:
             record_data,
         )
         self._connection.add_listener("state_change", self._handle_state_change)
+        self._connection.add_listener(
+            "recording_finished", self._handle_recording_finished
+        )
         self._send_command(
             "SET_LOCAL_DESCRIPTION", {"sdp": answer.sdp, "type": answer.type}
         )
+        self._metrics_reporter.start()
+        self._loop_monitor.start()
 
         await self._listen_for_messages()
         self._logger.debug("ConnectionRunner exiting")
@@ -109,6 +136,8 @@ class ConnectionRunner:
         self._logger.debug("ConnectionRunner Stopping")
         async with self._lock:
             self._running = False
+        await self._metrics_reporter.stop()
+        await self._loop_monitor.stop()
         await asyncio.gather(*self._tasks)
         self._stopped_event.set()
         self._logger.debug("Stop complete")
@@ -179,9 +208,32 @@ class ConnectionRunner:
                 await self._connection.start_recording()
             case "STOP_RECORDING":
                 await self._connection.stop_recording()
+            case "START_PROFILE":
+                # Profiles run for a while, keep handling commands meanwhile.
+                self._tasks.append(
+                    asyncio.create_task(
+                        self._profile(data, command_nr),
+                        name="ConnectionRunner._profile",
+                    )
+                )
+            case "STOP_PROFILE":
+                await self._connection.stop_profile()
+            case "GET_FRAME_TRACE":
+                events = await self._connection.get_frame_trace()
+                self._send_command("FRAME_TRACE", {"events": events}, command_nr)
             case _:
                 self._logger.error(f"Unrecognized command from main process: {command}")
 
+    async def _profile(self, duration: float, command_nr: int) -> None:
+        """Profile this process and send the collapsed stacks to the main process."""
+        assert self._connection is not None
+        try:
+            stacks = await self._connection.start_profile(duration)
+        except ErrorDictException as e:
+            self._send_command("PROFILE", e.error_message, command_nr)
+            return
+        self._send_command("PROFILE", {"stacks": stacks}, command_nr)
+
     async def _read(self):
         """Read line from stdin.  Non-blocking and awaitable."""
         return await asyncio.get_event_loop().run_in_executor(None, sys.stdin.readline)
@@ -193,6 +245,10 @@ class ConnectionRunner:
             self._logger.debug(f"Stopping, because state is {state}")
             await self.stop()
 
+    async def _handle_recording_finished(self, files: RecordingFilesDict) -> None:
+        """Relay finished recordings from `_connection` to parent process."""
+        self._send_command("RECORDING_FINISHED", files)
+
     async def _relay_api_message(self, message: MessageDict | Any) -> None:
         """Relay api messages from `_connection` to parent process."""
         self._send_command("API", message)
@@ -206,7 +262,8 @@ class ConnectionRunner:
         | dict
         | MessageDict
         | ConnectionProposalDict
-        | ConnectionAnswerDict,
+        | ConnectionAnswerDict
+        | RecordingFilesDict,
         command_nr: int = -1,
     ) -> None:
         """Send command to main / parent process via stdout.
@@ -15,7 +15,7 @@ from connection.messages import (
     ConnectionOfferDict,
     RTCSessionDescriptionDict,
 )
-from hub import BACKEND_DIR
+from hub import BACKEND_DIR, metrics
 from server import Config
 from hub.exceptions import ErrorDictException
 from connection.connection_state import ConnectionState
@@ -39,6 +39,8 @@ class ConnectionSubprocess(ConnectionInterface):
     Extends AsyncIOEventEmitter, providing the following events:
     - `state_change` : hub.connection_state.ConnectionState
         Emitted when the state of this connection changes.
+    - `recording_finished` : connection.messages.RecordingFilesDict
+        Emitted when recording stopped and the recordings were written.
     """
 
     _config: Config
@@ -50,6 +52,7 @@ class ConnectionSubprocess(ConnectionInterface):
     _initial_audio_group_filters: list[FilterDict]
     _initial_video_group_filters: list[FilterDict]
     _filter_receiver: FilterSubprocessReceiver
+    _measurement_directory: str | None
     _record_data: tuple
 
     __lock: asyncio.Lock
@@ -60,6 +63,8 @@ class ConnectionSubprocess(ConnectionInterface):
     _tasks: list[asyncio.Task]
     _command_nr: int
     _responses: dict[int, asyncio.Queue[dict]]
+    _messages_sent: metrics.Counter
+    _messages_received: metrics.Counter
 
     _local_description_received: asyncio.Event
     _local_description: RTCSessionDescription | None
@@ -95,7 +100,9 @@ class ConnectionSubprocess(ConnectionInterface):
         video_filters : list of custom_types.filter.FilterDict
             Default video filters for this connection.
         record_data : tuple
-            Boolean flag for recording the experiment and the path where the recordings will be saved.
+            Boolean flag for recording the experiment, the path where the recordings
+            will be saved, the recording segment duration and the fsync flag, see
+            hub.record_handler.RecordHandler.
 
         See Also
         --------
@@ -120,12 +127,23 @@ class ConnectionSubprocess(ConnectionInterface):
         self._state = ConnectionState.NEW
         self._logger = logging.getLogger("ConnectionSubprocess")
         self._filter_receiver = FilterSubprocessReceiver(filter_api)
+        self._measurement_directory = filter_api.measurement_directory
 
         self._local_description_received = asyncio.Event()
         self._local_description = None
 
         self._command_nr = 0
         self._responses = {}
+        self._messages_sent, self._messages_received = [
+            metrics.counter(
+                "hub_ipc_messages_total",
+                channel="connection",
+                peer=log_name_suffix,
+                direction=direction,
+            )
+            for direction in ["sent", "received"]
+        ]
+        metrics.add_collector(self._collect_metrics)
 
         self._tasks = [
             asyncio.create_task(self._run(), name="ConnectionSubprocess.run")
@@ -165,14 +183,16 @@ class ConnectionSubprocess(ConnectionInterface):
     async def stop(self) -> None:
         # For docstring see ConnectionInterface or hover over function declaration
         self._logger.debug("Stopping ConnectionSubprocess")
-        if self._process is not None and self._process.returncode is None:
-            self._process.terminate()
+        await self._terminate()
         async with self.__lock:
             self._running = False
         current_task = asyncio.current_task()
         tasks = [t for t in self._tasks if t is not current_task]
         await asyncio.gather(*tasks)
         await self._log_final_stdout_stderr()
+        metrics.remove_collector(self._collect_metrics)
+        metrics.remove_remote(self._metrics_source)
+        metrics.remove_series(channel="connection", peer=self._log_name_suffix)
         self._set_state(ConnectionState.CLOSED)
         self._logger.debug("Stop complete")
 
@@ -197,16 +217,16 @@ class ConnectionSubprocess(ConnectionInterface):
         await self._send_command("SET_AUDIO_FILTERS", filters)
 
     async def set_video_group_filters(
-        self, group_filters: list[FilterDict], ports: list[int]
+        self, group_filters: list[FilterDict], endpoint: str
     ) -> None:
         # For docstring see ConnectionInterface or hover over function declaration
-        await self._send_command("SET_VIDEO_GROUP_FILTERS", (group_filters, ports))
+        await self._send_command("SET_VIDEO_GROUP_FILTERS", (group_filters, endpoint))
 
     async def set_audio_group_filters(
-        self, group_filters: list[FilterDict], ports: list[int]
+        self, group_filters: list[FilterDict], endpoint: str
     ) -> None:
         # For docstring see ConnectionInterface or hover over function declaration
-        await self._send_command("SET_AUDIO_GROUP_FILTERS", (group_filters, ports))
+        await self._send_command("SET_AUDIO_GROUP_FILTERS", (group_filters, endpoint))
 
     async def start_recording(self) -> None:
         # For docstring see ConnectionInterface or hover over function declaration
@@ -216,6 +236,38 @@ class ConnectionSubprocess(ConnectionInterface):
         # For docstring see ConnectionInterface or hover over function declaration
         await self._send_command("STOP_RECORDING", None)
 
+    async def get_frame_trace(self) -> list[dict]:
+        # For docstring see ConnectionInterface or hover over function declaration
+        response = await self._send_command_wait_for_response("GET_FRAME_TRACE", None)
+        if response is None:
+            return []
+        return response["events"]
+
+    async def start_profile(self, duration: float) -> str:
+        # For docstring see ConnectionInterface or hover over function declaration
+        response = await self._send_command_wait_for_response("START_PROFILE", duration)
+        if response is None:
+            return ""
+        return response["stacks"]
+
+    async def stop_profile(self) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        await self._send_command("STOP_PROFILE", None)
+
+    @property
+    def _metrics_source(self) -> str:
+        """Key for the metrics received from the subprocess, see hub.metrics."""
+        return f"connection-{id(self)}"
+
+    async def _collect_metrics(self) -> None:
+        """Update the metrics of the control channel, see hub.metrics."""
+        labels = {"channel": "connection", "peer": self._log_name_suffix}
+        metrics.gauge("hub_ipc_pending_responses", **labels).set(len(self._responses))
+        if self._process is not None and self._process.stdin is not None:
+            metrics.gauge("hub_ipc_write_buffer_bytes", **labels).set(
+                self._process.stdin.transport.get_write_buffer_size()
+            )
+
     def _set_state(self, state: ConnectionState) -> None:
         """Set connection state and emit `state_change` event."""
         if self._state == state:
@@ -236,27 +288,14 @@ class ConnectionSubprocess(ConnectionInterface):
         program = [
             sys.executable,
             join(BACKEND_DIR, "subprocess_main.py"),
-            "-l",
-            self._log_name_suffix,
-            "-o",
-            json.dumps(self._offer),
-            "--audio-filters",
-            json.dumps(self._initial_audio_filters),
-            "--video-filters",
-            json.dumps(self._initial_video_filters),
-            "--audio-group-filters",
-            json.dumps(self._initial_audio_group_filters),
-            "--video-group-filters",
-            json.dumps(self._initial_video_group_filters),
-            "--record-data",
-            json.dumps(self._record_data),
+            *self._get_arguments(),
         ]
         program_summary = program[:5] + [
             program[5][:10] + ("..." if len(program[5]) >= 10 else "")
         ]
 
         self._process = await create_subprocess_exec(
-            *program, stdin=PIPE, stderr=PIPE, stdout=PIPE
+            *program, stdin=PIPE, stderr=PIPE, stdout=PIPE, limit=2**24
         )
         self._logger = logging.getLogger(f"ConnectionSubprocess-{self._process.pid}")
         self._logger.debug(
@@ -270,6 +309,37 @@ class ConnectionSubprocess(ConnectionInterface):
                 name="ConnectionSubprocess._wait_for_messages",
             )
         )
+        self._start_ping()
+
+    def _get_arguments(self) -> list[str]:
+        """Get the command line arguments for `subprocess_main.py`."""
+        arguments = [
+            "-l",
+            self._log_name_suffix,
+            "-o",
+            json.dumps(self._offer),
+            "--audio-filters",
+            json.dumps(self._initial_audio_filters),
+            "--video-filters",
+            json.dumps(self._initial_video_filters),
+            "--audio-group-filters",
+            json.dumps(self._initial_audio_group_filters),
+            "--video-group-filters",
+            json.dumps(self._initial_video_group_filters),
+            "--record-data",
+            json.dumps(self._record_data),
+        ]
+        if self._measurement_directory is not None:
+            arguments += ["--measurement-directory", self._measurement_directory]
+        return arguments
+
+    async def _terminate(self) -> None:
+        """Terminate the subprocess, if it is running."""
+        if self._process is not None and self._process.returncode is None:
+            self._process.terminate()
+
+    def _start_ping(self) -> None:
+        """Start pinging the subprocess, if `ping_subprocesses` is enabled."""
         if self._config.ping_subprocesses > 0:
             self._tasks.append(
                 asyncio.create_task(
@@ -348,6 +418,7 @@ class ConnectionSubprocess(ConnectionInterface):
         data = msg["data"]
         command = msg["command"]
         command_nr = msg["command_nr"]
+        self._messages_received.inc()
 
         # self._logger.debug(
         #     f"Received {command} command from subprocess, nr: {command_nr}"
@@ -373,12 +444,18 @@ class ConnectionSubprocess(ConnectionInterface):
                 )
             case "STATE_CHANGE":
                 self._set_state(ConnectionState(data))
+            case "RECORDING_FINISHED":
+                self.emit("recording_finished", data)
             case "API":
                 await self._message_handler(data)
-            case "CONNECTION_PROPOSAL" | "CONNECTION_ANSWER":
+            case (
+                "CONNECTION_PROPOSAL" | "CONNECTION_ANSWER" | "FRAME_TRACE" | "PROFILE"
+            ):
                 await self._set_answer(command_nr, data)
             case "LOG":
                 handle_log_from_subprocess(data, self._logger)
+            case "METRICS":
+                metrics.update_remote(self._metrics_source, data)
             case _:
                 self._logger.error(f"Unrecognized command from subprocess: {command}")
 
@@ -508,12 +585,6 @@ class ConnectionSubprocess(ConnectionInterface):
         """
         data = json.dumps({"command": command, "data": data, "command_nr": command_nr})
         self._logger.debug(data)
-        if self._process is None:
-            self._logger.error(f"Failed send {data}, _process is None")
-            return
-        if self._process.stdin is None:
-            self._logger.error(f"Failed send {data}, _process.stdin is None")
-            return
 
         async with self.__lock:
             if not self._running:
@@ -521,8 +592,19 @@ class ConnectionSubprocess(ConnectionInterface):
                     f"Not sending {command} command, because running is false"
                 )
                 return
-            self._process.stdin.write(data.encode("utf-8") + b"\n")
-            await self._process.stdin.drain()
+            await self._write(data)
+            self._messages_sent.inc()
+
+    async def _write(self, data: str) -> None:
+        """Write a serialized command to the subprocess via stdin."""
+        if self._process is None:
+            self._logger.error(f"Failed send {data}, _process is None")
+            return
+        if self._process.stdin is None:
+            self._logger.error(f"Failed send {data}, _process.stdin is None")
+            return
+        self._process.stdin.write(data.encode("utf-8") + b"\n")
+        await self._process.stdin.drain()
 
 
 ConnectionInterface.register(ConnectionSubprocess)
@@ -560,7 +642,9 @@ async def connection_subprocess_factory(
     video_group_filters : list of custom_types.filter.FilterDict
         Default video group filters for this connection.
     record_data : tuple
-        Boolean flag for recording the experiment and the path where the recordings will be saved.
+        Boolean flag for recording the experiment, the path where the recordings will
+        be saved, the recording segment duration and the fsync flag, see
+        hub.record_handler.RecordHandler.
 
     Returns
     -------
@@ -0,0 +1,153 @@
+"""Provide ICE configuration for all peer connections of the hub.
+
+All aiortc.RTCPeerConnection instances must be created with `create_peer_connection`,
+which applies the ICE settings from the hub config (see server.config.Config):
+
+- `ice_servers`: STUN / TURN servers.  Without servers, only host candidates are
+  gathered and no request leaves the local network.
+- `ice_host_only`: ignore `ice_servers` and only gather host candidates, e.g. for lab
+  networks and air-gapped machines.
+- `ice_gathering_timeout`: maximum time spent waiting for STUN / TURN servers while
+  gathering candidates.  `setLocalDescription` blocks until gathering finished.
+- `ice_port_range`: local UDP port range for ICE candidates, e.g. for firewalls.
+
+Call `configure_ice` once per process before creating peer connections.  The gathering
+timeout and port range are not part of the aiortc / aioice API, they are applied by
+wrapping `aioice.Connection.get_component_candidates`, which gathers the candidates.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import random
+from typing import Any, TypedDict
+
+import aioice
+from aiortc import RTCConfiguration, RTCIceServer, RTCPeerConnection
+
+_logger = logging.getLogger("ICE")
+
+
+class IceServerDict(TypedDict, total=False):
+    """TypedDict for STUN / TURN servers in the hub config.
+
+    Attributes
+    ----------
+    urls : str or list of str
+        Server URL(s), e.g. `stun:stun.l.google.com:19302` or `turn:host:3478`.
+    username : str, optional
+        Username for TURN servers.
+    credential : str, optional
+        Password for TURN servers.
+    """
+
+    urls: str | list[str]
+    username: str
+    credential: str
+
+
+class _IceSettings:
+    """ICE settings of this process, set by `configure_ice`."""
+
+    servers: list[RTCIceServer] | None = None
+    host_only: bool = False
+    gathering_timeout: float = 5.0
+    port_range: tuple[int, int] | None = None
+
+
+_settings = _IceSettings()
+_gathering = contextvars.ContextVar("ice_gathering", default=False)
+_original_get_component_candidates = aioice.Connection.get_component_candidates
+
+
+def configure_ice(config: Any) -> None:
+    """Apply the ICE settings of `config` to peer connections created afterwards.
+
+    Parameters
+    ----------
+    config : server.config.Config
+        Hub config.
+    """
+    _settings.servers = [
+        RTCIceServer(s["urls"], s.get("username"), s.get("credential"))
+        for s in config.ice_servers
+    ]
+    _settings.host_only = config.ice_host_only
+    _settings.gathering_timeout = config.ice_gathering_timeout
+    _settings.port_range = (
+        tuple(config.ice_port_range) if config.ice_port_range is not None else None
+    )
+    aioice.Connection.get_component_candidates = _get_component_candidates
+    # Only log the URLs, TURN servers have credentials.
+    servers = (
+        "none (host only)"
+        if _settings.host_only
+        else [s.urls for s in _settings.servers]
+    )
+    _logger.debug(
+        f"ICE servers: {servers}, gathering timeout: {_settings.gathering_timeout}s, "
+        f"port range: {_settings.port_range}"
+    )
+
+
+def create_peer_connection() -> RTCPeerConnection:
+    """Create a new aiortc.RTCPeerConnection using the configured ICE settings."""
+    servers = [] if _settings.host_only else _settings.servers
+    return RTCPeerConnection(RTCConfiguration(iceServers=servers))
+
+
+async def _get_component_candidates(
+    self: aioice.Connection, component: int, addresses: list[str], timeout: int = 5
+):
+    """Replacement for aioice.Connection.get_component_candidates.
+
+    Applies the gathering timeout, and the port range for host candidates.
+    """
+    loop = asyncio.get_running_loop()
+    if _settings.port_range is not None:
+        _install_port_range(loop)
+
+    token = _gathering.set(True)
+    try:
+        return await _original_get_component_candidates(
+            self, component, addresses, timeout=_settings.gathering_timeout
+        )
+    finally:
+        _gathering.reset(token)
+
+
+def _install_port_range(loop) -> None:
+    """Bind ICE host candidates of `loop` to ports in the configured port range.
+
+    Wraps `loop.create_datagram_endpoint`.  Only endpoints created while gathering
+    candidates with an unspecified port are affected.
+    """
+    if getattr(loop, "_ice_port_range_installed", False):
+        return
+    original = loop.create_datagram_endpoint
+
+    async def create_datagram_endpoint(protocol_factory, local_addr=None, **kwargs):
+        port_range = _settings.port_range
+        if (
+            not _gathering.get()
+            or port_range is None
+            or local_addr is None
+            or local_addr[1] != 0
+        ):
+            return await original(protocol_factory, local_addr=local_addr, **kwargs)
+
+        ports = list(range(port_range[0], port_range[1] + 1))
+        random.shuffle(ports)
+        for port in ports:
+            try:
+                return await original(
+                    protocol_factory, local_addr=(local_addr[0], port), **kwargs
+                )
+            except OSError:
+                continue
+        raise OSError(f"No free port in ICE port range {port_range}")
+
+    loop.create_datagram_endpoint = create_datagram_endpoint
+    loop._ice_port_range_installed = True
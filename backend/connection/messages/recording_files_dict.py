@@ -0,0 +1,23 @@
+from typing import TypedDict
+
+
+class RecordingFilesDict(TypedDict):
+    """TypedDict for the files written when a connection stops recording.
+
+    Emitted with the `recording_finished` event of connection.connection_interface
+    implementations.
+
+    Attributes
+    ----------
+    video : str or None
+        Path of the filtered video recording.  None if no video was recorded.
+    raw_video : str or None
+        Path of the raw (unfiltered) video recording.  None if no raw video was
+        recorded.
+    audio : str or None
+        Path of the audio recording.  None if no audio was recorded.
+    """
+
+    video: str | None
+    raw_video: str | None
+    audio: str | None
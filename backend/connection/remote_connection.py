@@ -0,0 +1,310 @@
+"""Provide the `RemoteConnection` class, a ConnectionSubprocess on a worker node.
+
+See hub.worker_nodes for worker nodes and the link protocol.
+
+Worker nodes on other hosts can not reach host-local resources of the hub: recording
+paths, the OpenFace worker pool (`tcp://127.0.0.1`), the `ipc://` endpoints of
+group filters and the measurement directories in the `sessions` folder of the hub.
+Connections using them are only placed on worker nodes on the host of the hub (see
+`get_host_local_features`).  If they are enabled for a connection on another host later
+on, they are not applied and an error is logged.  Connections on other hosts are
+started without measurement directory, so no measurements are written outside the
+sessions of the hub.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Callable, Coroutine, Tuple
+
+from aiortc import RTCSessionDescription
+
+from connection.connection_subprocess import ConnectionSubprocess
+from connection.connection_state import ConnectionState
+from connection.messages import RTCSessionDescriptionDict
+from custom_types.message import MessageDict
+from filter_api import FilterAPI
+from filters import FilterDict
+from hub.exceptions import ErrorDictException
+from hub.worker_nodes import WorkerNode
+from server import Config
+
+HOST_LOCAL_FILTERS = {"OPENFACE_AU", "AUDIO_SPEAKING_TIME"}
+"""Filters using services or writing measurements only available on the hub host."""
+
+
+def get_host_local_features(
+    record: bool, filters: list[FilterDict], group_filters: list[FilterDict]
+) -> list[str]:
+    """Get the features of a connection that only work on the host of the hub.
+
+    Parameters
+    ----------
+    record : bool
+        True if the connection is recorded.
+    filters : list of filters.FilterDict
+        Audio and video filters of the connection.
+    group_filters : list of filters.FilterDict
+        Audio and video group filters of the connection.
+
+    Returns
+    -------
+    list of str
+        Names of the features, empty if the connection can run on any worker node.
+    """
+    features = []
+    if record:
+        features.append("recording")
+    features += sorted({f["name"] for f in filters if f["name"] in HOST_LOCAL_FILTERS})
+    if len(group_filters) > 0:
+        features.append("group filters")
+    return features
+
+
+class RemoteConnection(ConnectionSubprocess):
+    """Wrapper executing a hub.connection.Connection on a remote worker node.
+
+    Uses the same command protocol as ConnectionSubprocess, but the subprocess is
+    started by a worker node and commands are sent over the link to the node.
+
+    Extends connection.connection_subprocess.ConnectionSubprocess.
+    """
+
+    _node: WorkerNode
+    _connection_id: str | None
+    _exited: asyncio.Event
+    _exit_output: tuple[int | None, str, str]
+
+    def __init__(
+        self,
+        node: WorkerNode,
+        offer: RTCSessionDescriptionDict,
+        message_handler: Callable[[MessageDict], Coroutine[Any, Any, None]],
+        log_name_suffix: str,
+        config: Config,
+        audio_filters: list[FilterDict],
+        video_filters: list[FilterDict],
+        audio_group_filters: list[FilterDict],
+        video_group_filters: list[FilterDict],
+        filter_api: FilterAPI,
+        record_data: tuple,
+    ):
+        """Create new RemoteConnection on `node`.
+
+        See ConnectionSubprocess for the other parameters.
+
+        Parameters
+        ----------
+        node : hub.worker_nodes.WorkerNode
+            Worker node the connection is executed on.
+        """
+        self._node = node
+        self._connection_id = None
+        self._exited = asyncio.Event()
+        self._exit_output = (None, "", "")
+        super().__init__(
+            offer,
+            message_handler,
+            log_name_suffix,
+            config,
+            audio_filters,
+            video_filters,
+            audio_group_filters,
+            video_group_filters,
+            filter_api,
+            record_data,
+        )
+
+    def handle_exit(self, returncode: int | None, stdout: str, stderr: str) -> None:
+        """Handle the exit of the remote subprocess or the loss of the worker node.
+
+        Parameters
+        ----------
+        returncode : int or None
+            Return code of the subprocess, None if the worker node disconnected.
+        stdout : str
+            Remaining output of the subprocess on stdout.
+        stderr : str
+            Output of the subprocess on stderr.
+        """
+        self._exit_output = (returncode, stdout, stderr)
+        self._exited.set()
+        # Unblock get_local_description, if the subprocess exited before sending it.
+        self._local_description_received.set()
+        if not self._running:
+            return
+        if returncode is None:
+            self._set_state(ConnectionState.FAILED)
+        self._tasks.append(
+            asyncio.create_task(self.stop(), name="RemoteConnection.stop")
+        )
+
+    async def get_local_description(self) -> RTCSessionDescription:
+        """Get localdescription.  Blocks until the worker node sends localdescription.
+
+        Raises
+        ------
+        ErrorDictException
+            If the remote subprocess exited before sending the localdescription.
+        """
+        await self._local_description_received.wait()
+        if self._local_description is None:
+            raise ErrorDictException(
+                code=500,
+                type="INTERNAL_SERVER_ERROR",
+                description="Failed to start connection on worker node.",
+            )
+        return self._local_description
+
+    async def set_video_filters(self, filters: list[FilterDict]) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        await super().set_video_filters(self._remove_host_local_filters(filters))
+
+    async def set_audio_filters(self, filters: list[FilterDict]) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        await super().set_audio_filters(self._remove_host_local_filters(filters))
+
+    async def set_video_group_filters(
+        self, group_filters: list[FilterDict], endpoint: str
+    ) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        await super().set_video_group_filters(
+            self._remove_group_filters(group_filters), endpoint
+        )
+
+    async def set_audio_group_filters(
+        self, group_filters: list[FilterDict], endpoint: str
+    ) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        await super().set_audio_group_filters(
+            self._remove_group_filters(group_filters), endpoint
+        )
+
+    def _remove_host_local_filters(self, filters: list[FilterDict]) -> list[FilterDict]:
+        """Remove filters in `HOST_LOCAL_FILTERS`, if the node is on another host."""
+        if self._node.local:
+            return filters
+        removed = [f["name"] for f in filters if f["name"] in HOST_LOCAL_FILTERS]
+        if len(removed) > 0:
+            self._logger.error(
+                f"Not applying {', '.join(removed)}, worker node {self._node.name} is "
+                "not on the host of the hub"
+            )
+        return [f for f in filters if f["name"] not in HOST_LOCAL_FILTERS]
+
+    def _remove_group_filters(
+        self, group_filters: list[FilterDict]
+    ) -> list[FilterDict]:
+        """Remove all group filters, if the node is on another host."""
+        if self._node.local or len(group_filters) == 0:
+            return group_filters
+        self._logger.error(
+            f"Not applying group filters, worker node {self._node.name} can not reach "
+            "the group filter endpoint of the experiment"
+        )
+        return []
+
+    def _get_arguments(self) -> list[str]:
+        """Get the command line arguments for `subprocess_main.py` on the node.
+
+        Nodes on other hosts do not get a measurement directory, the measurements of
+        the session are only written on the host of the hub.
+        """
+        arguments = super()._get_arguments()
+        if not self._node.local and self._measurement_directory is not None:
+            index = arguments.index("--measurement-directory")
+            del arguments[index : index + 2]
+        return arguments
+
+    async def _run(self) -> None:
+        """Start the connection on the worker node."""
+        self._connection_id = await self._node.start_connection(
+            self, self._get_arguments()
+        )
+        self._logger = logging.getLogger(
+            f"RemoteConnection-{self._node.name}-{self._connection_id}"
+        )
+        self._logger.debug(f"Connection started on {self._node}")
+        self._start_ping()
+
+    async def _terminate(self) -> None:
+        """Terminate the subprocess on the worker node, if it is running."""
+        if self._connection_id is not None and not self._exited.is_set():
+            await self._node.stop_connection(self._connection_id)
+
+    async def _write(self, data: str) -> None:
+        """Send a serialized command to the subprocess over the worker node link."""
+        if self._connection_id is None:
+            self._logger.error(f"Failed send {data}, connection was not started")
+            return
+        # Add the connection ID to the serialized command object.
+        await self._node.send_serialized(
+            f'{{"connection": "{self._connection_id}", {data[1:]}'
+        )
+
+    async def _log_final_stdout_stderr(self) -> None:
+        """Wait for the remote subprocess to exit and log its output."""
+        if self._connection_id is None:
+            return
+        try:
+            await asyncio.wait_for(self._exited.wait(), 10)
+        except asyncio.TimeoutError:
+            self._logger.warning("Remote subprocess did not exit")
+            return
+
+        returncode, stdout, stderr = self._exit_output
+        self._logger.debug(f"Remote subprocess exited with returncode: {returncode}")
+        if stdout:
+            self._logger.debug(f"[stdout START]:\n {stdout}\n[stdout END]")
+        if stderr:
+            self._logger.error(f"[stderr START]:\n {stderr}\n[stderr END]")
+
+
+async def remote_connection_factory(
+    node: WorkerNode,
+    offer: RTCSessionDescription,
+    message_handler: Callable[[MessageDict], Coroutine[Any, Any, None]],
+    log_name_suffix: str,
+    config: Config,
+    audio_filters: list[FilterDict],
+    video_filters: list[FilterDict],
+    audio_group_filters: list[FilterDict],
+    video_group_filters: list[FilterDict],
+    filter_api: FilterAPI,
+    record_data: tuple,
+) -> Tuple[RTCSessionDescription, RemoteConnection]:
+    """Instantiate new RemoteConnection on `node`.
+
+    See connection.connection_subprocess.connection_subprocess_factory for the other
+    parameters.
+
+    Parameters
+    ----------
+    node : hub.worker_nodes.WorkerNode
+        Worker node the connection is executed on, see
+        hub.worker_nodes.WorkerNodeServer.select.
+
+    Raises
+    ------
+    ErrorDictException
+        If the worker node failed to start the connection.
+    """
+    offer_dict = RTCSessionDescriptionDict(sdp=offer.sdp, type=offer.type)  # type: ignore
+
+    connection = RemoteConnection(
+        node,
+        offer_dict,
+        message_handler,
+        log_name_suffix,
+        config,
+        audio_filters,
+        video_filters,
+        audio_group_filters,
+        video_group_filters,
+        filter_api,
+        record_data,
+    )
+
+    local_description = await connection.get_local_description()
+    return (local_description, connection)
@@ -3,6 +3,8 @@ import logging
 from aiortc import RTCPeerConnection, MediaStreamTrack, RTCSessionDescription
 from pyee.asyncio import AsyncIOEventEmitter
 
+from connection.ice import create_peer_connection
+from hub import frame_tracing
 from connection.messages import (
     ConnectionAnswerDict,
     ConnectionProposalDict,
@@ -61,9 +63,9 @@ class SubConnection(AsyncIOEventEmitter):
         self._closed = False
         self._participant_summary = participant_summary
 
-        self._pc = RTCPeerConnection()
-        self._pc.addTrack(video_track)
-        self._pc.addTrack(audio_track)
+        self._pc = create_peer_connection()
+        frame_tracing.trace_sender(self._pc.addTrack(video_track))
+        frame_tracing.trace_sender(self._pc.addTrack(audio_track))
         self._pc.on("connectionstatechange", self._on_connection_state_change)
 
         # Stop SubConnection if one of the tracks ends
@@ -0,0 +1,240 @@
+"""Provide the `WorkerNodeRunner` class, the worker node side of hub.worker_nodes.
+
+A worker node connects to the hub, registers and executes connections placed on it by
+the hub in local `subprocess_main.py` subprocesses.  Commands and messages of the
+subprocesses are relayed unchanged, tagged with the connection ID of the link.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sys
+from asyncio.subprocess import PIPE, Process, create_subprocess_exec
+from os.path import join
+
+from hub import BACKEND_DIR
+from hub.worker_nodes import LINK_LIMIT
+
+
+class WorkerNodeRunner:
+    """Connects to the hub and runs connections placed on this worker node."""
+
+    _host: str
+    _port: int
+    _token: str
+    _name: str
+    _capacity: int
+    _load_interval: float
+
+    _processes: dict[str, Process]
+    _tasks: set[asyncio.Task]
+    _writer: asyncio.StreamWriter | None
+    _write_lock: asyncio.Lock
+    _logger: logging.Logger
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        token: str,
+        name: str,
+        capacity: int,
+        load_interval: float = 5.0,
+    ) -> None:
+        """Create new WorkerNodeRunner.
+
+        Parameters
+        ----------
+        host : str
+            Host of the hub.
+        port : int
+            Port the hub listens on for worker nodes, `worker_node_port` in the hub
+            config.
+        token : str
+            Shared secret, `worker_node_token` in the hub config.
+        name : str
+            Name of this node, used in the hub logs.
+        capacity : int
+            Maximum number of connections placed on this node.
+        load_interval : float, default 5.0
+            Interval in seconds the CPU load is reported to the hub in.
+        """
+        self._host = host
+        self._port = port
+        self._token = token
+        self._name = name
+        self._capacity = capacity
+        self._load_interval = load_interval
+        self._processes = {}
+        self._tasks = set()
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._logger = logging.getLogger(f"WorkerNode-{name}")
+
+    async def run(self, retry_interval: float = 5.0) -> None:
+        """Connect to the hub and run until stopped.
+
+        Reconnects after `retry_interval` seconds if the hub is not reachable or the
+        link closes.  Connections running on this node are stopped when the link
+        closes, since the hub considers them lost.
+        """
+        try:
+            while True:
+                try:
+                    await self._run_link()
+                except (ConnectionError, OSError) as e:
+                    self._logger.warning(f"Link to hub {self._host}:{self._port}: {e}")
+                await self._stop_all()
+                await asyncio.sleep(retry_interval)
+        finally:
+            await self._stop_all()
+
+    async def _run_link(self) -> None:
+        """Register with the hub and handle commands until the link closes."""
+        reader, writer = await asyncio.open_connection(
+            self._host, self._port, limit=LINK_LIMIT
+        )
+        self._writer = writer
+        await self._send(
+            {
+                "command": "REGISTER",
+                "data": {
+                    "token": self._token,
+                    "name": self._name,
+                    "capacity": self._capacity,
+                    "cpus": os.cpu_count() or 1,
+                },
+                "command_nr": -1,
+            }
+        )
+        response = json.loads(await reader.readline() or b"null")
+        if response is None or response["command"] != "REGISTERED":
+            raise ConnectionError("Registration rejected, check worker_node_token")
+        self._logger.info(f"Registered with hub as {response['data']}")
+
+        load_task = asyncio.create_task(self._report_load())
+        try:
+            while True:
+                line = await reader.readline()
+                if len(line) == 0:
+                    raise ConnectionError("Link closed by hub")
+                await self._handle_line(line)
+        finally:
+            load_task.cancel()
+            writer.close()
+            self._writer = None
+
+    async def _handle_line(self, line: bytes) -> None:
+        """Handle a message from the hub."""
+        try:
+            message = json.loads(line)
+        except (json.JSONDecodeError, TypeError) as e:
+            self._logger.error(f"Failed to parse message from hub: {e}")
+            return
+
+        command = message["command"]
+        connection_id = message.get("connection")
+        match command:
+            case "START_CONNECTION":
+                await self._start_connection(connection_id, message["data"])
+            case "STOP_CONNECTION":
+                process = self._processes.get(connection_id)  # type: ignore
+                if process is not None and process.returncode is None:
+                    process.terminate()
+            case _:
+                # Command for a connection, the subprocess ignores `connection`.
+                process = self._processes.get(connection_id)  # type: ignore
+                if process is None or process.stdin is None:
+                    self._logger.debug(f"{command} for unknown {connection_id}")
+                    return
+                process.stdin.write(line)
+                try:
+                    await process.stdin.drain()
+                except ConnectionError:
+                    self._logger.debug(f"{command} for exited {connection_id}")
+
+    async def _start_connection(self, connection_id: str, arguments: list[str]) -> None:
+        """Start `subprocess_main.py` for a connection."""
+        process = await create_subprocess_exec(
+            sys.executable,
+            join(BACKEND_DIR, "subprocess_main.py"),
+            *arguments,
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            limit=LINK_LIMIT,
+        )
+        self._processes[connection_id] = process
+        self._logger.info(f"Started connection {connection_id}, PID: {process.pid}")
+        task = asyncio.create_task(self._relay(connection_id, process))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _relay(self, connection_id: str, process: Process) -> None:
+        """Relay the messages of a subprocess to the hub until it exits."""
+        assert process.stdout is not None and process.stderr is not None
+        prefix = f'{{"connection": "{connection_id}", '.encode("utf-8")
+        while True:
+            try:
+                line = await process.stdout.readline()
+            except ValueError:
+                self._logger.error("readline() failed, message was to long.")
+                continue
+            if len(line) == 0:
+                break
+            if not line.startswith(b"{"):
+                self._logger.debug(f"Unexpected output of {connection_id}: {line!r}")
+                continue
+            # Add the connection ID to the serialized command object.
+            await self._send_serialized(prefix + line[1:])
+
+        stdout, stderr = await process.communicate()
+        self._processes.pop(connection_id, None)
+        self._logger.info(
+            f"Connection {connection_id} exited, returncode: {process.returncode}"
+        )
+        await self._send(
+            {
+                "command": "CONNECTION_EXITED",
+                "connection": connection_id,
+                "data": {
+                    "returncode": process.returncode,
+                    "stdout": stdout.decode(errors="replace"),
+                    "stderr": stderr.decode(errors="replace"),
+                },
+                "command_nr": -1,
+            }
+        )
+
+    async def _report_load(self) -> None:
+        """Report the CPU load of this node to the hub in an interval."""
+        cpus = os.cpu_count() or 1
+        while True:
+            load = os.getloadavg()[0] / cpus if hasattr(os, "getloadavg") else 0.0
+            await self._send({"command": "LOAD", "data": {"load": load}})
+            await asyncio.sleep(self._load_interval)
+
+    async def _stop_all(self) -> None:
+        """Terminate all connections running on this node."""
+        for process in self._processes.values():
+            if process.returncode is None:
+                process.terminate()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _send(self, message: dict) -> None:
+        """Send `message` to the hub."""
+        await self._send_serialized(json.dumps(message).encode("utf-8") + b"\n")
+
+    async def _send_serialized(self, data: bytes) -> None:
+        """Send a serialized message, ending with a newline, to the hub."""
+        async with self._write_lock:
+            if self._writer is None or self._writer.is_closing():
+                return
+            self._writer.write(data)
+            try:
+                await self._writer.drain()
+            except ConnectionError as e:
+                self._logger.warning(f"Failed to send message to hub: {e}")
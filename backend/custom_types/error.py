@@ -55,6 +55,7 @@ ERROR_TYPES = Literal[
     "NOT_CONNECTED_TO_EXPERIMENT",
     "EXPERIMENT_RUNNING",
     "ALREADY_JOINED_EXPERIMENT",
+    "PROFILE_ALREADY_RUNNING",
 ]
 """Possible error types for custom_types.error.ErrorDict.
 
@@ -73,6 +73,10 @@ MESSAGE_TYPES = Literal[
     "SET_GROUP_FILTERS",
     "PING",
     "PONG",
+    "POST_PROCESSING",
+    "GET_FRAME_TRACE",
+    "START_PROFILE",
+    "STOP_PROFILE",
 ]
 """Possible message types for custom_types.message.MessageDict.
 
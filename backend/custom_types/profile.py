@@ -0,0 +1,83 @@
+"""Provide the `ProfileRequestDict` and `StopProfileRequestDict` TypedDicts.
+
+Use for type hints and static type checking without any overhead during runtime.
+"""
+
+from typing import TypeGuard, TypedDict
+
+import custom_types.util as util
+from hub.profiler import MAX_DURATION
+
+
+class ProfileRequestDict(TypedDict):
+    """TypedDict for `START_PROFILE` requests from experimenters.
+
+    Attributes
+    ----------
+    participant_id : str
+        ID of the participant whose connection should be profiled.
+    duration : float
+        Duration of the profile in seconds.  Must be greater than 0 and at most
+        hub.profiler.MAX_DURATION.
+    """
+
+    participant_id: str
+    duration: float
+
+
+class StopProfileRequestDict(TypedDict):
+    """TypedDict for `STOP_PROFILE` requests from experimenters.
+
+    Attributes
+    ----------
+    participant_id : str
+        ID of the participant whose profile should be stopped early.
+    """
+
+    participant_id: str
+
+
+def is_valid_profile_request(data) -> TypeGuard[ProfileRequestDict]:
+    """Check if `data` is a valid ProfileRequestDict.
+
+    Checks if all required and no unknown keys exist in data as well as the data types
+    and range of the values.
+
+    Parameters
+    ----------
+    data : any
+        Data to perform check on.
+
+    Returns
+    -------
+    bool
+        True if `data` is a valid ProfileRequestDict.
+    """
+    return (
+        util.check_valid_typeddict_keys(data, ProfileRequestDict)
+        and isinstance(data["participant_id"], str)
+        and isinstance(data["duration"], (int, float))
+        and not isinstance(data["duration"], bool)
+        and 0 < data["duration"] <= MAX_DURATION
+    )
+
+
+def is_valid_stop_profile_request(data) -> TypeGuard[StopProfileRequestDict]:
+    """Check if `data` is a valid StopProfileRequestDict.
+
+    Checks if all required and no unknown keys exist in data as well as the data types
+    of the values.
+
+    Parameters
+    ----------
+    data : any
+        Data to perform check on.
+
+    Returns
+    -------
+    bool
+        True if `data` is a valid StopProfileRequestDict.
+    """
+    return util.check_valid_typeddict_keys(data, StopProfileRequestDict) and isinstance(
+        data["participant_id"], str
+    )
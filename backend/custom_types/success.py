@@ -42,6 +42,10 @@ SUCCESS_TYPES = Literal[
     "MUTE",
     "SET_FILTERS",
     "SET_GROUP_FILTERS",
+    "GET_FRAME_TRACE",
+    "START_PROFILE",
+    "STOP_PROFILE",
+    "PROFILE_FINISHED",
 ]
 """Possible success types for custom_types.success.SuccessDict.
 
@@ -1,2 +1,3 @@
 from .experiment import Experiment
 from .experiment_state import ExperimentState
+from .experiment_worker import ExperimentWorker
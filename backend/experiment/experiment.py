@@ -1,8 +1,9 @@
 """Provide the `Experiment` class."""
+
 from __future__ import annotations
 
 import logging
-from typing import Any, TYPE_CHECKING
+from typing import Any, Literal, TYPE_CHECKING
 from pyee.asyncio import AsyncIOEventEmitter
 
 from custom_types.message import MessageDict
@@ -14,8 +15,17 @@ from hub.exceptions import ErrorDictException
 from session.data.session import SessionData
 
 from group_filters.group_filter_aggregator import GroupFilterAggregator
+from group_filters.group_filter_aggregation_process import (
+    GroupFilterAggregationProcess,
+)
+from group_filters.group_filter_broker import (
+    GroupFilterBroker,
+    get_group_filter_endpoint,
+)
 from filters.filter_dict import FilterDict
-from group_filters import group_filter_aggregator_factory
+from group_filters.group_filter_aggregator_factory import (
+    update_group_filter_aggregators,
+)
 import asyncio
 
 if TYPE_CHECKING:
@@ -37,8 +47,15 @@ class Experiment(AsyncIOEventEmitter):
     _participants: dict[str, Participant]
     _audio_group_filter_aggregators: dict[str, GroupFilterAggregator]
     _video_group_filter_aggregators: dict[str, GroupFilterAggregator]
-
-    def __init__(self, session: SessionData):
+    _aggregation_process: GroupFilterAggregationProcess | None
+    _group_filter_broker: GroupFilterBroker | None
+    group_filter_endpoint: str
+
+    def __init__(
+        self,
+        session: SessionData,
+        aggregation_process: GroupFilterAggregationProcess | None = None,
+    ):
         """Start a new Experiment.
 
         Parameters
@@ -46,6 +63,9 @@ class Experiment(AsyncIOEventEmitter):
         session : session.data.session.SessionData
             SessionData this experiment is based on. Will modify the session during
             execution.
+        aggregation_process : GroupFilterAggregationProcess, optional
+            Process the group filter aggregators are executed on.  If None, the
+            aggregators run on the event loop of the experiment.
         """
         super().__init__()
         self._logger = logging.getLogger(f"Experiment-{session.id}")
@@ -57,6 +77,15 @@ class Experiment(AsyncIOEventEmitter):
         self.session.creation_time = timestamp()
         self._audio_group_filter_aggregators = {}
         self._video_group_filter_aggregators = {}
+        self._aggregation_process = aggregation_process
+        if aggregation_process is None:
+            self._group_filter_broker = GroupFilterBroker(
+                get_group_filter_endpoint(session.id)
+            )
+            self.group_filter_endpoint = self._group_filter_broker.endpoint
+        else:
+            self._group_filter_broker = None
+            self.group_filter_endpoint = aggregation_process.endpoint
 
     def __str__(self) -> str:
         """Get string representation of this Experiment."""
@@ -432,99 +461,85 @@ class Experiment(AsyncIOEventEmitter):
         self.emit("state", self._state)
 
     async def set_video_group_filter_aggregators(
-        self, group_filter_configs: list[FilterDict], ports: list[int]
+        self, group_filter_configs: list[FilterDict]
     ) -> None:
-        old_group_filter_aggregators = self._video_group_filter_aggregators
+        """Update the video group filter aggregators of this experiment.
 
-        self._video_group_filter_aggregators = {}
-        coroutines = []
-        for config, port in zip(group_filter_configs, ports):
-            filter_id = config["id"]
-            # Reuse existing filter for matching id and name.
-            if (
-                filter_id in old_group_filter_aggregators
-                and old_group_filter_aggregators[filter_id]._group_filter.config["name"]
-                == config["name"]
-            ):
-                self._video_group_filter_aggregators[
-                    filter_id
-                ] = old_group_filter_aggregators[filter_id]
-
-                self._video_group_filter_aggregators[
-                    filter_id
-                ]._group_filter.set_config(config)
-                self._video_group_filter_aggregators[filter_id].delete_data()
-            else:
-                # Create a new filter for configs with empty id.
-                self._video_group_filter_aggregators[
-                    filter_id
-                ] = group_filter_aggregator_factory.create_group_filter_aggregator(
-                    "video", config, port
-                )
+        Parameters
+        ----------
+        group_filter_configs : list of filters.FilterDict
+            New video group filter configs.
+        """
+        await self._set_group_filter_aggregators("video", group_filter_configs)
 
-        # Cleanup old group filter aggregators
-        for (
-            filter_id,
-            old_group_filter_aggregator,
-        ) in old_group_filter_aggregators.items():
-            if filter_id not in self._video_group_filter_aggregators:
-                coroutines.append(old_group_filter_aggregator.cleanup())
+    async def set_audio_group_filter_aggregators(
+        self, group_filter_configs: list[FilterDict]
+    ) -> None:
+        """Update the audio group filter aggregators of this experiment.
 
-        # Run new group filter aggregators
-        for (
-            new_group_filter_aggregator
-        ) in self._video_group_filter_aggregators.values():
-            task = asyncio.create_task(new_group_filter_aggregator.run())
-            new_group_filter_aggregator.set_task(task)
-            coroutines.append(task)
+        Parameters
+        ----------
+        group_filter_configs : list of filters.FilterDict
+            New audio group filter configs.
+        """
+        await self._set_group_filter_aggregators("audio", group_filter_configs)
 
-        await asyncio.gather(*coroutines)
+    async def start_group_filter_aggregators(self) -> None:
+        """Create the group filter aggregators for the group filters in the session.
 
-    async def set_audio_group_filter_aggregators(
-        self, group_filter_configs: list[FilterDict], ports: list[int]
-    ) -> None:
-        old_group_filter_aggregators = self._audio_group_filter_aggregators
+        Participants send group filter data as soon as they join, so the aggregators
+        must exist before the first participant joins, not only after the group filters
+        are changed by an experimenter.  Errors are logged, not raised.
+        """
+        for kind in ("video", "audio"):
+            configs: dict[str, FilterDict] = {}
+            for p_data in self.session.participants.values():
+                for config in getattr(p_data, f"{kind}_group_filters"):
+                    configs.setdefault(config["id"], config)
+            if len(configs) == 0:
+                continue
+            try:
+                await self._set_group_filter_aggregators(kind, list(configs.values()))
+            except ErrorDictException as e:
+                self._logger.error(
+                    f"Failed to create {kind} group filter aggregators: {e.description}"
+                )
 
+    async def cleanup(self) -> None:
+        """Stop all group filter aggregators and the aggregation process, if used."""
+        if self._aggregation_process is not None:
+            await self._aggregation_process.stop()
+        if self._group_filter_broker is not None:
+            await self._group_filter_broker.stop()
+        aggregators = [
+            *self._video_group_filter_aggregators.values(),
+            *self._audio_group_filter_aggregators.values(),
+        ]
+        self._video_group_filter_aggregators = {}
         self._audio_group_filter_aggregators = {}
-        coroutines = []
-        for config, port in zip(group_filter_configs, ports):
-            filter_id = config["id"]
-            # Reuse existing filter for matching id and name.
-            if (
-                filter_id in old_group_filter_aggregators
-                and old_group_filter_aggregators[filter_id]._group_filter.config["name"]
-                == config["name"]
-            ):
-                self._audio_group_filter_aggregators[
-                    filter_id
-                ] = old_group_filter_aggregators[filter_id]
-
-                self._audio_group_filter_aggregators[
-                    filter_id
-                ]._group_filter.set_config(config)
-                self._audio_group_filter_aggregators[filter_id].delete_data()
-            else:
-                # Create a new filter for configs with empty id.
-                self._audio_group_filter_aggregators[
-                    filter_id
-                ] = group_filter_aggregator_factory.create_group_filter_aggregator(
-                    "audio", config, port
-                )
+        await asyncio.gather(*[a.cleanup() for a in aggregators])
 
-        # Cleanup old group filter aggregators
-        for (
-            filter_id,
-            old_group_filter_aggregator,
-        ) in old_group_filter_aggregators.items():
-            if filter_id not in self._audio_group_filter_aggregators:
-                coroutines.append(old_group_filter_aggregator.cleanup())
-
-        # Run new group filter aggregators
-        for (
-            new_group_filter_aggregator
-        ) in self._audio_group_filter_aggregators.values():
-            task = asyncio.create_task(new_group_filter_aggregator.run())
-            new_group_filter_aggregator.set_task(task)
-            coroutines.append(task)
-
-        await asyncio.gather(*coroutines)
+    async def _set_group_filter_aggregators(
+        self, kind: Literal["video", "audio"], group_filter_configs: list[FilterDict]
+    ) -> None:
+        """Update the group filter aggregators of `kind`."""
+        if self._aggregation_process is not None:
+            await self._aggregation_process.set_group_filter_aggregators(
+                kind, group_filter_configs
+            )
+            return
+
+        assert self._group_filter_broker is not None
+        if kind == "video":
+            aggregators = self._video_group_filter_aggregators
+        else:
+            aggregators = self._audio_group_filter_aggregators
+        aggregators = await update_group_filter_aggregators(
+            kind, aggregators, group_filter_configs
+        )
+        if kind == "video":
+            self._video_group_filter_aggregators = aggregators
+        else:
+            self._audio_group_filter_aggregators = aggregators
+        self._group_filter_broker.set_aggregators(kind, aggregators)
+        self._group_filter_broker.start()
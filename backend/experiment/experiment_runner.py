@@ -0,0 +1,472 @@
+"""Provide the `ExperimentRunner` class, the worker side of ExperimentWorker.
+
+See experiment.experiment_worker for an overview.  The runner hosts a regular
+experiment.Experiment with its participants, group filter aggregators and connection
+subprocesses.  Experimenters are represented by users.Experimenter instances with an
+`ExperimenterRelayConnection`, which sends all messages to the experimenter's
+connection on the hub.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any
+
+from aiortc import RTCSessionDescription
+
+from connection.connection_interface import ConnectionInterface
+from connection.connection_state import ConnectionState
+from connection.ice import configure_ice
+from connection.messages import ConnectionAnswerDict, ConnectionOfferDict
+from custom_types.message import MessageDict
+from experiment.experiment import Experiment
+from experiment.experiment_state import ExperimentState
+from filters import FilterDict
+from group_filters.group_filter_aggregation_process import GroupFilterAggregationProcess
+from hub import frame_tracing, metrics
+from hub.exceptions import ErrorDictException
+from hub.subprocess_logging import SubprocessLoggingHandler
+from server import Config
+from session.data.participant.participant_summary import ParticipantSummaryDict
+from session.data.session import SessionData, SessionDict, session_data_factory
+
+# users must be imported after hub.hub, which imports users itself.
+import hub.hub  # noqa: F401, E402
+from users import Experimenter, Participant, participant_factory  # noqa: E402
+
+
+class ExperimenterRelayConnection(ConnectionInterface):
+    """Connection of an experimenter, whose client is connected to the hub.
+
+    Messages are relayed to the experimenter connection on the hub.  Experimenters do
+    not publish streams, so only `send` and `stop` have an effect.  Subscribing to the
+    experimenter or profiling it raises an ErrorDictException, other methods do
+    nothing.
+
+    Implements connection.connection_interface.ConnectionInterface.
+    """
+
+    _experimenter_id: str
+    _runner: ExperimentRunner
+    _state: ConnectionState
+
+    def __init__(self, experimenter_id: str, runner: ExperimentRunner) -> None:
+        super().__init__()
+        self._experimenter_id = experimenter_id
+        self._runner = runner
+        self._state = ConnectionState.CONNECTED
+
+    @property
+    def state(self) -> ConnectionState:
+        # For docstring see ConnectionInterface or hover over function declaration
+        return self._state
+
+    async def stop(self) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        if self._state is ConnectionState.CLOSED:
+            return
+        self._state = ConnectionState.CLOSED
+        self.emit("state_change", self._state)
+
+    async def send(self, data: MessageDict | dict) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        if self._state is ConnectionState.CLOSED:
+            return
+        self._runner.send_command(
+            "EXPERIMENTER_SEND",
+            {"experimenter_id": self._experimenter_id, "message": data},
+        )
+
+    async def create_subscriber_proposal(
+        self, participant_summary: ParticipantSummaryDict | str | None
+    ) -> ConnectionOfferDict:
+        # For docstring see ConnectionInterface or hover over function declaration
+        raise _not_publishing_error()
+
+    async def handle_subscriber_offer(
+        self, offer: ConnectionOfferDict
+    ) -> ConnectionAnswerDict:
+        # For docstring see ConnectionInterface or hover over function declaration
+        raise _not_publishing_error()
+
+    async def stop_subconnection(self, subconnection_id: str) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        # No streams are published, so there are no SubConnections.
+        pass
+
+    async def set_muted(self, video: bool, audio: bool) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        pass
+
+    async def set_video_filters(self, filters: list[FilterDict]) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        pass
+
+    async def set_audio_filters(self, filters: list[FilterDict]) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        pass
+
+    async def set_video_group_filters(
+        self, group_filters: list[FilterDict], endpoint: str
+    ) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        pass
+
+    async def set_audio_group_filters(
+        self, group_filters: list[FilterDict], endpoint: str
+    ) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        pass
+
+    async def start_recording(self) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        pass
+
+    async def stop_recording(self) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        pass
+
+    async def get_frame_trace(self) -> list[dict]:
+        # For docstring see ConnectionInterface or hover over function declaration
+        return []
+
+    async def start_profile(self, duration: float) -> str:
+        # For docstring see ConnectionInterface or hover over function declaration
+        raise ErrorDictException(
+            code=501,
+            type="NOT_IMPLEMENTED",
+            description=(
+                "Experimenter connections on experiment workers are not profiled."
+            ),
+        )
+
+    async def stop_profile(self) -> None:
+        # For docstring see ConnectionInterface or hover over function declaration
+        pass
+
+
+def _not_publishing_error() -> ErrorDictException:
+    """Get the error for subscriptions to a relayed experimenter."""
+    return ErrorDictException(
+        code=501,
+        type="NOT_IMPLEMENTED",
+        description="Experimenters on experiment workers do not publish streams.",
+    )
+
+
+class _WorkerSessionManager:
+    """Provides the session of the worker to users, like session.SessionManager."""
+
+    _session: SessionData
+
+    def __init__(self, session: SessionData) -> None:
+        self._session = session
+
+    def get_session(self, session_id: str) -> SessionData | None:
+        """Get the session with the given id, if it is the session of this worker."""
+        return self._session if session_id == self._session.id else None
+
+
+class _PostProcessingRelay:
+    """Submits post-processing jobs to the queue on the hub."""
+
+    _runner: ExperimentRunner
+
+    def __init__(self, runner: ExperimentRunner) -> None:
+        self._runner = runner
+
+    async def submit(
+        self,
+        type: str,
+        session_id: str,
+        participant_id: str,
+        inputs: list[str],
+        output: str,
+        priority: int = 1,
+    ) -> None:
+        """Submit a job, see hub.post_processing.PostProcessingQueue.submit."""
+        self._runner.send_command(
+            "POST_PROCESSING",
+            {
+                "type": type,
+                "session_id": session_id,
+                "participant_id": participant_id,
+                "inputs": inputs,
+                "output": output,
+                "priority": priority,
+            },
+        )
+
+
+class _WorkerHub:
+    """Provides the parts of hub.hub.Hub users use, on the worker.
+
+    Hub wide operations are relayed to the hub.
+    """
+
+    config: Config
+    experiments: dict[str, Experiment]
+    session_manager: _WorkerSessionManager
+    post_processing: _PostProcessingRelay
+    worker_nodes: None
+    _runner: ExperimentRunner
+
+    def __init__(
+        self, config: Config, experiment: Experiment, runner: ExperimentRunner
+    ) -> None:
+        self.config = config
+        self.experiments = {experiment.session.id: experiment}
+        self.session_manager = _WorkerSessionManager(experiment.session)
+        self.post_processing = _PostProcessingRelay(runner)
+        # Worker nodes register with the hub, connections run on the worker.
+        self.worker_nodes = None
+        self._runner = runner
+
+    async def send_to_experimenters(
+        self, data: MessageDict, exclude: Experimenter | None = None
+    ) -> None:
+        """Send `data` to all experimenters connected to the hub."""
+        self._runner.send_command(
+            "SEND_TO_EXPERIMENTERS",
+            {"message": data, "exclude": exclude.id if exclude is not None else None},
+        )
+
+    async def create_experiment(self, session_id: str) -> Experiment:
+        """Not available on workers, experiments are created by the hub."""
+        raise ErrorDictException(
+            code=409,
+            type="INVALID_REQUEST",
+            description="Experiment already exists.",
+        )
+
+
+class ExperimentRunner:
+    """Worker counterpart to experiment.experiment_worker.ExperimentWorker.
+
+    Handles incoming commands from the hub and relays messages and events from the
+    experiment to the hub.
+
+    Intended to be executed on a dedicated subprocess, uses stdin and stdout for
+    communication with the hub.
+    """
+
+    _config: Config
+    _experiment: Experiment
+    _hub: _WorkerHub
+    _experimenters: dict[str, Experimenter]
+    _tasks: set[asyncio.Task]
+    _metrics_reporter: metrics.MetricsReporter
+    _logger: logging.Logger
+
+    def __init__(self, session_dict: SessionDict) -> None:
+        """Instantiate new ExperimentRunner and create the experiment.
+
+        Parameters
+        ----------
+        session_dict : session.data.session.SessionDict
+            Session the experiment is based on.
+        """
+        self._config = Config()
+        configure_ice(self._config)
+
+        # Setup logging for worker
+        handler = SubprocessLoggingHandler(self.send_command)
+        logging.basicConfig(
+            level=logging.getLevelName(self._config.log), handlers=[handler]
+        )
+        dependencies_log_level = logging.getLevelName(self._config.log_dependencies)
+        logging.getLogger("aiohttp").setLevel(dependencies_log_level)
+        logging.getLogger("aioice").setLevel(dependencies_log_level)
+        logging.getLogger("aiortc").setLevel(dependencies_log_level)
+        logging.getLogger("PIL").setLevel(dependencies_log_level)
+        self._logger = logging.getLogger("ExperimentRunner")
+        metrics.configure(f"experiment-{os.getpid()}", self._config.metrics_interval)
+        frame_tracing.configure(self._config.frame_tracing, f"experiment-{os.getpid()}")
+        self._metrics_reporter = metrics.MetricsReporter(
+            self.send_command, self._config.metrics_interval
+        )
+
+        session = session_data_factory(session_dict)
+        aggregation_process = None
+        if self._config.group_filter_aggregation_process:
+            aggregation_process = GroupFilterAggregationProcess(
+                session.id, self._config.ping_subprocesses
+            )
+        self._experiment = Experiment(session, aggregation_process)
+        self._hub = _WorkerHub(self._config, self._experiment, self)
+        self._experimenters = {}
+        self._tasks = set()
+
+        session.add_listener("update", self._handle_session_update)
+        self._experiment.add_listener("state", self._handle_state)
+
+    async def run(self) -> None:
+        """Run the ExperimentRunner.  Returns after the hub sent `SHUTDOWN`."""
+        await self._experiment.start_group_filter_aggregators()
+        self.send_command("READY", self._experiment.session.asdict())
+        self._metrics_reporter.start()
+        await self._listen_for_messages()
+        self._logger.debug("ExperimentRunner exiting")
+
+    def send_command(self, command: str, data: Any, command_nr: int = -1) -> None:
+        """Send command to the hub via stdout.
+
+        Parameters
+        ----------
+        command : str
+            Command / operator for message.
+        data : any
+            JSON serializable data for command / operator.
+        command_nr : int, optional
+            Command nr identifying requests with responses.  Only required if response
+            must be identified with request.
+        """
+        line = json.dumps({"command": command, "data": data, "command_nr": command_nr})
+        print(line, flush=True)
+
+    async def _listen_for_messages(self) -> None:
+        """Listen for messages / commands from the hub over stdin."""
+        loop = asyncio.get_running_loop()
+        while True:
+            msg = await loop.run_in_executor(None, sys.stdin.readline)
+            if len(msg) == 0:
+                self._logger.debug("stdin closed, shutting down")
+                await self._shutdown()
+                return
+
+            try:
+                parsed = json.loads(msg)
+            except (json.JSONDecodeError, TypeError) as e:
+                self._logger.error(f"Failed to parse message from hub: {e}")
+                continue
+
+            if parsed["command"] == "SHUTDOWN":
+                await self._shutdown()
+                self.send_command("RESPONSE", None, parsed["command_nr"])
+                return
+            self._handle_message(parsed)
+
+    def _handle_message(self, msg: dict) -> None:
+        """Handle message / command from the hub.
+
+        Experimenters are added and removed immediately, to keep the order of
+        experimenter messages.  All other commands are handled in separate tasks, since
+        some experiment API endpoints only return after a long time.
+        """
+        data = msg["data"]
+        command = msg["command"]
+        command_nr = msg["command_nr"]
+
+        match command:
+            case "PING":
+                self.send_command(
+                    "PONG", {"original": data, "subprocess_time": time.time()}
+                )
+            case "ADD_EXPERIMENTER":
+                self._add_experimenter(data)
+            case "REMOVE_EXPERIMENTER":
+                experimenter = self._experimenters.pop(data, None)
+                if experimenter is not None:
+                    self._create_task(experimenter.disconnect())
+            case "EXPERIMENTER_MESSAGE":
+                experimenter = self._experimenters.get(data["experimenter_id"])
+                if experimenter is None:
+                    self._logger.warning(
+                        f"Unknown experimenter: {data['experimenter_id']}"
+                    )
+                    return
+                self._create_task(experimenter.handle_message(data["message"]))
+            case "PARTICIPANT_OFFER":
+                self._create_task(
+                    self._respond(command_nr, self._add_participant(data))
+                )
+            case "START_EXPERIMENT":
+                self._create_task(self._respond(command_nr, self._experiment.start()))
+            case "STOP_EXPERIMENT":
+                self._create_task(self._respond(command_nr, self._experiment.stop()))
+            case _:
+                self._logger.error(f"Unrecognized command from hub: {command}")
+
+    def _create_task(self, coroutine) -> None:
+        """Run `coroutine` in a task, keeping a reference until it is done."""
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _respond(self, command_nr: int, coroutine) -> None:
+        """Await `coroutine` and send its result or error as `RESPONSE` to the hub."""
+        try:
+            result = await coroutine
+        except ErrorDictException as e:
+            result = e.error_message
+        except Exception as e:
+            self._logger.exception(f"Failed to handle command: {e}")
+            result = ErrorDictException(
+                code=500,
+                type="INTERNAL_SERVER_ERROR",
+                description="Internal server error. See server log for details.",
+            ).error_message
+        self.send_command("RESPONSE", result, command_nr)
+
+    def _add_experimenter(self, experimenter_id: str) -> None:
+        """Add the hub experimenter with `experimenter_id` to the experiment."""
+        experimenter = Experimenter(experimenter_id, self._hub)  # type: ignore
+        experimenter.set_connection(ExperimenterRelayConnection(experimenter_id, self))
+        self._experimenters[experimenter_id] = experimenter
+        self._create_task(experimenter.join_experiment(self._experiment))
+
+    async def _add_participant(self, data: dict) -> dict:
+        """Create a participant and its connection, return the answer."""
+        participant_id = data["participant_id"]
+        participant_data = self._experiment.session.participants.get(participant_id)
+        if participant_data is None:
+            raise ErrorDictException(
+                code=400,
+                type="UNKNOWN_PARTICIPANT",
+                description="Participant not found in the given session.",
+            )
+
+        offer = RTCSessionDescription(data["offer"]["sdp"], data["offer"]["type"])
+        answer, participant = await participant_factory(
+            offer,
+            participant_id,
+            self._experiment,
+            participant_data,
+            self._hub,  # type: ignore
+            self._config,
+        )
+        participant.add_listener("disconnected", self._handle_participant_disconnect)
+        self._send_participants()
+        return {"sdp": answer.sdp, "type": answer.type}
+
+    def _handle_participant_disconnect(self, _: Participant) -> None:
+        self._send_participants()
+
+    def _send_participants(self) -> None:
+        """Send the IDs of the connected participants to the hub."""
+        self.send_command("PARTICIPANTS", list(self._experiment.participants))
+
+    def _handle_session_update(self, session: SessionData) -> None:
+        """Relay session data changes to the hub, which saves them."""
+        self.send_command("SESSION_UPDATE", session.asdict())
+
+    def _handle_state(self, state: ExperimentState) -> None:
+        """Relay experiment state changes to the hub."""
+        self.send_command("STATE", state.value)
+
+    async def _shutdown(self) -> None:
+        """Disconnect all users and send the final session data to the hub."""
+        self._logger.debug("Shutting down")
+        await self._metrics_reporter.stop()
+        users = [
+            *self._experiment.participants.values(),
+            *self._experimenters.values(),
+        ]
+        await asyncio.gather(*[u.disconnect() for u in users], return_exceptions=True)
+        await self._experiment.cleanup()
+        self.send_command("SESSION_UPDATE", self._experiment.session.asdict())
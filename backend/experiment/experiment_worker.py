@@ -0,0 +1,454 @@
+"""Provide the `ExperimentWorker` class, running an Experiment on a worker process.
+
+If `experiment_workers` is enabled in the config, every experiment runs in a dedicated
+worker process (see experiment.experiment_runner.ExperimentRunner and
+`experiment_worker_main.py`), including the participant connections (and their
+connection subprocesses), the group filter aggregators and all experiment API
+endpoints.  The hub only routes participant offers and experimenter messages to the
+worker and relays messages from the worker to the experimenters, so a busy experiment
+does not delay signaling for other experiments.
+
+Experimenter connections stay on the hub, because an experimenter can switch between
+experiments.  While an experimenter is part of an experiment running on a worker, the
+experiment API messages of the experimenter (see `FORWARDED_MESSAGES`) are forwarded to
+the worker.  Media is not relayed, sub-connections are created by the participant
+connections on the worker and negotiated via the experimenter's datachannel.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from asyncio.subprocess import PIPE, Process, create_subprocess_exec
+from os.path import join
+from typing import TYPE_CHECKING, Any
+
+from aiortc import RTCSessionDescription
+from pyee.asyncio import AsyncIOEventEmitter
+
+from custom_types.error import ErrorDict
+from custom_types.message import MessageDict
+from experiment.experiment_state import ExperimentState
+from hub import BACKEND_DIR, metrics
+from hub.exceptions import ErrorDictException
+from hub.subprocess_logging import handle_log_from_subprocess
+from server import Config
+from session.data.session import SessionData
+
+if TYPE_CHECKING:
+    from hub.hub import Hub
+    from users import Experimenter
+
+FORWARDED_MESSAGES = {
+    "START_EXPERIMENT",
+    "STOP_EXPERIMENT",
+    "ADD_NOTE",
+    "CHAT",
+    "KICK_PARTICIPANT",
+    "BAN_PARTICIPANT",
+    "MUTE",
+    "SET_FILTERS",
+    "SET_GROUP_FILTERS",
+    "CONNECTION_OFFER",
+    "GET_FRAME_TRACE",
+    "START_PROFILE",
+    "STOP_PROFILE",
+}
+"""Experimenter message types handled by the worker of the joined experiment."""
+
+_WORKER_NOT_RUNNING = MessageDict(
+    type="ERROR",
+    data=ErrorDict(
+        code=500,
+        type="INTERNAL_SERVER_ERROR",
+        description="Experiment worker is not running.",
+    ),
+)
+
+
+class ExperimentWorker(AsyncIOEventEmitter):
+    """Hub side of an experiment.experiment.Experiment running on a worker process.
+
+    Provides the parts of the Experiment interface the hub uses.  The session data,
+    experiment state and connected participants are mirrored from the worker.
+
+    Extends AsyncIOEventEmitter, providing the following events:
+    - `state` : experiment.experiment_state.ExperimentState
+        Emitted when the experiment state changes.
+    """
+
+    session: SessionData
+    _hub: Hub
+    _config: Config
+    _state: ExperimentState
+    _participants: set[str]
+    _experimenters: list[Experimenter]
+
+    _logger: logging.Logger
+    _process: Process | None
+    _running: bool
+    _tasks: list[asyncio.Task]
+    _ready: asyncio.Event
+    _command_nr: int
+    _responses: dict[int, asyncio.Future]
+    _messages_sent: metrics.Counter
+    _messages_received: metrics.Counter
+
+    def __init__(self, session: SessionData, hub: Hub, config: Config) -> None:
+        """Create new ExperimentWorker.  Use `start_worker` to start the worker.
+
+        Parameters
+        ----------
+        session : session.data.session.SessionData
+            SessionData the experiment is based on.  Changes made by the worker are
+            applied to `session`, which persists them through the SessionManager.
+        hub : hub.hub.Hub
+            Hub the experiment is part of.
+        config : hub.config.Config
+            Hub config.
+        """
+        super().__init__()
+        self.session = session
+        self._hub = hub
+        self._config = config
+        self._state = ExperimentState.WAITING
+        self._participants = set()
+        self._experimenters = []
+
+        self._logger = logging.getLogger(f"ExperimentWorker-{session.id}")
+        self._process = None
+        self._running = False
+        self._tasks = []
+        self._ready = asyncio.Event()
+        self._command_nr = 0
+        self._responses = {}
+        self._messages_sent, self._messages_received = [
+            metrics.counter(
+                "hub_ipc_messages_total",
+                channel="experiment_worker",
+                peer=session.id,
+                direction=direction,
+            )
+            for direction in ["sent", "received"]
+        ]
+
+    def __str__(self) -> str:
+        """Get string representation of this ExperimentWorker."""
+        pid = self._process.pid if self._process is not None else None
+        return f"session={self.session.id}, title={self.session.title}, pid={pid}"
+
+    def __repr__(self) -> str:
+        """Get representation of this ExperimentWorker obj."""
+        return f"ExperimentWorker({str(self)})"
+
+    @property
+    def state(self) -> ExperimentState:
+        """State the experiment is in."""
+        return self._state
+
+    @property
+    def participants(self) -> set[str]:
+        """IDs of the participants currently connected to the experiment."""
+        return self._participants
+
+    @property
+    def experimenters(self) -> list[Experimenter]:
+        """Experimenters currently connected to the experiment."""
+        return self._experimenters
+
+    async def start_worker(self) -> None:
+        """Start the worker process and wait until it created the experiment."""
+        program = [
+            sys.executable,
+            join(BACKEND_DIR, "experiment_worker_main.py"),
+            "--session",
+            json.dumps(self.session.asdict()),
+        ]
+        self._process = await create_subprocess_exec(
+            *program, stdin=PIPE, stdout=PIPE, stderr=PIPE, limit=2**24
+        )
+        self._running = True
+        self._logger.info(f"Worker started, PID: {self._process.pid}")
+        metrics.add_collector(self._collect_metrics)
+
+        self._tasks.append(
+            asyncio.create_task(
+                self._wait_for_messages(), name="ExperimentWorker._wait_for_messages"
+            )
+        )
+        if self._config.ping_subprocesses > 0:
+            self._tasks.append(
+                asyncio.create_task(
+                    self._ping(self._config.ping_subprocesses),
+                    name="ExperimentWorker.ping",
+                )
+            )
+        await self._ready.wait()
+
+    async def stop_worker(self) -> None:
+        """Disconnect all participants and stop the worker process.
+
+        The final session data of the worker is applied to `session` before the worker
+        exits.
+        """
+        if self._running:
+            await self._send_command_wait_for_response("SHUTDOWN", None, timeout=10)
+            self._running = False
+        if self._process is not None and self._process.returncode is None:
+            try:
+                self._process.terminate()
+            except ProcessLookupError:
+                pass
+
+        current_task = asyncio.current_task()
+        await asyncio.gather(*[t for t in self._tasks if t is not current_task])
+        await self._log_final_stderr()
+        metrics.remove_collector(self._collect_metrics)
+        metrics.remove_remote(self._metrics_source)
+        metrics.remove_series(channel="experiment_worker", peer=self.session.id)
+        self._logger.info("Worker stopped")
+
+    async def start(self) -> None:
+        """Start the experiment on the worker, see experiment.Experiment.start."""
+        await self._send_command_wait_for_response("START_EXPERIMENT", None)
+
+    async def stop(self) -> None:
+        """Stop the experiment on the worker, see experiment.Experiment.stop."""
+        await self._send_command_wait_for_response("STOP_EXPERIMENT", None)
+
+    async def handle_participant_offer(
+        self, offer: RTCSessionDescription, participant_id: str
+    ) -> RTCSessionDescription:
+        """Create the participant and its connection on the worker.
+
+        Parameters
+        ----------
+        offer : aiortc.RTCSessionDescription
+            WebRTC offer from the participant.
+        participant_id : str
+            ID of the participant.  Must be checked by the hub before.
+
+        Returns
+        -------
+        aiortc.RTCSessionDescription
+            WebRTC answer for the participant.
+
+        Raises
+        ------
+        ErrorDictException
+            If the worker failed to create the participant.
+        """
+        answer = await self._send_command_wait_for_response(
+            "PARTICIPANT_OFFER",
+            {
+                "participant_id": participant_id,
+                "offer": {"sdp": offer.sdp, "type": offer.type},
+            },
+        )
+        return RTCSessionDescription(answer["sdp"], answer["type"])
+
+    def add_experimenter(self, experimenter: Experimenter) -> None:
+        """Add experimenter to the experiment on the worker.
+
+        Parameters
+        ----------
+        experimenter : users.Experimenter
+            Experimenter joining the experiment.
+        """
+        self._experimenters.append(experimenter)
+        self._logger.info(f"Experimenter ({str(experimenter)}) joined Experiment")
+        experimenter.add_listener("disconnected", self.remove_experimenter)
+        self._send_command("ADD_EXPERIMENTER", experimenter.id)
+
+    def remove_experimenter(self, experimenter: Experimenter) -> None:
+        """Remove experimenter from the experiment on the worker.
+
+        Parameters
+        ----------
+        experimenter : users.Experimenter
+            Experimenter leaving the experiment.
+
+        Raises
+        ------
+        ValueError
+            If the given `experimenter` is not part of this experiment.
+        """
+        self._experimenters.remove(experimenter)
+        experimenter.remove_listener("disconnected", self.remove_experimenter)
+        self._logger.info(f"Experimenter ({str(experimenter)}) left Experiment")
+        self._send_command("REMOVE_EXPERIMENTER", experimenter.id)
+
+    def forward_message(self, experimenter: Experimenter, message: MessageDict) -> None:
+        """Forward a message from `experimenter` to the worker.
+
+        Responses are sent to the experimenter by the worker.
+        """
+        self._send_command(
+            "EXPERIMENTER_MESSAGE",
+            {"experimenter_id": experimenter.id, "message": message},
+        )
+
+    @property
+    def _metrics_source(self) -> str:
+        """Key for the metrics received from the worker, see hub.metrics."""
+        return f"experiment-{id(self)}"
+
+    async def _collect_metrics(self) -> None:
+        """Update the metrics of the control channel, see hub.metrics."""
+        labels = {"channel": "experiment_worker", "peer": self.session.id}
+        metrics.gauge("hub_ipc_pending_responses", **labels).set(len(self._responses))
+        if self._process is not None and self._process.stdin is not None:
+            metrics.gauge("hub_ipc_write_buffer_bytes", **labels).set(
+                self._process.stdin.transport.get_write_buffer_size()
+            )
+
+    async def _ping(self, interval: float) -> None:
+        """Send PING command in interval, until the worker stopped."""
+        await asyncio.sleep(6)
+        while self._running:
+            self._send_command("PING", time.time())
+            await asyncio.sleep(interval)
+
+    async def _wait_for_messages(self) -> None:
+        """Receive and handle messages from the worker via stdout."""
+        assert self._process is not None and self._process.stdout is not None
+        while True:
+            try:
+                msg = await self._process.stdout.readline()
+            except ValueError:
+                self._logger.error("readline() failed, message was to long.")
+                continue
+
+            if len(msg) == 0:
+                if self._running:
+                    self._logger.error("Worker exited unexpectedly")
+                self._running = False
+                self._ready.set()
+                for future in self._responses.values():
+                    if not future.done():
+                        future.set_result(_WORKER_NOT_RUNNING)
+                return
+
+            try:
+                parsed = json.loads(msg)
+            except (json.JSONDecodeError, TypeError) as e:
+                self._logger.error(f"Failed to parse message from worker: {e}")
+                continue
+
+            self._messages_received.inc()
+            try:
+                await self._handle_worker_message(parsed)
+            except Exception as e:
+                self._logger.exception(f"Failed to handle {parsed['command']}: {e}")
+
+    async def _handle_worker_message(self, msg: dict) -> None:
+        """Handle a message / command from the worker."""
+        data = msg["data"]
+        command = msg["command"]
+
+        match command:
+            case "READY":
+                self._apply_session_update(data)
+                self._ready.set()
+            case "RESPONSE":
+                future = self._responses.get(msg["command_nr"])
+                if future is not None and not future.done():
+                    future.set_result(data)
+            case "LOG":
+                handle_log_from_subprocess(data, self._logger)
+            case "METRICS":
+                metrics.update_remote(self._metrics_source, data)
+            case "STATE":
+                state = ExperimentState(data)
+                if state != self._state:
+                    self._state = state
+                    self.emit("state", state)
+            case "PARTICIPANTS":
+                self._participants = set(data)
+            case "SESSION_UPDATE":
+                self._apply_session_update(data)
+            case "EXPERIMENTER_SEND":
+                for experimenter in self._experimenters:
+                    if experimenter.id == data["experimenter_id"]:
+                        await experimenter.send(data["message"])
+            case "SEND_TO_EXPERIMENTERS":
+                exclude = None
+                for experimenter in self._hub.experimenters:
+                    if experimenter.id == data["exclude"]:
+                        exclude = experimenter
+                await self._hub.send_to_experimenters(data["message"], exclude)
+            case "POST_PROCESSING":
+                await self._hub.post_processing.submit(**data)
+            case "PONG":
+                rtt = round((time.time() - data["original"]) * 1000, 2)
+                self._logger.debug(f"Worker ping: RTT: {rtt}ms")
+            case _:
+                self._logger.error(f"Unrecognized command from worker: {command}")
+
+    def _apply_session_update(self, session_dict: dict) -> None:
+        """Apply session data changed by the worker to `session`."""
+        try:
+            self.session.update(session_dict)
+        except (ValueError, ErrorDictException) as e:
+            self._logger.error(f"Failed to apply session update from worker: {e}")
+
+    async def _log_final_stderr(self) -> None:
+        """Wait for the worker to exit and log potential output on stderr."""
+        if self._process is None:
+            return
+        assert self._process.stderr is not None
+        stderr = await self._process.stderr.read()
+        await self._process.wait()
+        self._logger.debug(f"Worker exited with returncode: {self._process.returncode}")
+        if stderr:
+            self._logger.error(f"[stderr START]:\n {stderr.decode()}\n[stderr END]")
+
+    async def _send_command_wait_for_response(
+        self, command: str, data: Any, timeout: float | None = None
+    ) -> Any:
+        """Send a command including unique command_nr and wait for the response.
+
+        Raises
+        ------
+        ErrorDictException
+            If the worker responded with an error custom_types.message.MessageDict or
+            is not running.
+        """
+        if not self._running:
+            response = _WORKER_NOT_RUNNING
+        else:
+            command_nr = self._command_nr
+            self._command_nr += 1
+            future = asyncio.get_running_loop().create_future()
+            self._responses[command_nr] = future
+            self._send_command(command, data, command_nr)
+            try:
+                response = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                self._logger.error(f"Worker did not respond to {command}")
+                response = _WORKER_NOT_RUNNING
+            finally:
+                self._responses.pop(command_nr, None)
+
+        if isinstance(response, dict) and response.get("type") == "ERROR":
+            err: ErrorDict = response["data"]
+            raise ErrorDictException(
+                code=err["code"], type=err["type"], description=err["description"]
+            )
+        return response
+
+    def _send_command(self, command: str, data: Any, command_nr: int = -1) -> None:
+        """Send command to the worker via stdin.
+
+        Writes are buffered and not awaited, so commands keep the order they were sent
+        in.
+        """
+        if not self._running or self._process is None or self._process.stdin is None:
+            self._logger.debug(f"Not sending {command} command, worker is not running")
+            return
+        line = json.dumps({"command": command, "data": data, "command_nr": command_nr})
+        self._process.stdin.write(line.encode("utf-8") + b"\n")
+        self._messages_sent.inc()
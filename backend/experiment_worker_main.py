@@ -0,0 +1,46 @@
+"""Entry point for experiment worker processes, see experiment.experiment_worker."""
+
+import asyncio
+import json
+import sys
+from argparse import ArgumentParser
+
+from experiment.experiment_runner import ExperimentRunner
+from session.data.session import SessionDict, is_valid_session
+
+
+def parse_args() -> SessionDict:
+    """Parse command line arguments.
+
+    Raises
+    ------
+    ValueError
+        If the session is invalid.
+    """
+    parser = ArgumentParser()
+    parser.add_argument("--session", dest="session", required=True)
+    args = parser.parse_args()
+
+    try:
+        session_dict = json.loads(args.session)
+    except (json.JSONDecodeError, TypeError) as e:
+        print(
+            f"Failed to parse session in command line arguments: {e}", file=sys.stderr
+        )
+        raise e
+
+    if not is_valid_session(session_dict):
+        print("Session parsed from command line arguments is invalid.", file=sys.stderr)
+        raise ValueError("Invalid session")
+
+    return session_dict
+
+
+async def main() -> None:
+    session_dict = parse_args()
+    runner = ExperimentRunner(session_dict)
+    await runner.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
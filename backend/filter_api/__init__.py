@@ -1,4 +1,6 @@
+from .measurement_sink import MeasurementSink
 from .filter_api_interface import FilterAPIInterface
 from .filter_api import FilterAPI
 from .filter_subprocess_api import FilterSubprocessAPI
 from .filter_subprocess_receiver import FilterSubprocessReceiver
+from .filter_offline_api import FilterOfflineAPI
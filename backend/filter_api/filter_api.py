@@ -28,17 +28,26 @@ class FilterAPI(FilterAPIInterface):
     """
 
     _user: User
+    _measurement_directory: str | None
 
-    def __init__(self, user: User) -> None:
+    def __init__(self, user: User, measurement_directory: str | None = None) -> None:
         """Initiate new FilterAPI.
 
         Parameters
         ----------
         user : hub.user.User
             User the filter API can access.
+        measurement_directory : str, optional
+            Directory filter measurements of `user` are stored in.
         """
         super().__init__()
         self._user = user
+        self._measurement_directory = measurement_directory
+
+    @property
+    def measurement_directory(self) -> str | None:
+        # For docstring see FilterAPIInterface or hover over function declaration
+        return self._measurement_directory
 
     async def experiment_send(self, to: str, data, exclude: str) -> None:
         # For docstring see FilterAPIInterface or hover over function declaration
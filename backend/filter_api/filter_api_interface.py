@@ -1,7 +1,10 @@
 """Provide the abstract `FilterAPIInterface`."""
 
+import time
 from abc import ABC, abstractmethod
 
+from filter_api.measurement_sink import FORMAT, MeasurementSink
+
 
 class FilterAPIInterface(ABC):
     """Abstract interface filter APIs.
@@ -23,13 +26,14 @@ class FilterAPIInterface(ABC):
 
     When adding a function to the filter API, it should be defined in
     hub.filter_api_interface.FilterAPIInterface and implemented in
-    hub.filter_api.FilterAPI as well as
-    hub.filter_subprocess_api.FilterSubprocessAPI.
+    hub.filter_api.FilterAPI, hub.filter_subprocess_api.FilterSubprocessAPI as well
+    as filter_api.filter_offline_api.FilterOfflineAPI.
 
     See Also
     --------
     hub.filter_api.FilterAPI
     hub.filter_subprocess_api.FilterSubprocessAPI
+    filter_api.filter_offline_api.FilterOfflineAPI
     https://github.com/TUMFARSynchrony/experimental-hub/wiki/Backend-Architecture
         Architecture UML Diagram.
     https://github.com/TUMFARSynchrony/experimental-hub/wiki/Filters
@@ -50,3 +54,56 @@ class FilterAPIInterface(ABC):
             FilterSubprocessAPI currently only logs the error).
         """
         pass
+
+    @property
+    @abstractmethod
+    def measurement_directory(self) -> str | None:
+        """Directory measurements of the user are stored in.
+
+        `sessions/<session_id>/measurements/<participant_id>` for participants, None if
+        the user is not part of a session, e.g. for experimenters.
+        """
+        pass
+
+    @property
+    def measurement_run_id(self) -> int | str | None:
+        """Run id for measurement sinks, see filter_api.measurement_sink.MeasurementSink.
+
+        None to use the creation time of the sink.
+        """
+        return None
+
+    def get_time(self) -> float:
+        """Get the current time for measurements, as unix timestamp in seconds.
+
+        The wall clock time for live connections.  Implementations processing
+        recordings return the time the current frame was recorded at.
+        """
+        return time.time()
+
+    def create_measurement_sink(
+        self,
+        name: str,
+        columns: dict[str, str],
+        format: FORMAT = "npz",
+        max_rows: int = 4096,
+        max_interval: float = 10.0,
+    ) -> MeasurementSink:
+        """Create a filter_api.measurement_sink.MeasurementSink for a filter.
+
+        The sink runs on the process of the filter and writes into
+        `measurement_directory`.  Rows are timestamped with `get_time`.  Filters should
+        `close` the sink in their `cleanup`.
+
+        See filter_api.measurement_sink.MeasurementSink for parameter documentation.
+        """
+        return MeasurementSink(
+            self.measurement_directory,
+            name,
+            columns,
+            format,
+            max_rows,
+            max_interval,
+            clock=self.get_time,
+            run_id=self.measurement_run_id,
+        )
@@ -0,0 +1,73 @@
+"""Provide `FilterOfflineAPI` implementation of `FilterAPIInterface`."""
+
+import logging
+
+from filter_api.filter_api_interface import FilterAPIInterface
+
+
+class FilterOfflineAPI(FilterAPIInterface):
+    """API for filters processing recordings instead of live connections.
+
+    Used by batch.batch_runner to run filters over stored recordings.  There is no
+    experiment the filters could send data to, and time is the recording time of the
+    frame that is currently processed instead of the wall clock time.
+
+    Implements hub.filter_api_interface.FilterAPIInterface.
+
+    See Also
+    --------
+    hub.filter_api_interface.FilterAPIInterface : further documentation.
+    batch.batch_runner : batch processing of recordings.
+    """
+
+    _logger: logging.Logger
+    _measurement_directory: str | None
+    _run_id: int | str | None
+    _time: float
+
+    def __init__(
+        self,
+        measurement_directory: str | None = None,
+        run_id: int | str | None = None,
+    ) -> None:
+        """Initialize new FilterOfflineAPI.
+
+        Parameters
+        ----------
+        measurement_directory : str, optional
+            Directory filter measurements are stored in.
+        run_id : int or str, optional
+            Run id for measurement sinks.  Must be unique if several FilterOfflineAPIs
+            write into the same `measurement_directory`, e.g. when processing segments
+            of a recording in parallel.
+        """
+        super().__init__()
+        self._logger = logging.getLogger("FilterOfflineAPI")
+        self._measurement_directory = measurement_directory
+        self._run_id = run_id
+        self._time = 0.0
+
+    @property
+    def measurement_directory(self) -> str | None:
+        # For docstring see FilterAPIInterface or hover over function declaration
+        return self._measurement_directory
+
+    @property
+    def measurement_run_id(self) -> int | str | None:
+        # For docstring see FilterAPIInterface or hover over function declaration
+        return self._run_id
+
+    def get_time(self) -> float:
+        # For docstring see FilterAPIInterface or hover over function declaration
+        return self._time
+
+    def set_time(self, value: float) -> None:
+        """Set the recording time of the frame that is processed next."""
+        self._time = value
+
+    async def experiment_send(self, to: str, data, exclude: str) -> None:
+        # For docstring see FilterAPIInterface or hover over function declaration
+        self._logger.debug(f"Ignoring experiment_send to {to}, processing recordings")
+
+
+FilterAPIInterface.register(FilterOfflineAPI)
@@ -28,8 +28,11 @@ class FilterSubprocessAPI(FilterAPIInterface):
     """
 
     _relay_command: Callable
+    _measurement_directory: str | None
 
-    def __init__(self, relay_command: Callable) -> None:
+    def __init__(
+        self, relay_command: Callable, measurement_directory: str | None = None
+    ) -> None:
         """Initialize new FilterSubprocessAPI.
 
         Parameters
@@ -38,9 +41,18 @@ class FilterSubprocessAPI(FilterAPIInterface):
             Relay function to send data to
             hub.filter_subprocess_receiver.FilterSubprocessReceiver on the main
             process.
+        measurement_directory : str, optional
+            Directory filter measurements are stored in.  Passed from the
+            hub.filter_api.FilterAPI on the main process.
         """
         super().__init__()
         self._relay_command = relay_command
+        self._measurement_directory = measurement_directory
+
+    @property
+    def measurement_directory(self) -> str | None:
+        # For docstring see FilterAPIInterface or hover over function declaration
+        return self._measurement_directory
 
     async def experiment_send(self, to: str, data, exclude: str) -> None:
         # For docstring see FilterAPIInterface or hover over function declaration
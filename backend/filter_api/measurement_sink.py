@@ -0,0 +1,313 @@
+"""Provide the `MeasurementSink`, a buffered time-series sink for filter measurements.
+
+Filters should not write files on the event loop for every frame.  A MeasurementSink
+buffers rows in typed, columnar numpy arrays and writes them in chunks on a thread
+pool executor, either as compressed numpy `.npz` files or, if `pyarrow` is installed,
+as Arrow IPC or Parquet files.
+
+Every row has a `time` column with the wall clock time (unix timestamp in seconds) the
+row was written at, in addition to the columns defined by the filter.
+
+Chunks are stored in the measurement directory of the participant, see
+`FilterAPIInterface.create_measurement_sink`, and named
+`<name>-<run id>-<chunk number>.<format>`, where the run id defaults to the start time
+of the sink in ms.  Run ids may have a tag, e.g. `<start time>-raw`.
+`load_measurements` loads and concatenates all chunks of a measurement.
+
+Examples
+--------
+>>> sink = filter_api.create_measurement_sink("speaking", {"speaking": "bool"})
+>>> sink.write(speaking=True)
+>>> await sink.close()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import glob
+import logging
+import os
+import re
+import time
+from typing import Callable, Literal, get_args
+
+import numpy
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+FORMAT = Literal["npz", "arrow", "parquet"]
+"""File formats supported by the MeasurementSink."""
+
+FORMATS: tuple[str, ...] = get_args(FORMAT)
+
+_EXTENSIONS: dict[str, str] = {"npz": ".npz", "arrow": ".arrow", "parquet": ".parquet"}
+
+
+class MeasurementSink:
+    """Buffered, columnar sink for per-frame filter measurements.
+
+    Rows are collected in preallocated numpy arrays.  When `max_rows` rows are
+    buffered or `max_interval` seconds after the first row was buffered, the buffer
+    is handed to an executor and written to a new chunk file, while new rows are written
+    to a fresh buffer.  At most `max_pending` chunks wait to be written; if writing
+    falls further behind, the rows of the next chunk are discarded and counted in
+    `dropped_rows`, which bounds memory.
+    """
+
+    name: str
+    directory: str | None
+    columns: dict[str, numpy.dtype]
+    format: FORMAT
+    max_rows: int
+    max_interval: float
+    max_pending: int
+    dropped_rows: int
+
+    _logger: logging.Logger
+    _run_id: str
+    _chunk: int
+    _size: int
+    _buffer: dict[str, numpy.ndarray]
+    _flush_timer: asyncio.TimerHandle | None
+    _pending: list[asyncio.Future]
+    _clock: Callable[[], float]
+
+    def __init__(
+        self,
+        directory: str | None,
+        name: str,
+        columns: dict[str, str],
+        format: FORMAT = "npz",
+        max_rows: int = 4096,
+        max_interval: float = 10.0,
+        max_pending: int = 4,
+        clock: Callable[[], float] = time.time,
+        run_id: int | str | None = None,
+    ) -> None:
+        """Create new MeasurementSink.
+
+        Use `FilterAPIInterface.create_measurement_sink` instead of instantiating the
+        sink directly.
+
+        Parameters
+        ----------
+        directory : str or None
+            Directory chunks are written to.  Created if it does not exist.  If None,
+            rows are discarded, e.g. for filters on experimenter connections.
+        name : str
+            Name of the measurement, used as file name prefix.
+        columns : dict of str to str
+            Column names mapped to numpy dtypes, e.g. `{"AU06": "float32"}`.  `time` is
+            added automatically.
+        format : str, "npz", "arrow" or "parquet", default "npz"
+            File format.  "arrow" and "parquet" require `pyarrow`, if it is not
+            installed "npz" is used.
+        max_rows : int, default 4096
+            Number of rows per chunk.
+        max_interval : float, default 10.0
+            Maximum number of seconds rows stay buffered before they are written.
+        max_pending : int, default 4
+            Maximum number of chunks waiting to be written.
+        clock : function () -> float, default time.time
+            Provides the timestamp for rows written without `timestamp`.
+        run_id : int or str, optional
+            Number used in the chunk file names, optionally followed by `-` and a
+            lowercase tag, e.g. `"1700000000000-raw"`.  Must be unique for all sinks
+            with the same `name` and `directory`.  Defaults to the current time in ms.
+
+        Raises
+        ------
+        ValueError
+            If `format` is unknown, a column is named `time` or a dtype is invalid.
+        """
+        if format not in FORMATS:
+            raise ValueError(f'Unknown format: "{format}". Must be one of: {FORMATS}')
+        if "time" in columns:
+            raise ValueError('Column name "time" is reserved.')
+
+        self._logger = logging.getLogger(f"MeasurementSink-{name}")
+        if format != "npz" and pyarrow is None:
+            self._logger.warning(
+                f"pyarrow not installed, using npz instead of {format}"
+            )
+            format = "npz"
+
+        self.name = name
+        self.directory = directory
+        self.columns = {"time": numpy.dtype("float64")}
+        self.columns.update({k: numpy.dtype(v) for k, v in columns.items()})
+        self.format = format
+        self.max_rows = max(max_rows, 1)
+        self.max_interval = max_interval
+        self.max_pending = max(max_pending, 1)
+        self.dropped_rows = 0
+
+        self._run_id = str(run_id if run_id is not None else int(time.time() * 1000))
+        self._chunk = 0
+        self._size = 0
+        self._buffer = self._new_buffer()
+        self._flush_timer = None
+        self._pending = []
+        self._clock = clock
+
+        if directory is None:
+            self._logger.debug("No measurement directory, measurements are discarded")
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"MeasurementSink(name={self.name}, directory={self.directory}, "
+            f"format={self.format}, columns={list(self.columns)})"
+        )
+
+    def write(self, timestamp: float | None = None, **values) -> None:
+        """Add a row to the sink.
+
+        Must be called from within a running event loop.  Never blocks on file I/O.
+
+        Parameters
+        ----------
+        timestamp : float, optional
+            Unix timestamp in seconds for this row.  Defaults to the time provided by
+            `clock`, usually the current time.
+        **values
+            Values for the columns of this sink.  Missing columns are filled with NaN
+            for floating point columns, and zero / empty values otherwise.
+
+        Raises
+        ------
+        KeyError
+            If a value is given for an unknown column.
+        """
+        if self.directory is None:
+            return
+
+        index = self._size
+        self._buffer["time"][index] = self._clock() if timestamp is None else timestamp
+        for column, value in values.items():
+            self._buffer[column][index] = value
+        self._size += 1
+
+        if self._size >= self.max_rows:
+            self._flush_buffer()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(
+                self.max_interval, self._flush_buffer
+            )
+
+    async def flush(self) -> None:
+        """Write all buffered rows and wait until all pending chunks are written."""
+        if self._size > 0:
+            self._flush_buffer()
+        if len(self._pending) > 0:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    async def close(self) -> None:
+        """Flush the sink.  The sink should not be used afterwards."""
+        await self.flush()
+        self._logger.debug(
+            f"Closed after {self._chunk} chunks, dropped rows: {self.dropped_rows}"
+        )
+
+    def _new_buffer(self) -> dict[str, numpy.ndarray]:
+        buffer = {}
+        for column, dtype in self.columns.items():
+            if dtype.kind in "fc":
+                buffer[column] = numpy.full(self.max_rows, numpy.nan, dtype=dtype)
+            else:
+                buffer[column] = numpy.zeros(self.max_rows, dtype=dtype)
+        return buffer
+
+    def _flush_buffer(self) -> None:
+        """Hand the current buffer to the executor and start a new one."""
+        assert self.directory is not None
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        self._pending = [f for f in self._pending if not f.done()]
+        if len(self._pending) >= self.max_pending:
+            # Writing can not keep up.  Discard this chunk to bound memory.
+            self.dropped_rows += self._size
+            self._logger.warning(
+                f"Writing measurements can not keep up, dropped {self._size} rows"
+            )
+        else:
+            data = {k: v[: self._size] for k, v in self._buffer.items()}
+            path = os.path.join(
+                self.directory,
+                f"{self.name}-{self._run_id}-{self._chunk:05d}{_EXTENSIONS[self.format]}",
+            )
+            self._chunk += 1
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, _write_chunk, path, data, self.format)
+            future.add_done_callback(self._handle_write_result)
+            self._pending.append(future)
+
+        # Also start a new buffer if the chunk was dropped, rows with missing columns
+        # must not contain values of the dropped chunk.
+        self._buffer = self._new_buffer()
+        self._size = 0
+
+    def _handle_write_result(self, future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            self._logger.error(f"Failed to write chunk: {future.exception()!r}")
+
+
+def _write_chunk(path: str, data: dict[str, numpy.ndarray], format: FORMAT) -> None:
+    """Write `data` to `path`.  Executed on an executor thread."""
+    if format == "npz":
+        numpy.savez_compressed(path, **data)
+        return
+
+    table = pyarrow.table(data)  # type: ignore
+    if format == "arrow":
+        pyarrow.feather.write_feather(table, path, compression="zstd")  # type: ignore
+    else:
+        pyarrow.parquet.write_table(table, path)  # type: ignore
+
+
+def load_measurements(directory: str, name: str) -> dict[str, numpy.ndarray]:
+    """Load all chunks of the measurement `name` in `directory`, ordered by time.
+
+    Parameters
+    ----------
+    directory : str
+        Measurement directory, e.g. `sessions/<session id>/measurements/<participant>`.
+    name : str
+        Name of the measurement.
+
+    Returns
+    -------
+    dict of str to numpy.ndarray
+        Concatenated columns.  Empty if no chunks were found.
+    """
+    pattern = re.compile(rf"{re.escape(name)}-\d+(-[a-z]+)?-\d+\.(npz|arrow|parquet)")
+    paths = sorted(
+        path
+        for path in glob.glob(os.path.join(glob.escape(directory), f"{name}-*"))
+        if pattern.fullmatch(os.path.basename(path))
+    )
+    chunks: list[dict[str, numpy.ndarray]] = []
+    for path in paths:
+        if path.endswith(".npz"):
+            with numpy.load(path) as npz:
+                chunks.append({k: npz[k] for k in npz.files})
+        elif pyarrow is not None and path.endswith(".arrow"):
+            table = pyarrow.feather.read_table(path)
+            chunks.append({k: table[k].to_numpy() for k in table.column_names})
+        elif pyarrow is not None and path.endswith(".parquet"):
+            table = pyarrow.parquet.read_table(path)
+            chunks.append({k: table[k].to_numpy() for k in table.column_names})
+
+    if len(chunks) == 0:
+        return {}
+
+    columns = {k: numpy.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+    order = numpy.argsort(columns["time"], kind="stable")
+    return {k: v[order] for k, v in columns.items()}
@@ -10,6 +10,7 @@ from hub import BACKEND_DIR
 from filters import FilterDict
 
 from filters.filter import Filter
+from filters import model_registry
 
 
 class SimpleGlassesDetection(Filter):
@@ -37,8 +38,13 @@ class SimpleGlassesDetection(Filter):
             BACKEND_DIR,
             "filters/glasses_detection/shape_predictor_68_face_landmarks.dat",
         )
-        self.detector = dlib.get_frontal_face_detector()
-        self.predictor = dlib.shape_predictor(self.predictor_path)
+        # Models are loaded once per process and shared between filter instances.
+        self.detector = model_registry.get_shared(
+            "dlib_frontal_face_detector", dlib.get_frontal_face_detector
+        )
+        self.predictor = model_registry.get_model(
+            self.predictor_path, dlib.shape_predictor
+        )
 
     @staticmethod
     def name(self) -> str:
@@ -0,0 +1,114 @@
+"""Provide a process-wide registry for heavy models used by filters.
+
+Filters are re-created whenever a filter config changes and every participant runs its
+own filter instances (usually in a dedicated subprocess, see
+connection.connection_subprocess.ConnectionSubprocess).  Loading large models, e.g.
+dlib's landmark predictor, in `Filter.__init__` therefore costs memory and latency for
+every filter instance.  The functions in this module load a model once per process and
+return the same object to all filters using it.
+
+File based models are keyed by their absolute path and modification time, so a model
+that is replaced on disk is loaded again the next time it is requested.
+
+Examples
+--------
+>>> predictor = model_registry.get_model(path, dlib.shape_predictor)
+>>> detector = model_registry.get_shared(
+...     "dlib_face_detector", dlib.get_frontal_face_detector
+... )
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger("ModelRegistry")
+
+_lock = threading.Lock()
+_models: dict[tuple[str, str], tuple[float, Any]] = {}
+_shared: dict[str, Any] = {}
+
+
+def get_model(path: str, loader: Callable[[str], T]) -> T:
+    """Get the model stored at `path`, loading it with `loader` if required.
+
+    The model is loaded at most once per process for each combination of `path`,
+    `loader` and modification time of the file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the model file.
+    loader : Callable(str) -> Any
+        Function loading the model from a path, e.g. `dlib.shape_predictor`.
+
+    Returns
+    -------
+    Any
+        Model returned by `loader`.  The same object is returned to all callers, it
+        must therefore not be modified by filters.
+
+    Raises
+    ------
+    FileNotFoundError
+        If there is no file at `path`.
+    """
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    key = (_loader_name(loader), path)
+
+    with _lock:
+        cached = _models.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        if cached is not None:
+            logger.info(f"Model changed on disk, reloading: {path}")
+        else:
+            logger.debug(f"Loading model: {path}")
+
+        model = loader(path)
+        _models[key] = (mtime, model)
+        return model
+
+
+def get_shared(name: str, factory: Callable[[], T]) -> T:
+    """Get a model that is not loaded from a file, e.g. a detector built in code.
+
+    Parameters
+    ----------
+    name : str
+        Unique name for the model.
+    factory : Callable() -> Any
+        Function creating the model.  Only called the first time `name` is requested.
+
+    Returns
+    -------
+    Any
+        Model returned by `factory`.
+    """
+    with _lock:
+        if name not in _shared:
+            logger.debug(f"Creating shared model: {name}")
+            _shared[name] = factory()
+        return _shared[name]
+
+
+def clear() -> None:
+    """Remove all models from the registry.
+
+    Models still referenced by filters stay alive until these filters are deleted.
+    """
+    with _lock:
+        _models.clear()
+        _shared.clear()
+
+
+def _loader_name(loader: Callable) -> str:
+    """Get a stable name for `loader`, used as part of the registry key."""
+    module = getattr(loader, "__module__", None) or ""
+    name = getattr(loader, "__qualname__", None) or repr(loader)
+    return f"{module}.{name}"
@@ -0,0 +1,205 @@
+"""Provide the frame transports used to send frames to the OpenFace AUExtractor.
+
+Three transports are available:
+
+- `png` : legacy protocol.  A single message with the base64 encoded PNG image.
+- `jpeg` : a JSON header and the JPEG encoded image as second message part.
+- `raw` : a JSON header only.  The pixels are written into a shared memory slot, which
+  the extractor reads in place.  No encoding or copying over the socket is required.
+
+For `jpeg` and `raw`, the header is a JSON object with the keys `frame` (frame number),
+`transport`, `shape`, `dtype`, `roi` (region of `shape` in the original frame or None)
+and `shm` (name of the shared memory slot or None).
+
+The OpenFace AUExtractor only decodes `png`, so `OpenFaceAUFilter` always uses it.
+`jpeg` and `raw` require an extractor implementing them, such as the stub in
+`benchmarks/open_face_stub.py`.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from multiprocessing import resource_tracker, shared_memory
+from typing import Literal, TypedDict, get_args
+
+import cv2
+import numpy
+
+TRANSPORT = Literal["png", "jpeg", "raw"]
+"""Transports available to send frames to the AUExtractor."""
+
+TRANSPORTS: tuple[str, ...] = get_args(TRANSPORT)
+
+
+class RoiDict(TypedDict):
+    """Region of interest in a frame, as returned by OpenFace."""
+
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class SharedFrameSlot:
+    """Shared memory slot holding the pixels of a single frame.
+
+    The slot grows when a larger frame is written.  Growing creates a new shared memory
+    block with a new name, which is communicated to the extractor in the frame header.
+    """
+
+    _shm: shared_memory.SharedMemory | None
+
+    def __init__(self) -> None:
+        """Initialize new, empty SharedFrameSlot."""
+        self._shm = None
+
+    @property
+    def name(self) -> str | None:
+        """Name of the shared memory block or None, if nothing was written yet."""
+        return None if self._shm is None else self._shm.name
+
+    def write(self, ndarray: numpy.ndarray) -> None:
+        """Copy `ndarray` into the slot.
+
+        `ndarray` may be a non-contiguous view, e.g. the region of interest in a frame.
+        """
+        if self._shm is None or self._shm.size < ndarray.nbytes:
+            self.close()
+            self._shm = shared_memory.SharedMemory(create=True, size=ndarray.nbytes)
+
+        target = numpy.ndarray(ndarray.shape, dtype=ndarray.dtype, buffer=self._shm.buf)
+        numpy.copyto(target, ndarray)
+
+    def close(self) -> None:
+        """Close and unlink the shared memory block."""
+        if self._shm is None:
+            return
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+
+
+def encode_frame(
+    ndarray: numpy.ndarray,
+    transport: TRANSPORT,
+    frame: int,
+    roi: RoiDict | None = None,
+    slot: SharedFrameSlot | None = None,
+    jpeg_quality: int = 90,
+) -> list[bytes] | None:
+    """Encode `ndarray` into the message parts for `transport`.
+
+    Parameters
+    ----------
+    ndarray : numpy.ndarray
+        Full frame in bgr24 format.
+    transport : str, "png", "jpeg" or "raw"
+        Transport used to send the frame.
+    frame : int
+        Frame number, included in the header.
+    roi : filters.open_face_au.frame_transport.RoiDict, optional
+        Region of `ndarray` that should be sent.  If None, the full frame is sent.
+    slot : filters.open_face_au.frame_transport.SharedFrameSlot, optional
+        Shared memory slot.  Required for the `raw` transport.
+    jpeg_quality : int, default 90
+        Quality used for the `jpeg` transport.
+
+    Returns
+    -------
+    list of bytes or None
+        Message parts that should be sent with `send_multipart`.  None if encoding
+        failed.
+
+    Raises
+    ------
+    ValueError
+        If `transport` is unknown or `slot` is missing for the `raw` transport.
+    """
+    if roi is not None:
+        ndarray = ndarray[
+            roi["y"] : roi["y"] + roi["height"], roi["x"] : roi["x"] + roi["width"]
+        ]
+
+    match transport:
+        case "png":
+            is_success, image_enc = cv2.imencode(".png", ndarray)
+            if not is_success:
+                return None
+            return [base64.b64encode(image_enc.tobytes())]
+        case "jpeg":
+            is_success, image_enc = cv2.imencode(
+                ".jpg", ndarray, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+            )
+            if not is_success:
+                return None
+            header = _header(ndarray, transport, frame, roi, None)
+            return [header, image_enc.tobytes()]
+        case "raw":
+            if slot is None:
+                raise ValueError("A SharedFrameSlot is required for the raw transport.")
+            slot.write(ndarray)
+            return [_header(ndarray, transport, frame, roi, slot.name)]
+        case _:
+            raise ValueError(
+                f'Unknown transport: "{transport}". Must be one of: {TRANSPORTS}'
+            )
+
+
+def decode_frame(parts: list[bytes]) -> tuple[dict | None, numpy.ndarray | None]:
+    """Decode message parts created by `encode_frame`.
+
+    Counterpart to `encode_frame`, as implemented by the AUExtractor.  Used by the stub
+    extractor in `benchmarks`.
+
+    Returns
+    -------
+    tuple of dict or None and numpy.ndarray or None
+        Header (None for the legacy `png` transport) and decoded frame.  For the `raw`
+        transport, the frame is a copy of the shared memory slot contents.
+    """
+    if len(parts) == 1 and not parts[0].startswith(b"{"):
+        buffer = numpy.frombuffer(base64.b64decode(parts[0]), dtype=numpy.uint8)
+        return None, cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+    header = json.loads(parts[0])
+    if header["transport"] == "jpeg":
+        buffer = numpy.frombuffer(parts[1], dtype=numpy.uint8)
+        return header, cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+    shm = shared_memory.SharedMemory(name=header["shm"], create=False)
+    # The slot is owned by the sender.  Avoid that the resource tracker of this
+    # process unlinks it on exit.
+    resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore
+    try:
+        view = numpy.ndarray(
+            header["shape"], dtype=numpy.dtype(header["dtype"]), buffer=shm.buf
+        )
+        ndarray = view.copy()
+        del view
+    finally:
+        shm.close()
+    return header, ndarray
+
+
+def _header(
+    ndarray: numpy.ndarray,
+    transport: TRANSPORT,
+    frame: int,
+    roi: RoiDict | None,
+    shm_name: str | None,
+) -> bytes:
+    """Build the JSON header for the `jpeg` and `raw` transports."""
+    return json.dumps(
+        {
+            "frame": frame,
+            "transport": transport,
+            "shape": list(ndarray.shape),
+            "dtype": str(ndarray.dtype),
+            "roi": roi,
+            "shm": shm_name,
+        }
+    ).encode("utf-8")
@@ -1,89 +1,219 @@
-import base64
+"""Provide the `OpenFaceAUExtractor`, client for the hub's OpenFace worker pool."""
+
+from __future__ import annotations
+
+import asyncio
 import json
+import logging
+from contextlib import suppress
+from typing import Callable
 
-import cv2
 import numpy
 import zmq
+import zmq.asyncio
 
-from filters.open_face_au.open_face import OpenFace
-from filters.open_face_au.port_manager import PortManager
+from filters.open_face_au import open_face_pool
+from filters.open_face_au.frame_transport import (
+    TRANSPORT,
+    RoiDict,
+    SharedFrameSlot,
+    encode_frame,
+)
 
+ResultCallback = Callable[[int, dict | None], None]
+"""Callback receiving the frame number and AU result (None if extraction failed)."""
 
-class OpenFaceAUExtractor:
-    port_manager: PortManager
-    open_face: OpenFace
-    socket: zmq.Socket
-    is_extracting: bool
-    is_connected: bool
-
-    def __init__(self):
-        self.port_manager = PortManager()
 
-        self.open_face = OpenFace(self.port_manager.port)
+class OpenFaceAUExtractor:
+    """Pipelined client for the filters.open_face_au.open_face_pool.OpenFaceWorkerPool.
+
+    Up to `pipeline_depth` frames are in flight at the same time.  Every frame is sent
+    with its frame number, which the pool returns with the result, so results are
+    matched to the exact frame they were extracted from, even if they arrive out of
+    order.
+
+    Call `start` before submitting frames and `close` when the extractor is no longer
+    used.
+    """
+
+    transport: TRANSPORT
+    pipeline_depth: int
+    endpoint: str | None
+    _logger: logging.Logger
+    _socket: zmq.asyncio.Socket | None
+    _task: asyncio.Task | None
+    _in_flight: dict[int, tuple[asyncio.Future, SharedFrameSlot]]
+    _free_slots: list[SharedFrameSlot]
+
+    def __init__(
+        self,
+        transport: TRANSPORT = "png",
+        pipeline_depth: int = 2,
+        endpoint: str | None = None,
+    ):
+        """Create new OpenFaceAUExtractor.
+
+        Parameters
+        ----------
+        transport : str, "png", "jpeg" or "raw", default "png"
+            Transport used to send frames to the AUExtractor.  The OpenFace
+            AUExtractor only supports "png".  See filters.open_face_au.frame_transport
+            for details.
+        pipeline_depth : int, default 2
+            Maximum number of frames in flight.  The pool processes the frames of a
+            client in order on a single worker, frames in flight beyond the one being
+            processed hide the transport latency.
+        endpoint : str, optional
+            Endpoint of the OpenFaceWorkerPool.  If None, the endpoint published by the
+            hub is used.
+        """
+        self._logger = logging.getLogger("OpenFaceAUExtractor")
+        self.transport = transport
+        self.pipeline_depth = max(pipeline_depth, 1)
+        self.endpoint = endpoint or open_face_pool.get_endpoint()
+        self._socket = None
+        self._task = None
+        self._in_flight = {}
+        self._free_slots = [SharedFrameSlot() for _ in range(self.pipeline_depth)]
+
+    @property
+    def is_running(self) -> bool:
+        """True if the extractor is connected to the worker pool."""
+        return self._socket is not None
+
+    @property
+    def in_flight(self) -> int:
+        """Number of frames sent to the pool, which did not receive a result yet."""
+        return len(self._in_flight)
+
+    def start(self) -> None:
+        """Connect to the worker pool and start receiving results.
+
+        Must be called from within a running event loop.  Does nothing if the hub did
+        not start a worker pool, in which case `submit` always returns None.
+        """
+        if self.endpoint is None:
+            self._logger.warning("OpenFace worker pool is not running")
+            return
+
+        self._socket = zmq.asyncio.Context.instance().socket(zmq.DEALER)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.connect(self.endpoint)
+        self._task = asyncio.create_task(
+            self._receive_results(), name="OpenFaceAUExtractor.receive_results"
+        )
+
+    async def close(self) -> None:
+        """Stop receiving results, cancel frames in flight and release resources."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        for future, slot in self._in_flight.values():
+            future.cancel()
+            self._free_slots.append(slot)
+        self._in_flight.clear()
+
+        for slot in self._free_slots:
+            slot.close()
+
+        if self._socket is not None:
+            # Let the pool rebalance its workers, see open_face_pool.
+            with suppress(zmq.ZMQError):
+                self._socket.send_multipart([open_face_pool.LEAVE], flags=zmq.NOBLOCK)
+            self._socket.close(linger=100)
+            self._socket = None
+
+    def submit(
+        self,
+        ndarray: numpy.ndarray,
+        frame: int,
+        roi: RoiDict | None = None,
+        callback: ResultCallback | None = None,
+    ) -> asyncio.Future[dict | None] | None:
+        """Send `ndarray` to the worker pool without waiting for the result.
+
+        Parameters
+        ----------
+        ndarray : numpy.ndarray
+            Frame in bgr24 format.
+        frame : int
+            Frame number.  Must be unique for the frames in flight.
+        roi : filters.open_face_au.frame_transport.RoiDict, optional
+            Region of `ndarray` that should be sent.  If None, the full frame is sent.
+        callback : function (int, dict or None) -> None, optional
+            Called with `frame` and the result once the result for this frame arrived.
+
+        Returns
+        -------
+        asyncio.Future or None
+            Future resolving to the AUExtractor result for this frame, or None if the
+            pool dropped the frame or failed to process it.  None instead of a future
+            if the frame was not sent, because the pipeline is full, the extractor is
+            not running or encoding failed.
+        """
+        if (
+            self._socket is None
+            or len(self._free_slots) == 0
+            or frame in self._in_flight
+        ):
+            return None
+
+        slot = self._free_slots.pop()
+        parts = encode_frame(ndarray, self.transport, frame, roi, slot)
+        if parts is None:
+            self._free_slots.append(slot)
+            return None
 
-        context = zmq.Context()
-        self.socket = context.socket(zmq.REQ)
         try:
-            self.socket.bind(f"tcp://127.0.0.1:{self.port_manager.port}")
-            self.is_connected = True
+            frame_id = str(frame).encode("ascii")
+            self._socket.send_multipart([frame_id, *parts], flags=zmq.NOBLOCK)
         except zmq.ZMQError as e:
-            self.is_connected = False
-            print(f"ZMQError: {e}")
-
-        self.is_extracting = False
-
-    def __del__(self):
-        self.socket.close()
-        del self.port_manager, self.open_face
-
-    def extract(self, ndarray: numpy.ndarray) -> tuple[int, str, object]:
-        port_msg = f"Port: {self.port_manager.port}"
-
-        if not self.is_connected:
-            return -1, f"Port {self.port_manager.port} is already taken!", None
-
-        result = None
-        received = False
-        try:
-            result = self._get_result()
-            received = True
-        except zmq.ZMQError:
-            if self.is_extracting:
-                return 1, port_msg, None
-
-        success = self._start_extraction(ndarray)
-        if success:
-            try:
-                result = self._get_result()
-                received = True
-            except zmq.ZMQError:
-                pass
-
-            if received:
-                return 0, port_msg, result
+            self._logger.debug(f"Failed to send frame {frame}: {e}")
+            self._free_slots.append(slot)
+            return None
+
+        future: asyncio.Future[dict | None] = asyncio.get_running_loop().create_future()
+        if callback is not None:
+            future.add_done_callback(
+                lambda f: None if f.cancelled() else callback(frame, f.result())
+            )
+        self._in_flight[frame] = (future, slot)
+        return future
+
+    async def extract(
+        self, ndarray: numpy.ndarray, frame: int, roi: RoiDict | None = None
+    ) -> dict | None:
+        """Extract AUs from `ndarray` and wait for the result.
+
+        See `submit` for details.  Returns None if the frame could not be sent.
+        """
+        future = self.submit(ndarray, frame, roi)
+        if future is None:
+            return None
+        return await future
+
+    async def _receive_results(self) -> None:
+        """Receive results from the pool and resolve the matching futures."""
+        assert self._socket is not None
+        while True:
+            frame_id, status, payload = await self._socket.recv_multipart()
+            frame = int(frame_id)
+            entry = self._in_flight.pop(frame, None)
+            if entry is None:
+                self._logger.debug(f"Ignoring result for unknown frame {frame}")
+                continue
+
+            future, slot = entry
+            self._free_slots.append(slot)
+            if status == b"ok":
+                result = json.loads(payload)
             else:
-                return 1, port_msg, result
-        else:
-            return -2, f"No connection established on {self.port_manager.port}", result
-
-    def _start_extraction(self, ndarray: numpy.ndarray) -> bool:
-        is_success, image_enc = cv2.imencode(".png", ndarray)
+                self._logger.debug(
+                    f"No result for frame {frame}: {payload.decode('utf-8')}"
+                )
+                result = None
 
-        if not is_success:
-            return False
-
-        im_bytes = bytearray(image_enc.tobytes())
-        im_64 = base64.b64encode(im_bytes)
-
-        try:
-            self.socket.send(im_64, flags=zmq.NOBLOCK)
-            self.is_extracting = True
-            return True
-        except zmq.ZMQError:
-            return False
-
-    def _get_result(self) -> object:
-        message = self.socket.recv(flags=zmq.NOBLOCK)
-        data = json.loads(message)
-        self.is_extracting = False
-        return data
+            if not future.done():
+                future.set_result(result)
@@ -1,6 +1,7 @@
 import numpy
 from av import VideoFrame
 
+from filter_api import FilterAPIInterface
 from filters.filter import Filter
 from filters.simple_line_writer import SimpleLineWriter
 from filters.open_face_au.open_face_au_extractor import OpenFaceAUExtractor
@@ -15,19 +16,28 @@ class OpenFaceAUFilter(Filter):
     file_writer: OpenFaceDataParser
     line_writer: SimpleLineWriter
     au_extractor: OpenFaceAUExtractor
+    _filter_api: FilterAPIInterface
+    _data_frame: int
 
     def __init__(self, config, audio_track_handler, video_track_handler):
         super().__init__(config, audio_track_handler, video_track_handler)
-        self.au_extractor = OpenFaceAUExtractor()
+        pipeline_depth = config["config"].get("pipelineDepth", {}).get("value", 2)
+        # The OpenFace AUExtractor only decodes the png transport.
+        self.au_extractor = OpenFaceAUExtractor("png", pipeline_depth)
         self.line_writer = SimpleLineWriter()
-        self.file_writer = OpenFaceDataParser()
+        self._filter_api = video_track_handler.filter_api
+        self.file_writer = OpenFaceDataParser(self._filter_api)
 
         self.data = {"intensity": {"AU06": "-", "AU12": "-"}}
         self.frame = 0
+        self._data_frame = 0
 
     def __del__(self):
         del self.file_writer, self.line_writer, self.au_extractor
 
+    async def complete_setup(self) -> None:
+        self.au_extractor.start()
+
     @staticmethod
     def name(self) -> str:
         return "OPENFACE_AU"
@@ -47,7 +57,15 @@ class OpenFaceAUFilter(Filter):
             "id": id,
             "channel": "video",
             "groupFilter": False,
-            "config": {},
+            "config": {
+                "pipelineDepth": {
+                    "min": 1,
+                    "max": 8,
+                    "step": 1,
+                    "value": 2,
+                    "defaultValue": 2,
+                },
+            },
         }
 
     async def process(
@@ -56,32 +74,38 @@ class OpenFaceAUFilter(Filter):
         self.frame = self.frame + 1
 
         # If ROI is sent from the OpenFace, only send that region
+        roi = None
         if "roi" in self.data.keys() and self.data["roi"]["width"] != 0:
             roi = self.data["roi"]
-            exit_code, msg, result = self.au_extractor.extract(
-                ndarray[
-                    roi["y"] : (roi["y"] + roi["height"]),
-                    roi["x"] : (roi["x"] + roi["width"]),
-                ]
-            )
-        else:
-            exit_code, msg, result = self.au_extractor.extract(ndarray)
-
-        if exit_code == 0:
-            self.data = result
-            # TODO: use correct frame
-            # if a frame is skipped, data corresponds to a frame before current frame, but self.frame does not
-            self.file_writer.write(self.frame, self.data)
-        else:
-            self.file_writer.write(self.frame, {"intensity": "-1"})
+
+        # Results arrive later, store them with the time the frame was processed at.
+        timestamp = self._filter_api.get_time()
+        future = self.au_extractor.submit(
+            ndarray,
+            self.frame,
+            roi,
+            lambda frame, result: self._on_result(frame, result, timestamp),
+        )
+        if future is None:
+            # Pipeline is full or the worker pool is not available, skip this frame
+            self.file_writer.write(self.frame, None, timestamp)
 
         # Put text on image
         au06 = self.data["intensity"]["AU06"]
         au12 = self.data["intensity"]["AU12"]
+        msg = f"Frame: {self._data_frame}, in flight: {self.au_extractor.in_flight}"
         ndarray = self.line_writer.write_lines(
             ndarray, [f"AU06: {au06}", f"AU12: {au12}", msg]
         )
         return ndarray
 
+    def _on_result(self, frame: int, result: dict | None, timestamp: float) -> None:
+        """Write the result for `frame` and show it, if it is the newest result."""
+        self.file_writer.write(frame, result, timestamp)
+        if result is not None and frame > self._data_frame:
+            self.data = result
+            self._data_frame = frame
+
     async def cleanup(self) -> None:
-        del self
+        await self.au_extractor.close()
+        await self.file_writer.close()
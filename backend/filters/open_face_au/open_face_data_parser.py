@@ -1,35 +1,65 @@
-import csv
-import os
+import math
+
+from filter_api import FilterAPIInterface, MeasurementSink
 
 
 class OpenFaceDataParser:
-    def __init__(self):
-        # TODO: get session and participant id
-        path = os.path.join(
-            os.path.dirname(
-                os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            ),
-            "sessions",
-            "ae839e5e6f",
-            "OpenFace",
+    """Write OpenFace AU results into a filter_api.MeasurementSink.
+
+    Results are stored in the `open_face_au` measurement of the participant, with the
+    columns `frame`, `success`, `AU06`, `AU12` and the region of interest `roi_x`,
+    `roi_y`, `roi_width` and `roi_height`.
+    """
+
+    sink: MeasurementSink
+
+    def __init__(self, filter_api: FilterAPIInterface):
+        self.sink = filter_api.create_measurement_sink(
+            "open_face_au",
+            {
+                "frame": "int64",
+                "success": "bool",
+                "AU06": "float32",
+                "AU12": "float32",
+                "roi_x": "int32",
+                "roi_y": "int32",
+                "roi_width": "int32",
+                "roi_height": "int32",
+            },
         )
-        filename = "9ba5fdccde"
-        appendix = ".csv"
 
-        if not os.path.exists(path):
-            os.makedirs(path)
+    def write(
+        self, frame: int, openface_data: dict | None, timestamp: float | None = None
+    ):
+        """Write the result for `frame`.  `openface_data` is None if extraction failed.
+
+        `timestamp` is the time `frame` was processed at, see
+        `FilterAPIInterface.get_time`.  Defaults to the current time of the sink.
+        """
+        if openface_data is None:
+            self.sink.write(timestamp, frame=frame, success=False)
+            return
 
-        filepath = os.path.join(path, filename + appendix)
-        i = 1
-        while os.path.exists(filepath):
-            filepath = os.path.join(path, filename + f"_{i}" + appendix)
-            i = i + 1
+        intensity = openface_data.get("intensity", {})
+        roi = openface_data.get("roi") or {}
+        self.sink.write(
+            timestamp,
+            frame=frame,
+            success=True,
+            AU06=_to_float(intensity.get("AU06")),
+            AU12=_to_float(intensity.get("AU12")),
+            roi_x=roi.get("x", 0),
+            roi_y=roi.get("y", 0),
+            roi_width=roi.get("width", 0),
+            roi_height=roi.get("height", 0),
+        )
 
-        self.save_file = open(filepath, "w")
-        self.writer = csv.writer(self.save_file, delimiter=",")
+    async def close(self):
+        await self.sink.close()
 
-    def __del__(self):
-        self.save_file.close()
 
-    def write(self, frame: int, openface_data):
-        self.writer.writerow((f"frame {frame}", openface_data))
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
@@ -0,0 +1,352 @@
+"""Provide the `OpenFaceWorkerPool`, a hub-wide pool of OpenFace AUExtractor workers.
+
+The pool is shared by all participants.  The hub publishes its endpoint when it starts
+and starts the pool when the first `OPENFACE_AU` filter is used (see
+hub.hub.Hub.prepare_filters).  OpenFaceAUFilter instances (see
+filters.open_face_au.open_face_au_extractor.OpenFaceAUExtractor) connect to the pool
+with a ZMQ DEALER socket, the pool accepts requests on a ROUTER socket.
+
+Protocol
+--------
+Request (client -> pool) : `[frame_id, *parts]`
+    `frame_id` is the ascii encoded frame number, `parts` are the message parts created
+    by filters.open_face_au.frame_transport.encode_frame.
+Leave (client -> pool) : `[LEAVE]`
+    Sent by a client before it disconnects.
+Reply (pool -> client) : `[frame_id, status, payload]`
+    `status` is one of `ok`, `dropped` or `error`.  For `ok`, `payload` is the JSON
+    result of the AUExtractor, otherwise an error message.
+
+Scheduling
+----------
+OpenFace tracks the face across frames, so all frames of a client must be processed
+by the same AUExtractor, one at a time and in order.  Each client is therefore
+assigned to one worker when it sends its first frame, the worker with the fewest
+clients.  Workers are started on demand, up to a fixed number sized to the available
+CPU cores.  Assignments only change when clients join or leave: if a client leaves and
+the number of clients of two workers differs by more than one, a client is moved to
+the worker with fewer clients.  Clients that did not send a frame for
+`CLIENT_TIMEOUT` seconds are removed when the next client joins.
+
+Each client has a small queue of pending frames.  If a client sends frames faster than
+they can be processed, the oldest pending frames are dropped.  Whenever a worker is
+idle, it takes the next frame of its waiting clients in round-robin order, so every
+client of a worker gets a fair share regardless of its frame rate.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+import zmq
+import zmq.asyncio
+
+from filters.open_face_au.open_face import OpenFace
+
+ENDPOINT_ENV = "EXPERIMENTAL_HUB_OPEN_FACE_POOL"
+"""Environment variable the pool endpoint is published in.
+
+Set by `OpenFaceWorkerPool.publish_endpoint`.  Inherited by connection subprocesses.
+"""
+
+LEAVE = b"leave"
+"""Request sent by clients before they disconnect, see module docs."""
+
+CLIENT_TIMEOUT = 30.0
+"""Seconds without frames after which a client is considered gone."""
+
+
+def get_endpoint() -> str | None:
+    """Get the endpoint of the OpenFaceWorkerPool of the hub, if there is one."""
+    return os.environ.get(ENDPOINT_ENV)
+
+
+class _OpenFaceWorker:
+    """Single AUExtractor process, the REQ socket connected to it and its clients."""
+
+    open_face: OpenFace
+    socket: zmq.asyncio.Socket
+    port: int
+    queues: OrderedDict[bytes, deque[tuple[bytes, list[bytes]]]]
+    busy: bool
+
+    def __init__(self, context: zmq.asyncio.Context) -> None:
+        self.socket = context.socket(zmq.REQ)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.port = self.socket.bind_to_random_port("tcp://127.0.0.1")
+        self.open_face = OpenFace(self.port)
+        self.queues = OrderedDict()
+        self.busy = False
+
+    async def extract(self, parts: list[bytes], timeout: float) -> bytes:
+        await self.socket.send_multipart(parts)
+        return await asyncio.wait_for(self.socket.recv(), timeout)
+
+    def next_frame(self) -> tuple[bytes, bytes, list[bytes]] | None:
+        """Get the next frame in round-robin order over the waiting clients."""
+        for identity, queue in self.queues.items():
+            if len(queue) > 0:
+                frame_id, parts = queue.popleft()
+                self.queues.move_to_end(identity)
+                return identity, frame_id, parts
+        return None
+
+    def close(self) -> None:
+        self.socket.close()
+        del self.open_face
+
+
+class OpenFaceWorkerPool:
+    """Pool of OpenFace AUExtractor workers, shared by all OpenFaceAUFilters."""
+
+    _logger: logging.Logger
+    _port: int
+    _num_workers: int
+    _max_queued_frames: int
+    _timeout: float
+    _context: zmq.asyncio.Context
+    _socket: zmq.asyncio.Socket | None
+    _task: asyncio.Task | None
+    _workers: list[_OpenFaceWorker]
+    _assignments: dict[bytes, _OpenFaceWorker]
+    _last_seen: dict[bytes, float]
+    _jobs: set[asyncio.Task]
+
+    def __init__(
+        self,
+        port: int,
+        num_workers: int = 0,
+        max_queued_frames: int = 8,
+        timeout: float = 30.0,
+    ) -> None:
+        """Create new OpenFaceWorkerPool.  Start it with `start`.
+
+        Parameters
+        ----------
+        port : int
+            Local port the pool accepts requests on.
+        num_workers : int, default 0
+            Maximum number of AUExtractor workers.  If 0, the number of CPU cores is
+            used.
+        max_queued_frames : int, default 8
+            Maximum number of pending frames per client.  If exceeded, the oldest
+            pending frame of that client is dropped.
+        timeout : float, default 30.0
+            Seconds to wait for a result from a worker before it is restarted.  Must
+            cover the time the AUExtractor needs to load its models.
+        """
+        self._logger = logging.getLogger("OpenFaceWorkerPool")
+        self._port = port
+        self._num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+        self._max_queued_frames = max_queued_frames
+        self._timeout = timeout
+        self._context = zmq.asyncio.Context.instance()
+        self._socket = None
+        self._task = None
+        self._workers = []
+        self._assignments = {}
+        self._last_seen = {}
+        self._jobs = set()
+
+    def __repr__(self) -> str:
+        return (
+            f"OpenFaceWorkerPool(port={self._port}, workers={len(self._workers)}/"
+            f"{self._num_workers}, clients={len(self._assignments)})"
+        )
+
+    @property
+    def endpoint(self) -> str:
+        """Endpoint clients connect to."""
+        return f"tcp://127.0.0.1:{self._port}"
+
+    @property
+    def running(self) -> bool:
+        """True if the pool is bound to its port and handling requests."""
+        return self._task is not None
+
+    def publish_endpoint(self) -> None:
+        """Publish the endpoint in the `ENDPOINT_ENV` environment variable.
+
+        Filters in connection subprocesses started afterwards find the pool with
+        `get_endpoint`.  Clients may connect before the pool is started, their frames
+        are queued by ZMQ until the pool is started.
+        """
+        os.environ[ENDPOINT_ENV] = self.endpoint
+
+    async def start(self) -> None:
+        """Bind the pool to its port and start handling requests.
+
+        Also publishes the endpoint, see `publish_endpoint`.  Does nothing if the pool
+        is running.
+
+        Raises
+        ------
+        zmq.ZMQError
+            If the port is not available.
+        """
+        if self.running:
+            return
+        self._socket = self._context.socket(zmq.ROUTER)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.bind(self.endpoint)
+        self.publish_endpoint()
+        self._task = asyncio.create_task(self._run(), name="OpenFaceWorkerPool.run")
+        self._logger.info(
+            f"Listening on {self.endpoint} with up to {self._num_workers} workers"
+        )
+
+    async def stop(self) -> None:
+        """Stop handling requests and terminate all workers."""
+        self._logger.debug("Stopping OpenFaceWorkerPool")
+        os.environ.pop(ENDPOINT_ENV, None)
+        tasks = list(self._jobs)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+        for worker in self._workers:
+            worker.close()
+        self._workers = []
+        self._assignments.clear()
+        self._last_seen.clear()
+
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    async def _run(self) -> None:
+        """Receive requests from clients and dispatch them to the workers."""
+        assert self._socket is not None
+        while True:
+            message = await self._socket.recv_multipart()
+            if len(message) == 2 and message[1] == LEAVE:
+                self._remove_client(message[0])
+                continue
+            if len(message) < 3:
+                self._logger.warning(f"Ignoring invalid request: {message[:2]}")
+                continue
+
+            identity, frame_id, *parts = message
+            worker = self._assignments.get(identity)
+            if worker is None:
+                worker = self._add_client(identity)
+            self._last_seen[identity] = time.monotonic()
+            await self._enqueue(worker, identity, frame_id, parts)
+            self._dispatch(worker)
+
+    async def _enqueue(
+        self,
+        worker: _OpenFaceWorker,
+        identity: bytes,
+        frame_id: bytes,
+        parts: list[bytes],
+    ) -> None:
+        """Add a frame to the queue of client `identity`, dropping stale frames."""
+        queue = worker.queues[identity]
+        queue.append((frame_id, parts))
+        while len(queue) > self._max_queued_frames:
+            dropped_id, _ = queue.popleft()
+            await self._reply(identity, dropped_id, b"dropped", b"Frame dropped.")
+
+    def _add_client(self, identity: bytes) -> _OpenFaceWorker:
+        """Assign a new client to the worker with the fewest clients."""
+        now = time.monotonic()
+        for client, last_seen in list(self._last_seen.items()):
+            if now - last_seen > CLIENT_TIMEOUT:
+                self._logger.debug(f"Removing inactive client {client!r}")
+                self._remove_client(client)
+
+        if len(self._workers) < self._num_workers and all(
+            len(w.queues) > 0 for w in self._workers
+        ):
+            worker = self._start_worker()
+        else:
+            worker = min(self._workers, key=lambda w: len(w.queues))
+        worker.queues[identity] = deque()
+        self._assignments[identity] = worker
+        return worker
+
+    def _remove_client(self, identity: bytes) -> None:
+        """Remove a client and rebalance the clients of the workers."""
+        worker = self._assignments.pop(identity, None)
+        self._last_seen.pop(identity, None)
+        if worker is None:
+            return
+        del worker.queues[identity]
+
+        most = max(self._workers, key=lambda w: len(w.queues))
+        least = min(self._workers, key=lambda w: len(w.queues))
+        if len(most.queues) - len(least.queues) > 1:
+            # Prefer a client without pending frames, its next frame starts on the new
+            # worker.
+            moved = min(most.queues, key=lambda client: len(most.queues[client]))
+            least.queues[moved] = most.queues.pop(moved)
+            self._assignments[moved] = least
+            self._dispatch(least)
+
+    def _dispatch(self, worker: _OpenFaceWorker) -> None:
+        """Start processing the next frame of `worker`, if it is idle."""
+        if worker.busy:
+            return
+        job = worker.next_frame()
+        if job is None:
+            return
+        worker.busy = True
+        task = asyncio.create_task(self._process(worker, *job))
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+
+    def _start_worker(self) -> _OpenFaceWorker:
+        worker = _OpenFaceWorker(self._context)
+        self._workers.append(worker)
+        self._logger.debug(
+            f"Started worker {len(self._workers)}/{self._num_workers} on port "
+            f"{worker.port}"
+        )
+        return worker
+
+    def _restart_worker(self, worker: _OpenFaceWorker) -> _OpenFaceWorker:
+        """Replace `worker` with a new AUExtractor, keeping its clients."""
+        new_worker = _OpenFaceWorker(self._context)
+        new_worker.queues = worker.queues
+        self._workers[self._workers.index(worker)] = new_worker
+        for identity in new_worker.queues:
+            self._assignments[identity] = new_worker
+        worker.close()
+        return new_worker
+
+    async def _process(
+        self,
+        worker: _OpenFaceWorker,
+        identity: bytes,
+        frame_id: bytes,
+        parts: list[bytes],
+    ) -> None:
+        """Extract AUs for a single frame on `worker` and reply to the client."""
+        try:
+            result = await worker.extract(parts, self._timeout)
+        except (asyncio.TimeoutError, zmq.ZMQError) as e:
+            self._logger.warning(
+                f"Worker on port {worker.port} failed, restarting it. Error: {e!r}"
+            )
+            worker = self._restart_worker(worker)
+            await self._reply(identity, frame_id, b"error", b"AUExtractor failed.")
+        else:
+            worker.busy = False
+            await self._reply(identity, frame_id, b"ok", result)
+
+        self._dispatch(worker)
+
+    async def _reply(
+        self, identity: bytes, frame_id: bytes, status: bytes, payload: bytes
+    ) -> None:
+        if self._socket is None:
+            return
+        await self._socket.send_multipart([identity, frame_id, status, payload])
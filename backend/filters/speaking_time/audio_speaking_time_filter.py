@@ -1,6 +1,7 @@
 import numpy
 from av import AudioFrame
 from filters.filter_dict import FilterDict
+from filter_api import MeasurementSink
 
 from filters.filter import Filter
 
@@ -10,12 +11,16 @@ class AudioSpeakingTimeFilter(Filter):
 
     seconds: float
     _config: FilterDict
+    _sink: MeasurementSink
 
     def __init__(
         self, config: FilterDict, audio_track_handler, video_track_handler
     ) -> None:
         super().__init__(config, audio_track_handler, video_track_handler)
         self.seconds = float(0)
+        self._sink = audio_track_handler.filter_api.create_measurement_sink(
+            "speaking_time", {"speaking": "bool", "seconds": "float64"}
+        )
 
     @staticmethod
     def name(self) -> str:
@@ -42,6 +47,11 @@ class AudioSpeakingTimeFilter(Filter):
     async def process(
         self, audioFrame: AudioFrame, ndarray: numpy.ndarray
     ) -> numpy.ndarray:
-        if numpy.abs(ndarray).mean() > 125:
+        speaking = numpy.abs(ndarray).mean() > 125
+        if speaking:
             self.seconds += audioFrame.samples / audioFrame.sample_rate
+        self._sink.write(speaking=speaking, seconds=self.seconds)
         return ndarray
+
+    async def cleanup(self) -> None:
+        await self._sink.close()
@@ -2,10 +2,9 @@
 
 from __future__ import annotations
 
+import asyncio
 import numpy
-import zmq
-import zmq.asyncio
-from typing import TypeGuard
+from typing import TYPE_CHECKING, TypeGuard
 from abc import ABC, abstractmethod
 from av import VideoFrame, AudioFrame
 
@@ -14,6 +13,9 @@ from filters.filter_dict import FilterDict
 import logging
 from typing import Any
 
+if TYPE_CHECKING:
+    from group_filters.group_filter_broker import GroupFilterSender
+
 
 class GroupFilter(ABC):
     """Abstract base class for all group filters.
@@ -21,16 +23,34 @@ class GroupFilter(ABC):
     Attributes
     ----------
     config
+    data_len_per_participant : int
+        Number of values per participant required for an aggregation.  0 aggregates
+        whenever data is received.
+    num_participants_in_aggregation : int or "all"
+        Number of participants in each aggregation.
+    batch_size : int
+        Maximum number of values sent to the aggregator in one message.  Values of
+        `process_individual_frame` are collected until `batch_size` values are
+        available, reducing the message rate for filters with a high frame rate (e.g.
+        ~50 audio frames per second).  1 sends every value separately.
+    batch_window : float
+        Maximum time in milliseconds a value waits in a batch.  Bounds the latency
+        added by batching, also if no more frames arrive (e.g. muted tracks).  0
+        disables the time limit.
     """
 
     _config: FilterDict
     _logger: logging.Logger
-    is_socket_connected: bool
-    _context: zmq.Context | None
-    _socket: zmq.Socket | None
+    _sender: GroupFilterSender | None
+    _topic: str
+    _batch_times: list[int]
+    _batch_data: list[Any]
+    _batch_timer: asyncio.TimerHandle | None
 
     data_len_per_participant: int = 0
     num_participants_in_aggregation: int = 2
+    batch_size: int = 1
+    batch_window: float = 0
 
     def __init__(self, config: FilterDict, participant_id: str) -> None:
         """Initialize new Group Filter.
@@ -53,9 +73,11 @@ class GroupFilter(ABC):
         )
         self._config = config
         self.participant_id = participant_id
-        self.is_socket_connected = False
-        self._context = None
-        self._socket = None
+        self._sender = None
+        self._topic = ""
+        self._batch_times = []
+        self._batch_data = []
+        self._batch_timer = None
 
     @property
     def config(self) -> FilterDict:
@@ -72,14 +94,27 @@ class GroupFilter(ABC):
         """
         self._config = config
 
-    def connect_aggregator(self, port: int) -> None:
-        self._context = zmq.asyncio.Context.instance()
-        self._socket = self._context.socket(zmq.PUSH)
-        try:
-            self._socket.connect(f"tcp://127.0.0.1:{port}")
-            self.is_socket_connected = True
-        except zmq.ZMQError as e:
-            self._logger.error(f"ZMQ Error: {e}")
+    def set_sender(self, sender: GroupFilterSender | None, topic: str) -> None:
+        """Set the sender used to send data to the aggregator.
+
+        Parameters
+        ----------
+        sender : group_filters.group_filter_broker.GroupFilterSender or None
+            Sender connected to the group filter broker of the experiment.  If None, no
+            data is sent.
+        topic : str
+            Topic of the aggregator of this filter, see
+            group_filters.group_filter_broker.get_topic.
+
+        Notes
+        -----
+        A pending batch is sent with the previous sender and topic, if the sender or
+        topic changes.
+        """
+        if sender is not self._sender or topic != self._topic:
+            self.flush()
+        self._sender = sender
+        self._topic = topic
 
     async def complete_setup(self) -> None:
         """Complete setup, allowing for asynchronous setup and accessing other filters.
@@ -97,10 +132,40 @@ class GroupFilter(ABC):
 
         Called before the filter is deleted.  In case the filter spawned any
         asyncio.Task tasks they should be stopped & awaited in a custom implementation
-        overriding this function.
+        overriding this function.  Sends the pending batch, see `flush`.
         """
-        self.is_socket_connected = False
-        self._context.destroy()
+        self.flush()
+        self._sender = None
+
+    def flush(self) -> None:
+        """Send the pending batch of values to the aggregator, if there is one."""
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        if len(self._batch_times) == 0:
+            return
+        message: dict[str, Any] = {
+            "participant_id": self.participant_id,
+            "time": self._batch_times[-1],
+            "times": self._batch_times,
+            "data": self._batch_data,
+        }
+        self._batch_times = []
+        self._batch_data = []
+        self._send(message)
+
+    def _send(self, message: dict[str, Any]) -> None:
+        """Send `message` to the aggregator."""
+        if self._sender is None:
+            return
+        try:
+            if self._sender.send(self._topic, message):
+                self._logger.debug(f"Data sent for {self.participant_id}: {message}")
+        except Exception as e:
+            self._logger.debug(
+                f"Exception: {e} | Data cannot be sent for {self.participant_id}:"
+                f" {message}"
+            )
 
     @staticmethod
     def validate_dict(data) -> TypeGuard[FilterDict]:
@@ -113,24 +178,45 @@ class GroupFilter(ABC):
     async def process_individual_frame_and_send_data_to_aggregator(
         self, original: VideoFrame | AudioFrame, ndarray: numpy.ndarray, ts: int
     ) -> None:
-        if self.is_socket_connected:
+        """Process a frame and send the result to the aggregator.
+
+        If `batch_size` is greater than 1, results are collected and sent as one
+        message with the lists `times` and `data` once the batch is full or the first
+        value waited for `batch_window` milliseconds (checked by a timer, so that the
+        batch is also sent if no more frames arrive).  See
+        group_filters.group_filter_aggregator.GroupFilterAggregator.handle_message.
+
+        Parameters
+        ----------
+        original : av.VideoFrame or av.AudioFrame
+            Original frame.
+        ndarray : numpy.ndarray
+            Frame data as ndarray.
+        ts : int
+            Timestamp of the frame in nanoseconds.
+        """
+        if self._sender is not None:
             data = await self.process_individual_frame(original, ndarray)
-            if data is not None:
-                message = dict()
-                message["participant_id"] = self.participant_id
-                message["time"] = ts
-                message["data"] = data
-
-                try:
-                    self._socket.send_json(message, flags=zmq.NOBLOCK)
-
-                    self._logger.debug(
-                        f"Data sent for {self.participant_id}: {message}"
-                    )
-                except Exception as e:
-                    self._logger.debug(
-                        f"Exception: {e} | Data cannot be sent for {self.participant_id}: {message}"
-                    )
+            if data is None:
+                return
+
+            if self.batch_size <= 1:
+                self._send(
+                    {"participant_id": self.participant_id, "time": ts, "data": data}
+                )
+                return
+
+            self._batch_times.append(ts)
+            self._batch_data.append(data)
+            if len(self._batch_times) >= self.batch_size or (
+                self.batch_window > 0
+                and ts - self._batch_times[0] >= self.batch_window * 1_000_000
+            ):
+                self.flush()
+            elif self._batch_timer is None and self.batch_window > 0:
+                self._batch_timer = asyncio.get_running_loop().call_later(
+                    self.batch_window / 1000, self.flush
+                )
 
     @staticmethod
     @abstractmethod
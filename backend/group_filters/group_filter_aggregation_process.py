@@ -0,0 +1,281 @@
+"""Provide the `GroupFilterAggregationProcess` class.
+
+Group filter aggregators align and aggregate the data of all participants (NumPy /
+SciPy work).  Executed on the event loop of the hub, long aggregations would delay
+signaling and session management.  If `group_filter_aggregation_process` is enabled in
+the config, the aggregators of each experiment run on a dedicated aggregation process
+instead (see `aggregator_main.py` and
+group_filters.group_filter_aggregation_runner.GroupFilterAggregationRunner).
+
+The aggregation process binds the group filter endpoint of the experiment (see
+group_filters.group_filter_broker), so the participant connections send data directly
+to the aggregation process.  Only config updates are sent through the control channel
+(stdin / stdout of the process).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from asyncio.subprocess import PIPE, Process, create_subprocess_exec
+from os.path import join
+from typing import Any, Literal
+
+from custom_types.error import ErrorDict
+from custom_types.message import MessageDict
+from filters.filter_dict import FilterDict
+from group_filters.group_filter_broker import get_group_filter_endpoint
+from hub import BACKEND_DIR, metrics
+from hub.exceptions import ErrorDictException
+from hub.subprocess_logging import handle_log_from_subprocess
+
+_NOT_RUNNING = MessageDict(
+    type="ERROR",
+    data=ErrorDict(
+        code=500,
+        type="INTERNAL_SERVER_ERROR",
+        description="Group filter aggregation process is not running.",
+    ),
+)
+
+
+class GroupFilterAggregationProcess:
+    """Control channel to the aggregation process of an experiment."""
+
+    endpoint: str
+    _log_name_suffix: str
+    _ping_interval: float
+    _logger: logging.Logger
+    _process: Process | None
+    _tasks: list[asyncio.Task]
+    _lock: asyncio.Lock
+    _command_nr: int
+    _responses: dict[int, asyncio.Future]
+    _messages_sent: metrics.Counter
+    _messages_received: metrics.Counter
+
+    def __init__(self, session_id: str, ping_interval: float = 0) -> None:
+        """Create new GroupFilterAggregationProcess.  Use `start` to start it.
+
+        Parameters
+        ----------
+        session_id : str
+            ID of the session of the experiment.  Used for the group filter endpoint and
+            logger names.
+        ping_interval : float, default 0
+            Interval in seconds to ping the process in, for debugging.  0 disables
+            pinging.  See `ping_subprocesses` in the config.
+        """
+        self.endpoint = get_group_filter_endpoint(session_id)
+        self._log_name_suffix = session_id
+        self._ping_interval = ping_interval
+        self._logger = logging.getLogger(f"AggregationProcess-{session_id}")
+        self._process = None
+        self._tasks = []
+        self._lock = asyncio.Lock()
+        self._command_nr = 0
+        self._responses = {}
+
+    @property
+    def running(self) -> bool:
+        """True if the aggregation process is running."""
+        return self._process is not None and self._process.returncode is None
+
+    async def start(self) -> None:
+        """Start the aggregation process."""
+        self._process = await create_subprocess_exec(
+            sys.executable,
+            join(BACKEND_DIR, "aggregator_main.py"),
+            "--endpoint",
+            self.endpoint,
+            "--log-name-suffix",
+            self._log_name_suffix,
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+        )
+        self._logger.info(f"Aggregation process started, PID: {self._process.pid}")
+        self._messages_sent, self._messages_received = [
+            metrics.counter(
+                "hub_ipc_messages_total",
+                channel="aggregation_process",
+                peer=self._log_name_suffix,
+                direction=direction,
+            )
+            for direction in ["sent", "received"]
+        ]
+        metrics.add_collector(self._collect_metrics)
+        self._tasks.append(
+            asyncio.create_task(
+                self._wait_for_messages(),
+                name="GroupFilterAggregationProcess._wait_for_messages",
+            )
+        )
+        if self._ping_interval > 0:
+            self._tasks.append(
+                asyncio.create_task(
+                    self._ping(), name="GroupFilterAggregationProcess.ping"
+                )
+            )
+
+    async def stop(self) -> None:
+        """Cleanup all aggregators and stop the aggregation process."""
+        if self._process is None:
+            return
+        if self.running:
+            try:
+                await self._send_command_wait_for_response("SHUTDOWN", None, 10)
+                # Closing stdin unblocks the reader of the runner, so it can exit.
+                assert self._process.stdin is not None
+                self._process.stdin.close()
+                await asyncio.wait_for(self._process.wait(), 5)
+            except (ErrorDictException, asyncio.TimeoutError):
+                pass
+            if self.running:
+                self._process.terminate()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._log_final_stderr()
+        metrics.remove_collector(self._collect_metrics)
+        metrics.remove_remote(self._metrics_source)
+        metrics.remove_series(channel="aggregation_process", peer=self._log_name_suffix)
+        self._process = None
+        self._tasks = []
+
+    async def set_group_filter_aggregators(
+        self,
+        kind: Literal["video", "audio"],
+        group_filter_configs: list[FilterDict],
+    ) -> None:
+        """Update the aggregators of `kind` on the aggregation process.
+
+        Starts the aggregation process if it is not running.  See
+        group_filters.group_filter_aggregator_factory.update_group_filter_aggregators.
+
+        Raises
+        ------
+        ErrorDictException
+            If the aggregators could not be updated.
+        """
+        async with self._lock:
+            if not self.running:
+                await self.start()
+        await self._send_command_wait_for_response(
+            "SET_GROUP_FILTER_AGGREGATORS",
+            {"kind": kind, "group_filters": group_filter_configs},
+        )
+
+    @property
+    def _metrics_source(self) -> str:
+        """Key for the metrics received from the process, see hub.metrics."""
+        return f"aggregator-{id(self)}"
+
+    async def _collect_metrics(self) -> None:
+        """Update the metrics of the control channel, see hub.metrics."""
+        labels = {"channel": "aggregation_process", "peer": self._log_name_suffix}
+        metrics.gauge("hub_ipc_pending_responses", **labels).set(len(self._responses))
+        if self._process is not None and self._process.stdin is not None:
+            metrics.gauge("hub_ipc_write_buffer_bytes", **labels).set(
+                self._process.stdin.transport.get_write_buffer_size()
+            )
+
+    async def _ping(self) -> None:
+        """Send PING command in interval, until the process exited."""
+        while self.running:
+            try:
+                await self._send_command("PING", time.time())
+            except ConnectionError:
+                return
+            await asyncio.sleep(self._ping_interval)
+
+    async def _wait_for_messages(self) -> None:
+        """Receive and handle messages from the aggregation process via stdout."""
+        assert self._process is not None and self._process.stdout is not None
+        while True:
+            try:
+                msg = await self._process.stdout.readline()
+            except ValueError:
+                self._logger.error("readline() failed, message was to long.")
+                continue
+
+            if len(msg) == 0:
+                for future in self._responses.values():
+                    if not future.done():
+                        future.set_result(_NOT_RUNNING)
+                return
+
+            try:
+                parsed = json.loads(msg)
+            except (json.JSONDecodeError, TypeError) as e:
+                self._logger.error(f"Failed to parse message: {e}")
+                continue
+
+            self._messages_received.inc()
+            match parsed["command"]:
+                case "RESPONSE":
+                    future = self._responses.get(parsed["command_nr"])
+                    if future is not None and not future.done():
+                        future.set_result(parsed["data"])
+                case "LOG":
+                    handle_log_from_subprocess(parsed["data"], self._logger)
+                case "METRICS":
+                    metrics.update_remote(self._metrics_source, parsed["data"])
+                case "PONG":
+                    rtt = (time.time() - parsed["data"]["original"]) * 1000
+                    self._logger.debug(f"Aggregation process ping: RTT: {rtt:.2f}ms")
+                case command:
+                    self._logger.error(f"Unrecognized command: {command}")
+
+    async def _log_final_stderr(self) -> None:
+        """Wait for the process to exit and log potential output on stderr."""
+        assert self._process is not None and self._process.stderr is not None
+        stderr = await self._process.stderr.read()
+        await self._process.wait()
+        self._logger.debug(
+            f"Aggregation process exited with returncode: {self._process.returncode}"
+        )
+        if stderr:
+            self._logger.error(f"[stderr START]:\n {stderr.decode()}\n[stderr END]")
+
+    async def _send_command_wait_for_response(
+        self, command: str, data: Any, timeout: float | None = None
+    ) -> None:
+        """Send a command including unique command_nr and wait for the response.
+
+        Raises
+        ------
+        ErrorDictException
+            If the process responded with an error or exited before responding.
+        """
+        command_nr = self._command_nr
+        self._command_nr += 1
+        future = asyncio.get_running_loop().create_future()
+        self._responses[command_nr] = future
+        try:
+            await self._send_command(command, data, command_nr)
+            response = await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            self._logger.error(f"Aggregation process did not respond to {command}")
+            response = _NOT_RUNNING
+        finally:
+            self._responses.pop(command_nr, None)
+
+        if isinstance(response, dict) and response.get("type") == "ERROR":
+            err: ErrorDict = response["data"]
+            raise ErrorDictException(
+                code=err["code"], type=err["type"], description=err["description"]
+            )
+
+    async def _send_command(
+        self, command: str, data: Any, command_nr: int = -1
+    ) -> None:
+        """Send command to the aggregation process via stdin."""
+        if not self.running:
+            raise ConnectionError("Aggregation process is not running")
+        assert self._process is not None and self._process.stdin is not None
+        line = json.dumps({"command": command, "data": data, "command_nr": command_nr})
+        self._process.stdin.write(line.encode("utf-8") + b"\n")
+        self._messages_sent.inc()
+        await self._process.stdin.drain()
@@ -0,0 +1,137 @@
+"""Provide the `GroupFilterAggregationRunner`, running group filter aggregators.
+
+Counterpart to group_filters.group_filter_aggregation_process, executed on the
+aggregation process of an experiment (see `aggregator_main.py`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Literal
+
+from group_filters import GroupFilterAggregator
+from group_filters.group_filter_broker import GroupFilterBroker
+from group_filters.group_filter_aggregator_factory import (
+    update_group_filter_aggregators,
+)
+from hub import metrics
+from hub.exceptions import ErrorDictException
+from hub.subprocess_logging import SubprocessLoggingHandler
+from server import Config
+
+
+class GroupFilterAggregationRunner:
+    """Runs the group filter aggregators of an experiment on the aggregation process.
+
+    Handles incoming commands from the hub (or experiment worker) over stdin and sends
+    responses and logs over stdout.
+    """
+
+    _aggregators: dict[Literal["video", "audio"], dict[str, GroupFilterAggregator]]
+    _broker: GroupFilterBroker
+    _metrics_reporter: metrics.MetricsReporter
+    _logger: logging.Logger
+
+    def __init__(self, endpoint: str, log_name_suffix: str) -> None:
+        """Instantiate new GroupFilterAggregationRunner.
+
+        Parameters
+        ----------
+        endpoint : str
+            Endpoint for the group_filters.group_filter_broker.GroupFilterBroker.
+        log_name_suffix : str
+            Suffix for the logger name, usually the session ID.
+        """
+        config = Config()
+        handler = SubprocessLoggingHandler(self.send_command)
+        logging.basicConfig(level=logging.getLevelName(config.log), handlers=[handler])
+        self._logger = logging.getLogger(
+            f"GroupFilterAggregationRunner-{log_name_suffix}"
+        )
+        self._aggregators = {"video": {}, "audio": {}}
+        self._broker = GroupFilterBroker(endpoint)
+        metrics.configure(f"aggregator-{os.getpid()}", config.metrics_interval)
+        self._metrics_reporter = metrics.MetricsReporter(
+            self.send_command, config.metrics_interval
+        )
+
+    async def run(self) -> None:
+        """Handle commands until `SHUTDOWN` is received or stdin is closed."""
+        self._broker.start()
+        self._metrics_reporter.start()
+        loop = asyncio.get_running_loop()
+        while True:
+            msg = await loop.run_in_executor(None, sys.stdin.readline)
+            if len(msg) == 0:
+                self._logger.debug("stdin closed, shutting down")
+                await self._cleanup()
+                return
+
+            try:
+                parsed = json.loads(msg)
+            except (json.JSONDecodeError, TypeError) as e:
+                self._logger.error(f"Failed to parse message: {e}")
+                continue
+
+            command = parsed["command"]
+            data = parsed["data"]
+            command_nr = parsed["command_nr"]
+            match command:
+                case "SET_GROUP_FILTER_AGGREGATORS":
+                    result = await self._set_aggregators(
+                        data["kind"], data["group_filters"]
+                    )
+                    self.send_command("RESPONSE", result, command_nr)
+                case "PING":
+                    self.send_command(
+                        "PONG", {"original": data, "subprocess_time": time.time()}
+                    )
+                case "SHUTDOWN":
+                    await self._cleanup()
+                    self.send_command("RESPONSE", None, command_nr)
+                    return
+                case _:
+                    self._logger.error(f"Unrecognized command: {command}")
+
+    def send_command(self, command: str, data: Any, command_nr: int = -1) -> None:
+        """Send command via stdout.
+
+        Parameters
+        ----------
+        command : str
+            Command / operator for message.
+        data : any
+            JSON serializable data for command / operator.
+        command_nr : int, optional
+            Command nr identifying requests with responses.
+        """
+        line = json.dumps({"command": command, "data": data, "command_nr": command_nr})
+        print(line, flush=True)
+
+    async def _set_aggregators(
+        self, kind: Literal["video", "audio"], group_filters: list
+    ) -> Any:
+        """Update the aggregators of `kind`.  Returns None or an error message."""
+        try:
+            self._aggregators[kind] = await update_group_filter_aggregators(
+                kind, self._aggregators[kind], group_filters
+            )
+        except ErrorDictException as e:
+            return e.error_message
+        self._broker.set_aggregators(kind, self._aggregators[kind])
+        self._logger.debug(f"Running {kind} aggregators: {self._aggregators[kind]}")
+        return None
+
+    async def _cleanup(self) -> None:
+        """Stop the broker and cleanup all aggregators."""
+        await self._metrics_reporter.stop()
+        await self._broker.stop()
+        aggregators = [*self._aggregators["video"].values()]
+        aggregators.extend(self._aggregators["audio"].values())
+        await asyncio.gather(*[a.cleanup() for a in aggregators])
+        self._aggregators = {"video": {}, "audio": {}}
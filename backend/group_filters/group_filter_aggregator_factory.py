@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import asyncio
+from typing import Literal
+
 from filters import FilterDict
 from group_filters import group_filter_utils
 from group_filters import GroupFilterAggregator
@@ -8,7 +11,7 @@ from hub.exceptions import ErrorDictException
 
 
 def create_group_filter_aggregator(
-    channel: str, group_filter_config: FilterDict, port: int
+    channel: str, group_filter_config: FilterDict
 ) -> GroupFilterAggregator:
     group_filter_name = group_filter_config["name"]
 
@@ -21,4 +24,68 @@ def create_group_filter_aggregator(
             description=f"Unknown group filter type {group_filter_name}.",
         )
 
-    return GroupFilterAggregator(channel, group_filters[group_filter_name], port)
+    return GroupFilterAggregator(channel, group_filters[group_filter_name])
+
+
+async def update_group_filter_aggregators(
+    kind: Literal["video", "audio"],
+    aggregators: dict[str, GroupFilterAggregator],
+    group_filter_configs: list[FilterDict],
+) -> dict[str, GroupFilterAggregator]:
+    """Update running group filter aggregators to match `group_filter_configs`.
+
+    Aggregators with matching id and name are reused (their data is deleted), new
+    aggregators are created and aggregators that are no longer used are cleaned up.
+    The aggregators must be passed to the GroupFilterBroker of the experiment, see
+    group_filters.group_filter_broker.
+
+    Parameters
+    ----------
+    kind : "video" or "audio"
+        Kind of the group filters.
+    aggregators : dict of str to group_filters.GroupFilterAggregator
+        Currently running aggregators, by group filter id.
+    group_filter_configs : list of filters.FilterDict
+        New group filter configs.
+
+    Returns
+    -------
+    dict of str to group_filters.GroupFilterAggregator
+        Running aggregators, by group filter id.
+
+    Raises
+    ------
+    ErrorDictException
+        If a group filter in `group_filter_configs` is unknown.  `aggregators` are not
+        changed in this case.
+    """
+    # Check all configs first, so `aggregators` stay unchanged on errors.
+    group_filters = group_filter_utils.get_group_filter_dict()
+    for config in group_filter_configs:
+        if config["name"] not in group_filters:
+            raise ErrorDictException(
+                code=404,
+                type="UNKNOWN_FILTER_TYPE",
+                description=f"Unknown group filter type {config['name']}.",
+            )
+
+    new_aggregators: dict[str, GroupFilterAggregator] = {}
+    for config in group_filter_configs:
+        filter_id = config["id"]
+        old = aggregators.get(filter_id)
+        # Reuse existing aggregator for matching id and name.
+        if old is not None and old._group_filter.name() == config["name"]:
+            old.delete_data()
+            new_aggregators[filter_id] = old
+        else:
+            new_aggregators[filter_id] = create_group_filter_aggregator(kind, config)
+
+    # Cleanup old group filter aggregators
+    await asyncio.gather(
+        *[
+            aggregator.cleanup()
+            for filter_id, aggregator in aggregators.items()
+            if new_aggregators.get(filter_id) is not aggregator
+        ]
+    )
+    return new_aggregators
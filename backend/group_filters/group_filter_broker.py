@@ -0,0 +1,321 @@
+"""Provide the transport between group filters and group filter aggregators.
+
+Each experiment has one `GroupFilterBroker`, bound to a single ZMQ `ipc://` endpoint
+(see `get_group_filter_endpoint`).  The track handlers of all participant connections
+send the data of their group filters to this endpoint through one `GroupFilterSender`
+each, which is reused when the group filters are reconfigured.  Messages are
+multiplexed by topic, `<kind>:<group filter id>`, and the broker dispatches them to the
+matching group_filters.GroupFilterAggregator.
+
+Aggregation results are published by the broker on a second endpoint (see
+`get_result_endpoint`), once for every participant taking part in the aggregation,
+with topic `<participant id>/<kind>:<group filter id>`.  Every track handler
+subscribes to the results for its participant and kind with a
+`GroupFilterResultReceiver`, which keeps the latest result of each group filter.
+Filters can read these results in `process` without awaiting anything (see
+hub.track_handler.TrackHandler.get_group_filter_result), so feedback does not add a
+round trip to the processing of a frame.
+
+Sending never blocks the media pipeline.  If the aggregators or receivers fall behind
+and the high-water marks are reached, new data or results are dropped.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from contextlib import suppress
+from tempfile import gettempdir
+from time import perf_counter, time_ns
+from typing import Any
+
+import zmq
+import zmq.asyncio
+
+from group_filters.group_filter_aggregator import GroupFilterAggregator
+from group_filters.group_filter_result_dict import GroupFilterResultDict
+from hub import metrics
+
+SEND_HIGH_WATER_MARK = 256
+"""Maximum number of messages queued per sender before new data is dropped."""
+
+RECEIVE_HIGH_WATER_MARK = 4096
+"""Maximum number of messages queued by the broker, shared by all senders."""
+
+RESULT_HIGH_WATER_MARK = 64
+"""Maximum number of results queued per receiver before new results are dropped."""
+
+
+def get_group_filter_endpoint(session_id: str) -> str:
+    """Get the ZMQ endpoint of the group filter broker of an experiment.
+
+    The endpoint is unique for the session and the process hosting the experiment.
+    """
+    return f"ipc://{gettempdir()}/group-filters-{session_id}-{os.getpid()}"
+
+
+def get_result_endpoint(endpoint: str) -> str:
+    """Get the endpoint aggregation results are published on by the broker."""
+    return f"{endpoint}-results"
+
+
+def get_topic(kind: str, filter_id: str) -> str:
+    """Get the topic for the data of the group filter with `filter_id` of `kind`."""
+    return f"{kind}:{filter_id}"
+
+
+def _to_json(obj: Any) -> Any:
+    """Convert NumPy arrays and scalars for `json.dumps`."""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _remove_ipc_file(endpoint: str) -> None:
+    """Remove the socket file of an ipc endpoint, ZMQ does not remove it."""
+    if endpoint.startswith("ipc://"):
+        with suppress(FileNotFoundError):
+            os.remove(endpoint[len("ipc://") :])
+
+
+class GroupFilterBroker:
+    """Receives group filter data on one endpoint and dispatches it to aggregators."""
+
+    endpoint: str
+    _aggregators: dict[str, GroupFilterAggregator]
+    _durations: dict[str, metrics.Histogram]
+    _socket: zmq.asyncio.Socket | None
+    _result_socket: zmq.Socket | None
+    _task: asyncio.Task | None
+    _logger: logging.Logger
+
+    def __init__(self, endpoint: str) -> None:
+        """Create new GroupFilterBroker.  Use `start` to bind the endpoint.
+
+        Parameters
+        ----------
+        endpoint : str
+            ZMQ endpoint to bind, see `get_group_filter_endpoint`.
+        """
+        self.endpoint = endpoint
+        self._aggregators = {}
+        self._durations = {}
+        self._socket = None
+        self._result_socket = None
+        self._task = None
+        self._logger = logging.getLogger("GroupFilterBroker")
+
+    @property
+    def running(self) -> bool:
+        """True if the broker is bound and receiving."""
+        return self._task is not None
+
+    def start(self) -> None:
+        """Bind the endpoint and start dispatching messages to the aggregators."""
+        if self._task is not None:
+            return
+        self._socket = zmq.asyncio.Context.instance().socket(zmq.PULL)
+        self._socket.setsockopt(zmq.RCVHWM, RECEIVE_HIGH_WATER_MARK)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.bind(self.endpoint)
+        self._result_socket = zmq.Context.instance().socket(zmq.PUB)
+        self._result_socket.setsockopt(zmq.SNDHWM, RESULT_HIGH_WATER_MARK)
+        self._result_socket.setsockopt(zmq.LINGER, 0)
+        self._result_socket.bind(get_result_endpoint(self.endpoint))
+        self._task = asyncio.create_task(self._run(), name="GroupFilterBroker._run")
+        self._logger.debug(f"Listening on {self.endpoint}")
+
+    async def stop(self) -> None:
+        """Stop receiving and close the endpoint."""
+        if self._task is None or self._socket is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._socket.close()
+        if self._result_socket is not None:
+            self._result_socket.close()
+        self._task = None
+        self._socket = None
+        self._result_socket = None
+        _remove_ipc_file(self.endpoint)
+        _remove_ipc_file(get_result_endpoint(self.endpoint))
+
+    def set_aggregators(
+        self, kind: str, aggregators: dict[str, GroupFilterAggregator]
+    ) -> None:
+        """Set the aggregators of `kind`, by group filter id."""
+        for topic in self._aggregators:
+            if (
+                topic.startswith(f"{kind}:")
+                and topic[len(kind) + 1 :] not in aggregators
+            ):
+                metrics.remove_series(filter_id=topic[len(kind) + 1 :])
+        self._aggregators = {
+            topic: aggregator
+            for topic, aggregator in self._aggregators.items()
+            if not topic.startswith(f"{kind}:")
+        }
+        for filter_id, aggregator in aggregators.items():
+            self._aggregators[get_topic(kind, filter_id)] = aggregator
+        self._durations = {
+            topic: metrics.histogram(
+                "hub_group_filter_aggregation_seconds",
+                kind=topic.split(":", 1)[0],
+                filter=aggregator.name,
+                filter_id=topic.split(":", 1)[1],
+            )
+            for topic, aggregator in self._aggregators.items()
+        }
+
+    async def _run(self) -> None:
+        """Receive messages, aggregate and publish the results."""
+        assert self._socket is not None
+        while True:
+            topic, payload = await self._socket.recv_multipart()
+            topic = topic.decode()
+            aggregator = self._aggregators.get(topic)
+            if aggregator is None:
+                # Data sent before a reconfiguration reached the senders.
+                continue
+            start = perf_counter()
+            try:
+                message = json.loads(payload)
+                results = aggregator.handle_message(message)
+                for participants, data in results:
+                    self._publish(topic, participants, message["time"], data)
+                self._durations[topic].observe(perf_counter() - start)
+            except Exception as e:
+                self._logger.debug(
+                    f"Exception: {e} | Data aggregation cannot be performed."
+                )
+            # `recv_multipart` does not yield while messages are queued, yield so
+            # aggregating does not starve the other tasks of the event loop.
+            await asyncio.sleep(0)
+
+    def _publish(
+        self, topic: str, participants: tuple[str, ...], time: int, data: Any
+    ) -> None:
+        """Publish an aggregation result to all `participants`."""
+        assert self._result_socket is not None
+        result = GroupFilterResultDict(
+            filter_id=topic.split(":", 1)[1],
+            participants=list(participants),
+            time=time,
+            created=time_ns(),
+            data=data,
+        )
+        payload = json.dumps(result, default=_to_json).encode()
+        for participant_id in participants:
+            self._result_socket.send_multipart(
+                [f"{participant_id}/{topic}".encode(), payload], flags=zmq.NOBLOCK
+            )
+
+
+class GroupFilterSender:
+    """Sends the data of group filters to the GroupFilterBroker of an experiment."""
+
+    endpoint: str
+    dropped: int
+    _sent: metrics.Counter
+    _dropped: metrics.Counter
+    _socket: zmq.Socket
+    _logger: logging.Logger
+
+    def __init__(self, endpoint: str) -> None:
+        """Create new GroupFilterSender connected to `endpoint`.
+
+        Parameters
+        ----------
+        endpoint : str
+            Endpoint of the GroupFilterBroker, see `get_group_filter_endpoint`.
+        """
+        self.endpoint = endpoint
+        self.dropped = 0
+        self._sent = metrics.counter("hub_group_filter_messages_total", result="sent")
+        self._dropped = metrics.counter(
+            "hub_group_filter_messages_total", result="dropped"
+        )
+        self._socket = zmq.Context.instance().socket(zmq.PUSH)
+        self._socket.setsockopt(zmq.SNDHWM, SEND_HIGH_WATER_MARK)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.connect(endpoint)
+        self._logger = logging.getLogger("GroupFilterSender")
+
+    def send(self, topic: str, message: Any) -> bool:
+        """Send `message` for `topic` without blocking.
+
+        Returns
+        -------
+        bool
+            False if the message was dropped, because the high-water mark is reached.
+        """
+        try:
+            self._socket.send_multipart(
+                [topic.encode(), json.dumps(message, default=_to_json).encode()],
+                flags=zmq.NOBLOCK,
+            )
+        except zmq.Again:
+            self.dropped += 1
+            self._dropped.inc()
+            if self.dropped % SEND_HIGH_WATER_MARK == 1:
+                self._logger.warning(
+                    f"Aggregation is falling behind, dropped {self.dropped} messages"
+                )
+            return False
+        self._sent.inc()
+        return True
+
+    def close(self) -> None:
+        """Close the connection to the broker."""
+        self._socket.close()
+
+
+class GroupFilterResultReceiver:
+    """Receives the aggregation results for one participant and kind.
+
+    Keeps the latest result of each group filter.  Reading a result does not block or
+    await, results are replaced by a task receiving from the GroupFilterBroker.
+    """
+
+    endpoint: str
+    latest: dict[str, GroupFilterResultDict]
+    _socket: zmq.asyncio.Socket
+    _task: asyncio.Task
+
+    def __init__(self, endpoint: str, participant_id: str, kind: str) -> None:
+        """Create new GroupFilterResultReceiver and start receiving.
+
+        Parameters
+        ----------
+        endpoint : str
+            Endpoint of the GroupFilterBroker, see `get_group_filter_endpoint`.
+        participant_id : str
+            ID of the participant to receive results for.
+        kind : str
+            Kind of the group filters to receive results for.
+        """
+        self.endpoint = endpoint
+        self.latest = {}
+        self._socket = zmq.asyncio.Context.instance().socket(zmq.SUB)
+        self._socket.setsockopt(zmq.RCVHWM, RESULT_HIGH_WATER_MARK)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.setsockopt_string(zmq.SUBSCRIBE, f"{participant_id}/{kind}:")
+        self._socket.connect(get_result_endpoint(endpoint))
+        self._task = asyncio.create_task(
+            self._run(), name="GroupFilterResultReceiver._run"
+        )
+
+    async def close(self) -> None:
+        """Stop receiving results and close the connection to the broker."""
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._socket.close()
+
+    async def _run(self) -> None:
+        """Receive results and store the latest result of each group filter."""
+        while True:
+            _, payload = await self._socket.recv_multipart()
+            result: GroupFilterResultDict = json.loads(payload)
+            self.latest[result["filter_id"]] = result
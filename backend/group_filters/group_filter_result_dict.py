@@ -0,0 +1,31 @@
+from typing import Any, TypedDict
+
+
+class GroupFilterResultDict(TypedDict):
+    """TypedDict for the result of a group filter aggregation.
+
+    Published by the GroupFilterBroker to the participants taking part in the
+    aggregation, see group_filters.group_filter_broker.
+
+    Attributes
+    ----------
+    filter_id : str
+        ID of the group filter.
+    participants : list of str
+        IDs of the participants whose data was aggregated, in the order of the aligned
+        data.
+    time : int
+        Timestamp (`time.time_ns()`) of the data that triggered the aggregation, as
+        sent by the group filter.
+    created : int
+        Timestamp (`time.time_ns()`) of the aggregation.  Compare to the current time
+        to judge if a result is stale.
+    data : Any
+        Aggregation result, as returned by `GroupFilter.aggregate`.
+    """
+
+    filter_id: str
+    participants: list[str]
+    time: int
+    created: int
+    data: Any
@@ -6,8 +6,6 @@ from filters.filter_dict import FilterDict
 from group_filters.group_filters_request_dict import SetGroupFiltersRequestDict
 
 import custom_types.util as util
-from socket import socket
-
 
 logger = logging.getLogger("GroupFilters")
 
@@ -82,9 +80,3 @@ def get_group_filter_list() -> list[str]:
         result.append(myClass.name())
 
     return result
-
-
-def find_an_available_port(addr: str = "") -> int:
-    with socket() as s:
-        s.bind((addr, 0))
-        return s.getsockname()[1]
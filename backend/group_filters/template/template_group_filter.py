@@ -22,6 +22,8 @@ class TemplateGroupFilter(GroupFilter):
 
     data_len_per_participant = 1  # data required for aggregation
     num_participants_in_aggregation = 2  # number of participants joining in aggregation
+    batch_size = 1  # values sent to the aggregator per message
+    batch_window = 0  # max. time span of a batch in ms, 0 for no limit
 
     def __init__(self, config: FilterDict, participant_id: str):
         super().__init__(config, participant_id)
@@ -0,0 +1,275 @@
+"""Provide sampled per-frame latency tracing of the media pipeline.
+
+If `frame_tracing` is set in the config, every TrackHandler traces one in
+`frame_tracing` frames from the moment the decoded frame is received until it is
+sent to each subscriber.  A `FrameTrace` records a span for every stage of the
+pipeline: group filters, each filter (including the conversions to and from NumPy),
+mute, the hand-off through the MediaRelay to a subscriber, encoding and sending.
+Spans are stored in a ring buffer per process, holding the last `MAX_SPANS` spans.
+
+Decoding runs on the decoder thread of aiortc before the TrackHandler receives the
+frame, so traces start when the decoded frame is handed to the pipeline.
+
+Experimenters can dump the traces of an experiment with the `GET_FRAME_TRACE` command,
+which writes them in the Chrome trace event format (see `get_events`), readable with
+`chrome://tracing` or https://ui.perfetto.dev.  Every track (and every subscriber of a
+track) is shown as one thread, the stages of a frame as consecutive slices with the
+frame ID in their arguments.  Timestamps use `time.monotonic_ns`, which is shared by
+all processes on a machine.
+
+Frames that are not sampled only increment a counter, so tracing is cheap enough to be
+left enabled.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from aiortc import MediaStreamTrack, RTCRtpSender
+from av import AudioFrame, VideoFrame
+
+MAX_SPANS = 20000
+"""Number of spans kept per process, older spans are discarded."""
+
+_sample_interval = 0
+_process = "hub"
+_frame_ids = itertools.count()
+_spans: deque[tuple[str, str, str, int, int, int]] = deque(maxlen=MAX_SPANS)
+_thread_ids: dict[str, int] = {}
+
+
+def configure(sample_interval: int, process: str) -> None:
+    """Configure frame tracing for this process.
+
+    Parameters
+    ----------
+    sample_interval : int
+        `frame_tracing` from the config.  One in `sample_interval` frames is traced, 0
+        disables tracing.
+    process : str
+        Name of this process, shown as process name in the trace.
+    """
+    global _sample_interval, _process
+    _sample_interval = sample_interval
+    _process = process
+
+
+def get_sample_interval() -> int:
+    """Get the sample interval, 0 if tracing is disabled.  See `configure`."""
+    return _sample_interval
+
+
+class FrameTrace:
+    """Trace of one sampled frame, recording consecutive spans in the ring buffer."""
+
+    __slots__ = ("frame_id", "connection", "track", "_last")
+
+    frame_id: int
+    connection: str
+    track: str
+    _last: int
+
+    def __init__(
+        self,
+        connection: str,
+        track: str,
+        frame_id: int | None = None,
+        start: int | None = None,
+    ) -> None:
+        """Start a new FrameTrace.
+
+        Parameters
+        ----------
+        connection : str
+            Log name suffix of the connection the frame belongs to.
+        track : str
+            Name of the track the spans are shown on, e.g. `video`.
+        frame_id : int, optional
+            ID of the frame.  A new ID is generated if not set.
+        start : int, optional
+            Start of the first span, from `time.monotonic_ns`.  Now, if not set.
+        """
+        self.frame_id = next(_frame_ids) if frame_id is None else frame_id
+        self.connection = connection
+        self.track = track
+        self._last = time.monotonic_ns() if start is None else start
+
+    def stamp(self, stage: str) -> None:
+        """Record the span of `stage`, from the previous stamp until now."""
+        now = time.monotonic_ns()
+        _spans.append(
+            (stage, self.connection, self.track, self.frame_id, self._last, now)
+        )
+        self._last = now
+
+    def branch(self, subscriber: str) -> FrameTrace:
+        """Continue the trace for `subscriber`, on a track of its own."""
+        return FrameTrace(
+            self.connection, f"{self.track} > {subscriber}", self.frame_id, self._last
+        )
+
+
+class TracedRelayTrack(MediaStreamTrack):
+    """Relays a subscription of a TrackHandler and continues the traces of its frames.
+
+    Returned by hub.track_handler.TrackHandler.subscribe if tracing is enabled.  Use
+    `trace_sender` to trace encoding and sending of the frames.
+    """
+
+    subscriber: str
+    trace: FrameTrace | None
+    _proxy: MediaStreamTrack
+    _get_traced_frame: Callable[[], tuple[Any, FrameTrace] | None]
+
+    def __init__(
+        self,
+        proxy: MediaStreamTrack,
+        get_traced_frame: Callable[[], tuple[Any, FrameTrace] | None],
+        subscriber: str,
+    ) -> None:
+        """Create new TracedRelayTrack.
+
+        Parameters
+        ----------
+        proxy : aiortc.MediaStreamTrack
+            Proxy returned by the aiortc.contrib.media.MediaRelay of the TrackHandler.
+        get_traced_frame : function () -> tuple of frame and FrameTrace, or None
+            Get the latest traced frame of the TrackHandler and its trace.
+        subscriber : str
+            Name of the subscriber, shown in the trace.
+        """
+        super().__init__()
+        self.kind = proxy.kind
+        self.subscriber = subscriber
+        self.trace = None
+        self._proxy = proxy
+        self._get_traced_frame = get_traced_frame
+
+    async def recv(self) -> AudioFrame | VideoFrame:
+        """Receive the next frame from the relay, records the relay span if traced."""
+        frame = await self._proxy.recv()
+        traced = self._get_traced_frame()
+        if traced is not None and traced[0] is frame:
+            self.trace = traced[1].branch(self.subscriber)
+            self.trace.stamp("relay")
+        return frame
+
+    def stop(self) -> None:
+        """Stop this track and the relay proxy."""
+        super().stop()
+        self._proxy.stop()
+
+
+def trace_sender(sender: RTCRtpSender) -> None:
+    """Trace encoding and sending of the traced frames of `sender`.
+
+    Does nothing if the track of `sender` is not a `TracedRelayTrack`.
+
+    Notes
+    -----
+    aiortc encodes in `RTCRtpSender._next_encoded_frame` and sends the packets of the
+    encoded frame before requesting the next one.  The `encode` span ends when the
+    frame is encoded, the `send` span when the next frame is requested.
+    """
+    track = sender.track
+    if not isinstance(track, TracedRelayTrack):
+        return
+    next_encoded_frame: Callable[[Any], Awaitable[Any]] = sender._next_encoded_frame
+    sending: FrameTrace | None = None
+
+    async def _next_encoded_frame(codec: Any) -> Any:
+        nonlocal sending
+        if sending is not None:
+            sending.stamp("send")
+            sending = None
+        encoded_frame = await next_encoded_frame(codec)
+        if track.trace is not None:
+            if encoded_frame is not None:
+                track.trace.stamp("encode")
+                sending = track.trace
+            track.trace = None
+        return encoded_frame
+
+    sender._next_encoded_frame = _next_encoded_frame  # type: ignore
+
+
+def get_events(connection: str | None = None) -> list[dict]:
+    """Get the recorded spans in the Chrome trace event format.
+
+    Parameters
+    ----------
+    connection : str, optional
+        If set, only spans of this connection (log name suffix) are returned.
+
+    Returns
+    -------
+    list of dict
+        Complete events (`ph`: `X`), timestamps and durations in microseconds, and
+        metadata events naming the process and threads.  Use as `traceEvents` of a
+        trace file.
+    """
+    pid = os.getpid()
+    threads: dict[str, int] = {}
+    events: list[dict] = []
+    for stage, span_connection, track, frame_id, start, end in list(_spans):
+        if connection is not None and span_connection != connection:
+            continue
+        thread = f"{span_connection} {track}"
+        tid = threads.get(thread)
+        if tid is None:
+            # Thread IDs are kept, so they do not collide between dumps of connections
+            # in the same process.
+            tid = threads[thread] = _thread_ids.setdefault(thread, len(_thread_ids) + 1)
+        events.append(
+            {
+                "name": stage,
+                "cat": "frame",
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": (end - start) / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": {"frame_id": frame_id},
+            }
+        )
+
+    metadata = [
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": pid,
+            "tid": 0,
+            "args": {"name": _process},
+        }
+    ]
+    for thread, tid in threads.items():
+        metadata.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": thread},
+            }
+        )
+    return metadata + events
+
+
+def write_trace(path: str, events: list[dict]) -> None:
+    """Write `events` into a Chrome trace file at `path`.
+
+    Parameters
+    ----------
+    path : str
+        Path of the trace file.  Missing directories are created.
+    events : list of dict
+        Trace events, e.g. merged results of `get_events` of multiple processes.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
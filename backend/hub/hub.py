@@ -6,17 +6,24 @@ import asyncio
 import logging
 import json
 from os.path import join
-from hub import FRONTEND_DIR
+from hub import BACKEND_DIR, FRONTEND_DIR, frame_tracing, metrics
 
 from custom_types.message import MessageDict
 from session.data.participant.participant_summary import ParticipantSummaryDict
 
-from experiment import Experiment
+from experiment import Experiment, ExperimentWorker
 from hub.util import generate_unique_id
 from hub.exceptions import ErrorDictException
+from hub.loop_monitor import LoopMonitor
 from hub.util import get_system_specs
 
 from filters.filter import Filter
+from filters.open_face_au import OpenFaceAUFilter
+from filters.open_face_au.open_face_pool import OpenFaceWorkerPool
+from group_filters.group_filter_aggregation_process import GroupFilterAggregationProcess
+from hub.post_processing import PostProcessingQueue
+from hub.worker_nodes import WorkerNodeServer
+from connection.ice import configure_ice
 
 import experiment.experiment as _experiment
 import session.session_manager as _sm
@@ -34,10 +41,14 @@ class Hub:
     """
 
     experimenters: list[Experimenter]
-    experiments: dict[str, _experiment.Experiment]
+    experiments: dict[str, _experiment.Experiment | ExperimentWorker]
     session_manager: _sm.SessionManager
     server: Server
     config: Config
+    open_face_pool: OpenFaceWorkerPool
+    post_processing: PostProcessingQueue
+    worker_nodes: WorkerNodeServer | None
+    _loop_monitor: LoopMonitor
     _logger: logging.Logger
 
     def __init__(self):
@@ -52,6 +63,7 @@ class Hub:
             found.
         """
         self.config = Config()
+        configure_ice(self.config)
 
         # Setup logging
         logging.basicConfig(
@@ -71,6 +83,8 @@ class Hub:
         logging.getLogger("PIL").setLevel(dependencies_log_level)
 
         self._logger.debug(f"Successfully loaded config: {str(self.config)}")
+        metrics.configure("hub", self.config.metrics_interval)
+        frame_tracing.configure(self.config.frame_tracing, "hub")
 
         self.get_filters_json()
         self._logger.debug("Successfully created filters_data.json in frontend folder")
@@ -79,9 +93,35 @@ class Hub:
         self.experiments = {}
         self.session_manager = _sm.SessionManager("sessions")
         self.server = Server(self.handle_offer, self.config)
+        self.open_face_pool = OpenFaceWorkerPool(
+            self.config.open_face_port, self.config.open_face_workers
+        )
+        self.post_processing = PostProcessingQueue(
+            join(BACKEND_DIR, "sessions"),
+            self.config.post_processing_workers,
+            self.send_to_experimenters,
+        )
+        self._loop_monitor = LoopMonitor(self.config.loop_monitor_threshold)
+        self.worker_nodes = None
+        if self.config.worker_node_port > 0:
+            self.worker_nodes = WorkerNodeServer(
+                self.config.worker_node_host,
+                self.config.worker_node_port,
+                self.config.worker_node_token,
+            )
 
     async def start(self):
-        """Start the hub.  Starts the server."""
+        """Start the hub.
+
+        Starts the server, job queue, worker node server and event loop monitor.  The
+        OpenFace worker pool is started on demand, see `prepare_filters`.
+        """
+        self._loop_monitor.start()
+        # The pool is started when the first OpenFace filter is used.
+        self.open_face_pool.publish_endpoint()
+        await self.post_processing.start()
+        if self.worker_nodes is not None:
+            await self.worker_nodes.start()
         await self.server.start()
 
     async def stop(self):
@@ -92,10 +132,21 @@ class Hub:
                 await experiment.stop()
             except ErrorDictException:
                 pass
+            if isinstance(experiment, ExperimentWorker):
+                await experiment.stop_worker()
+            else:
+                await experiment.cleanup()
             experiment.session.creation_time = 0
-        tasks = [self.server.stop()]
+        tasks = [
+            self.server.stop(),
+            self.open_face_pool.stop(),
+            self.post_processing.stop(),
+            self._loop_monitor.stop(),
+        ]
         for experimenter in self.experimenters:
             tasks.append(experimenter.disconnect())
+        if self.worker_nodes is not None:
+            tasks.append(self.worker_nodes.stop())
 
         await asyncio.gather(*tasks)
 
@@ -279,15 +330,41 @@ class Hub:
                 ),
             )
 
-        answer, _ = await participant_factory(
-            offer, participant_id, experiment, participant_data, self, self.config
+        await self.prepare_filters(
+            participant_data.video_filters + participant_data.audio_filters
         )
+        if isinstance(experiment, ExperimentWorker):
+            answer = await experiment.handle_participant_offer(offer, participant_id)
+        else:
+            answer, _ = await participant_factory(
+                offer, participant_id, experiment, participant_data, self, self.config
+            )
 
         return answer, participant_data.as_summary_dict()
 
-    async def create_experiment(self, session_id: str) -> Experiment:
+    async def prepare_filters(self, filters: list) -> None:
+        """Start the services of the hub required by `filters`.
+
+        Starts the OpenFace worker pool if an `OPENFACE_AU` filter is used.  Must be
+        called before the filters are applied to a connection.
+
+        Parameters
+        ----------
+        filters : list of filters.FilterDict
+            Filter configs that will be applied.
+        """
+        open_face = OpenFaceAUFilter.name(OpenFaceAUFilter)
+        if not self.open_face_pool.running and any(
+            isinstance(f, dict) and f.get("name") == open_face for f in filters
+        ):
+            await self.open_face_pool.start()
+
+    async def create_experiment(self, session_id: str) -> Experiment | ExperimentWorker:
         """Create a new Experiment based on existing session data.
 
+        If `experiment_workers` is enabled in the config, the experiment is started on
+        a dedicated worker process, see experiment.experiment_worker.
+
         Also send a `EXPERIMENT_CREATED` message to all experimenters, if experiment was
         successfully created.
 
@@ -319,8 +396,19 @@ class Hub:
             )
 
         # Create Experiment
-        experiment = Experiment(session)
-        self.experiments[session_id] = experiment
+        if self.config.experiment_workers:
+            experiment = ExperimentWorker(session, self, self.config)
+            self.experiments[session_id] = experiment
+            await experiment.start_worker()
+        else:
+            aggregation_process = None
+            if self.config.group_filter_aggregation_process:
+                aggregation_process = GroupFilterAggregationProcess(
+                    session_id, self.config.ping_subprocesses
+                )
+            experiment = Experiment(session, aggregation_process)
+            self.experiments[session_id] = experiment
+            await experiment.start_group_filter_aggregators()
 
         # Notify all experimenters about the new experiment
         message = MessageDict(
@@ -0,0 +1,152 @@
+"""Provide the `LoopMonitor`, detecting blocking code on the event loop.
+
+A blocking call on the event loop (e.g. a slow filter, synchronous file IO or
+`time.sleep`) delays all other tasks of the process, including media processing and
+signaling, without raising any error.  The LoopMonitor measures the scheduling lag of
+the loop continuously and records it in the `hub_event_loop_lag_seconds` histogram (see
+hub.metrics).
+
+A watchdog thread checks if the loop is still responsive.  If the loop is blocked for
+longer than a threshold (`loop_monitor_threshold` in the config), the watchdog captures
+the stack of the loop thread while it is blocked.  After the loop resumes, the stack is
+logged as warning (relayed with `LOG` from subprocesses) and the location of the
+blocking code is counted in `hub_event_loop_blocked_total`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from os.path import basename
+from types import FrameType
+
+from hub import BACKEND_DIR, metrics
+
+INTERVAL = 0.05
+"""Interval in seconds in which the scheduling lag is measured."""
+
+MAX_STACK_DEPTH = 20
+"""Maximum number of frames of the logged stacks, innermost frames are kept."""
+
+
+class LoopMonitor:
+    """Measures the lag of the running event loop and reports blocking callbacks."""
+
+    _threshold: float
+    _logger: logging.Logger
+    _loop: asyncio.AbstractEventLoop | None
+    _loop_thread_id: int
+    _heartbeat: float
+    _lag: metrics.Histogram
+    _task: asyncio.Task | None
+    _watchdog: threading.Thread | None
+    _stopped: threading.Event
+
+    def __init__(self, threshold: float) -> None:
+        """Create new LoopMonitor.  Use `start` to start monitoring.
+
+        Parameters
+        ----------
+        threshold : float
+            Duration in seconds the loop must be blocked before the stack of the
+            blocking code is reported, `loop_monitor_threshold` from the config.  0
+            disables the monitor.
+        """
+        self._threshold = threshold
+        self._logger = logging.getLogger("LoopMonitor")
+        self._loop = None
+        self._loop_thread_id = 0
+        self._heartbeat = 0.0
+        self._lag = metrics.histogram("hub_event_loop_lag_seconds")
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start monitoring the running loop, if the threshold is greater than 0."""
+        if self._threshold <= 0 or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run(), name="LoopMonitor._run")
+        self._watchdog = threading.Thread(
+            target=self._watch, name="LoopMonitor._watch", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Stop monitoring."""
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._watchdog = None
+
+    async def _run(self) -> None:
+        """Measure the scheduling lag every `INTERVAL` seconds."""
+        while True:
+            await asyncio.sleep(INTERVAL)
+            now = time.monotonic()
+            self._lag.observe(max(now - self._heartbeat - INTERVAL, 0))
+            self._heartbeat = now
+
+    def _watch(self) -> None:
+        """Watchdog thread, captures the stack of the loop thread if it is blocked."""
+        reported = 0.0
+        while not self._stopped.wait(min(self._threshold / 2, INTERVAL)):
+            heartbeat = self._heartbeat
+            if heartbeat == reported:
+                continue
+            blocked_since = heartbeat + INTERVAL
+            if time.monotonic() - blocked_since < self._threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                return
+            reported = heartbeat
+            stack = traceback.format_stack(frame)[-MAX_STACK_DEPTH:]
+            location = _get_location(frame)
+            # Report on the loop, after it resumed.  Logging handlers of subprocesses
+            # write to stdout, which must not be used by two threads.
+            assert self._loop is not None
+            try:
+                self._loop.call_soon_threadsafe(
+                    self._report, blocked_since, location, stack
+                )
+            except RuntimeError:
+                # Loop closed.
+                return
+
+    def _report(self, blocked_since: float, location: str, stack: list[str]) -> None:
+        """Log and count a blocking callback detected by the watchdog."""
+        duration = time.monotonic() - blocked_since
+        metrics.counter("hub_event_loop_blocked_total", location=location).inc()
+        self._logger.warning(
+            f"Event loop was blocked for {duration:.3f}s in {location}. Stack while "
+            f"blocked:\n{''.join(stack)}"
+        )
+
+
+def _get_location(frame: FrameType) -> str:
+    """Get the innermost location of `frame` in the backend, as `<file>:<function>`.
+
+    Falls back to the innermost frame, if no frame is in the backend (e.g. in
+    `time.sleep` called by a library).
+    """
+    innermost = frame
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(str(BACKEND_DIR)) and "site-packages" not in filename:
+            innermost = frame
+            break
+        frame = frame.f_back
+    code = innermost.f_code
+    return f"{basename(code.co_filename)}:{code.co_name}"
@@ -0,0 +1,441 @@
+"""Provide the process-wide metrics of the backend, served by the hub on `/metrics`.
+
+Metrics are recorded in the process they occur in, using the functions `counter`,
+`gauge` and `histogram`, which return the series for a metric and a set of labels.
+Series should be looked up once and kept, e.g. by a TrackHandler, as recording a value
+is then only an attribute update.  All metrics must be defined in `METRICS`.
+
+Subprocesses (connection subprocesses, experiment workers and aggregation processes)
+run a `MetricsReporter`, which sends a snapshot of the metrics of the process,
+including the latest snapshots received from its own subprocesses, to the parent
+process in the `METRICS` command every `metrics_interval` seconds (see config).
+Parents store these snapshots with `update_remote`.  The hub renders its own metrics
+and all stored snapshots in the Prometheus text exposition format (see `render`).  The
+`process` label identifies the process of every sample.
+
+Values that are only available on demand, like WebRTC stats or IPC buffer sizes, are
+updated by collectors (see `add_collector`) right before a snapshot is taken.
+
+Examples
+--------
+>>> frames = metrics.counter("hub_track_frames_total", connection="P-1", state="in")
+>>> frames.inc()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Literal, TypedDict
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+_logger = logging.getLogger("Metrics")
+
+MetricType = Literal["counter", "gauge", "histogram"]
+
+METRICS: dict[str, tuple[MetricType, str]] = {
+    "hub_filter_process_seconds": (
+        "histogram",
+        "Duration of Filter.process for one frame.",
+    ),
+    "hub_group_filter_process_seconds": (
+        "histogram",
+        "Duration of the individual frame processing of a group filter for one frame.",
+    ),
+    "hub_group_filter_aggregation_seconds": (
+        "histogram",
+        "Duration of an aggregation cycle, per message received by an aggregator.",
+    ),
+    "hub_group_filter_messages_total": (
+        "counter",
+        "Messages sent to the group filter aggregators, by result (sent / dropped).",
+    ),
+    "hub_track_frames_total": (
+        "counter",
+        (
+            "Frames received (in), returned (out) and lost in the filter pipeline "
+            "(dropped) by a TrackHandler."
+        ),
+    ),
+    "hub_ipc_messages_total": (
+        "counter",
+        "Messages on the control channel of a subprocess, by direction.",
+    ),
+    "hub_ipc_write_buffer_bytes": (
+        "gauge",
+        "Bytes waiting to be written to the control channel of a subprocess.",
+    ),
+    "hub_ipc_pending_responses": (
+        "gauge",
+        "Commands sent to a subprocess, waiting for a response.",
+    ),
+    "hub_webrtc_bytes_total": (
+        "counter",
+        "Bytes sent and received on the transports of a connection.",
+    ),
+    "hub_webrtc_bitrate_bits_per_second": (
+        "gauge",
+        "Bitrate on the transports of a connection, since the last collection.",
+    ),
+    "hub_webrtc_packets_received_total": (
+        "counter",
+        "RTP packets received from the client of a connection.",
+    ),
+    "hub_webrtc_packets_lost_total": (
+        "counter",
+        "RTP packets from the client of a connection that were lost.",
+    ),
+    "hub_webrtc_round_trip_time_seconds": (
+        "gauge",
+        "Round trip time to the client of a connection, from RTCP receiver reports.",
+    ),
+    "hub_webrtc_fraction_lost": (
+        "gauge",
+        (
+            "Fraction of the packets sent to the client that were lost, from RTCP "
+            "receiver reports."
+        ),
+    ),
+    "hub_event_loop_lag_seconds": (
+        "histogram",
+        "Scheduling lag of the event loop, see hub.loop_monitor.",
+    ),
+    "hub_event_loop_blocked_total": (
+        "counter",
+        (
+            "Callbacks blocking the event loop for longer than loop_monitor_threshold,"
+            " by location of the blocking code."
+        ),
+    ),
+    "process_cpu_seconds_total": (
+        "counter",
+        "CPU time used by the process in seconds.",
+    ),
+    "process_resident_memory_bytes": (
+        "gauge",
+        "Resident memory size of the process in bytes.",
+    ),
+}
+"""Type and help text of all metrics, by name."""
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+"""Upper bounds of the buckets of all histograms, in seconds."""
+
+
+class MetricsSnapshotDict(TypedDict):
+    """Snapshot of the metrics of a process, sent in the `METRICS` command.
+
+    Attributes
+    ----------
+    process : str
+        Name of the process, used as `process` label.
+    samples : list
+        `[name, labels, value]` for every series.  For histograms, value is
+        `[bucket counts, sum]`, with one count per bucket in `BUCKETS` and one for
+        values greater than the last bucket.
+    """
+
+    process: str
+    samples: list[list[Any]]
+
+
+class Counter:
+    """Monotonically increasing value."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increase the counter by `amount`."""
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        """Set the counter to a total counted elsewhere, e.g. by aiortc."""
+        self.value = value
+
+    def sample(self) -> float:
+        return self.value
+
+
+class Gauge:
+    """Value that can go up and down."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        """Set the gauge to `value`."""
+        self.value = value
+
+    def sample(self) -> float:
+        return self.value
+
+
+class Histogram:
+    """Distribution of durations in seconds, counted in `BUCKETS`."""
+
+    __slots__ = ("counts", "sum")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add `value` to the histogram."""
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    def sample(self) -> list:
+        return [self.counts.copy(), self.sum]
+
+
+_TYPES: dict[MetricType, type[Counter | Gauge | Histogram]] = {
+    "counter": Counter,
+    "gauge": Gauge,
+    "histogram": Histogram,
+}
+
+_process = "hub"
+_interval = 0.0
+_series: dict[tuple[str, tuple[tuple[str, str], ...]], Counter | Gauge | Histogram] = {}
+_collectors: list[Callable[[], Awaitable[None]]] = []
+_remote: dict[str, tuple[float, list[MetricsSnapshotDict]]] = {}
+
+
+def configure(process: str, interval: float) -> None:
+    """Configure the metrics of this process.
+
+    Parameters
+    ----------
+    process : str
+        Name of this process, used as `process` label for its metrics.
+    interval : float
+        `metrics_interval` from the config.  Snapshots of subprocesses are discarded if
+        they were not updated for three intervals.
+    """
+    global _process, _interval
+    _process = process
+    _interval = interval
+
+
+def _get(name: str, metric_type: MetricType, labels: dict[str, str]) -> Any:
+    """Get or create the series of metric `name` with `labels`."""
+    if METRICS[name][0] != metric_type:
+        raise TypeError(f"{name} is a {METRICS[name][0]}, not a {metric_type}")
+    key = (name, tuple(sorted(labels.items())))
+    series = _series.get(key)
+    if series is None:
+        series = _series[key] = _TYPES[metric_type]()
+    return series
+
+
+def counter(name: str, **labels: str) -> Counter:
+    """Get the Counter `name` with `labels`.  Created if it does not exist."""
+    return _get(name, "counter", labels)
+
+
+def gauge(name: str, **labels: str) -> Gauge:
+    """Get the Gauge `name` with `labels`.  Created if it does not exist."""
+    return _get(name, "gauge", labels)
+
+
+def histogram(name: str, **labels: str) -> Histogram:
+    """Get the Histogram `name` with `labels`.  Created if it does not exist."""
+    return _get(name, "histogram", labels)
+
+
+def remove_series(**labels: str) -> None:
+    """Remove all series which have all `labels`, e.g. of a closed connection."""
+    items = set(labels.items())
+    for key in [k for k in _series if items.issubset(k[1])]:
+        del _series[key]
+
+
+def add_collector(collector: Callable[[], Awaitable[None]]) -> None:
+    """Add a collector, which updates metrics before a snapshot is taken."""
+    _collectors.append(collector)
+
+
+def remove_collector(collector: Callable[[], Awaitable[None]]) -> None:
+    """Remove a collector added with `add_collector`."""
+    if collector in _collectors:
+        _collectors.remove(collector)
+
+
+def update_remote(source: str, snapshots: list[MetricsSnapshotDict]) -> None:
+    """Store the snapshots received in a `METRICS` command from `source`.
+
+    Parameters
+    ----------
+    source : str
+        Key identifying the subprocess in this process.  Replaces the snapshots
+        previously received from `source`.
+    snapshots : list of MetricsSnapshotDict
+        Snapshots of the subprocess and its own subprocesses.
+    """
+    _remote[source] = (time.monotonic(), snapshots)
+
+
+def remove_remote(source: str) -> None:
+    """Remove the snapshots of `source`, e.g. after the subprocess exited."""
+    _remote.pop(source, None)
+
+
+async def collect() -> list[MetricsSnapshotDict]:
+    """Run all collectors and get snapshots of this process and its subprocesses."""
+    results = await asyncio.gather(
+        *[collector() for collector in _collectors], return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            _logger.debug(f"Metrics collector failed: {result}")
+
+    counter("process_cpu_seconds_total").set(time.process_time())
+    gauge("process_resident_memory_bytes").set(_get_resident_memory())
+
+    snapshot = MetricsSnapshotDict(
+        process=_process,
+        samples=[
+            [name, dict(labels), series.sample()]
+            for (name, labels), series in _series.items()
+        ],
+    )
+    snapshots = [snapshot]
+    now = time.monotonic()
+    for source, (received, remote) in list(_remote.items()):
+        if _interval > 0 and now - received > 3 * _interval:
+            _logger.debug(f"Discarding outdated metrics of {source}")
+            del _remote[source]
+            continue
+        snapshots.extend(remote)
+    return snapshots
+
+
+def render(snapshots: list[MetricsSnapshotDict]) -> str:
+    """Render `snapshots` in the Prometheus text exposition format (version 0.0.4)."""
+    families: dict[str, list[str]] = {name: [] for name in METRICS}
+    bounds = [*map(repr, BUCKETS), "+Inf"]
+    for snapshot in snapshots:
+        process = snapshot["process"]
+        for name, labels, value in snapshot["samples"]:
+            lines = families.get(name)
+            if lines is None:
+                # Unknown to this version of the hub.
+                continue
+            labels = {"process": process, **labels}
+            if METRICS[name][0] != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_format_labels({**labels, 'le': bound})} "
+                    f"{cumulative}"
+                )
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    output = []
+    for name, lines in families.items():
+        if len(lines) == 0:
+            continue
+        metric_type, description = METRICS[name]
+        output.append(f"# HELP {name} {description}")
+        output.append(f"# TYPE {name} {metric_type}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    """Format `labels` for the text exposition format."""
+    escaped = [
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for key, value in labels.items()
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format(value: float) -> str:
+    """Format a sample value for the text exposition format."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _get_resident_memory() -> float:
+    """Get the resident memory size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        # Peak instead of current resident memory size, in kilobytes on Linux and
+        # bytes on macOS.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return math.nan
+
+
+class MetricsReporter:
+    """Sends metric snapshots of a subprocess to its parent process periodically.
+
+    The parent should store the snapshots with `update_remote` when it receives the
+    `METRICS` command.
+    """
+
+    _send_command: Callable[[str, Any], None]
+    _interval: float
+    _task: asyncio.Task | None
+
+    def __init__(self, send_command: Callable[[str, Any], None], interval: float):
+        """Create new MetricsReporter.  Use `start` to start reporting.
+
+        Parameters
+        ----------
+        send_command : Callable(str, Any) -> None
+            Function used to send commands (`METRICS`) to the parent process.
+        interval : float
+            Interval in seconds to send snapshots in, `metrics_interval` from the
+            config.
+        """
+        self._send_command = send_command
+        self._interval = interval
+        self._task = None
+
+    def start(self) -> None:
+        """Start sending snapshots, if the interval is greater than 0."""
+        if self._interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="MetricsReporter._run")
+
+    async def stop(self) -> None:
+        """Stop sending snapshots."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        """Send a snapshot every interval."""
+        while True:
+            await asyncio.sleep(self._interval)
+            self._send_command("METRICS", await collect())
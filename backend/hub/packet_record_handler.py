@@ -0,0 +1,311 @@
+"""Provide PacketRecordHandler for recording encoded video without transcoding."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from fractions import Fraction
+from typing import Any
+
+import aiortc
+import av
+from aiortc import RTCRtpReceiver
+
+from hub.recording_index import RecordingIndexWriter
+
+VIDEO_CLOCK_RATE = 90000
+"""RTP clock rate for video.  Timestamps of encoded frames are in this clock rate."""
+
+_MAX_QUEUED_FRAMES = 300
+"""Maximum number of encoded frames waiting to be written (~10s at 30 fps)."""
+
+_TIMESTAMP_RANGE = 2**32
+"""RTP timestamps are 32 bit and wrap around."""
+
+
+class _TeeQueue:
+    """Replacement for the decoder queue of an aiortc.RTCRtpReceiver.
+
+    Forwards everything to the original decoder queue and additionally passes encoded
+    frames to a PacketRecordHandler.  The decoder thread of the receiver keeps reading
+    from the original queue, so live processing is not affected.
+    """
+
+    def __init__(self, target: queue.Queue, handler: PacketRecordHandler) -> None:
+        self._target = target
+        self._handler = handler
+
+    def put(self, item: Any, *args, **kwargs) -> None:
+        self._target.put(item, *args, **kwargs)
+        if item is not None:
+            self._handler._on_encoded_frame(*item)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target, name)
+
+
+class PacketRecordHandler:
+    """Record the encoded video of a receiver without decoding or re-encoding it.
+
+    Encoded frames are tapped after the jitter buffer of the aiortc.RTCRtpReceiver,
+    i.e. after the RTP packets were reassembled into frames, and remuxed into a
+    Matroska container on a dedicated writer thread.  Recording starts with the first
+    keyframe after `start`, a keyframe is requested from the sender when recording
+    starts.
+
+    Has the same interface as hub.record_handler.RecordHandler, except that
+    `add_receiver` is used instead of `add_track`.  Keyframes are added to the
+    recording index next to the recording, see hub.recording_index.
+
+    Tapping relies on private attributes of aiortc.RTCRtpReceiver (the decoder queue
+    and `_send_rtcp_pli`, see requirements.txt for the supported aiortc version).  If
+    they are missing, an error is logged and the raw video is not recorded.
+    """
+
+    _logger: logging.Logger
+    _record: bool
+    _record_to: str
+    _receiver: RTCRtpReceiver | None
+    _recording: bool
+    _queue: queue.Queue[tuple[Any, Any, float] | None]
+    _writer: threading.Thread | None
+    _dropped: int
+    _index: RecordingIndexWriter
+
+    def __init__(self, record: bool = False, record_to: str = "") -> None:
+        """Initialize new PacketRecordHandler.
+
+        Parameters
+        ----------
+        record : bool
+            Flag whether the track must be recorded or not.
+        record_to : str
+            Path for the recording result, without file extension.
+
+        Notes
+        -----
+        Full path of the recording will be:
+        ./sessions/<session_id>/<participant_id>_raw_<date>_<start_time>.mkv
+        """
+        self._logger = logging.getLogger("Raw-Video-PacketRecordHandler")
+        self._record = record
+        self._record_to = record_to
+        self._receiver = None
+        self._recording = False
+        self._queue = queue.Queue(maxsize=_MAX_QUEUED_FRAMES)
+        self._writer = None
+        self._dropped = 0
+
+        if self._record and self._record_to != "":
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            self._record_to = f"{self._record_to}_{timestamp}.mkv"
+        else:
+            self._record_to = ""
+
+        self._index = RecordingIndexWriter(self._record_to, "video")
+
+    def add_receiver(self, receiver: RTCRtpReceiver) -> None:
+        """Tap the encoded frames received by `receiver`.
+
+        Parameters
+        ----------
+        receiver : aiortc.RTCRtpReceiver
+            Receiver of the incoming video track.
+        """
+        if self._record_to == "":
+            return
+
+        attribute = "_RTCRtpReceiver__decoder_queue"
+        decoder_queue = getattr(receiver, attribute, None)
+        if not isinstance(decoder_queue, queue.Queue) or not callable(
+            getattr(receiver, "_send_rtcp_pli", None)
+        ):
+            self._logger.error(
+                f"Failed to tap receiver, aiortc {aiortc.__version__} is not supported."
+                " Raw video recording is disabled"
+            )
+            self._record_to = ""
+            return
+
+        setattr(receiver, attribute, _TeeQueue(decoder_queue, self))
+        self._receiver = receiver
+        self._logger.debug(f"Add receiver: {self._record_to}")
+
+    async def start(self) -> None:
+        """Start recording."""
+        if self._record_to == "" or self._recording:
+            return
+
+        self._writer = threading.Thread(
+            target=self._write, name="PacketRecordHandler-writer", daemon=True
+        )
+        self._writer.start()
+        self._recording = True
+        self._logger.debug(f"Start recording {self._record_to}")
+        await self._request_keyframe()
+
+    async def stop(self) -> str | None:
+        """Stop recording and wait until all frames are written.
+
+        Returns
+        -------
+        str or None
+            Path of the recording, or None if nothing was recorded.
+        """
+        if not self._recording:
+            return None
+
+        self._recording = False
+        # Never block the event loop on a stalled writer, drop the oldest frames to
+        # make room for the end marker instead.
+        while True:
+            try:
+                self._queue.put_nowait(None)
+                break
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._dropped += 1
+                except queue.Empty:
+                    pass
+        if self._writer is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._writer.join)
+            self._writer = None
+
+        if self._dropped > 0:
+            self._logger.warning(f"Dropped {self._dropped} frames, writer too slow")
+        self._logger.info(f"Finish processing: {self._record_to}")
+        return self._record_to if os.path.isfile(self._record_to) else None
+
+    async def _request_keyframe(self) -> None:
+        """Send a picture loss indication, so the sender sends a new keyframe."""
+        if self._receiver is None:
+            return
+        for source in self._receiver.getSynchronizationSources():
+            try:
+                await self._receiver._send_rtcp_pli(source.source)
+            except Exception as e:
+                self._logger.debug(f"Failed to request keyframe: {e}")
+
+    def _on_encoded_frame(self, codec, encoded_frame) -> None:
+        """Queue an encoded frame for the writer.  Called on the event loop."""
+        if not self._recording:
+            return
+        try:
+            self._queue.put_nowait((codec, encoded_frame, time.time()))
+        except queue.Full:
+            self._dropped += 1
+
+    def _write(self) -> None:
+        """Remux queued frames into the output file.  Executed on the writer thread."""
+        container = None
+        stream = None
+        first_timestamp = 0
+        timestamp = None
+        last_pts = -1
+
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                codec, encoded_frame, wall_time = item
+                codec_name = codec.mimeType.split("/")[1].lower()
+
+                if stream is None:
+                    if not is_keyframe(codec_name, encoded_frame.data):
+                        continue
+                    size = _get_frame_size(codec_name, encoded_frame.data)
+                    if size is None:
+                        continue
+                    container = av.open(self._record_to, "w", format="matroska")
+                    stream = container.add_stream(codec_name)
+                    stream.width, stream.height = size
+                    stream.time_base = Fraction(1, VIDEO_CLOCK_RATE)
+                    first_timestamp = encoded_frame.timestamp
+                    self._index.start(wall_time)
+
+                # Rebase timestamps to the first recorded frame, keep them monotonic
+                timestamp = unwrap_timestamp(encoded_frame.timestamp, timestamp)
+                pts = max(timestamp - first_timestamp, last_pts + 1)
+                last_pts = pts
+
+                packet = av.Packet(encoded_frame.data)
+                packet.stream = stream
+                packet.pts = pts
+                packet.dts = pts
+                packet.time_base = Fraction(1, VIDEO_CLOCK_RATE)
+                if is_keyframe(codec_name, encoded_frame.data):
+                    packet.is_keyframe = True
+                    self._index.add(pts / VIDEO_CLOCK_RATE)
+                container.mux(packet)
+        except Exception as e:
+            self._logger.error(f"Failed to write {self._record_to}: {e!r}")
+        finally:
+            if container is not None:
+                container.close()
+        self._index.finalize()
+
+
+def unwrap_timestamp(timestamp: int, previous: int | None) -> int:
+    """Extend the 32 bit RTP `timestamp` beyond its wrap around.
+
+    Parameters
+    ----------
+    timestamp : int
+        RTP timestamp of a frame.
+    previous : int or None
+        Unwrapped timestamp of the previous frame, None for the first frame.
+
+    Returns
+    -------
+    int
+        Unwrapped timestamp, closest to `previous`.  Frames within 2^31 ticks after
+        or before the previous frame are placed after or before it.
+    """
+    if previous is None:
+        return timestamp
+    delta = (timestamp - previous) % _TIMESTAMP_RANGE
+    if delta >= _TIMESTAMP_RANGE // 2:
+        delta -= _TIMESTAMP_RANGE
+    return previous + delta
+
+
+def is_keyframe(codec_name: str, data: bytes) -> bool:
+    """Check if the encoded frame `data` is a keyframe.
+
+    Parameters
+    ----------
+    codec_name : str
+        Codec of the frame, "vp8" or "h264".
+    data : bytes
+        Depayloaded frame, as reassembled by the jitter buffer of aiortc.
+    """
+    if len(data) == 0:
+        return False
+    if codec_name == "vp8":
+        # Bit 0 of the frame tag is 0 for keyframes.
+        return data[0] & 0x01 == 0
+    if codec_name == "h264":
+        # Annex B byte stream, look for IDR slices.
+        index = data.find(b"\x00\x00\x01")
+        while index != -1 and index + 3 < len(data):
+            if data[index + 3] & 0x1F == 5:
+                return True
+            index = data.find(b"\x00\x00\x01", index + 3)
+    return False
+
+
+def _get_frame_size(codec_name: str, data: bytes) -> tuple[int, int] | None:
+    """Get the frame size of the keyframe `data` by decoding it once."""
+    try:
+        context = av.CodecContext.create(codec_name, "r")
+        for frame in context.decode(av.Packet(data)):
+            return frame.width, frame.height
+    except Exception:
+        pass
+    return None
@@ -0,0 +1,379 @@
+"""Provide the `PostProcessingQueue`, a hub-wide queue for recording post-processing.
+
+Recording post-processing, e.g. muxing the audio and video recordings of a
+participant, is not executed by the connections.  Connections report their finished
+recordings, and the hub queues the resulting jobs here.  A fixed number of workers
+executes the jobs in the background, ordered by priority.
+
+The state of all jobs of a session is stored in
+`sessions/<session_id>/post_processing.json`.  Jobs that were queued or running when
+the hub stopped are queued again when the hub starts.  Jobs are identified by a hash
+of their type, inputs and output, so submitting the same job twice does not execute it
+twice.  Outputs are written to a temporary file and renamed when a job succeeds, so an
+interrupted job can safely be retried.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Coroutine, Literal, TypedDict
+
+import av
+
+from custom_types.message import MessageDict
+
+JOB_TYPE = Literal["MUX"]
+"""Types of post-processing jobs."""
+
+JOB_STATE = Literal["QUEUED", "RUNNING", "DONE", "FAILED"]
+"""States of post-processing jobs."""
+
+STATE_FILE = "post_processing.json"
+"""Name of the file storing job states in a session directory."""
+
+
+class PostProcessingJobDict(TypedDict):
+    """TypedDict for recording post-processing jobs.
+
+    Attributes
+    ----------
+    id : str
+        Job ID, derived from `type`, `inputs` and `output`.
+    type : hub.post_processing.JOB_TYPE
+        Type of the job.
+    session_id : str
+        Session the recordings belong to.
+    participant_id : str
+        Participant the recordings belong to.
+    priority : int
+        Jobs with a lower priority value are executed first.
+    inputs : list of str
+        Input files.
+    output : str
+        Output file.
+    state : hub.post_processing.JOB_STATE
+        Current state of the job.
+    attempts : int
+        Number of times the job was executed.
+    progress : float
+        Progress of the current attempt, between 0 and 1.
+    error : str or None
+        Error of the last failed attempt.
+    """
+
+    id: str
+    type: JOB_TYPE
+    session_id: str
+    participant_id: str
+    priority: int
+    inputs: list[str]
+    output: str
+    state: JOB_STATE
+    attempts: int
+    progress: float
+    error: str | None
+
+
+class PostProcessingQueue:
+    """Queue executing recording post-processing jobs with bounded parallelism."""
+
+    _logger: logging.Logger
+    _sessions_dir: str
+    _num_workers: int
+    _max_attempts: int
+    _notify: Callable[[MessageDict], Coroutine[Any, Any, None]]
+    _jobs: dict[str, PostProcessingJobDict]
+    _queue: asyncio.PriorityQueue[tuple[int, int, str]]
+    _counter: int
+    _workers: list[asyncio.Task]
+    _retries: set[asyncio.Task]
+
+    def __init__(
+        self,
+        sessions_dir: str,
+        num_workers: int,
+        notify: Callable[[MessageDict], Coroutine[Any, Any, None]],
+        max_attempts: int = 3,
+    ) -> None:
+        """Create new PostProcessingQueue.  Start it with `start`.
+
+        Parameters
+        ----------
+        sessions_dir : str
+            Directory containing the session directories.
+        num_workers : int
+            Number of jobs executed in parallel.  If 0, half of the CPU cores are used.
+        notify : function (custom_types.message.MessageDict) -> None
+            Called with a `POST_PROCESSING` message whenever the state or progress of a
+            job changes, e.g. hub.hub.Hub.send_to_experimenters.
+        max_attempts : int, default 3
+            Number of times a job is executed before it is marked as failed.
+        """
+        self._logger = logging.getLogger("PostProcessingQueue")
+        self._sessions_dir = sessions_dir
+        if num_workers <= 0:
+            num_workers = max(1, (os.cpu_count() or 2) // 2)
+        self._num_workers = num_workers
+        self._max_attempts = max_attempts
+        self._notify = notify
+        self._jobs = {}
+        self._queue = asyncio.PriorityQueue()
+        self._counter = 0
+        self._workers = []
+        self._retries = set()
+
+    async def start(self) -> None:
+        """Queue unfinished jobs stored in the session directories and start workers."""
+        for job in self._load_jobs():
+            self._jobs[job["id"]] = job
+            if job["state"] in ("QUEUED", "RUNNING"):
+                job["state"] = "QUEUED"
+                job["progress"] = 0
+                self._put(job)
+
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"PostProcessingQueue.worker-{i}")
+            for i in range(self._num_workers)
+        ]
+        self._logger.info(
+            f"Started {self._num_workers} workers, {self._queue.qsize()} jobs restored"
+        )
+
+    async def stop(self) -> None:
+        """Stop all workers.  Interrupted jobs are queued again on the next start."""
+        tasks = [*self._workers, *self._retries]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+
+    def get_jobs(self, session_id: str | None = None) -> list[PostProcessingJobDict]:
+        """Get all known jobs, optionally only those of session `session_id`."""
+        return [
+            job
+            for job in self._jobs.values()
+            if session_id is None or job["session_id"] == session_id
+        ]
+
+    async def submit(
+        self,
+        type: JOB_TYPE,
+        session_id: str,
+        participant_id: str,
+        inputs: list[str],
+        output: str,
+        priority: int = 1,
+    ) -> PostProcessingJobDict:
+        """Submit a new job.
+
+        If the same job was already submitted, the existing job is returned.  Failed
+        jobs are queued again.
+
+        Parameters
+        ----------
+        type : hub.post_processing.JOB_TYPE
+            Type of the job.
+        session_id : str
+            Session the recordings belong to.
+        participant_id : str
+            Participant the recordings belong to.
+        inputs : list of str
+            Input files.
+        output : str
+            Output file.
+        priority : int, default 1
+            Jobs with a lower priority value are executed first.
+
+        Returns
+        -------
+        hub.post_processing.PostProcessingJobDict
+            The submitted job.
+        """
+        key = json.dumps([type, inputs, output]).encode("utf-8")
+        job_id = hashlib.sha1(key).hexdigest()[:12]
+
+        job = self._jobs.get(job_id)
+        if job is not None and job["state"] != "FAILED":
+            self._logger.debug(f"Job {job_id} already submitted, state: {job['state']}")
+            return job
+
+        job = PostProcessingJobDict(
+            id=job_id,
+            type=type,
+            session_id=session_id,
+            participant_id=participant_id,
+            priority=priority,
+            inputs=inputs,
+            output=output,
+            state="QUEUED",
+            attempts=0,
+            progress=0,
+            error=None,
+        )
+        self._jobs[job_id] = job
+        self._put(job)
+        await self._update(job)
+        self._logger.debug(f"Submitted {type} job {job_id}: {inputs} -> {output}")
+        return job
+
+    def _put(self, job: PostProcessingJobDict) -> None:
+        self._counter += 1
+        self._queue.put_nowait((job["priority"], self._counter, job["id"]))
+
+    async def _work(self) -> None:
+        """Execute jobs from the queue, one at a time."""
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs[job_id]
+            if job["state"] != "QUEUED":
+                continue
+
+            job["state"] = "RUNNING"
+            job["attempts"] += 1
+            job["progress"] = 0
+            await self._update(job)
+
+            try:
+                if not os.path.exists(job["output"]):
+                    await self._execute(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job["error"] = repr(e)
+                self._logger.warning(
+                    f"Job {job_id} failed (attempt {job['attempts']}): {e!r}"
+                )
+                if job["attempts"] < self._max_attempts:
+                    job["state"] = "QUEUED"
+                    self._retry_later(job, 2 ** job["attempts"])
+                else:
+                    job["state"] = "FAILED"
+            else:
+                job["state"] = "DONE"
+                job["progress"] = 1
+                job["error"] = None
+                self._logger.info(f"Job {job_id} done: {job['output']}")
+
+            await self._update(job)
+
+    def _retry_later(self, job: PostProcessingJobDict, delay: float) -> None:
+        async def _retry():
+            await asyncio.sleep(delay)
+            self._put(job)
+
+        task = asyncio.create_task(_retry())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _execute(self, job: PostProcessingJobDict) -> None:
+        """Execute `job`, writing to a temporary file that is renamed on success."""
+        for path in job["inputs"]:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Missing input: {path}")
+
+        base, extension = os.path.splitext(job["output"])
+        temporary = f"{base}.part{extension}"
+
+        match job["type"]:
+            case "MUX":
+                program = ["ffmpeg", "-nostdin", "-y", "-nostats", "-threads", "1"]
+                for path in job["inputs"]:
+                    program += ["-i", path]
+                for i in range(len(job["inputs"])):
+                    program += ["-map", str(i)]
+                program += ["-c", "copy", "-progress", "pipe:1", temporary]
+            case _:
+                raise ValueError(f"Unknown job type: {job['type']}")
+
+        duration = await asyncio.get_running_loop().run_in_executor(
+            None, _get_duration, job["inputs"]
+        )
+        await self._run_ffmpeg(job, program, duration)
+        os.replace(temporary, job["output"])
+
+    async def _run_ffmpeg(
+        self, job: PostProcessingJobDict, program: list[str], duration: float
+    ) -> None:
+        """Run ffmpeg, parse its progress output and report progress of `job`."""
+        process = await asyncio.create_subprocess_exec(
+            *program,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        assert process.stdout is not None and process.stderr is not None
+        stderr_task = asyncio.create_task(process.stderr.read())
+
+        last_report = 0.0
+        try:
+            async for line in process.stdout:
+                key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+                if key != "out_time_us" or duration <= 0 or not value.isdigit():
+                    continue
+                job["progress"] = min(int(value) / 1e6 / duration, 0.99)
+                if time.monotonic() - last_report >= 1:
+                    last_report = time.monotonic()
+                    await self._update(job, persist=False)
+            returncode = await process.wait()
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        finally:
+            stderr = await stderr_task
+
+        if returncode != 0:
+            tail = stderr.decode("utf-8", "replace").strip().splitlines()[-1:]
+            raise RuntimeError(f"ffmpeg exited with {returncode}: {tail}")
+
+    async def _update(self, job: PostProcessingJobDict, persist: bool = True) -> None:
+        """Persist `job` and notify about its state."""
+        if persist:
+            self._save_session(job["session_id"])
+        try:
+            await self._notify(MessageDict(type="POST_PROCESSING", data=job))
+        except Exception as e:
+            self._logger.debug(f"Failed to notify about job {job['id']}: {e!r}")
+
+    def _save_session(self, session_id: str) -> None:
+        """Write the jobs of `session_id` into the session directory."""
+        directory = os.path.join(self._sessions_dir, session_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, STATE_FILE)
+        jobs = {job["id"]: job for job in self.get_jobs(session_id)}
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(jobs, file, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def _load_jobs(self) -> list[PostProcessingJobDict]:
+        """Load jobs from all session directories."""
+        jobs: list[PostProcessingJobDict] = []
+        if not os.path.isdir(self._sessions_dir):
+            return jobs
+
+        for entry in os.scandir(self._sessions_dir):
+            path = os.path.join(entry.path, STATE_FILE)
+            if not entry.is_dir() or not os.path.isfile(path):
+                continue
+            try:
+                with open(path) as file:
+                    jobs.extend(json.load(file).values())
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                self._logger.error(f"Failed to load {path}: {e}")
+        return jobs
+
+
+def _get_duration(paths: list[str]) -> float:
+    """Get the longest duration of `paths` in seconds, 0 if unknown."""
+    duration = 0.0
+    for path in paths:
+        try:
+            with av.open(path) as container:
+                if container.duration is not None:
+                    duration = max(duration, container.duration / av.time_base)
+        except Exception:
+            pass
+    return duration
@@ -0,0 +1,138 @@
+"""Provide the `SamplingProfiler`, a statistical profiler for running processes.
+
+The profiler samples the stacks of all threads of the process (except its own) from a
+background thread, in a fixed interval.  Sampling only reads the current frames, so
+the profiled code is not slowed down apart from the sampling itself (around 1% CPU at
+the default interval).
+
+Profiles are returned as collapsed stacks, one line per unique stack with the number
+of samples: `<thread>;<outermost function>;...;<innermost function> <count>`.  This
+is the input format of flamegraph tools like https://www.speedscope.app or
+`flamegraph.pl`.
+
+Connections are profiled on demand with the `START_PROFILE` experimenter command, see
+connection.connection.Connection.start_profile.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import suppress
+from os.path import basename
+from types import FrameType
+
+MAX_DURATION = 300
+"""Maximum duration of a profile in seconds."""
+
+INTERVAL = 0.01
+"""Default interval in seconds in which the stacks are sampled."""
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads of this process, see module docs."""
+
+    interval: float
+    samples: int
+    _stacks: Counter[str]
+    _stopped: threading.Event
+    _done: asyncio.Event
+    _thread: threading.Thread | None
+
+    def __init__(self, interval: float = INTERVAL) -> None:
+        """Create new SamplingProfiler.  Use `start` to start sampling.
+
+        Parameters
+        ----------
+        interval : float, default `INTERVAL`
+            Interval in seconds in which the stacks are sampled.
+        """
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._stopped = threading.Event()
+        self._done = asyncio.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        """True if the profiler is sampling."""
+        return self._thread is not None and not self._stopped.is_set()
+
+    def start(self) -> None:
+        """Start sampling in a background thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._sample, name="SamplingProfiler._sample", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling, `run` returns the profile.
+
+        Does not wait for the sampling thread, which stops within one interval.
+        """
+        self._stopped.set()
+        self._done.set()
+
+    async def run(self, duration: float) -> str:
+        """Sample for `duration` seconds or until `stop` is called.
+
+        Parameters
+        ----------
+        duration : float
+            Maximum duration of the profile in seconds.
+
+        Returns
+        -------
+        str
+            Profile as collapsed stacks, see `get_collapsed_stacks`.
+        """
+        self.start()
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._done.wait(), duration)
+        self.stop()
+        assert self._thread is not None
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        return self.get_collapsed_stacks()
+
+    def get_collapsed_stacks(self) -> str:
+        """Get the sampled stacks in the collapsed stack format, see module docs."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self._stacks.most_common()
+        )
+
+    def _sample(self) -> None:
+        """Sample the stacks of all other threads until stopped."""
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = _collapse(frame)
+                self._stacks[f"{names.get(thread_id, thread_id)};{stack}"] += 1
+            self.samples += 1
+
+
+def write_profile(path: str, stacks: str) -> None:
+    """Write collapsed `stacks` to `path`.  Missing directories are created."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(stacks)
+
+
+def _collapse(frame: FrameType | None) -> str:
+    """Get the stack of `frame` as `;` separated functions, outermost first."""
+    functions = []
+    while frame is not None:
+        code = frame.f_code
+        functions.append(
+            f"{code.co_name} ({basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(functions))
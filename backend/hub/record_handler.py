@@ -1,29 +1,77 @@
 """Provide RecordHandler for handling media recorder."""
 
 from __future__ import annotations
+import asyncio
+import json
 import logging
-import math
 import os
-import subprocess
+import queue
+import shutil
+import threading
 import time
+from fractions import Fraction
+from typing import Any
 
-from aiortc.contrib.media import MediaRecorder, MediaBlackhole
+import av
+from av import AudioFrame, VideoFrame
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from hub.recording_index import RecordingIndexWriter
 from hub.track_handler import TrackHandler
 
+_MAX_QUEUED_FRAMES = 120
+"""Maximum number of frames waiting to be encoded before frames are dropped."""
+
+MANIFEST_FILE = "manifest.json"
+"""Name of the manifest file in the segment directory of a segmented recording."""
+
+_MP4_OPTIONS = {"movflags": "frag_keyframe+empty_moov+default_base_moof"}
+"""Write fragmented MP4 segments, so the open segment is readable after a crash."""
+
 
 class RecordHandler:
-    """Handles audio and video recording of the stream."""
+    """Handles audio and video recording of the stream.
+
+    The recorded track is only consumed between `start` and `stop`.  The timestamps of
+    the recorded frames are rebased to the first frame received after `start`, so the
+    recording starts at time 0 without any pre-roll.  Frames are encoded and written
+    on a dedicated writer thread, so encoding does not block the event loop.
+
+    If `segment_duration` is greater than 0, the recording is written in segments of
+    fixed duration into `<recording>_segments/`, each with its own encoder.  A
+    manifest in that directory lists all segments, including the open one, and is
+    updated whenever a segment is opened or closed.  Video segments are fragmented
+    MP4 files, so even the open segment is readable if the process crashes, and the
+    muxer state is bounded by the segment duration instead of the session duration.
+    When the recording is stopped, the segments are concatenated (stream copy) into
+    the final recording and the segment directory is removed.  Recordings that were
+    interrupted can be recovered from their segments with `concat_segments`.
+
+    While recording, keyframes are added to the recording index next to the recording,
+    see hub.recording_index.
+    """
 
     _logger: logging.Logger
-    _recorder: MediaRecorder | MediaBlackhole
     _record: bool
     _record_to: str
     _track: TrackHandler
     _track_format: str
-    _start_time: float
+    _source: MediaStreamTrack | None
+    _task: asyncio.Task | None
+    _queue: queue.Queue[tuple[AudioFrame | VideoFrame, float] | None]
+    _writer: threading.Thread | None
+    _dropped: int
+    _segment_duration: float
+    _fsync: bool
+    _index: RecordingIndexWriter
 
     def __init__(
-        self, track: TrackHandler, record: bool = False, record_to: str = None
+        self,
+        track: TrackHandler,
+        record: bool = False,
+        record_to: str = "",
+        segment_duration: float = 0,
+        fsync: bool = False,
     ) -> None:
         """Initialize new RecordHandler for `track`.
 
@@ -35,18 +83,33 @@ class RecordHandler:
             Flag whether the track must be recorded or not.
         record_to : str
             Path for the recording result.
+        segment_duration : float, default 0
+            Duration of recording segments in seconds.  If 0, the recording is written
+            into a single file.
+        fsync : bool, default False
+            If true, every finished segment and every manifest update are flushed to
+            disk with `os.fsync`, the open segment is not flushed.  Only used for
+            segmented recordings.
 
         Notes
         -----
         Full path of the recordings will be:
         ./sessions/<session_id>/<participant_id>_<date>_<start_time>.mp3/mp4
+        Segments of segmented recordings are stored in:
+        ./sessions/<session_id>/<participant_id>_<date>_<start_time>_segments/
         """
         super().__init__()
         self._logger = logging.getLogger(f"{track.kind.capitalize()}-RecordHandler")
         self._track = track
         self._record = record
         self._record_to = record_to
-        self._start_time = 0
+        self._source = None
+        self._task = None
+        self._queue = queue.Queue(maxsize=_MAX_QUEUED_FRAMES)
+        self._writer = None
+        self._dropped = 0
+        self._segment_duration = max(segment_duration, 0)
+        self._fsync = fsync
 
         if self._track.kind == "audio":
             self._track_format = "mp3"
@@ -56,68 +119,377 @@ class RecordHandler:
         if self._record and self._record_to != "":
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             self._record_to = self._record_to + "_" + timestamp + "." + self._track_format
-            self._recorder = MediaRecorder(self._record_to)
         else:
-            self._recorder = MediaBlackhole()
-            
+            self._record_to = ""
+
+        self._index = RecordingIndexWriter(self._record_to, self._track.kind)
+
     async def start(self) -> None:
-        """Start recorder."""
-        if self._record_to != "":
-            self._start_time = time.time()
-            await self._recorder.start()
-            self._logger.debug(f"Start recording {self._record_to}")
+        """Start recorder.  Frames received before `start` are not recorded."""
+        if self._record_to == "" or self._task is not None:
+            return
 
-    def add_track(self, track: TrackHandler) -> None:
+        self._writer = threading.Thread(
+            target=self._write, name=f"{self._logger.name}-writer", daemon=True
+        )
+        self._writer.start()
+        self._task = asyncio.create_task(
+            self._consume(), name=f"{self._logger.name}.consume"
+        )
+        self._logger.debug(f"Start recording {self._record_to}")
+
+    def add_track(self, track: MediaStreamTrack) -> None:
         """Add track to recorder.
 
+        The track is not consumed until the recording is started.
+
         Parameters
         ----------
-        track : TrackHandler
-            The audio/video track.
+        track : aiortc.MediaStreamTrack
+            Track that should be recorded, e.g. a subscription of a TrackHandler.
         """
-
         if self._record_to != "":
-            self._recorder.addTrack(track)
+            self._source = track
             self._logger.debug(f"Add track: {self._record_to}")
 
-    async def stop(self):
-        """Stop RecordHandler."""
+    async def stop(self) -> str | None:
+        """Stop RecordHandler and wait until all frames are written.
+
+        Returns
+        -------
+        str or None
+            Path of the recording, or None if nothing was recorded.
+        """
+        if self._task is None:
+            return None
+
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        self._queue.put(None)
+        if self._writer is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._writer.join)
+            self._writer = None
+
+        if self._dropped > 0:
+            self._logger.warning(f"Dropped {self._dropped} frames, encoder too slow")
+        self._logger.info(f"Finish processing: {self._record_to}")
+        return self._record_to if os.path.isfile(self._record_to) else None
+
+    async def _consume(self) -> None:
+        """Receive frames from the source track and queue them for the writer."""
+        if self._source is None:
+            self._logger.warning("No track added, nothing to record")
+            return
+
+        while True:
+            try:
+                frame = await self._source.recv()
+            except MediaStreamError:
+                return
+            try:
+                self._queue.put_nowait((frame, time.time()))
+            except queue.Full:
+                self._dropped += 1
+
+    def _write(self) -> None:
+        """Encode queued frames and write them.  Executed on the writer thread."""
+        if self._segment_duration > 0:
+            self._write_segments()
+            return
+
+        container = None
+        stream = None
+        first_pts = None
+        last_pts = -1
+
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                frame, wall_time = item
+                if frame.pts is None or frame.time_base is None:
+                    continue
+
+                if container is None:
+                    container = av.open(self._record_to, "w")
+                    stream = add_output_stream(container, frame)
+                    first_pts = frame.pts
+                    self._index.start(wall_time)
+
+                # Rebase timestamps to the first recorded frame, keep them monotonic.
+                pts = max(frame.pts - first_pts, last_pts + 1)
+                last_pts = pts
+                self._mux(container, stream.encode(copy_frame(frame, pts)))
+
+            if stream is not None:
+                self._mux(container, stream.encode(None))
+        except Exception as e:
+            self._logger.error(f"Failed to write {self._record_to}: {e!r}")
+        finally:
+            if container is not None:
+                container.close()
+        self._index.finalize()
+
+    def _write_segments(self) -> None:
+        """Encode queued frames into segments and concatenate them when stopped.
+
+        Executed on the writer thread.
+        """
+        directory = self.segment_directory
+        os.makedirs(directory, exist_ok=True)
+        manifest: dict[str, Any] = {
+            "kind": self._track.kind,
+            "output": os.path.basename(self._record_to),
+            "segment_duration": self._segment_duration,
+            "segments": [],
+        }
+        container = None
+        stream = None
+        segment: dict[str, Any] = {}
+        first_pts = None
+        segment_pts = 0
+        last_pts = -1
+
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                frame, wall_time = item
+                if frame.pts is None or frame.time_base is None:
+                    continue
+                if first_pts is None:
+                    first_pts = frame.pts
+                    self._index.start(wall_time)
+
+                # Rebase timestamps to the first recorded frame, keep them monotonic.
+                pts = max(frame.pts - first_pts, last_pts + 1)
+                last_pts = pts
+
+                elapsed = float((pts - segment_pts) * frame.time_base)
+                if container is not None and elapsed >= self._segment_duration:
+                    self._close_segment(container, stream, segment, manifest)
+                    container = None
+
+                if container is None:
+                    segment_pts = pts
+                    segment = {
+                        "file": f"{len(manifest['segments']):05d}.{self._track_format}",
+                        "start": float(pts * frame.time_base),
+                        "duration": None,
+                        "frames": 0,
+                    }
+                    manifest["segments"].append(segment)
+                    self._write_manifest(manifest)
+                    container = av.open(
+                        os.path.join(directory, segment["file"]),
+                        "w",
+                        container_options=(
+                            _MP4_OPTIONS if self._track_format == "mp4" else {}
+                        ),
+                    )
+                    stream = add_output_stream(container, frame)
+
+                # Timestamps of every segment start at 0, see `concat_segments`.
+                frame = copy_frame(frame, pts - segment_pts)
+                length = frame.samples if isinstance(frame, AudioFrame) else 1
+                segment["duration"] = float((frame.pts + length) * frame.time_base)
+                segment["frames"] += 1
+                self._mux(container, stream.encode(frame), segment["start"])
+
+            if container is not None:
+                self._close_segment(container, stream, segment, manifest)
+                container = None
+        except Exception as e:
+            self._logger.error(f"Failed to write segments of {self._record_to}: {e!r}")
+        finally:
+            if container is not None:
+                container.close()
+
+        if len(manifest["segments"]) == 0:
+            self._index.close()
+            shutil.rmtree(directory, ignore_errors=True)
+            return
 
-        if self._record_to != "":
-            end_time = time.time()
-            duration = end_time - self._start_time
-            await self._recorder.stop()
-            self._logger.debug(f"Stop recording {self._record_to}")
-
-            if self._track.kind == 'video':
-                while(True):
-                    if (os.path.isfile(self._record_to)):
-                        # Trim black frames
-                        self.trim(duration)
-                        self._logger.info(f"Finish processing: {self._record_to}")
-                        break
-
-                    # Need to wait until recording file is saved
-                    time.sleep(1)
-
-    def trim(self, duration: float):
         try:
-            duration_str = str(math.ceil(duration) * -1)
-            output = f"{self._record_to}_trimmed.{self._track_format}"
-            ffmpeg = subprocess.Popen(
-                    [
-                        "ffmpeg",
-                        "-sseof",
-                        duration_str,
-                        "-i",
-                        self._record_to,
-                        output,
-                    ]
-                )
-            self._logger.debug(f"[PID {ffmpeg.pid}]. Run ffmpeg subprocess for trimming {self._record_to}")
-            ffmpeg.communicate()
-            os.remove(self._record_to)
-            os.rename(output, self._record_to)
-        except Exception as error:
-            self._logger.error("Error running ffmpeg." + 
-                               f"Exception: {error}.")
+            concat_segments(directory, self._record_to)
+        except Exception as e:
+            self._logger.error(
+                f"Failed to concatenate segments into {self._record_to}, segments are "
+                f"kept in {directory}: {e!r}"
+            )
+            self._index.close()
+            return
+        shutil.rmtree(directory, ignore_errors=True)
+        self._index.finalize()
+
+    @property
+    def segment_directory(self) -> str:
+        """Directory segments are written to, if `segment_duration` is used."""
+        return f"{os.path.splitext(self._record_to)[0]}_segments"
+
+    def _close_segment(
+        self, container, stream, segment: dict[str, Any], manifest: dict[str, Any]
+    ) -> None:
+        """Flush the encoder, close the segment and update the manifest."""
+        try:
+            self._mux(container, stream.encode(None), segment["start"])
+        finally:
+            container.close()
+
+        if self._fsync:
+            _fsync(os.path.join(self.segment_directory, segment["file"]))
+        self._write_manifest(manifest)
+        self._logger.debug(
+            f"Closed segment {segment['file']} ({segment['duration']:.1f}s)"
+        )
+
+    def _write_manifest(self, manifest: dict[str, Any]) -> None:
+        """Atomically replace the manifest in the segment directory."""
+        path = os.path.join(self.segment_directory, MANIFEST_FILE)
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(manifest, file, indent=2)
+            if self._fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(f"{path}.tmp", path)
+        if self._fsync:
+            _fsync(self.segment_directory)
+
+    def _mux(self, container, packets, offset: float = 0) -> None:
+        """Mux encoded `packets` and add keyframes to the recording index.
+
+        `offset` is the start time of the current segment in seconds.
+        """
+        for packet in packets:
+            if packet.is_keyframe and packet.pts is not None:
+                self._index.add(float(packet.pts * packet.time_base) + offset)
+            container.mux(packet)
+
+
+def copy_frame(frame: AudioFrame | VideoFrame, pts: int) -> AudioFrame | VideoFrame:
+    """Copy `frame` with the timestamp `pts` for encoding.
+
+    Recorded frames are shared with the other consumers of the track (e.g. the
+    outgoing tracks of the subscribers, see aiortc.contrib.media.MediaRelay) and must
+    not be modified by the writer thread.
+    """
+    if isinstance(frame, AudioFrame):
+        copy = AudioFrame.from_ndarray(
+            frame.to_ndarray(), format=frame.format.name, layout=frame.layout.name
+        )
+        copy.sample_rate = frame.sample_rate
+    elif frame.format.name == "yuv420p":
+        copy = VideoFrame.from_ndarray(frame.to_ndarray(), format="yuv420p")
+    else:
+        # Converting creates a new frame, recordings are encoded as yuv420p.
+        copy = frame.reformat(format="yuv420p")
+    copy.pts = pts
+    copy.time_base = frame.time_base
+    return copy
+
+
+def add_output_stream(container, frame: AudioFrame | VideoFrame):
+    """Add an encoded output stream for recordings to `container`.
+
+    Audio is encoded as mp3, video as H.264.  Parameters are based on the first
+    `frame` that will be encoded.
+    """
+    if isinstance(frame, AudioFrame):
+        stream = container.add_stream("mp3", rate=frame.sample_rate)
+    else:
+        stream = container.add_stream("libx264", rate=30)
+        stream.pix_fmt = "yuv420p"
+        stream.width = frame.width
+        stream.height = frame.height
+    stream.codec_context.time_base = Fraction(frame.time_base)
+    return stream
+
+
+def concat_segments(directory: str, output: str) -> None:
+    """Concatenate the segments of a segmented recording into `output`.
+
+    Packets are copied without decoding or re-encoding.  The timestamps of each
+    segment are shifted so it starts at the start time stored in the manifest.
+    Missing or unreadable segments, e.g. the last segment of a recording that was
+    interrupted, are skipped.
+
+    Parameters
+    ----------
+    directory : str
+        Segment directory containing the manifest, see `RecordHandler`.
+    output : str
+        Path of the concatenated recording.  Written to a temporary file first.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the manifest does not exist.
+    ValueError
+        If none of the segments contains any packets.
+    """
+    with open(os.path.join(directory, MANIFEST_FILE)) as file:
+        manifest = json.load(file)
+
+    base, extension = os.path.splitext(output)
+    temporary = f"{base}.part{extension}"
+    container = av.open(temporary, "w")
+    stream = None
+    last_dts = None
+
+    try:
+        for segment in manifest["segments"]:
+            path = os.path.join(directory, segment["file"])
+            try:
+                source = av.open(path)
+            except (FileNotFoundError, av.FFmpegError):
+                continue
+
+            with source:
+                source_stream = source.streams[0]
+                offset = None
+                for packet in source.demux(source_stream):
+                    if packet.dts is None or packet.pts is None:
+                        continue
+                    if stream is None:
+                        stream = _add_stream_from_template(container, source_stream)
+                    if offset is None:
+                        # Fragmented MP4 has no edit list, the first (key)frame of a
+                        # segment may not start at 0 if the encoder delays frames.
+                        start = round(segment["start"] / source_stream.time_base)
+                        offset = start - packet.pts
+                        if last_dts is not None:
+                            # Encoders may start segments with negative timestamps.
+                            offset = max(offset, last_dts + 1 - packet.dts)
+                    packet.pts += offset
+                    packet.dts += offset
+                    last_dts = packet.dts
+                    packet.stream = stream
+                    container.mux(packet)
+    finally:
+        container.close()
+
+    if stream is None:
+        os.remove(temporary)
+        raise ValueError(f"No packets found in segments in {directory}")
+    os.replace(temporary, output)
+
+
+def _add_stream_from_template(container, template):
+    """Add a stream with the codec parameters of `template` to `container`."""
+    add_stream_from_template = getattr(container, "add_stream_from_template", None)
+    if add_stream_from_template is not None:
+        return add_stream_from_template(template)
+    return container.add_stream(template=template)
+
+
+def _fsync(path: str) -> None:
+    """Flush the file or directory `path` to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
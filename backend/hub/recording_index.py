@@ -0,0 +1,314 @@
+"""Provide the recording index, mapping wall clock time to keyframes of recordings.
+
+Every recording of a session gets an index file next to it,
+`<recording>.index.jsonl`, which is written incrementally by the recorder (see
+hub.record_handler.RecordHandler and hub.packet_record_handler.PacketRecordHandler).
+
+Index file format (JSON lines)
+------------------------------
+The first line is a header `{"file", "kind", "start"}`, where `start` is the wall clock
+time (unix timestamp in seconds) of the first recorded frame, i.e. of time 0 in the
+recording.  Every further line is an entry `{"wall", "pts", "pos"}` for a keyframe:
+its wall clock time, its presentation time in seconds in the recording, and its byte
+offset in the file.  While recording, byte offsets are not known yet and `pos` is null.
+When the recording is finished, the index is rebuilt from the keyframes of the file
+(without decoding), which adds the byte offsets.
+
+`SessionRecordingIndex` loads the indices of all recordings of a session, so all
+recordings can be aligned to the same instant in O(log n) and only the GOPs needed
+from that instant on must be decoded.
+
+Examples
+--------
+>>> index = SessionRecordingIndex.load("sessions/<session_id>")
+>>> for file, entry in index.seek(wall_time).items():
+...     container = av.open(os.path.join(index.directory, file))
+...     seek_container(container, entry)
+"""
+
+from __future__ import annotations
+
+import bisect
+import glob
+import json
+import logging
+import os
+from typing import TextIO, TypedDict
+
+import av
+
+INDEX_SUFFIX = ".index.jsonl"
+"""Suffix of index files, appended to the path of the recording."""
+
+_logger = logging.getLogger("RecordingIndex")
+
+
+class RecordingIndexEntryDict(TypedDict):
+    """TypedDict for keyframe entries in a recording index.
+
+    Attributes
+    ----------
+    wall : float
+        Wall clock time of the keyframe (unix timestamp in seconds).
+    pts : float
+        Presentation time of the keyframe in seconds, relative to the recording start.
+    pos : int or None
+        Byte offset of the keyframe in the recording, None if unknown.
+    """
+
+    wall: float
+    pts: float
+    pos: int | None
+
+
+class RecordingIndexWriter:
+    """Incrementally writes the index of a single recording.
+
+    Not thread safe, use from the writer thread of a recorder only.
+    """
+
+    recording: str
+    kind: str
+    min_interval: float
+
+    _file: TextIO | None
+    _start: float | None
+    _last_pts: float | None
+
+    def __init__(self, recording: str, kind: str, min_interval: float = 1.0) -> None:
+        """Create new RecordingIndexWriter for `recording`.
+
+        Parameters
+        ----------
+        recording : str
+            Path of the recording.  The index is written to `recording + INDEX_SUFFIX`.
+        kind : str
+            Kind of the recorded track, e.g. "audio" or "video".
+        min_interval : float, default 1.0
+            Minimum distance between two entries in seconds.  Keyframes closer to the
+            previous entry are skipped, e.g. for audio, where every frame is a keyframe.
+        """
+        self.recording = recording
+        self.kind = kind
+        self.min_interval = min_interval
+        self._file = None
+        self._start = None
+        self._last_pts = None
+
+    @property
+    def path(self) -> str:
+        """Path of the index file."""
+        return self.recording + INDEX_SUFFIX
+
+    def start(self, wall_time: float) -> None:
+        """Start the index.  `wall_time` is the wall clock time of recording time 0."""
+        self._start = wall_time
+        self._last_pts = None
+        self._file = open(self.path, "w")
+        self._write_line(self._header())
+
+    def add(self, pts: float, pos: int | None = None) -> None:
+        """Add keyframe at presentation time `pts` (seconds) to the index."""
+        if self._file is None or self._start is None:
+            return
+        if self._last_pts is not None and pts - self._last_pts < self.min_interval:
+            return
+        self._last_pts = pts
+        self._write_line(
+            RecordingIndexEntryDict(wall=self._start + pts, pts=pts, pos=pos)
+        )
+
+    def finalize(self) -> None:
+        """Close the index and rebuild it from the finished recording.
+
+        Reads the packets of the recording without decoding them, to add the byte
+        offsets of the keyframes.  If the recording can not be read, the incrementally
+        written index is kept.
+        """
+        self.close()
+        if self._start is None or not os.path.isfile(self.recording):
+            return
+
+        try:
+            entries = _read_keyframes(self.recording, self._start, self.min_interval)
+        except (av.FFmpegError, OSError) as e:
+            _logger.warning(f"Failed to rebuild index of {self.recording}: {e!r}")
+            return
+
+        with open(f"{self.path}.tmp", "w") as file:
+            for line in (self._header(), *entries):
+                file.write(json.dumps(line) + "\n")
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def close(self) -> None:
+        """Close the index file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _header(self) -> dict:
+        return {
+            "file": os.path.basename(self.recording),
+            "kind": self.kind,
+            "start": self._start,
+        }
+
+    def _write_line(self, line: dict) -> None:
+        assert self._file is not None
+        self._file.write(json.dumps(line) + "\n")
+        # Flush every line, so the index is complete up to the last line on crashes.
+        self._file.flush()
+
+
+def _read_keyframes(
+    recording: str, start: float, min_interval: float
+) -> list[RecordingIndexEntryDict]:
+    """Get keyframe entries of `recording` by demuxing it, without decoding."""
+    entries: list[RecordingIndexEntryDict] = []
+    last_pts = None
+    with av.open(recording) as container:
+        stream = container.streams[0]
+        for packet in container.demux(stream):
+            if not packet.is_keyframe or packet.pts is None:
+                continue
+            pts = float(packet.pts * stream.time_base)
+            if last_pts is not None and pts - last_pts < min_interval:
+                continue
+            last_pts = pts
+            pos = packet.pos if packet.pos is not None and packet.pos >= 0 else None
+            entries.append(RecordingIndexEntryDict(wall=start + pts, pts=pts, pos=pos))
+    return entries
+
+
+class RecordingIndex:
+    """Index of a single recording.  Use `SessionRecordingIndex` to load indices."""
+
+    file: str
+    kind: str
+    start: float
+    entries: list[RecordingIndexEntryDict]
+
+    _walls: list[float]
+
+    def __init__(
+        self,
+        file: str,
+        kind: str,
+        start: float,
+        entries: list[RecordingIndexEntryDict],
+    ) -> None:
+        self.file = file
+        self.kind = kind
+        self.start = start
+        self.entries = sorted(entries, key=lambda e: e["wall"])
+        self._walls = [e["wall"] for e in self.entries]
+
+    def __repr__(self) -> str:
+        return (
+            f"RecordingIndex(file={self.file}, kind={self.kind}, start={self.start}, "
+            f"entries={len(self.entries)})"
+        )
+
+    @property
+    def end(self) -> float:
+        """Wall clock time of the last indexed keyframe."""
+        return self._walls[-1] if len(self._walls) > 0 else self.start
+
+    def seek(self, wall_time: float) -> RecordingIndexEntryDict | None:
+        """Get the last keyframe at or before `wall_time`.
+
+        Returns None if the recording starts after `wall_time`.
+        """
+        i = bisect.bisect_right(self._walls, wall_time)
+        return self.entries[i - 1] if i > 0 else None
+
+    @classmethod
+    def load(cls, path: str) -> RecordingIndex:
+        """Load index file `path`.  Incomplete last lines are ignored.
+
+        Raises
+        ------
+        ValueError
+            If the header of the index file is missing or invalid.
+        """
+        entries: list[RecordingIndexEntryDict] = []
+        with open(path) as file:
+            try:
+                header = json.loads(file.readline())
+                file_name, kind, start = header["file"], header["kind"], header["start"]
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                raise ValueError(f"Invalid index header in {path}: {e!r}") from e
+
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return cls(file_name, kind, start, entries)
+
+
+class SessionRecordingIndex:
+    """Indices of all recordings of a session, on a shared wall clock timeline."""
+
+    directory: str
+    recordings: dict[str, RecordingIndex]
+
+    def __init__(self, directory: str, recordings: dict[str, RecordingIndex]) -> None:
+        self.directory = directory
+        self.recordings = recordings
+
+    def __repr__(self) -> str:
+        return (
+            f"SessionRecordingIndex(directory={self.directory}, "
+            f"recordings={list(self.recordings)})"
+        )
+
+    @classmethod
+    def load(cls, directory: str) -> SessionRecordingIndex:
+        """Load the indices of all recordings in session directory `directory`.
+
+        Invalid index files are skipped.
+        """
+        recordings: dict[str, RecordingIndex] = {}
+        pattern = os.path.join(glob.escape(directory), f"*{INDEX_SUFFIX}")
+        for path in sorted(glob.glob(pattern)):
+            try:
+                index = RecordingIndex.load(path)
+            except (OSError, ValueError) as e:
+                _logger.warning(f"Skipping recording index {path}: {e}")
+                continue
+            recordings[index.file] = index
+        return cls(directory, recordings)
+
+    def seek(self, wall_time: float) -> dict[str, RecordingIndexEntryDict]:
+        """Get the last keyframe at or before `wall_time` for every recording.
+
+        Recordings that start after `wall_time` are not included.
+
+        Returns
+        -------
+        dict of str to RecordingIndexEntryDict
+            Recording file names (relative to `directory`) mapped to the keyframe
+            decoding must start at to reach `wall_time`.
+        """
+        result: dict[str, RecordingIndexEntryDict] = {}
+        for file, index in self.recordings.items():
+            entry = index.seek(wall_time)
+            if entry is not None:
+                result[file] = entry
+        return result
+
+
+def seek_container(container, entry: RecordingIndexEntryDict) -> None:
+    """Seek the first stream of `container` to the keyframe `entry`.
+
+    Parameters
+    ----------
+    container : av.container.InputContainer
+        Opened recording.
+    entry : RecordingIndexEntryDict
+        Keyframe entry, e.g. from `SessionRecordingIndex.seek`.
+    """
+    stream = container.streams[0]
+    offset = round(entry["pts"] / stream.time_base)
+    container.seek(offset, stream=stream, backward=True, any_frame=False)
@@ -15,8 +15,16 @@ from av import VideoFrame, AudioFrame
 from aiortc.contrib.media import MediaRelay
 
 from filters import filter_factory, FilterDict, Filter, MuteAudioFilter, MuteVideoFilter
-from group_filters import GroupFilter, group_filter_factory, group_filter_utils
-from time import time_ns
+from group_filters import GroupFilter, group_filter_factory
+from group_filters.group_filter_broker import (
+    GroupFilterResultReceiver,
+    GroupFilterSender,
+    get_topic,
+)
+from group_filters.group_filter_result_dict import GroupFilterResultDict
+from hub import frame_tracing, metrics
+from hub.frame_tracing import FrameTrace, TracedRelayTrack
+from time import perf_counter, time_ns
 
 if TYPE_CHECKING:
     from connection.connection import Connection
@@ -36,8 +44,18 @@ class TrackHandler(MediaStreamTrack):
     _mute_filter: MuteAudioFilter | MuteVideoFilter
     _filters: dict[str, Filter]
     _group_filters: dict[str, GroupFilter]
+    _group_filter_sender: GroupFilterSender | None
+    _group_filter_results: GroupFilterResultReceiver | None
     _execute_filters: bool
     _execute_group_filters: bool
+    _frames_in: metrics.Counter
+    _frames_out: metrics.Counter
+    _frames_dropped: metrics.Counter
+    _filter_durations: dict[str, metrics.Histogram]
+    _group_filter_durations: dict[str, metrics.Histogram]
+    _trace_interval: int
+    _frame_count: int
+    _traced_frame: tuple[AudioFrame | VideoFrame, FrameTrace] | None
     _logger: logging.Logger
     __lock: asyncio.Lock
 
@@ -98,6 +116,22 @@ class TrackHandler(MediaStreamTrack):
         self._filters = {}
         self._execute_group_filters = True
         self._group_filters = {}
+        self._group_filter_sender = None
+        self._group_filter_results = None
+        self._filter_durations = {}
+        self._group_filter_durations = {}
+        self._frames_in, self._frames_out, self._frames_dropped = [
+            metrics.counter(
+                "hub_track_frames_total",
+                connection=connection._log_name_suffix,
+                kind=kind,
+                state=state,
+            )
+            for state in ["in", "out", "dropped"]
+        ]
+        self._trace_interval = frame_tracing.get_sample_interval()
+        self._frame_count = 0
+        self._traced_frame = None
 
         # Forward the ended event to this handler.
         self._track.add_listener("ended", self.stop)
@@ -120,12 +154,9 @@ class TrackHandler(MediaStreamTrack):
             self.kind, self.connection.incoming_audio, self.connection.incoming_video
         )
 
-        group_filter_ports = []
-        for _ in group_filters:
-            group_filter_ports.append(group_filter_utils.find_an_available_port())
-
         await self.set_filters(filters)
-        await self.set_group_filters(group_filters, group_filter_ports)
+        # The group filter endpoint of the experiment is set by the participant later.
+        await self.set_group_filters(group_filters, None)
 
     @property
     def track(self) -> MediaStreamTrack:
@@ -147,6 +178,26 @@ class TrackHandler(MediaStreamTrack):
         """Get group filters used by this TrackHandler."""
         return self._group_filters
 
+    def get_group_filter_result(self, filter_id: str) -> GroupFilterResultDict | None:
+        """Get the latest aggregation result of a group filter for this participant.
+
+        Does not block, filters can use it in `process`.  Check `created` in the result
+        to judge if the result is stale.
+
+        Parameters
+        ----------
+        filter_id : str
+            ID of a group filter of this TrackHandler.
+
+        Returns
+        -------
+        group_filters.group_filter_result_dict.GroupFilterResultDict or None
+            Latest result, or None if no result was received yet.
+        """
+        if self._group_filter_results is None:
+            return None
+        return self._group_filter_results.latest.get(filter_id)
+
     @property
     def muted(self) -> bool:
         """Get muted state of TrackHandler."""
@@ -166,6 +217,16 @@ class TrackHandler(MediaStreamTrack):
             for f in list(self._filters.values()) + list(self._group_filters.values())
         ]
         await asyncio.gather(*coros)
+        if self._group_filter_sender is not None:
+            self._group_filter_sender.close()
+            self._group_filter_sender = None
+        if self._group_filter_results is not None:
+            await self._group_filter_results.close()
+            self._group_filter_results = None
+        self._traced_frame = None
+        metrics.remove_series(
+            connection=self.connection._log_name_suffix, kind=self.kind
+        )
 
     async def set_track(self, value: MediaStreamTrack):
         """Replace source track for this TrackHandler.
@@ -193,12 +254,17 @@ class TrackHandler(MediaStreamTrack):
             self._track.add_listener("ended", self.stop)
             previous.stop()
 
-    def subscribe(self) -> MediaStreamTrack:
+    def subscribe(self, subscriber: str = "subscriber") -> MediaStreamTrack:
         """Subscribe to the track managed by this handler.
 
         Creates a new proxy which relays the track.  This is required to add multiple
         subscribers to one track.
 
+        Parameters
+        ----------
+        subscriber : str, default "subscriber"
+            Name of the subscriber, used for frame tracing (see hub.frame_tracing).
+
         Returns
         -------
         aiortc.mediastreams.MediaStreamTrack
@@ -210,7 +276,14 @@ class TrackHandler(MediaStreamTrack):
         proxy!  If this TrackHandler is used directly, the framerate will be divided
         between the new consumer and all existing subscribers.
         """
-        return self._relay.subscribe(self, False)
+        proxy = self._relay.subscribe(self, False)
+        if self._trace_interval > 0:
+            return TracedRelayTrack(proxy, self._get_traced_frame, subscriber)
+        return proxy
+
+    def _get_traced_frame(self) -> tuple[AudioFrame | VideoFrame, FrameTrace] | None:
+        """Get the latest traced frame returned by `recv` and its trace."""
+        return self._traced_frame
 
     async def set_filters(self, filter_configs: list[FilterDict]) -> None:
         """Set or update filters to `filter_configs`.
@@ -248,11 +321,18 @@ class TrackHandler(MediaStreamTrack):
                 config, self.connection.incoming_audio, self.connection.incoming_video
             )
 
+        self._filter_durations = self._get_durations(
+            "hub_filter_process_seconds", self._filters
+        )
+
         coroutines: list[Coroutine] = []
         # Cleanup old filters
         for filter_id, old_filter in old_filters.items():
             if filter_id not in self._filters:
                 coroutines.append(old_filter.cleanup())
+                metrics.remove_series(
+                    connection=self.connection._log_name_suffix, filter_id=filter_id
+                )
 
         # Complete setup for new filters
         for new_filter in self._filters.values():
@@ -273,18 +353,51 @@ class TrackHandler(MediaStreamTrack):
         )
 
     async def set_group_filters(
-        self, group_filter_configs: list[FilterDict], ports: list[int]
+        self, group_filter_configs: list[FilterDict], endpoint: str | None
     ) -> None:
+        """Set or update the group filters of this TrackHandler.
+
+        Parameters
+        ----------
+        group_filter_configs : list of filters.FilterDict
+            Group filter configs.
+        endpoint : str or None
+            Group filter endpoint of the experiment, see
+            group_filters.group_filter_broker.  If None, the group filters do not send
+            data to the aggregators.
+        """
         async with self.__lock:
-            await self._set_group_filters(group_filter_configs, ports)
+            await self._set_group_filters(group_filter_configs, endpoint)
 
     async def _set_group_filters(
-        self, group_filter_configs: list[FilterDict], ports: list[int]
+        self, group_filter_configs: list[FilterDict], endpoint: str | None
     ) -> None:
+        # Reuse the sender and receiver (and their connections), unless the endpoint
+        # changed.
+        sender = self._group_filter_sender
+        results = self._group_filter_results
+        if sender is not None and sender.endpoint != endpoint:
+            # Send pending batches before the sender is closed.
+            for group_filter in self._group_filters.values():
+                group_filter.flush()
+            sender.close()
+            sender = None
+        if results is not None and results.endpoint != endpoint:
+            await results.close()
+            results = None
+        if endpoint is not None:
+            participant_id = self.connection._log_name_suffix[2:]
+            if sender is None:
+                sender = GroupFilterSender(endpoint)
+            if results is None:
+                results = GroupFilterResultReceiver(endpoint, participant_id, self.kind)
+        self._group_filter_sender = sender
+        self._group_filter_results = results
+
         old_group_filters = self._group_filters
 
         self._group_filters = {}
-        for config, port in zip(group_filter_configs, ports):
+        for config in group_filter_configs:
             filter_id = config["id"]
             # Reuse existing filter for matching id and type.
             if (
@@ -293,19 +406,31 @@ class TrackHandler(MediaStreamTrack):
             ):
                 self._group_filters[filter_id] = old_group_filters[filter_id]
                 self._group_filters[filter_id].set_config(config)
-                continue
-
-            # Create a new filter for configs with empty id.
-            self._group_filters[filter_id] = group_filter_factory.create_group_filter(
-                config, self.connection._log_name_suffix[2:]
+            else:
+                # Create a new filter for configs with empty id.
+                self._group_filters[filter_id] = (
+                    group_filter_factory.create_group_filter(
+                        config, self.connection._log_name_suffix[2:]
+                    )
+                )
+            self._group_filters[filter_id].set_sender(
+                sender, get_topic(self.kind, filter_id)
             )
-            self._group_filters[filter_id].connect_aggregator(port)
+
+        self._group_filter_durations = self._get_durations(
+            "hub_group_filter_process_seconds", self._group_filters
+        )
 
         coroutines: list[Coroutine] = []
         # Cleanup old filters
         for filter_id, old_group_filter in old_group_filters.items():
             if filter_id not in self._group_filters:
                 coroutines.append(old_group_filter.cleanup())
+                metrics.remove_series(
+                    connection=self.connection._log_name_suffix, filter_id=filter_id
+                )
+                if results is not None:
+                    results.latest.pop(filter_id, None)
 
         # Complete setup for new filters
         for new_filter in self._group_filters.values():
@@ -314,6 +439,21 @@ class TrackHandler(MediaStreamTrack):
         await asyncio.gather(*coroutines)
         self.reset_execute_group_filters()
 
+    def _get_durations(
+        self, name: str, filters: dict[str, Filter] | dict[str, GroupFilter]
+    ) -> dict[str, metrics.Histogram]:
+        """Get the histograms for the processing durations of `filters`, by id."""
+        return {
+            filter_id: metrics.histogram(
+                name,
+                connection=self.connection._log_name_suffix,
+                kind=self.kind,
+                filter=f.config["name"],
+                filter_id=filter_id,
+            )
+            for filter_id, f in filters.items()
+        }
+
     def reset_execute_group_filters(self):
         self._execute_group_filters = len(self._group_filters) > 0
 
@@ -337,79 +477,132 @@ class TrackHandler(MediaStreamTrack):
             raise MediaStreamError
 
         frame = await self.track.recv()
-
-        if self._execute_group_filters:
-            if self.kind == "video":
-                await self._run_video_group_filters(frame)
-            else:
-                await self._run_audio_group_filters(frame)
-
-        if self._execute_filters:
-            if self.kind == "video":
-                frame = await self._apply_video_filters(frame)
-            else:
-                frame = await self._apply_audio_filters(frame)
-
-        if self._muted:
-            muted_frame = await self._mute_filter.process(frame)
-            return muted_frame
-
+        self._frames_in.inc()
+
+        trace = None
+        if self._trace_interval > 0:
+            self._frame_count += 1
+            if self._frame_count % self._trace_interval == 0:
+                trace = FrameTrace(self.connection._log_name_suffix, self.kind)
+
+        try:
+            if self._execute_group_filters:
+                if self.kind == "video":
+                    await self._run_video_group_filters(frame, trace)
+                else:
+                    await self._run_audio_group_filters(frame, trace)
+
+            if self._execute_filters:
+                if self.kind == "video":
+                    frame = await self._apply_video_filters(frame, trace)
+                else:
+                    frame = await self._apply_audio_filters(frame, trace)
+
+            if self._muted:
+                frame = await self._mute_filter.process(frame)
+                if trace is not None:
+                    trace.stamp("mute")
+        except Exception:
+            self._frames_dropped.inc()
+            raise
+
+        if trace is not None:
+            self._traced_frame = (frame, trace)
+        self._frames_out.inc()
         return frame
 
-    async def _apply_video_filters(self, frame: VideoFrame):
+    async def _apply_video_filters(
+        self, frame: VideoFrame, trace: FrameTrace | None = None
+    ):
         """Parse video frame and pass it to `_apply_filters`."""
         ndarray = frame.to_ndarray(format="bgr24")
-        ndarray = await self._apply_filters(frame, ndarray)
+        if trace is not None:
+            trace.stamp("to_ndarray")
+        ndarray = await self._apply_filters(frame, ndarray, trace)
 
         new_frame = VideoFrame.from_ndarray(ndarray, format="bgr24")
         new_frame.time_base = frame.time_base
         new_frame.pts = frame.pts
+        if trace is not None:
+            trace.stamp("from_ndarray")
         return new_frame
 
-    async def _apply_audio_filters(self, frame: AudioFrame):
+    async def _apply_audio_filters(
+        self, frame: AudioFrame, trace: FrameTrace | None = None
+    ):
         """Parse audio frame and pass it to `_apply_filters`."""
         ndarray = frame.to_ndarray()
-        ndarray = await self._apply_filters(frame, ndarray)
+        if trace is not None:
+            trace.stamp("to_ndarray")
+        ndarray = await self._apply_filters(frame, ndarray, trace)
 
         new_frame = AudioFrame.from_ndarray(ndarray)
         new_frame.pts = frame.pts
         new_frame.time_base = frame.time_base
         new_frame.sample_rate = frame.sample_rate
+        if trace is not None:
+            trace.stamp("from_ndarray")
         return new_frame
 
     async def _apply_filters(
-        self, original: VideoFrame | AudioFrame, ndarray: numpy.ndarray
+        self,
+        original: VideoFrame | AudioFrame,
+        ndarray: numpy.ndarray,
+        trace: FrameTrace | None = None,
     ) -> numpy.ndarray:
         """Execute filter pipeline."""
         async with self.__lock:
             # Run all filters if not self._muted.
             if not self._muted:
-                for active_filter in self._filters.values():
+                for filter_id, active_filter in self._filters.items():
+                    start = perf_counter()
                     ndarray = await active_filter.process(original, ndarray)
+                    self._filter_durations[filter_id].observe(perf_counter() - start)
+                    if trace is not None:
+                        trace.stamp(f"filter {active_filter.config['name']}")
                 return ndarray
 
             # Muted. Only execute filters where run_if_muted is True.
-            for active_filter in self._filters.values():
+            for filter_id, active_filter in self._filters.items():
                 if active_filter.run_if_muted:
+                    start = perf_counter()
                     ndarray = await active_filter.process(original, ndarray)
+                    self._filter_durations[filter_id].observe(perf_counter() - start)
+                    if trace is not None:
+                        trace.stamp(f"filter {active_filter.config['name']}")
 
         return ndarray
 
-    async def _run_video_group_filters(self, frame: VideoFrame) -> None:
+    async def _run_video_group_filters(
+        self, frame: VideoFrame, trace: FrameTrace | None = None
+    ) -> None:
         ndarray = frame.to_ndarray(format="bgr24")
-        await self._run_group_filters(frame, ndarray)
+        if trace is not None:
+            trace.stamp("to_ndarray")
+        await self._run_group_filters(frame, ndarray, trace)
 
-    async def _run_audio_group_filters(self, frame: AudioFrame) -> None:
+    async def _run_audio_group_filters(
+        self, frame: AudioFrame, trace: FrameTrace | None = None
+    ) -> None:
         ndarray = frame.to_ndarray()
-        await self._run_group_filters(frame, ndarray)
+        if trace is not None:
+            trace.stamp("to_ndarray")
+        await self._run_group_filters(frame, ndarray, trace)
 
     async def _run_group_filters(
-        self, original: VideoFrame | AudioFrame, ndarray: numpy.ndarray
+        self,
+        original: VideoFrame | AudioFrame,
+        ndarray: numpy.ndarray,
+        trace: FrameTrace | None = None,
     ) -> None:
         """Execute group filter individual frame processing pipeline."""
         async with self.__lock:
             ts = time_ns()
-            for active_group_filter in self._group_filters.values():
+            for filter_id, active_group_filter in self._group_filters.items():
+                start = perf_counter()
                 await active_group_filter.process_individual_frame_and_send_data_to_aggregator(
                     original, ndarray, ts
                 )
+                self._group_filter_durations[filter_id].observe(perf_counter() - start)
+                if trace is not None:
+                    trace.stamp(f"group filter {active_group_filter.config['name']}")
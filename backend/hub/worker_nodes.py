@@ -0,0 +1,341 @@
+"""Provide the `WorkerNodeServer`, which places connections on remote worker nodes.
+
+Worker nodes are `worker_main.py` processes, usually running on other hosts.  They
+connect to the hub over TCP, register with the shared `worker_node_token` and then
+execute participant connections in local `subprocess_main.py` subprocesses on behalf of
+the hub (see connection.remote_connection.RemoteConnection and
+connection.worker_node_runner.WorkerNodeRunner).
+
+Link protocol
+-------------
+The link carries JSON lines.  Messages of a connection are the regular commands of the
+connection.connection_subprocess.ConnectionSubprocess protocol (`SET_VIDEO_FILTERS`,
+`CREATE_PROPOSAL`, `LOG`, ...) with an additional `connection` key identifying the
+connection on the link.  Node level messages:
+
+- node -> hub `REGISTER` : `{"token", "name", "capacity", "cpus"}`, first message.
+- hub -> node `REGISTERED` / `REJECTED` : response to `REGISTER`.
+- node -> hub `LOAD` : `{"load"}`, CPU load average of the node per CPU core.
+- hub -> node `START_CONNECTION` : `connection` and the command line arguments for
+  `subprocess_main.py` as data.
+- hub -> node `STOP_CONNECTION` : terminate the subprocess of `connection`.
+- node -> hub `CONNECTION_EXITED` : `{"returncode", "stdout", "stderr"}` of
+  `connection`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import ipaddress
+import json
+import logging
+from typing import TYPE_CHECKING
+
+from hub.util import generate_unique_id
+
+if TYPE_CHECKING:
+    from connection.remote_connection import RemoteConnection
+
+LINK_LIMIT = 2**26
+"""Maximum length of a single message on a worker node link in bytes."""
+
+
+class WorkerNode:
+    """Hub side of a registered worker node.
+
+    Attributes
+    ----------
+    local : bool
+        True if the node is connected from the host of the hub.  Only local nodes can
+        reach host-local resources of the hub, like the recording paths, measurement
+        directories, the OpenFace worker pool and group filter endpoints, see
+        connection.remote_connection.get_host_local_features.
+    """
+
+    name: str
+    capacity: int
+    cpus: int
+    local: bool
+    load: float
+    connections: dict[str, RemoteConnection]
+
+    _reader: asyncio.StreamReader
+    _writer: asyncio.StreamWriter
+    _write_lock: asyncio.Lock
+    _logger: logging.Logger
+
+    def __init__(
+        self,
+        name: str,
+        capacity: int,
+        cpus: int,
+        local: bool,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.name = name
+        self.capacity = capacity
+        self.cpus = cpus
+        self.local = local
+        self.load = 0.0
+        self.connections = {}
+        self._reader = reader
+        self._writer = writer
+        self._write_lock = asyncio.Lock()
+        self._logger = logging.getLogger(f"WorkerNode-{name}")
+
+    def __repr__(self) -> str:
+        return (
+            f"WorkerNode(name={self.name}, connections={len(self.connections)}/"
+            f"{self.capacity}, load={self.load:.2f}, local={self.local})"
+        )
+
+    @property
+    def utilization(self) -> float:
+        """Share of the capacity of this node used by connections."""
+        return len(self.connections) / self.capacity
+
+    async def start_connection(
+        self, connection: RemoteConnection, arguments: list[str]
+    ) -> str:
+        """Start `connection` on this node.
+
+        Parameters
+        ----------
+        connection : connection.remote_connection.RemoteConnection
+            Connection that will receive the messages of the remote subprocess.
+        arguments : list of str
+            Command line arguments for `subprocess_main.py`.
+
+        Returns
+        -------
+        str
+            ID of the connection on the link.
+        """
+        connection_id = generate_unique_id(list(self.connections))
+        self.connections[connection_id] = connection
+        await self.send(
+            {
+                "command": "START_CONNECTION",
+                "connection": connection_id,
+                "data": arguments,
+                "command_nr": -1,
+            }
+        )
+        return connection_id
+
+    async def stop_connection(self, connection_id: str) -> None:
+        """Terminate the subprocess of the connection with `connection_id`."""
+        await self.send(
+            {
+                "command": "STOP_CONNECTION",
+                "connection": connection_id,
+                "data": None,
+                "command_nr": -1,
+            }
+        )
+
+    async def send(self, message: dict) -> None:
+        """Send `message` to the node.  Messages are dropped if the link is closed."""
+        await self.send_serialized(json.dumps(message))
+
+    async def send_serialized(self, data: str) -> None:
+        """Send a serialized message to the node."""
+        async with self._write_lock:
+            if self._writer.is_closing():
+                self._logger.debug("Not sending message, link is closed")
+                return
+            self._writer.write(data.encode("utf-8") + b"\n")
+            try:
+                await self._writer.drain()
+            except ConnectionError as e:
+                self._logger.warning(f"Failed to send message: {e}")
+
+    async def run(self) -> None:
+        """Receive and dispatch messages from the node until the link closes."""
+        while True:
+            try:
+                line = await self._reader.readline()
+            except (ValueError, ConnectionError) as e:
+                self._logger.error(f"Failed to read from link: {e}")
+                break
+            if len(line) == 0:
+                break
+
+            try:
+                message = json.loads(line)
+            except (json.JSONDecodeError, TypeError) as e:
+                self._logger.error(f"Failed to parse message from node: {e}")
+                continue
+
+            try:
+                await self._handle_message(message)
+            except Exception as e:
+                self._logger.exception(f"Failed to handle message from node: {e}")
+
+        self._writer.close()
+        # Connections on this node are lost.
+        connections = list(self.connections.values())
+        self.connections.clear()
+        for connection in connections:
+            connection.handle_exit(None, "", "Worker node disconnected")
+
+    async def _handle_message(self, message: dict) -> None:
+        """Handle a message from the node."""
+        command = message["command"]
+        if command == "LOAD":
+            self.load = message["data"]["load"]
+            return
+
+        connection_id = message.get("connection")
+        connection = self.connections.get(connection_id)  # type: ignore
+        if connection is None:
+            self._logger.debug(f"{command} for unknown connection: {connection_id}")
+            return
+
+        if command == "CONNECTION_EXITED":
+            self.connections.pop(connection_id)  # type: ignore
+            data = message["data"]
+            connection.handle_exit(data["returncode"], data["stdout"], data["stderr"])
+        else:
+            await connection._handle_process_message(message)
+
+
+class WorkerNodeServer:
+    """TCP server worker nodes register with.  Places connections on the nodes."""
+
+    nodes: list[WorkerNode]
+
+    _host: str
+    _port: int
+    _token: str
+    _server: asyncio.Server | None
+    _tasks: set[asyncio.Task]
+    _logger: logging.Logger
+
+    def __init__(self, host: str, port: int, token: str) -> None:
+        """Create new WorkerNodeServer.  Use `start` to start listening.
+
+        Parameters
+        ----------
+        host : str
+            Address to listen on for worker nodes.
+        port : int
+            Port to listen on for worker nodes.
+        token : str
+            Shared secret worker nodes must send in `REGISTER`.
+        """
+        self.nodes = []
+        self._host = host
+        self._port = port
+        self._token = token
+        self._server = None
+        self._tasks = set()
+        self._logger = logging.getLogger("WorkerNodeServer")
+
+    async def start(self) -> None:
+        """Start listening for worker nodes."""
+        self._server = await asyncio.start_server(
+            self._handle_link, self._host, self._port, limit=LINK_LIMIT
+        )
+        self._logger.info(f"Listening for worker nodes on {self._host}:{self._port}")
+
+    async def stop(self) -> None:
+        """Stop the server and close the links to all nodes."""
+        if self._server is None:
+            return
+        self._server.close()
+        for node in self.nodes:
+            node._writer.close()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._server = None
+
+    def select(self, local_only: bool = False) -> WorkerNode | None:
+        """Get the least loaded worker node with free capacity, or None.
+
+        Nodes are ranked by the share of their capacity in use, ties are broken by the
+        CPU load reported by the nodes.
+
+        Parameters
+        ----------
+        local_only : bool, default False
+            If true, only nodes on the host of the hub are considered, see
+            `WorkerNode.local`.
+        """
+        available = [
+            n
+            for n in self.nodes
+            if len(n.connections) < n.capacity and (n.local or not local_only)
+        ]
+        if len(available) == 0:
+            return None
+        return min(available, key=lambda n: (n.utilization, n.load))
+
+    async def _handle_link(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Handle a new link, register and run the worker node."""
+        task = asyncio.current_task()
+        assert task is not None
+        self._tasks.add(task)
+        try:
+            node = await self._register(reader, writer)
+            if node is None:
+                writer.close()
+                return
+            self.nodes.append(node)
+            self._logger.info(f"Worker node registered: {node}")
+            await node.run()
+            self.nodes.remove(node)
+            self._logger.warning(f"Worker node disconnected: {node}")
+        finally:
+            self._tasks.discard(task)
+
+    async def _register(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> WorkerNode | None:
+        """Read and check the `REGISTER` message of a new link."""
+        peer = writer.get_extra_info("peername")
+        try:
+            line = await asyncio.wait_for(reader.readline(), 10)
+            message = json.loads(line)
+            data = message["data"]
+            valid = message["command"] == "REGISTER" and hmac.compare_digest(
+                str(data["token"]), self._token
+            )
+            capacity = max(1, int(data["capacity"]))
+            cpus = int(data["cpus"])
+            name = str(data.get("name", "node"))
+        except (asyncio.TimeoutError, ValueError, KeyError, TypeError, AttributeError):
+            valid = False
+
+        if not valid:
+            self._logger.warning(f"Rejected worker node {peer}")
+            writer.write(b'{"command": "REJECTED", "data": null}\n')
+            return None
+
+        name = f"{name}-{generate_unique_id([n.name for n in self.nodes])}"
+        node = WorkerNode(
+            name,
+            capacity,
+            cpus,
+            _is_loopback(peer),
+            reader,
+            writer,
+        )
+        await node.send({"command": "REGISTERED", "data": name})
+        return node
+
+
+def _is_loopback(peer: tuple | None) -> bool:
+    """Check if `peer` (the `peername` of a link) is on the host of the hub."""
+    if peer is None:
+        return False
+    try:
+        address = ipaddress.ip_address(peer[0])
+    except ValueError:
+        return False
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_loopback
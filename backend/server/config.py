@@ -1,8 +1,8 @@
 """Provide the `Config` class."""
 
-
 from typing import Literal
 
+import copy
 import json
 from os.path import join, exists
 from hub import BACKEND_DIR
@@ -25,8 +25,27 @@ class Config:
     log_dependencies: Literal["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"]
 
     ping_subprocesses: float
+    metrics_interval: float
+    frame_tracing: int
+    loop_monitor_threshold: float
     experimenter_multiprocessing: bool
     participant_multiprocessing: bool
+    experiment_workers: bool
+    group_filter_aggregation_process: bool
+    worker_node_host: str
+    worker_node_port: int
+    worker_node_token: str
+
+    open_face_port: int
+    open_face_workers: int
+    post_processing_workers: int
+    recording_segment_duration: int
+    recording_fsync: bool
+
+    ice_servers: list[dict]
+    ice_host_only: bool
+    ice_gathering_timeout: float
+    ice_port_range: list[int] | None
 
     def __init__(self):
         """Load config from `backend/config.json`.
@@ -65,6 +84,33 @@ class Config:
                     f"{key} must be of type {data_types[key]} in config.json."
                 )
 
+        # Optional keys, set to their default if missing.  Defaults disable the feature
+        # or keep the behavior of configs without the key.
+        defaults = {
+            "metrics_interval": 0.0,
+            "frame_tracing": 0,
+            "loop_monitor_threshold": 0.0,
+            "experiment_workers": False,
+            "group_filter_aggregation_process": False,
+            "worker_node_host": "127.0.0.1",
+            "worker_node_port": 0,
+            "worker_node_token": "",
+            "open_face_port": 5555,
+            "open_face_workers": 0,
+            "post_processing_workers": 0,
+            "recording_segment_duration": 0,
+            "recording_fsync": False,
+            "ice_servers": [{"urls": "stun:stun.l.google.com:19302"}],
+            "ice_host_only": False,
+            "ice_gathering_timeout": 5.0,
+        }
+        for key, default in defaults.items():
+            config.setdefault(key, copy.deepcopy(default))
+            if not isinstance(config[key], type(default)):
+                raise ValueError(
+                    f"{key} must be of type {type(default)} in config.json."
+                )
+
         # Special data checks.
         if config["environment"] not in ["dev", "prod"]:
             raise ValueError("'environment' must be 'dev' or 'prod' in config.json.")
@@ -76,6 +122,65 @@ class Config:
         if config["log_dependencies"] not in valid_log_levels:
             raise ValueError(f'"log_dependencies" must be one of: {valid_log_levels}')
 
+        if config["metrics_interval"] < 0:
+            raise ValueError('"metrics_interval" must be 0 or greater in config.json.')
+
+        if config["frame_tracing"] < 0:
+            raise ValueError('"frame_tracing" must be 0 or greater in config.json.')
+
+        if config["loop_monitor_threshold"] < 0:
+            raise ValueError(
+                '"loop_monitor_threshold" must be 0 or greater in config.json.'
+            )
+
+        if config["open_face_workers"] < 0:
+            raise ValueError('"open_face_workers" must be 0 or greater in config.json.')
+
+        if not 0 <= config["worker_node_port"] <= 65535:
+            raise ValueError(
+                '"worker_node_port" must be between 0 and 65535 in config.json.'
+            )
+
+        if config["worker_node_port"] > 0 and config["worker_node_token"] == "":
+            raise ValueError(
+                '"worker_node_token" must be set if "worker_node_port" is used.'
+            )
+
+        if config["post_processing_workers"] < 0:
+            raise ValueError(
+                '"post_processing_workers" must be 0 or greater in config.json.'
+            )
+
+        if config["recording_segment_duration"] < 0:
+            raise ValueError(
+                '"recording_segment_duration" must be 0 or greater in config.json.'
+            )
+
+        for server in config["ice_servers"]:
+            if not isinstance(server, dict) or not isinstance(
+                server.get("urls"), (str, list)
+            ):
+                raise ValueError(
+                    'Every entry in "ice_servers" must be an object with "urls" in '
+                    "config.json."
+                )
+
+        if config["ice_gathering_timeout"] <= 0:
+            raise ValueError(
+                '"ice_gathering_timeout" must be greater than 0 in config.json.'
+            )
+
+        ice_port_range = config.get("ice_port_range")
+        if ice_port_range is not None and (
+            not isinstance(ice_port_range, list)
+            or len(ice_port_range) != 2
+            or not all(isinstance(port, int) for port in ice_port_range)
+            or not 0 < ice_port_range[0] <= ice_port_range[1] <= 65535
+        ):
+            raise ValueError(
+                '"ice_port_range" must be null or [min_port, max_port] in config.json.'
+            )
+
         # Load config into this class.
         self.experimenter_password = config["experimenter_password"]
         self.host = config["host"]
@@ -86,8 +191,27 @@ class Config:
         self.log = config["log"]
         self.log_dependencies = config["log_dependencies"]
         self.ping_subprocesses = config["ping_subprocesses"]
+        self.metrics_interval = config["metrics_interval"]
+        self.frame_tracing = config["frame_tracing"]
+        self.loop_monitor_threshold = config["loop_monitor_threshold"]
         self.experimenter_multiprocessing = config["experimenter_multiprocessing"]
         self.participant_multiprocessing = config["participant_multiprocessing"]
+        self.experiment_workers = config["experiment_workers"]
+        self.group_filter_aggregation_process = config[
+            "group_filter_aggregation_process"
+        ]
+        self.worker_node_host = config["worker_node_host"]
+        self.worker_node_port = config["worker_node_port"]
+        self.worker_node_token = config["worker_node_token"]
+        self.open_face_port = config["open_face_port"]
+        self.open_face_workers = config["open_face_workers"]
+        self.post_processing_workers = config["post_processing_workers"]
+        self.recording_segment_duration = config["recording_segment_duration"]
+        self.recording_fsync = config["recording_fsync"]
+        self.ice_servers = config["ice_servers"]
+        self.ice_host_only = config["ice_host_only"]
+        self.ice_gathering_timeout = config["ice_gathering_timeout"]
+        self.ice_port_range = ice_port_range
 
         # Parse log_file
         self.log_file = config.get("log_file")
@@ -113,15 +237,34 @@ class Config:
                 raise FileNotFoundError(f"Did not find ssl_key file: {self.ssl_key}")
 
     def __str__(self) -> str:
-        """Get string representation of parameters in this Config."""
+        """Get string representation of parameters in this Config.
+
+        Only the URLs of `ice_servers` are included, not the TURN credentials.
+        """
+        ice_server_urls = [server["urls"] for server in self.ice_servers]
         return (
-            f"host={self.host}, port={self.port}, environment={self.environment}, "
-            f"https={self.https}, serve_frontend={self.serve_frontend}, ssl_cert="
-            f"{self.ssl_cert}, ssl_key={self.ssl_key}, log={self.log}, log_dependencies"
-            f"={self.log_dependencies}, log_file={self.log_file}, ping_subprocesses="
-            f"{self.ping_subprocesses}, experimenter_multiprocessing="
-            f"{self.experimenter_multiprocessing}, participant_multiprocessing="
-            f"{self.participant_multiprocessing}."
+            f"host={self.host}, port={self.port}, environment={self.environment},"
+            f" https={self.https}, serve_frontend={self.serve_frontend},"
+            f" ssl_cert={self.ssl_cert}, ssl_key={self.ssl_key}, log={self.log},"
+            f" log_dependencies={self.log_dependencies}, log_file={self.log_file},"
+            f" ping_subprocesses={self.ping_subprocesses},"
+            f" metrics_interval={self.metrics_interval},"
+            f" frame_tracing={self.frame_tracing},"
+            f" loop_monitor_threshold={self.loop_monitor_threshold},"
+            f" experimenter_multiprocessing={self.experimenter_multiprocessing},"
+            f" participant_multiprocessing={self.participant_multiprocessing},"
+            f" experiment_workers={self.experiment_workers},"
+            f" group_filter_aggregation_process={self.group_filter_aggregation_process},"
+            f" worker_node_host={self.worker_node_host},"
+            f" worker_node_port={self.worker_node_port},"
+            f" open_face_port={self.open_face_port},"
+            f" open_face_workers={self.open_face_workers},"
+            f" post_processing_workers={self.post_processing_workers},"
+            f" recording_segment_duration={self.recording_segment_duration},"
+            f" recording_fsync={self.recording_fsync}, ice_servers={ice_server_urls},"
+            f" ice_host_only={self.ice_host_only},"
+            f" ice_gathering_timeout={self.ice_gathering_timeout},"
+            f" ice_port_range={self.ice_port_range}."
         )
 
     def __repr__(self) -> str:
@@ -15,7 +15,7 @@ from custom_types.message import MessageDict
 from custom_types.error import ErrorDict
 
 from hub.exceptions import ErrorDictException
-from hub import FRONTEND_BUILD_DIR
+from hub import FRONTEND_BUILD_DIR, metrics
 from server.config import Config
 
 
@@ -61,6 +61,8 @@ class Server:
             self._app.router.add_get("/hello-world", self.get_hello_world),
             self._app.router.add_post("/offer", self.handle_offer),
         ]
+        if self._config.metrics_interval > 0:
+            routes.append(self._app.router.add_get("/metrics", self.get_metrics))
 
         # Serve frontend build
         # Redirect sub-pages to index (client handles routing -> single-page app)
@@ -151,6 +153,14 @@ class Server:
             text=json.dumps({"text": "Hello World", "timestamp": str(datetime.now())}),
         )
 
+    async def get_metrics(self, request: web.Request) -> web.StreamResponse:
+        """Respond with the metrics of all processes, see hub.metrics."""
+        text = metrics.render(await metrics.collect())
+        return web.Response(
+            text=text,
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
     def _get_ssl_context(self) -> None | SSLContext:
         """Get ssl context if `ssl_cert` and `ssl_key` are defined in config.
 
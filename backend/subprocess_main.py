@@ -39,6 +39,12 @@ def parse_args() -> (
         "--video-group-filters", dest="video_group_filters", required=False, default=[]
     )
     parser.add_argument("--record-data", dest="record_data", required=False, default=[])
+    parser.add_argument(
+        "--measurement-directory",
+        dest="measurement_directory",
+        required=False,
+        default=None,
+    )
     args = parser.parse_args()
 
     # Check and parse offer
@@ -73,6 +79,7 @@ def parse_args() -> (
         audio_group_filters,
         video_group_filters,
         record_data,
+        args.measurement_directory,
     )
 
 
@@ -85,6 +92,7 @@ async def main() -> None:
         audio_group_filters,
         video_group_filters,
         record_data,
+        measurement_directory,
     ) = parse_args()
 
     runner = ConnectionRunner()
@@ -96,6 +104,7 @@ async def main() -> None:
         audio_group_filters,
         video_group_filters,
         record_data,
+        measurement_directory,
     )
 
 
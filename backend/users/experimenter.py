@@ -9,6 +9,8 @@ hub.connection.Connection.
 from __future__ import annotations
 import asyncio
 import logging
+import os
+import time
 from typing import Any, Coroutine
 
 from filters import filter_utils
@@ -16,16 +18,24 @@ from group_filters import group_filter_utils
 from session.data.session import is_valid_session
 from custom_types.chat_message import is_valid_chatmessage
 from custom_types.kick import is_valid_kickrequest
+from custom_types.error import ErrorDict
 from custom_types.message import MessageDict
 from custom_types.success import SuccessDict
 from custom_types.note import is_valid_note
 from custom_types.mute import is_valid_mute_request
+from custom_types.profile import (
+    is_valid_profile_request,
+    is_valid_stop_profile_request,
+)
 from custom_types.session_id_request import is_valid_session_id_request
 
+from connection.connection_interface import ConnectionInterface
 from connection.connection_state import ConnectionState
+from hub import BACKEND_DIR, frame_tracing, profiler
 from hub.exceptions import ErrorDictException
 from users.user import User
 import experiment.experiment as _exp
+import experiment.experiment_worker as _exp_worker
 import hub.hub as _h
 
 
@@ -41,8 +51,9 @@ class Experimenter(User):
         WebRTC `offer`.  Use factory instead of instantiating Experimenter directly.
     """
 
-    _experiment: _exp.Experiment | None
+    _experiment: _exp.Experiment | _exp_worker.ExperimentWorker | None
     _hub: _h.Hub
+    _profile_tasks: set[asyncio.Task]
 
     def __init__(self, experimenter_id: str, hub: _h.Hub) -> None:
         """Instantiate new Experimenter instance.
@@ -63,6 +74,7 @@ class Experimenter(User):
         self._logger = logging.getLogger(f"Experimenter-{experimenter_id}")
         self._hub = hub
         self._experiment = None
+        self._profile_tasks = set()
 
         # Add API endpoints
         self.on_message("GET_SESSION_LIST", self._handle_get_session_list)
@@ -81,6 +93,9 @@ class Experimenter(User):
         self.on_message("SET_FILTERS", self._handle_set_filters)
         self.on_message("SET_GROUP_FILTERS", self._handle_set_group_filters)
         self.on_message("GET_SESSION", self._handle_get_session)
+        self.on_message("GET_FRAME_TRACE", self._handle_get_frame_trace)
+        self.on_message("START_PROFILE", self._handle_start_profile)
+        self.on_message("STOP_PROFILE", self._handle_stop_profile)
 
     def __str__(self) -> str:
         """Get string representation of this experimenter.
@@ -109,9 +124,42 @@ class Experimenter(User):
             self._logger.info(f"Experimenter connected. {str(self)}")
             await self._subscribe_to_participants_streams()
 
+    async def handle_message(self, message: MessageDict) -> None:
+        # For docstring see User or hover over function declaration
+        if message["type"] == "SET_FILTERS" and isinstance(message.get("data"), dict):
+            # Start hub services for the filters, also for experiments on workers.
+            data = message["data"]
+            await self._hub.prepare_filters(
+                [
+                    f
+                    for key in ("video_filters", "audio_filters")
+                    if isinstance(data.get(key), list)
+                    for f in data[key]
+                ]
+            )
+        # Experiment API messages are handled by the worker running the experiment.
+        if (
+            isinstance(self._experiment, _exp_worker.ExperimentWorker)
+            and message["type"] in _exp_worker.FORWARDED_MESSAGES
+        ):
+            self._experiment.forward_message(self, message)
+            return
+        await super().handle_message(message)
+
+    async def join_experiment(
+        self, experiment: _exp.Experiment | _exp_worker.ExperimentWorker
+    ) -> None:
+        """Join `experiment` and subscribe to its participants."""
+        self._experiment = experiment
+        self._experiment.add_experimenter(self)
+        await self._subscribe_to_participants_streams()
+
     async def _subscribe_to_participants_streams(self) -> None:
-        """Subscribe to all participants in `self._experiment`."""
-        if self._experiment is not None:
+        """Subscribe to all participants in `self._experiment`.
+
+        For experiments running on a worker, the worker subscribes the experimenter.
+        """
+        if isinstance(self._experiment, _exp.Experiment):
             coroutines: list[Coroutine] = []
             for p in self._experiment.participants.values():
                 if p is self:
@@ -158,8 +206,9 @@ class Experimenter(User):
         Raises
         ------
         ErrorDictException
-            If data is not a valid SessionDict or session id is not known (cannot update
-            unknown session).
+            If data is not a valid SessionDict, session id is not known (cannot update
+            unknown session) or the experiment of the session runs on an experiment
+            worker.
         """
         # Data check
         if not is_valid_session(data):
@@ -197,6 +246,20 @@ class Experimenter(User):
                 description="Cannot edit session, session has already started.",
             )
 
+        # The session of an experiment worker is owned by the worker, edits on the hub
+        # would not reach it.
+        if isinstance(
+            self._hub.experiments.get(session.id), _exp_worker.ExperimentWorker
+        ):
+            raise ErrorDictException(
+                code=409,
+                type="EXPERIMENT_RUNNING",
+                description=(
+                    "Cannot edit session, its experiment is running on an experiment "
+                    "worker."
+                ),
+            )
+
         # Check if read only parameters where changed
         # Checks for participant IDs are included in session.update()
         if data["creation_time"] != session.creation_time:
@@ -309,11 +372,8 @@ class Experimenter(User):
                 description="Message data is not a valid SessionIdRequest.",
             )
 
-        self._experiment = await self._hub.create_experiment(data["session_id"])
-        self._experiment.add_experimenter(self)
-
-        # Subscribe to participants in experiment
-        await self._subscribe_to_participants_streams()
+        experiment = await self._hub.create_experiment(data["session_id"])
+        await self.join_experiment(experiment)
 
         # Notify caller that he joined the experiment
         success = SuccessDict(
@@ -375,11 +435,7 @@ class Experimenter(User):
                 description="There is no experiment with the given ID.",
             )
 
-        self._experiment = experiment
-        self._experiment.add_experimenter(self)
-
-        # Subscribe to participants in experiment
-        await self._subscribe_to_participants_streams()
+        await self.join_experiment(experiment)
 
         success = SuccessDict(
             type="JOIN_EXPERIMENT", description="Successfully joined experiment."
@@ -400,8 +456,10 @@ class Experimenter(User):
         experiment = self.get_experiment_or_raise("Failed to leave experiment.")
         experiment.remove_experimenter(self)
 
-        for participant in experiment.participants.values():
-            await participant.remove_subscriber(self)
+        # Workers remove the subscriptions when the experimenter is removed.
+        if isinstance(experiment, _exp.Experiment):
+            for participant in experiment.participants.values():
+                await participant.remove_subscriber(self)
 
         self._experiment = None
 
@@ -755,29 +813,16 @@ class Experimenter(User):
             )
 
         video_group_filters = data["video_group_filters"]
-        video_group_filter_ports = []
-        for _ in video_group_filters:
-            video_group_filter_ports.append(group_filter_utils.find_an_available_port())
-
         audio_group_filters = data["audio_group_filters"]
-        audio_group_filter_ports = []
-        for _ in audio_group_filters:
-            audio_group_filter_ports.append(group_filter_utils.find_an_available_port())
 
         experiment = self.get_experiment_or_raise("Failed to set filters.")
-        coroutines = []
 
         # Update experiment with group filter aggregator
-        coroutines.append(
-            experiment.set_video_group_filter_aggregators(
-                video_group_filters, video_group_filter_ports
-            )
-        )
-        coroutines.append(
-            experiment.set_audio_group_filter_aggregators(
-                audio_group_filters, audio_group_filter_ports
-            )
+        await asyncio.gather(
+            experiment.set_video_group_filter_aggregators(video_group_filters),
+            experiment.set_audio_group_filter_aggregators(audio_group_filters),
         )
+        coroutines = []
 
         # Update participant data
         for p_data in experiment.session.participants.values():
@@ -789,12 +834,12 @@ class Experimenter(User):
             if p.connection is not None:
                 coroutines.append(
                     p.set_video_group_filters(
-                        video_group_filters, video_group_filter_ports
+                        video_group_filters, experiment.group_filter_endpoint
                     )
                 )
                 coroutines.append(
                     p.set_audio_group_filters(
-                        audio_group_filters, audio_group_filter_ports
+                        audio_group_filters, experiment.group_filter_endpoint
                     )
                 )
         await asyncio.gather(*coroutines)
@@ -833,3 +878,214 @@ class Experimenter(User):
             )
         session_dict = session.asdict()
         return MessageDict(type="SESSION", data=session_dict)
+
+    async def _handle_get_frame_trace(self, _) -> MessageDict:
+        """Handle requests with type `GET_FRAME_TRACE`.
+
+        Collects the frame traces of all connected participants in the experiment (see
+        hub.frame_tracing) and writes them as Chrome trace JSON to
+        `sessions/<session_id>/frame_trace_<date>_<time>.json`.  Traces can be too
+        large for the datachannel, so only the path is sent to the client.
+
+        Parameters
+        ----------
+        _ : any
+            Message data.  Ignored / not required.
+
+        Returns
+        -------
+        custom_types.message.MessageDict
+            MessageDict with type: `SUCCESS`, data: custom_types.success.SuccessDict and
+            SuccessDict type: `GET_FRAME_TRACE`.  The description contains the path of
+            the trace file.
+
+        Raises
+        ------
+        ErrorDictException
+            If frame tracing is disabled in the config or if this Experimenter is not
+            connected to a hub.experiment.Experiment.
+        """
+        if frame_tracing.get_sample_interval() == 0:
+            raise ErrorDictException(
+                code=409,
+                type="INVALID_REQUEST",
+                description='Frame tracing is disabled, see "frame_tracing" in config.',
+            )
+        experiment = self.get_experiment_or_raise("Failed to get frame trace.")
+
+        traces = await asyncio.gather(
+            *[
+                p.connection.get_frame_trace()
+                for p in experiment.participants.values()
+                if p.connection is not None
+            ]
+        )
+        events = [event for trace in traces for event in trace]
+        path = os.path.join(
+            BACKEND_DIR,
+            "sessions",
+            experiment.session.id,
+            f"frame_trace_{time.strftime('%Y%m%d_%H%M%S')}.json",
+        )
+        await asyncio.get_running_loop().run_in_executor(
+            None, frame_tracing.write_trace, path, events
+        )
+
+        success = SuccessDict(
+            type="GET_FRAME_TRACE",
+            description=f"Wrote frame trace with {len(events)} events to {path}.",
+        )
+        return MessageDict(type="SUCCESS", data=success)
+
+    async def _handle_start_profile(self, data: Any) -> MessageDict:
+        """Handle requests with type `START_PROFILE`.
+
+        Starts profiling the process of the connection of a participant (see
+        hub.profiler) for the requested duration, or until `STOP_PROFILE` is received.
+        The request is answered immediately, the profile is collected in the background
+        so that `STOP_PROFILE` can be handled while it runs.  The collapsed stacks are
+        written to
+        `sessions/<session_id>/profiles/<participant_id>_<date>_<time>.folded`, then a
+        `SUCCESS` message with SuccessDict type `PROFILE_FINISHED` and the path in the
+        description is sent.  If the profile fails, an `ERROR` message is sent instead.
+
+        Parameters
+        ----------
+        data : any or custom_types.profile.ProfileRequestDict
+            Message data.  Everything other than custom_types.profile.ProfileRequestDict
+            will raise an ErrorDictException.
+
+        Returns
+        -------
+        custom_types.message.MessageDict
+            MessageDict with type: `SUCCESS`, data: custom_types.success.SuccessDict and
+            SuccessDict type: `START_PROFILE`.
+
+        Raises
+        ------
+        ErrorDictException
+            If data is not a valid custom_types.profile.ProfileRequestDict, if the
+            participant is not connected or if this Experimenter is not connected to a
+            hub.experiment.Experiment.
+        """
+        if not is_valid_profile_request(data):
+            raise ErrorDictException(
+                code=400,
+                type="INVALID_DATATYPE",
+                description="Message data is not a valid ProfileRequest.",
+            )
+
+        experiment = self.get_experiment_or_raise("Failed to start profile.")
+        connection = self._get_participant_connection(
+            experiment, data["participant_id"]
+        )
+        path = os.path.join(
+            BACKEND_DIR,
+            "sessions",
+            experiment.session.id,
+            "profiles",
+            f"{data['participant_id']}_{time.strftime('%Y%m%d_%H%M%S')}.folded",
+        )
+        task = asyncio.create_task(
+            self._run_profile(connection, data["duration"], path)
+        )
+        self._profile_tasks.add(task)
+        task.add_done_callback(self._profile_tasks.discard)
+
+        success = SuccessDict(
+            type="START_PROFILE",
+            description=f"Started profile of participant {data['participant_id']}.",
+        )
+        return MessageDict(type="SUCCESS", data=success)
+
+    async def _run_profile(
+        self, connection: ConnectionInterface, duration: float, path: str
+    ) -> None:
+        """Profile `connection`, write the profile to `path` and notify the client.
+
+        See `_handle_start_profile`.
+        """
+        try:
+            stacks = await connection.start_profile(duration)
+            await asyncio.get_running_loop().run_in_executor(
+                None, profiler.write_profile, path, stacks
+            )
+        except ErrorDictException as err:
+            self._logger.info(f"Failed to profile. {err.description}")
+            await self.send(err.error_message)
+            return
+        except Exception as err:
+            self._logger.error(f"Failed to profile: {err!r}")
+            error = ErrorDict(
+                type="INTERNAL_SERVER_ERROR",
+                code=500,
+                description="Internal server error. See server log for details.",
+            )
+            await self.send(MessageDict(type="ERROR", data=error))
+            return
+
+        success = SuccessDict(
+            type="PROFILE_FINISHED", description=f"Wrote profile to {path}."
+        )
+        await self.send(MessageDict(type="SUCCESS", data=success))
+
+    async def _handle_stop_profile(self, data: Any) -> MessageDict:
+        """Handle requests with type `STOP_PROFILE`.
+
+        Stops the profile of a participant started with `START_PROFILE` early.  The
+        profile is written and `PROFILE_FINISHED` is sent.
+
+        Parameters
+        ----------
+        data : any or custom_types.profile.StopProfileRequestDict
+            Message data.  Everything other than
+            custom_types.profile.StopProfileRequestDict will raise an
+            ErrorDictException.
+
+        Returns
+        -------
+        custom_types.message.MessageDict
+            MessageDict with type: `SUCCESS`, data: custom_types.success.SuccessDict and
+            SuccessDict type: `STOP_PROFILE`.
+
+        Raises
+        ------
+        ErrorDictException
+            If data is not a valid custom_types.profile.StopProfileRequestDict, if the
+            participant is not connected or if this Experimenter is not connected to a
+            hub.experiment.Experiment.
+        """
+        if not is_valid_stop_profile_request(data):
+            raise ErrorDictException(
+                code=400,
+                type="INVALID_DATATYPE",
+                description="Message data is not a valid StopProfileRequest.",
+            )
+
+        experiment = self.get_experiment_or_raise("Failed to stop profile.")
+        connection = self._get_participant_connection(
+            experiment, data["participant_id"]
+        )
+        await connection.stop_profile()
+
+        success = SuccessDict(type="STOP_PROFILE", description="Stopped profile.")
+        return MessageDict(type="SUCCESS", data=success)
+
+    def _get_participant_connection(
+        self, experiment: _exp.Experiment, participant_id: str
+    ) -> ConnectionInterface:
+        """Get the connection of a participant in `experiment`.
+
+        Raises
+        ------
+        ErrorDictException
+            If the participant is not connected to the experiment.
+        """
+        participant = experiment.participants.get(participant_id)
+        if participant is None or participant.connection is None:
+            raise ErrorDictException(
+                code=404,
+                type="UNKNOWN_PARTICIPANT",
+                description=f'Participant "{participant_id}" is not connected.',
+            )
+        return participant.connection
@@ -54,7 +54,7 @@ async def experimenter_factory(
             [],
             [],
             filter_api,
-            (False, ""),
+            (False, "", 0, False),
         )
     else:
         answer, connection = await connection_factory(
@@ -66,7 +66,7 @@ async def experimenter_factory(
             [],
             [],
             filter_api,
-            (False, ""),
+            (False, "", 0, False),
         )
 
     experimenter.set_connection(connection)
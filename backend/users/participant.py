@@ -22,6 +22,8 @@ from custom_types.success import SuccessDict
 import experiment.experiment as _exp
 from experiment import ExperimentState
 from connection.connection_state import ConnectionState
+from connection.connection_interface import ConnectionInterface
+from connection.messages import RecordingFilesDict
 from hub.exceptions import ErrorDictException
 from session.data.participant import ParticipantData
 from users.user import User
@@ -108,6 +110,34 @@ class Participant(User):
     def get_summary(self) -> ParticipantSummaryDict:
         return self._participant_data.as_summary_dict()
 
+    def set_connection(self, connection: ConnectionInterface) -> None:
+        # For docstring see User or hover over function declaration
+        super().set_connection(connection)
+        connection.add_listener("recording_finished", self._handle_recording_finished)
+
+    async def _handle_recording_finished(self, files: RecordingFilesDict) -> None:
+        """Submit post-processing jobs for the recordings of this participant.
+
+        Muxes the audio recording into the filtered and raw video recordings.  Jobs run
+        in the background, see hub.post_processing.PostProcessingQueue.
+        """
+        audio = files.get("audio")
+        if audio is None:
+            return
+
+        for video, priority in ((files.get("video"), 1), (files.get("raw_video"), 2)):
+            if video is None:
+                continue
+            base, extension = os.path.splitext(video)
+            await self._hub.post_processing.submit(
+                "MUX",
+                self._experiment.session.id,
+                self.id,
+                [video, audio],
+                f"{base}_av{extension}",
+                priority,
+            )
+
     async def kick(self, reason: str) -> None:
         """Kick the participant.
 
@@ -322,3 +352,19 @@ class Participant(User):
         if not os.path.isdir(record_directory_path):
             os.mkdir(record_directory_path)
         return record_directory_path + "/" + self.id
+
+    def get_measurement_directory(self) -> str:
+        """Get the directory filter measurements of this participant are stored in.
+
+        Notes
+        -----
+        The format: ./sessions/<session_id>/measurements/<participant_id>
+        The directory is created by the filter_api.measurement_sink.MeasurementSink.
+        """
+        return os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "sessions",
+            self.experiment.session.id,
+            "measurements",
+            self.id,
+        )
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
+import logging
 from typing import TYPE_CHECKING
 
-
 if TYPE_CHECKING:
     from experiment import Experiment
 
@@ -13,12 +13,18 @@ from aiortc import RTCSessionDescription
 
 from connection.connection import connection_factory
 from connection.connection_subprocess import connection_subprocess_factory
+from connection.remote_connection import (
+    get_host_local_features,
+    remote_connection_factory,
+)
 from session.data.participant import ParticipantData
 from filter_api import FilterAPI
 
 from server import Config
 from users.participant import Participant
 
+_logger = logging.getLogger("ParticipantFactory")
+
 
 async def participant_factory(
     offer: RTCSessionDescription,
@@ -33,6 +39,12 @@ async def participant_factory(
     Instantiate new hub.participant.Participant, handle offer using
     hub.connection.connection_factory and set connection for the Participant.
 
+    The connection is placed on the least loaded worker node, if the hub has worker
+    nodes with free capacity (see hub.worker_nodes), otherwise it is executed on the
+    hub.  Connections using recording, measuring filters (OpenFace, speaking time) or
+    group filters are only placed on worker nodes on the host of the hub, see
+    connection.remote_connection.get_host_local_features.
+
     This sequence must be donne for all participants.  Instantiating a Participant
     directly will likely lead to problems, since it won't have a Connection.
 
@@ -55,11 +67,44 @@ async def participant_factory(
         representing the client.
     """
     participant = Participant(participant_id, experiment, participant_data, hub)
-    filter_api = FilterAPI(participant)
-    record_data = (experiment.session.record, participant.get_recording_path())
+    filter_api = FilterAPI(participant, participant.get_measurement_directory())
+    record_data = (
+        experiment.session.record,
+        participant.get_recording_path(),
+        config.recording_segment_duration,
+        config.recording_fsync,
+    )
     log_name_suffix = f"P-{participant_id}"
+    node = None
+    if hub.worker_nodes is not None:
+        # Features using host-local resources of the hub require a node on this host.
+        features = get_host_local_features(
+            experiment.session.record,
+            participant_data.audio_filters + participant_data.video_filters,
+            participant_data.audio_group_filters + participant_data.video_group_filters,
+        )
+        node = hub.worker_nodes.select(local_only=len(features) > 0)
+        if node is None and len(features) > 0 and hub.worker_nodes.select():
+            _logger.info(
+                f"Not placing participant {participant_id} on a worker node on another"
+                f" host, {', '.join(features)} only work on the host of the hub"
+            )
 
-    if config.participant_multiprocessing:
+    if node is not None:
+        answer, connection = await remote_connection_factory(
+            node,
+            offer,
+            participant.handle_message,
+            log_name_suffix,
+            config,
+            participant_data.audio_filters,
+            participant_data.video_filters,
+            participant_data.audio_group_filters,
+            participant_data.video_group_filters,
+            filter_api,
+            record_data,
+        )
+    elif config.participant_multiprocessing:
         answer, connection = await connection_subprocess_factory(
             offer,
             participant.handle_message,
@@ -86,4 +131,13 @@ async def participant_factory(
         )
 
     participant.set_connection(connection)
+    # Connect the initial group filters to the aggregators of the experiment.
+    if participant_data.video_group_filters:
+        await connection.set_video_group_filters(
+            participant_data.video_group_filters, experiment.group_filter_endpoint
+        )
+    if participant_data.audio_group_filters:
+        await connection.set_audio_group_filters(
+            participant_data.audio_group_filters, experiment.group_filter_endpoint
+        )
     return answer, participant
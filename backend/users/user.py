@@ -251,8 +251,12 @@ class User(AsyncIOEventEmitter, metaclass=ABCMeta):
             return
 
         # Error handling in case multiple users connect simultaneously
-        # Abort if user is not yet fully connected
-        if user.connection is None:
+        # Abort if user is not yet fully connected (e.g. datachannel not open).  The
+        # user subscribes to all others once its connection state is `CONNECTED`.
+        if (
+            user.connection is None
+            or user.connection.state is not ConnectionState.CONNECTED
+        ):
             self._logger.debug(
                 f"Avoid adding not fully connected subscriber: {repr(user)}"
             )
@@ -520,10 +524,10 @@ class User(AsyncIOEventEmitter, metaclass=ABCMeta):
                 await self._connection.set_audio_filters(filters)
 
     async def set_video_group_filters(
-        self, group_filters: list[FilterDict], ports: list[int]
+        self, group_filters: list[FilterDict], endpoint: str
     ) -> None:
         if self._connection is not None:
-            await self._connection.set_video_group_filters(group_filters, ports)
+            await self._connection.set_video_group_filters(group_filters, endpoint)
         else:
 
             @self.once("connection_set")
@@ -534,13 +538,13 @@ class User(AsyncIOEventEmitter, metaclass=ABCMeta):
                         "None."
                     )
                     return
-                await self._connection.set_video_group_filters(group_filters, ports)
+                await self._connection.set_video_group_filters(group_filters, endpoint)
 
     async def set_audio_group_filters(
-        self, group_filters: list[FilterDict], ports: list[int]
+        self, group_filters: list[FilterDict], endpoint: str
     ) -> None:
         if self._connection is not None:
-            await self._connection.set_audio_group_filters(group_filters, ports)
+            await self._connection.set_audio_group_filters(group_filters, endpoint)
         else:
 
             @self.once("connection_set")
@@ -551,7 +555,7 @@ class User(AsyncIOEventEmitter, metaclass=ABCMeta):
                         "None."
                     )
                     return
-                await self._connection.set_audio_group_filters(group_filters, ports)
+                await self._connection.set_audio_group_filters(group_filters, endpoint)
 
     async def start_recording(self) -> None:
         """Start recording for this user."""
@@ -0,0 +1,55 @@
+"""Entry point for worker nodes executing participant connections for a hub.
+
+See hub.worker_nodes.  Start the hub with `worker_node_port` set in `config.json`, then
+start one or more worker nodes, e.g. on the same host:
+
+`python worker_main.py --hub 127.0.0.1:8081 --capacity 8`
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from argparse import ArgumentParser
+
+from connection.worker_node_runner import WorkerNodeRunner
+from server import Config
+
+
+async def main() -> None:
+    config = Config()
+    parser = ArgumentParser(description="Run a worker node for a hub.")
+    parser.add_argument(
+        "--hub",
+        default=f"127.0.0.1:{config.worker_node_port}",
+        help="Host and worker node port of the hub, default: 127.0.0.1:<config port>.",
+    )
+    parser.add_argument(
+        "--token",
+        default=config.worker_node_token,
+        help="Shared secret, default: worker_node_token in config.json.",
+    )
+    parser.add_argument("--name", default=socket.gethostname())
+    parser.add_argument(
+        "--capacity",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Maximum number of connections on this node, default: CPU cores.",
+    )
+    parser.add_argument("--log", default=config.log)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.getLevelName(args.log),
+        format="%(asctime)s:%(levelname)s:%(name)s: %(message)s",
+    )
+    host, port = args.hub.rsplit(":", 1)
+    runner = WorkerNodeRunner(host, int(port), args.token, args.name, args.capacity)
+    await runner.run()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Detected Keyboard Interrupt. Exiting...")